@@ -0,0 +1,271 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Columnar game analytics: record events and triggers of games, and aggregate them with NumPy.
+
+``EventRecorder`` is attached to games by the 'event' and 'trigger' callbacks (see ``Game.add_callback``),
+each resolved event or trigger is a row of integer columns (see ``Columns``)::
+
+    game:   The game id (given when attaching the game).
+    turn:   The turn number.
+    type:   Index of the event (or trigger) type in the type table.
+    owner:  Index of the owner (the card id, etc.) in the card table, -1 if None.
+    target: Index of the target in the card table, -1 if None.
+    value:  The value of the event (e.g. damage or healing after bonuses), 0 if not exists.
+
+Types in the type table are names of event classes (e.g. ``'Damage'``) and ``'Trigger:<qualname of the class>'``
+of triggers; keys in the card table are card ids, ``'H<id>'`` of heroes, ``'P<id>'`` of hero powers, and class
+names of other entities (e.g. ``'Player'``).
+Targets of events are ``target`` of them, or ``defender`` of attacks and the card of draws; triggers use the target
+and the value of their current events.
+
+Rows are appended into ``array`` columns, no Python objects are kept for each row. ``EventTable`` holds columns as
+NumPy arrays, it is saved into (and loaded from) ``.npz`` files, tables of different files are merged by
+``EventTable.concatenate``. Aggregations (``type_stats`` and ``card_stats``) are NumPy group-bys over code columns::
+
+    recorder = EventRecorder()
+    recorder.attach(game)
+    ...     # Run games.
+    table = recorder.to_table()
+    stats = card_stats(table, 'Damage')     # Average damage dealt per card: stats.mean
+
+[NOTE]: This module requires NumPy (``pip install MyHearthStone[learning]``).
+"""
+
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from ..game.card import Card
+from ..game.hero import Hero, HeroPower
+
+__author__ = 'fyabc'
+
+Columns = ('game', 'turn', 'type', 'owner', 'target', 'value')
+
+TriggerPrefix = 'Trigger:'
+
+# Aggregated statistics of groups: keys (names of groups), and arrays of the number of rows,
+# the sum and the mean of values and the number of distinct games of each group.
+GroupStats = namedtuple('GroupStats', ['keys', 'count', 'total', 'mean', 'games'])
+
+
+def _entity_key(entity):
+    if isinstance(entity, Card):
+        return str(entity.id)
+    if isinstance(entity, Hero):
+        return 'H{}'.format(entity.id)
+    if isinstance(entity, HeroPower):
+        return 'P{}'.format(entity.id)
+    return type(entity).__name__
+
+
+class EventRecorder:
+    """Record events and triggers of games into columns."""
+
+    def __init__(self):
+        self.columns = {name: array('i') for name in Columns}
+        self.types = []
+        self.cards = []
+
+        self._type_indices = {}
+        self._card_indices = {}
+        # Cache of entity classes to card indices.
+        self._class_indices = {}
+        self._next_game_id = 0
+
+    def __len__(self):
+        return len(self.columns['game'])
+
+    def __repr__(self):
+        return 'EventRecorder(rows={}, types={}, cards={})'.format(len(self), len(self.types), len(self.cards))
+
+    def attach(self, game, game_id=None):
+        """Attach the recorder to the game.
+
+        :param game: The game.
+        :param game_id: The game id, default to the next unused id.
+        :return: The game id.
+        """
+        if game_id is None:
+            game_id = self._next_game_id
+        self._next_game_id = max(self._next_game_id, game_id + 1)
+
+        def _on_event(event):
+            self._record(game_id, game.n_turns, type(event).__name__, event)
+
+        def _on_trigger(trigger, current_event):
+            self._record(game_id, game.n_turns, TriggerPrefix + type(trigger).__qualname__, current_event,
+                         owner=trigger.owner)
+
+        game.add_callback(_on_event, 'event')
+        game.add_callback(_on_trigger, 'trigger')
+        return game_id
+
+    def _type_index(self, name):
+        index = self._type_indices.get(name)
+        if index is None:
+            index = self._type_indices[name] = len(self.types)
+            self.types.append(name)
+        return index
+
+    def _card_index(self, entity):
+        if entity is None:
+            return -1
+        cls = type(entity)
+        index = self._class_indices.get(cls)
+        if index is None:
+            key = _entity_key(entity)
+            index = self._card_indices.get(key)
+            if index is None:
+                index = self._card_indices[key] = len(self.cards)
+                self.cards.append(key)
+            self._class_indices[cls] = index
+        return index
+
+    def _record(self, game_id, turn, type_name, event, owner=None):
+        target = getattr(event, 'target', None)
+        if target is None:
+            target = getattr(event, 'defender', None) or getattr(event, 'card', None)
+        value = getattr(event, 'value', 0)
+        columns = self.columns
+        columns['game'].append(game_id)
+        columns['turn'].append(turn)
+        columns['type'].append(self._type_index(type_name))
+        columns['owner'].append(self._card_index(event.owner if owner is None else owner))
+        columns['target'].append(self._card_index(target))
+        columns['value'].append(value if type(value) is int else 0)
+
+    def to_table(self):
+        """Get the table of recorded rows (columns are copied)."""
+        return EventTable({name: np.array(column, dtype=np.int32) for name, column in self.columns.items()},
+                          list(self.types), list(self.cards))
+
+    def save(self, filename):
+        self.to_table().save(filename)
+
+
+class EventTable:
+    """The table of recorded rows.
+
+    :param columns: Dict of column names to int32 arrays of the same length.
+    :param types: The type table.
+    :param cards: The card table.
+    """
+
+    def __init__(self, columns, types, cards):
+        self.columns = columns
+        self.types = types
+        self.cards = cards
+
+    def __len__(self):
+        return len(self.columns['game'])
+
+    def __repr__(self):
+        return 'EventTable(rows={}, types={}, cards={})'.format(len(self), len(self.types), len(self.cards))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def save(self, filename):
+        np.savez(filename, types=np.array(self.types, dtype=str), cards=np.array(self.cards, dtype=str),
+                 **self.columns)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as data:
+            return cls({name: data[name] for name in Columns}, data['types'].tolist(), data['cards'].tolist())
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Concatenate tables, type and card tables are merged (codes are remapped)."""
+        types, cards = [], []
+        type_indices, card_indices = {}, {}
+        parts = {name: [] for name in Columns}
+        for table in tables:
+            # [NOTE]: The extra last item maps -1 (None) to -1.
+            type_map = np.array([type_indices.setdefault(t, len(type_indices)) for t in table.types] + [-1],
+                                dtype=np.int32)
+            card_map = np.array([card_indices.setdefault(c, len(card_indices)) for c in table.cards] + [-1],
+                                dtype=np.int32)
+            for name in Columns:
+                column = table.columns[name]
+                if name == 'type':
+                    column = type_map[column]
+                elif name in ('owner', 'target'):
+                    column = card_map[column]
+                parts[name].append(column)
+        types.extend(type_indices)
+        cards.extend(card_indices)
+        return cls({name: np.concatenate(part) if part else np.zeros(0, dtype=np.int32)
+                    for name, part in parts.items()}, types, cards)
+
+    def type_index(self, name):
+        """Get the index of the type name, or -1 if not found."""
+        try:
+            return self.types.index(name)
+        except ValueError:
+            return -1
+
+
+def _group_stats(codes, values, games, keys):
+    """Group rows by codes (in ``[0, len(keys))``, rows with negative codes are ignored)."""
+    n = len(keys)
+    valid = codes >= 0
+    codes, values, games = codes[valid], values[valid], games[valid]
+    count = np.bincount(codes, minlength=n)
+    total = np.bincount(codes, weights=values, minlength=n)
+    mean = np.divide(total, count, out=np.zeros(n), where=count > 0)
+    # Distinct (code, game) pairs.
+    stride = int(games.max(initial=0)) + 1
+    pairs = np.unique(codes.astype(np.int64) * stride + games)
+    n_games = np.bincount(pairs // stride, minlength=n)
+    return GroupStats(keys, count, total, mean, n_games)
+
+
+def type_stats(table):
+    """Get statistics of each type (e.g. which triggers fire most).
+
+    :rtype: GroupStats
+    """
+    return _group_stats(table['type'], table['value'], table['game'], table.types)
+
+
+def card_stats(table, event_type=None, by='owner'):
+    """Get statistics of each card (e.g. average damage dealt per card).
+
+    :param table: The event table.
+    :param event_type: The type name (or a list of type names) of rows to aggregate, None means all rows.
+    :param by: Group by the 'owner' or 'target' column.
+    :rtype: GroupStats
+    """
+    if by not in ('owner', 'target'):
+        raise ValueError('Unknown group column {!r}'.format(by))
+    codes, values, games = table[by], table['value'], table['game']
+    if event_type is not None:
+        names = [event_type] if isinstance(event_type, str) else event_type
+        mask = np.isin(table['type'], [table.type_index(name) for name in names])
+        codes, values, games = codes[mask], values[mask], games[mask]
+    return _group_stats(codes, values, games, table.cards)
+
+
+def top(stats, n=10, by='count'):
+    """Get the top ``n`` groups of the statistics.
+
+    :return: List of (key, value of ``by``), groups without rows are skipped.
+    """
+    values = getattr(stats, by)
+    order = np.argsort(-values, kind='stable')[:n]
+    return [(stats.keys[i], values[i].item()) for i in order if stats.count[i] > 0]
+
+
+__all__ = [
+    'Columns',
+    'GroupStats',
+    'EventRecorder',
+    'EventTable',
+    'type_stats',
+    'card_stats',
+    'top',
+]
@@ -0,0 +1,246 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Batched NumPy featurisation of game states, for learned evaluators (value networks, etc).
+
+A game is encoded from the view of a player (hidden cards of the opponent are only encoded as present) into
+fixed-shape arrays (see ``Features``)::
+
+    entities:   float32 [NumSlots, NumEntityFeatures], features of entities (see ``EntityFeatures``).
+    card_ids:   int32 [NumSlots], embedding indices of entities (see ``CardVocabulary``).
+    globals:    float32 [NumGlobalFeatures], global features (see ``GlobalFeatures``).
+
+Entity slots are in the fixed layout of ``Slots``: zones of the viewer, then zones of the opponent.
+Empty slots are all zeros (``card_ids`` of them are ``CardVocabulary.Pad``).
+Values are raw (not normalized), normalization is left to the model.
+
+Use ``Featuriser.new_buffers`` to preallocate buffers of a batch, then encode games into them by ``encode``
+or ``encode_batch`` without allocation.
+
+[NOTE]: This module requires NumPy (``pip install MyHearthStone[learning]``).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from ..game.player import Player
+from ..utils.game import Zone
+from ..utils.package_io import all_cards, all_heroes, all_hero_powers
+
+__author__ = 'fyabc'
+
+# (owner, zone, number of slots), owner 0 is the viewer, 1 is the opponent.
+Slots = (
+    (0, Zone.Hero, Player.HeroMax),
+    (0, Zone.HeroPower, Player.HeroPowerMax),
+    (0, Zone.Weapon, Player.WeaponMax),
+    (0, Zone.Play, Player.PlayMax),
+    (0, Zone.Hand, Player.HandMax),
+    (0, Zone.Secret, Player.SecretMax),
+    (1, Zone.Hero, Player.HeroMax),
+    (1, Zone.HeroPower, Player.HeroPowerMax),
+    (1, Zone.Weapon, Player.WeaponMax),
+    (1, Zone.Play, Player.PlayMax),
+    (1, Zone.Hand, Player.HandMax),
+    (1, Zone.Secret, Player.SecretMax),
+)
+NumSlots = sum(n for _, _, n in Slots)
+
+
+def _slot_ranges():
+    ranges, start = {}, 0
+    for owner, zone, n in Slots:
+        ranges[owner, zone] = start, n
+        start += n
+    return ranges
+
+
+# (start slot, number of slots) of each (owner, zone).
+SlotRanges = _slot_ranges()
+
+# Hidden zones of the opponent, only the presence of entities is encoded.
+HiddenZones = frozenset([Zone.Hand, Zone.Secret])
+
+# Numeric tags and bool tags of entities, missing tags are 0.
+NumericTags = ('cost', 'attack', 'max_health', 'damage', 'armor', 'n_attack', 'n_total_attack', 'spell_power')
+BoolTags = (
+    'first_turn', 'taunt', 'divine_shield', 'stealth', 'charge', 'rush', 'frozen', 'immune', 'windfury',
+    'poisonous', 'lifesteal', 'silenced', 'to_be_destroyed',
+)
+EntityFeatures = ('present',) + NumericTags + BoolTags + ('health', 'n_enchantments')
+NumEntityFeatures = len(EntityFeatures)
+_MaxHealthIndex, _DamageIndex = NumericTags.index('max_health'), NumericTags.index('damage')
+
+# Player features are repeated for the viewer and the opponent.
+PlayerFeatures = (
+    'max_mana', 'available_mana', 'temp_mana', 'overload', 'overload_next', 'tire_counter',
+    'hand_size', 'deck_size', 'play_size', 'secret_size',
+)
+GlobalFeatures = ('n_turns', 'my_turn') + tuple(
+    '{}.{}'.format(owner, name) for owner in ('me', 'opponent') for name in PlayerFeatures)
+NumGlobalFeatures = len(GlobalFeatures)
+
+Features = namedtuple('Features', ['entities', 'card_ids', 'globals'])
+
+
+class CardVocabulary:
+    """Map entity classes (cards, heroes and hero powers) to embedding indices.
+
+    Index 0 is the padding of empty slots, index 1 is hidden (or unknown) entities.
+    Other indices are assigned in order of (kind, id), so they are same in different processes
+    if the same packages are loaded.
+    """
+
+    Pad = 0
+    Hidden = 1
+
+    def __init__(self):
+        classes = []
+        for kind, data in enumerate((all_cards(), all_heroes(), all_hero_powers())):
+            classes.extend((kind, str(key), cls) for key, cls in data.items())
+        classes.sort(key=lambda item: item[:2])
+        self._indices = {cls: i for i, (_, _, cls) in enumerate(classes, start=self.Hidden + 1)}
+
+    def __len__(self):
+        return len(self._indices) + self.Hidden + 1
+
+    def index(self, entity):
+        return self._indices.get(type(entity), self.Hidden)
+
+    def index_of_id(self, card_id):
+        """Get the index of the card id (e.g. choices of **Choose One** cards)."""
+        return self._indices.get(all_cards().get(card_id), self.Hidden)
+
+
+def entity_slot(game, player_id, entity):
+    """Get the slot of the entity in features from the view of the player.
+
+    :return: The slot index, or -1 if the entity is not in any slot (e.g. in the deck).
+    """
+    slot_range = SlotRanges.get((0 if entity.player_id == player_id else 1, entity.zone))
+    if slot_range is None:
+        return -1
+    try:
+        index = game.get_zone(entity.zone, entity.player_id).index(entity)
+    except ValueError:
+        return -1
+    start, n = slot_range
+    return start + index if index < n else -1
+
+
+class Featuriser:
+    """Encode games into fixed-shape NumPy arrays.
+
+    :param vocabulary: The card vocabulary, default to a new ``CardVocabulary`` of loaded packages.
+    """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = CardVocabulary() if vocabulary is None else vocabulary
+
+        # Class-level default values of tags, key: entity class.
+        self._defaults = {}
+
+    @staticmethod
+    def new_buffers(batch_size):
+        """Allocate buffers of a batch of games."""
+        return Features(
+            entities=np.zeros((batch_size, NumSlots, NumEntityFeatures), dtype=np.float32),
+            card_ids=np.zeros((batch_size, NumSlots), dtype=np.int32),
+            globals=np.zeros((batch_size, NumGlobalFeatures), dtype=np.float32),
+        )
+
+    def _class_defaults(self, cls):
+        defaults = self._defaults.get(cls)
+        if defaults is None:
+            data = cls.data
+            defaults = self._defaults[cls] = {tag: data.get(tag, 0) for tag in NumericTags + BoolTags}
+        return defaults
+
+    def _entity_row(self, entity):
+        # [NOTE]: Read entity-level tags and cached class-level defaults directly (much faster than ``ChainMap``).
+        tags = entity.data.maps[0]
+        defaults = self._class_defaults(type(entity))
+        numeric = [tags.get(tag, defaults[tag]) or 0 for tag in NumericTags]
+        row = [1.0]
+        row.extend(numeric)
+        row.extend(1.0 if tags.get(tag, defaults[tag]) else 0.0 for tag in BoolTags)
+        row.append(numeric[_MaxHealthIndex] - numeric[_DamageIndex])
+        row.append(len(entity.enchantments) + len(entity.aura_enchantments))
+        return row
+
+    def encode(self, game, player_id, out=None, index=0):
+        """Encode the game from the view of the player.
+
+        :param out: Buffers to write into (see ``new_buffers``), allocate new buffers of batch size 1 if None.
+        :param index: The index in the batch to write into.
+        :return: The buffers.
+        :rtype: Features
+        """
+        if out is None:
+            out = self.new_buffers(1)
+        entities, card_ids, globals_ = out.entities[index], out.card_ids[index], out.globals[index]
+        entities.fill(0)
+        card_ids.fill(CardVocabulary.Pad)
+
+        players = (game.get_player(player_id), game.get_player(1 - player_id))
+        vocabulary = self.vocabulary
+        slot = 0
+        for owner, zone, n in Slots:
+            zone_entities = players[owner].get_zone(zone)
+            if owner == 1 and zone in HiddenZones:
+                m = min(n, len(zone_entities))
+                entities[slot:slot + m, 0] = 1.0
+                card_ids[slot:slot + m] = CardVocabulary.Hidden
+            else:
+                for i, entity in enumerate(zone_entities[:n]):
+                    if entity is None:
+                        continue
+                    entities[slot + i] = self._entity_row(entity)
+                    card_ids[slot + i] = vocabulary.index(entity)
+            slot += n
+
+        row = [game.n_turns, 1.0 if game.current_player == player_id else 0.0]
+        for player in players:
+            row.extend((
+                player.max_mana, player.displayed_mana(), player.temp_mana, player.overload, player.overload_next,
+                player.tire_counter, len(player.hand), len(player.deck), len(player.play), len(player.secret),
+            ))
+        globals_[:] = row
+        return out
+
+    def encode_batch(self, games, player_ids=None, out=None):
+        """Encode a batch of games.
+
+        :param games: List of games.
+        :param player_ids: List of viewers, default to current players of games.
+        :param out: Buffers to write into, the batch size must be at least the number of games.
+            Allocate new buffers if None.
+        :return: The buffers, only the first ``len(games)`` entries are written.
+        :rtype: Features
+        """
+        if out is None:
+            out = self.new_buffers(len(games))
+        elif len(out.entities) < len(games):
+            raise ValueError('Batch size of buffers {} is less than the number of games {}'.format(
+                len(out.entities), len(games)))
+        if player_ids is None:
+            player_ids = [game.current_player for game in games]
+        for index, (game, player_id) in enumerate(zip(games, player_ids)):
+            self.encode(game, player_id, out=out, index=index)
+        return out
+
+
+__all__ = [
+    'Slots',
+    'NumSlots',
+    'SlotRanges',
+    'EntityFeatures',
+    'NumEntityFeatures',
+    'GlobalFeatures',
+    'NumGlobalFeatures',
+    'Features',
+    'CardVocabulary',
+    'entity_slot',
+    'Featuriser',
+]
@@ -0,0 +1,394 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Monte Carlo Tree Search agent.
+
+The agent searches in clones of the game (see ``clone_game``), each iteration:
+
+    1. Determinisation: the hidden information (cards in the hand and deck of the opponent, order of the own deck)
+        is sampled randomly in the clone, so the tree is built over information sets (single observer ISMCTS).
+        Tree nodes are keyed by serialized actions (see ``game.legal_actions.action_key``),
+        so they are shared between determinisations.
+    2. Selection and expansion: UCB over children that are legal in the current determinisation.
+        Progressive widening: actions of the same source with different targets or positions are added gradually.
+    3. Rollout: play the game with a fast default policy for some turns, then evaluate the game state.
+    4. Back propagation.
+
+Transpositions (the same information set reached by different action orders, e.g. playing two minions into the
+same board in either order) share the same node, found in a transposition table (see ``transposition``) by
+``game.zobrist.observer_hash``. So the tree is a directed acyclic graph, and values are backed up along the selected
+path.
+
+The subtree of the chosen action is reused by the next move in the same turn.
+Search statistics (iterations per second, etc.) are stored in ``MCTSAgent.stats``.
+"""
+
+import math
+import pickle
+import random
+import time
+
+from .agent import Agent, register_agent
+from .rule_based.components import get_cost_ge_5
+from .transposition import TranspositionTable
+from ..game import player_action as pa
+from ..game.legal_actions import action_key, action_source
+from ..game.zobrist import observer_hash
+from ..utils.constants import C
+from ..utils.game import Zone, Type
+from ..utils.message import info
+
+__author__ = 'fyabc'
+
+
+def dump_game(game):
+    """Serialize the game for search (e.g. send it to worker processes, see ``parallel``).
+
+    Callbacks (of frontends, servers and state syncs) and the event history are not serialized.
+
+    [NOTE]: They are removed from the game during dumping (much faster than skipping them in a custom pickler),
+    so the game must not be used by other threads at the same time.
+    [NOTE]: The process that loads the game must load the same packages.
+    """
+    callbacks, event_history = game.callbacks, game.event_history
+    game.callbacks, game.event_history = {when: [] for when in callbacks}, []
+    try:
+        return pickle.dumps(game, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        game.callbacks, game.event_history = callbacks, event_history
+
+
+def load_game(data):
+    return pickle.loads(data)
+
+
+def clone_game(game):
+    """Clone the game for search. See ``dump_game`` for details."""
+    return load_game(dump_game(game))
+
+
+def _characters(game, player_id):
+    return game.get_zone(Zone.Play, player_id) + game.get_zone(Zone.Hero, player_id)
+
+
+def rank_actions(actions):
+    """Get the widening rank of each action: the index of the action in actions of the same source.
+
+    The first action of each source has rank 0, others (different targets, positions, etc.) are added by
+    progressive widening.
+    """
+    counts = {}
+    ranks = []
+    for action in actions:
+        source = action_source(action)
+        source = action.__class__.__name__ if source is None else source.eid
+        ranks.append(counts.get(source, 0))
+        counts[source] = ranks[-1] + 1
+    return ranks
+
+
+def evaluate(game, player_id):
+    """Evaluate the game state from the view of the player.
+
+    :return: The reward in [0, 1]: 1 is win, 0 is lose.
+    """
+    result = game.game_result
+    if result is not None:
+        if result == game.ResultDraw:
+            return 0.5
+        return 1.0 if (result == game.ResultWin0) == (player_id == 0) else 0.0
+
+    score = 0.0
+    for pid, sign in ((player_id, 1.0), (1 - player_id, -1.0)):
+        player = game.get_player(pid)
+        score += sign * player.hero.health
+        score += sign * sum(m.attack + m.health for m in player.play)
+        score += sign * len(player.hand)
+    return 1.0 / (1.0 + math.exp(-score / 10.0))
+
+
+def default_policy(game, rng):
+    """The fast default policy of rollouts.
+
+    Play the most expensive playable card without target, use the hero power without target,
+    then attack the enemy hero (or a random valid defender), else end the turn.
+    """
+    player_id = game.current_player
+    player = game.get_player(player_id)
+
+    cards = [c for c in player.hand if c.can_do_action() and not c.have_target]
+    if cards:
+        card = max(cards, key=lambda c: (c.cost, rng.random()))
+        type_ = card.type
+        if type_ == Type.Minion:
+            return pa.PlayMinion(game, card, len(player.play), None, player_id)
+        elif type_ == Type.Spell:
+            return pa.PlaySpell(game, card, None, player_id)
+        elif type_ == Type.Weapon:
+            return pa.PlayWeapon(game, card, None, player_id)
+
+    hp = player.hero_power
+    if hp.can_do_action() and not hp.have_target:
+        return pa.UseHeroPower(game, None, player_id)
+
+    for attacker in player.play + player.heroes:
+        if not attacker.can_do_action():
+            continue
+        defenders = [d for d in _characters(game, 1 - player_id) if attacker.check_defender(d)]
+        if not defenders:
+            continue
+        enemy_hero = game.get_hero(1 - player_id)
+        defender = enemy_hero if enemy_hero in defenders else rng.choice(defenders)
+        return pa.ToAttack(game, attacker, defender)
+
+    return pa.TurnEnd(game, player_id)
+
+
+class SearchNode:
+    """Node of the search tree.
+
+    ``value`` is the total reward of the player who ran the action of the node.
+    ``avails`` is the number of times that this node is available (legal) when its parent is visited.
+    """
+
+    __slots__ = ('parent', 'key', 'player_id', 'children', 'visits', 'avails', 'value')
+
+    def __init__(self, parent=None, key=None, player_id=None):
+        self.parent = parent
+        self.key = key
+        self.player_id = player_id
+        self.children = {}
+        self.visits = 0
+        self.avails = 1
+        self.value = 0.0
+
+    def __repr__(self):
+        return 'SearchNode(key={}, visits={}, value={:.2f})'.format(self.key, self.visits, self.value)
+
+    def ucb(self, exploration):
+        return self.value / self.visits + exploration * math.sqrt(math.log(self.avails) / self.visits)
+
+    def size(self):
+        return 1 + sum(child.size() for child in self.children.values())
+
+
+def _node_weight(node):
+    return node.visits
+
+
+@register_agent
+class MCTSAgent(Agent):
+    """The Monte Carlo Tree Search agent.
+
+    :param time_budget: Time budget (in seconds) of each move.
+    :param max_iterations: Max number of iterations of each move.
+    :param transpositions: Size of the transposition table, 0 means no transpositions.
+    :param seed: Random seed of the search.
+    """
+
+    def __init__(self, game, player_id, **kwargs):
+        super().__init__(game, player_id)
+        mcts_c = C.AI.MCTS
+        self.time_budget = kwargs.pop('time_budget', mcts_c.TimeBudget)
+        self.max_iterations = kwargs.pop('max_iterations', mcts_c.MaxIterations)
+        self.exploration = kwargs.pop('exploration', mcts_c.Exploration)
+        self.widening_c = kwargs.pop('widening_c', mcts_c.WideningC)
+        self.widening_alpha = kwargs.pop('widening_alpha', mcts_c.WideningAlpha)
+        self.rollout_turns = kwargs.pop('rollout_turns', mcts_c.RolloutTurns)
+        self.rollout_actions = kwargs.pop('rollout_actions', mcts_c.RolloutActions)
+        self.transposition_size = kwargs.pop('transpositions', mcts_c.Transpositions)
+        self.random = random.Random(kwargs.pop('seed', None))
+
+        self.transpositions = None
+        if self.transposition_size > 0:
+            self.transpositions = TranspositionTable(self.transposition_size, weight=_node_weight)
+
+        # The reused subtree of the last chosen action, and the turn of it.
+        self._root = None
+        self._root_turn = None
+
+        # Statistics of the last search.
+        self.stats = {}
+
+    get_replace_card = get_cost_ge_5
+
+    def get_player_action(self):
+        game = self.game
+
+        if self._root is not None and self._root_turn == game.n_turns and game.current_player == self.player_id:
+            root = self._root
+            root.parent = None
+        else:
+            root = SearchNode()
+        reused = root.visits
+        if self.transpositions is not None:
+            self.transpositions.new_generation()
+
+        start_time = time.perf_counter()
+        iterations = self.search(root)
+        return self._choose(root, iterations, time.perf_counter() - start_time, reused=reused)
+
+    def search(self, root, time_budget=None, max_iterations=None):
+        """Run search iterations from the root, until the time budget or the iteration budget is used up.
+
+        :return: Number of iterations.
+        """
+        deadline = time.perf_counter() + (self.time_budget if time_budget is None else time_budget)
+        max_iterations = self.max_iterations if max_iterations is None else max_iterations
+        iterations = 0
+        while iterations < max_iterations and time.perf_counter() < deadline:
+            game, path = self._select(root)
+            self._backup(path, self.rollout(game))
+            iterations += 1
+        return iterations
+
+    def _choose(self, root, iterations, elapsed, reused=0):
+        """Choose the most visited child of the root that is legal in the real game, and update statistics."""
+        game = self.game
+        actions = {action_key(action): action for action in game.get_legal_actions()}
+        # [NOTE]: Use keys of the root, since a transposition node may be shared by different actions.
+        candidates = [(key, child) for key, child in root.children.items() if key in actions]
+        if candidates:
+            key, best = max(candidates, key=lambda item: item[1].visits)
+            action = actions[key]
+        else:
+            best, action = None, pa.TurnEnd(game, self.player_id)
+
+        if best is None or isinstance(action, pa.TurnEnd):
+            self._root = self._root_turn = None
+        else:
+            self._root, self._root_turn = best, game.n_turns
+
+        self.stats = {
+            'iterations': iterations,
+            'time': elapsed,
+            'iterations_per_second': iterations / elapsed if elapsed > 0 else 0.0,
+            'reused_visits': reused,
+            'visits': 0 if best is None else best.visits,
+            'win_rate': 0.0 if best is None else best.value / best.visits,
+            'transposition_hits': 0 if self.transpositions is None else self.transpositions.hits,
+        }
+        info('{} choose {}: {iterations} iterations in {time:.3f}s ({iterations_per_second:.1f}/s), '
+             'reused {reused_visits} visits, win rate {win_rate:.3f}'.format(self, action, **self.stats))
+        return action
+
+    def __repr__(self):
+        return '{}(player_id={})'.format(self.__class__.__name__, self.player_id)
+
+    def _determinise(self, game):
+        """Sample the hidden information of the game randomly."""
+        rng = self.random
+        game.random = random.Random(rng.random())
+
+        rng.shuffle(game.get_player(self.player_id).deck)
+
+        opponent = game.get_player(1 - self.player_id)
+        n_hand = len(opponent.hand)
+        pool = opponent.hand + opponent.deck
+        rng.shuffle(pool)
+        opponent.hand, opponent.deck = pool[:n_hand], pool[n_hand:]
+        for zone, cards in ((Zone.Hand, opponent.hand), (Zone.Deck, opponent.deck)):
+            for card in cards:
+                if card.zone != zone:
+                    card.zone = zone
+        game.invalidate_legal_actions()
+        return game
+
+    def _allowed_actions(self, actions, visits):
+        n_variants = max(1, math.ceil(self.widening_c * visits ** self.widening_alpha))
+        return [action for action, rank in zip(actions, rank_actions(actions)) if rank < n_variants]
+
+    def _select(self, root):
+        """Selection and expansion in a new determinisation.
+
+        Visit counts of nodes in the path are increased here, values are added by ``_backup``,
+        so pending paths (leaf parallelisation, see ``parallel``) are treated as losses (virtual loss).
+
+        :return: The game at the leaf and the path of nodes.
+        """
+        game = self._determinise(clone_game(self.game))
+        node = root
+        path = [root]
+
+        while game.running:
+            actions = {}
+            for action in self._allowed_actions(game.get_legal_actions(), node.visits):
+                actions.setdefault(action_key(action), action)
+
+            children = []
+            untried = None
+            for key in actions:
+                child = node.children.get(key)
+                if child is None:
+                    if untried is None:
+                        untried = key
+                else:
+                    child.avails += 1
+                    children.append(child)
+
+            if untried is not None:
+                player_id = game.current_player
+                game.run_player_action(actions[untried])
+                child = self._find_transposition(game, player_id, path)
+                if child is None:
+                    child = node.children[untried] = SearchNode(node, untried, player_id)
+                    self._store_transposition(game, child)
+                    path.append(child)
+                    break
+
+                # Transposition, continue the selection from the shared node.
+                node = node.children[untried] = child
+                path.append(node)
+                continue
+
+            node = max(children, key=lambda c: c.ucb(self.exploration))
+            game.run_player_action(actions[node.key])
+            path.append(node)
+
+        for node in path:
+            node.visits += 1
+        return game, path
+
+    def _find_transposition(self, game, player_id, path):
+        """Find the node of the same information set in the transposition table."""
+        if self.transpositions is None or not game.running:
+            return None
+        node = self.transpositions.get(observer_hash(game, self.player_id))
+        # [NOTE]: Nodes in the path are not shared, so the tree is acyclic.
+        if node is None or node.player_id != player_id or any(node is n for n in path):
+            return None
+        return node
+
+    def _store_transposition(self, game, node):
+        if self.transpositions is not None and game.running:
+            self.transpositions.put(observer_hash(game, self.player_id), node)
+
+    def _backup(self, path, reward):
+        for node in path:
+            node.value += reward if node.player_id == self.player_id else 1.0 - reward
+
+    def rollout(self, game):
+        """Play the game with the default policy for some turns, then evaluate it."""
+        rng = self.random
+        end_turn = game.n_turns + self.rollout_turns
+        n_actions = 0
+        while game.running and game.n_turns < end_turn:
+            if n_actions >= self.rollout_actions:
+                action = pa.TurnEnd(game, game.current_player)
+            else:
+                action = default_policy(game, rng)
+            n_actions = 0 if isinstance(action, pa.TurnEnd) else n_actions + 1
+            game.run_player_action(action)
+        return evaluate(game, self.player_id)
+
+
+__all__ = [
+    'dump_game',
+    'load_game',
+    'clone_game',
+    'rank_actions',
+    'evaluate',
+    'default_policy',
+    'SearchNode',
+    'MCTSAgent',
+]
@@ -0,0 +1,193 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Parallel search of the MCTS agent (see ``mcts``) across a process pool.
+
+Python threads cannot speed up the search because of the GIL, so the search runs in worker processes:
+
+    1. Root parallelisation ("root"): each worker builds an independent tree from the same game state
+        (with different random seeds), visit counts and values of root children are merged by the master.
+    2. Leaf parallelisation ("leaf"): the master builds one tree, selects a batch of leaves (pending leaves are
+        treated as losses, so the batch contains different leaves), then rollouts of the batch are run by workers.
+
+Games are sent to workers by ``mcts.dump_game``. Workers load packages once when they start, and pools are shared
+by all agents and reused across moves (see ``get_search_pool``).
+
+Run ``test/benchmark_search.py`` to measure the scaling.
+"""
+
+import atexit
+import math
+import multiprocessing
+import os
+import time
+
+from .agent import register_agent
+from .mcts import MCTSAgent, SearchNode, dump_game, load_game
+from ..utils.constants import C
+from ..utils.package_io import reload_packages
+
+__author__ = 'fyabc'
+
+
+def _init_worker():
+    """Load packages when the worker starts."""
+    reload_packages()
+
+
+def _search_tree(data, player_id, seed, options):
+    """Task of root parallelisation: build an independent tree.
+
+    :return: Number of iterations, and statistics (visits, value) of root children.
+    """
+    agent = MCTSAgent(load_game(data), player_id, seed=seed, **options)
+    root = SearchNode()
+    iterations = agent.search(root)
+    return iterations, {key: (child.visits, child.value) for key, child in root.children.items()}
+
+
+def _run_rollouts(tasks, player_id, options):
+    """Task of leaf parallelisation: run rollouts of a chunk of leaves.
+
+    :param tasks: List of (dumped game, seed).
+    :return: List of rewards.
+    """
+    rewards = []
+    for data, seed in tasks:
+        game = load_game(data)
+        rewards.append(MCTSAgent(game, player_id, seed=seed, **options).rollout(game))
+    return rewards
+
+
+class SearchPool:
+    """The pool of search worker processes.
+
+    :param n_workers: Number of worker processes, 0 means the number of CPUs.
+    """
+
+    def __init__(self, n_workers):
+        self.n_workers = n_workers
+        self._pool = multiprocessing.get_context().Pool(n_workers, initializer=_init_worker)
+
+    def __repr__(self):
+        return 'SearchPool(n_workers={})'.format(self.n_workers)
+
+    def starmap(self, fn, args_list):
+        return self._pool.starmap(fn, args_list)
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+# Shared pools, key: number of workers.
+_Pools = {}
+
+
+def get_search_pool(n_workers=None):
+    """Get the shared search pool with the given number of workers (default to ``C.AI.MCTS.Workers``)."""
+    if n_workers is None:
+        n_workers = C.AI.MCTS.Workers
+    if n_workers <= 0:
+        n_workers = os.cpu_count() or 1
+    pool = _Pools.get(n_workers)
+    if pool is None:
+        pool = _Pools[n_workers] = SearchPool(n_workers)
+    return pool
+
+
+@atexit.register
+def close_search_pools():
+    for pool in _Pools.values():
+        pool.close()
+    _Pools.clear()
+
+
+@register_agent
+class ParallelMCTSAgent(MCTSAgent):
+    """The MCTS agent that searches in a process pool.
+
+    :param mode: 'root' or 'leaf', see the module docstring.
+    :param n_workers: Number of worker processes.
+    :param batch_size: Number of leaves in each batch of the leaf parallelisation.
+    """
+
+    Modes = ('root', 'leaf')
+
+    def __init__(self, game, player_id, **kwargs):
+        mcts_c = C.AI.MCTS
+        self.mode = kwargs.pop('mode', mcts_c.ParallelMode)
+        if self.mode not in self.Modes:
+            raise ValueError('Unknown parallel mode {!r}'.format(self.mode))
+        self.batch_size = kwargs.pop('batch_size', mcts_c.LeafBatchSize)
+        self.pool = get_search_pool(kwargs.pop('n_workers', None))
+        super().__init__(game, player_id, **kwargs)
+
+    def _worker_options(self):
+        return {
+            'exploration': self.exploration,
+            'widening_c': self.widening_c,
+            'widening_alpha': self.widening_alpha,
+            'rollout_turns': self.rollout_turns,
+            'rollout_actions': self.rollout_actions,
+            'transpositions': self.transposition_size,
+        }
+
+    def search(self, root, time_budget=None, max_iterations=None):
+        if time_budget is None:
+            time_budget = self.time_budget
+        if max_iterations is None:
+            max_iterations = self.max_iterations
+        if self.mode == 'root':
+            return self._search_root(root, time_budget, max_iterations)
+        return self._search_leaf(root, time_budget, max_iterations)
+
+    def _search_root(self, root, time_budget, max_iterations):
+        n_workers = self.pool.n_workers
+        data = dump_game(self.game)
+        options = dict(self._worker_options(), time_budget=time_budget,
+                       max_iterations=math.ceil(max_iterations / n_workers))
+        results = self.pool.starmap(_search_tree, [
+            (data, self.player_id, self.random.getrandbits(32), options) for _ in range(n_workers)])
+
+        iterations = 0
+        for n, children in results:
+            iterations += n
+            root.visits += n
+            for key, (visits, value) in children.items():
+                child = root.children.get(key)
+                if child is None:
+                    child = root.children[key] = SearchNode(root, key, self.player_id)
+                child.visits += visits
+                child.value += value
+        return iterations
+
+    def _search_leaf(self, root, time_budget, max_iterations):
+        n_workers = self.pool.n_workers
+        options = self._worker_options()
+        deadline = time.perf_counter() + time_budget
+        iterations = 0
+        while iterations < max_iterations and time.perf_counter() < deadline:
+            batch = []
+            for _ in range(min(self.batch_size, max_iterations - iterations)):
+                game, path = self._select(root)
+                batch.append((path, dump_game(game), self.random.getrandbits(32)))
+
+            chunk_size = math.ceil(len(batch) / n_workers)
+            chunks = [[(data, seed) for _, data, seed in batch[i:i + chunk_size]]
+                      for i in range(0, len(batch), chunk_size)]
+            rewards = [reward for chunk in self.pool.starmap(
+                _run_rollouts, [(chunk, self.player_id, options) for chunk in chunks]) for reward in chunk]
+
+            for (path, _, _), reward in zip(batch, rewards):
+                self._backup(path, reward)
+            iterations += len(batch)
+        return iterations
+
+
+__all__ = [
+    'SearchPool',
+    'get_search_pool',
+    'close_search_pools',
+    'ParallelMCTSAgent',
+]
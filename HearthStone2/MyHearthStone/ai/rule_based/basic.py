@@ -4,7 +4,7 @@
 from .components import *
 from ..agent import Agent, register_agent
 from ...game import player_action as pa
-from ...utils.game import Type
+from ...utils.game import Type, Zone
 
 __author__ = 'fyabc'
 
@@ -22,9 +22,9 @@ class DefaultAgent(Agent):
 class PlayNoTarget(Agent):
     """This agent will play all available cards in hand which have no target, from left to right."""
     def get_player_action(self):
-        for card in self.hand:
-            if not card.have_target and card.can_do_action():
-                return make_pa_no_target(self, card)
+        action = get_no_target_play(self)
+        if action is not None:
+            return action
         # If no available card, just end the turn.
         return pa.TurnEnd(self.game)
 
@@ -34,15 +34,10 @@ class PlayNoTarget(Agent):
 @register_agent
 class BaseAgent(Agent):
     def get_player_action(self):
-        # Play hand.
-        for card in self.hand:
-            if not card.have_target and card.can_do_action():
-                return make_pa_no_target(self, card)
-
-        # Use hero power.
-        hp = self.player.hero_power
-        if not hp.have_target and hp.can_do_action():
-            return pa.UseHeroPower(self.game, None, self.player_id)
+        # Play hand, then use hero power.
+        action = get_no_target_play(self, zones=(Zone.Hand, Zone.HeroPower))
+        if action is not None:
+            return action
 
         # If no available card, just end the turn.
         return pa.TurnEnd(self.game)
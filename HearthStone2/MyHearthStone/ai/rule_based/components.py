@@ -4,7 +4,7 @@
 """Components of rule-based AI agents."""
 
 from ...game import player_action as pa
-from ...utils.game import Type
+from ...utils.game import Type, Zone
 
 __author__ = 'fyabc'
 
@@ -23,11 +23,26 @@ def make_pa_no_target(self, card):
         return pa.TurnEnd(self.game)
 
 
+def get_no_target_play(agent, zones=(Zone.Hand,)):
+    """Get the first legal play action without target, whose source is in the given zones.
+
+    Actions are searched in the order of ``Game.get_legal_actions`` (cards in hand from left to right,
+    then the hero power), minions are played to the rightmost position.
+
+    :return: The player action, or None if not found.
+    """
+    for action in agent.game.get_legal_actions():
+        if isinstance(action, pa.Play) and action.target is None and action.source.zone in zones:
+            return action
+    return None
+
+
 def get_cost_ge_5(agent):
     return [i for i, c in enumerate(agent.hand) if c.cost >= 5]
 
 
 __all__ = [
     'make_pa_no_target',
+    'get_no_target_play',
     'get_cost_ge_5',
 ]
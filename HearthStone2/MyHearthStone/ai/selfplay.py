@@ -0,0 +1,394 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Self-play data pipeline: play games between agents in worker processes, and write sharded datasets.
+
+Each position (the state before an action of the current player) is a row of the dataset, with fields
+(see ``Fields``)::
+
+    entities, card_ids, globals:    features of the state from the view of the current player (see ``features``).
+    actions:    int32 [5], the chosen action (see ``ActionFields`` and ``encode_action``).
+    outcomes:   float32, the final result from the view of the current player: 1 win, -1 lose, 0 draw.
+    meta:       int32 [4], (game id, turn, player id, step in the game).
+
+Layout of the output directory::
+
+    worker-<k>-<i>.<field>.npy      Shard i of worker k, one ``.npy`` file (memory-mapped) for each field.
+                                    All shards have ``shard_size`` rows, only the first ``n_rows`` of the last
+                                    shard of each worker are used.
+    worker-<k>.index.json           Index of shards of worker k, rewritten when each shard is finished.
+    manifest.json                   Written at the end: the feature layout, all shards and statistics.
+
+Use ``SelfPlayDataset`` to read the dataset (shards are memory-mapped, not loaded into memory).
+Run ``test/run_selfplay.py`` to generate a dataset from the command line.
+
+[NOTE]: This module requires NumPy (``pip install MyHearthStone[learning]``).
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+from . import features
+from .standard import get_agent_by_name
+from ..game import player_action as pa
+from ..game.core import Game
+from ..game.default_data import PracticeDecks
+from ..game.game_entity import GameEntity
+from ..utils.constants import C
+from ..utils.game import DefaultClassHeroMap
+from ..utils.message import info, warning
+from ..utils.package_io import all_heroes, reload_packages
+
+__author__ = 'fyabc'
+
+ManifestVersion = 1
+
+ActionTypes = ('TurnEnd', 'PlayMinion', 'PlaySpell', 'PlayWeapon', 'UseHeroPower', 'ToAttack', 'Concede')
+_ActionTypeIndices = {name: i for i, name in enumerate(ActionTypes)}
+
+# Slots are features slots (see ``features.entity_slot``), choices are card embedding indices, missing values are -1.
+ActionFields = ('type', 'source', 'target', 'position', 'choice')
+
+# (name, dtype, shape of each row)
+Fields = (
+    ('entities', 'float32', (features.NumSlots, features.NumEntityFeatures)),
+    ('card_ids', 'int32', (features.NumSlots,)),
+    ('globals', 'float32', (features.NumGlobalFeatures,)),
+    ('actions', 'int32', (len(ActionFields),)),
+    ('outcomes', 'float32', ()),
+    ('meta', 'int32', (4,)),
+)
+
+
+def encode_action(action, game, player_id, vocabulary):
+    """Encode the player action into a row of ``ActionFields``."""
+    source = target = None
+    position = choice = -1
+    if isinstance(action, pa.ToAttack):
+        source, target = action.attacker, action.defender
+    elif isinstance(action, pa.Play):
+        source, target = action.source, action.target
+        if isinstance(action, pa.PlayMinion):
+            position = action.loc
+        for key, value in action.po_data.items():
+            if key.startswith('choice.') and not key.endswith('.all'):
+                if isinstance(value, GameEntity):
+                    choice = vocabulary.index(value)
+                else:
+                    choice = vocabulary.index_of_id(value)
+    return (
+        _ActionTypeIndices.get(action.__class__.__name__, -1),
+        -1 if source is None else features.entity_slot(game, player_id, source),
+        -1 if target is None else features.entity_slot(game, player_id, target),
+        position,
+        choice,
+    )
+
+
+def valid_classes():
+    """Get classes of practice decks that have heroes."""
+    heroes = all_heroes()
+    return sorted(k for k in PracticeDecks['Normal'] if DefaultClassHeroMap.get(k) in heroes)
+
+
+class PositionBuffer:
+    """Growable buffers of positions of one game, reused between games."""
+
+    def __init__(self, capacity=256):
+        self.n_rows = 0
+        self.arrays = {name: np.zeros((capacity,) + shape, dtype=dtype) for name, dtype, shape in Fields}
+
+    def features(self):
+        """Get the ``features.Features`` view of buffers, grow them if full."""
+        capacity = len(self.arrays['outcomes'])
+        if self.n_rows == capacity:
+            for name, array in self.arrays.items():
+                new_array = np.zeros((2 * capacity,) + array.shape[1:], dtype=array.dtype)
+                new_array[:capacity] = array
+                self.arrays[name] = new_array
+        return features.Features(self.arrays['entities'], self.arrays['card_ids'], self.arrays['globals'])
+
+
+class ShardWriter:
+    """Write rows into fixed-size memory-mapped shards.
+
+    :param directory: The output directory.
+    :param prefix: Prefix of shard files.
+    :param shard_size: Number of rows of each shard.
+    """
+
+    def __init__(self, directory, prefix, shard_size):
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+
+        # Finished shards: list of {'name': ..., 'n_rows': ...}.
+        self.shards = []
+        self._arrays = None
+        self._n_rows = 0
+
+    @property
+    def n_rows(self):
+        return sum(shard['n_rows'] for shard in self.shards) + self._n_rows
+
+    def _open(self):
+        name = '{}-{}'.format(self.prefix, len(self.shards))
+        self._arrays = {
+            field: np.lib.format.open_memmap(
+                os.path.join(self.directory, '{}.{}.npy'.format(name, field)),
+                mode='w+', dtype=dtype, shape=(self.shard_size,) + shape)
+            for field, dtype, shape in Fields
+        }
+        self._n_rows = 0
+        self.shards.append({'name': name, 'n_rows': 0})
+
+    def _finish(self):
+        for array in self._arrays.values():
+            array.flush()
+        self.shards[-1]['n_rows'] = self._n_rows
+        self._arrays = None
+        self._n_rows = 0
+        with open(os.path.join(self.directory, '{}.index.json'.format(self.prefix)), 'w') as f:
+            json.dump({'shard_size': self.shard_size, 'shards': self.shards}, f, indent=2)
+
+    def write(self, arrays, n_rows):
+        """Write the first n rows of arrays (dict of field name to array)."""
+        start = 0
+        while start < n_rows:
+            if self._arrays is None:
+                self._open()
+            n = min(n_rows - start, self.shard_size - self._n_rows)
+            for field, array in self._arrays.items():
+                array[self._n_rows:self._n_rows + n] = arrays[field][start:start + n]
+            self._n_rows += n
+            start += n
+            if self._n_rows == self.shard_size:
+                self._finish()
+
+    def close(self):
+        if self._arrays is not None:
+            self._finish()
+
+
+def play_game(game_id, agents, featuriser, buffer, seed=None, agent_kwargs=None, classes=None):
+    """Play a game between agents, record positions into the buffer.
+
+    :param agents: Names of agents of player 0 and 1.
+    :param featuriser: The ``features.Featuriser``.
+    :param buffer: The ``PositionBuffer``, positions of the game are written into ``buffer.arrays[:buffer.n_rows]``.
+    :return: The game.
+    """
+    rng = random.Random(seed)
+    classes = valid_classes() if classes is None else classes
+    agent_kwargs = agent_kwargs or [{}, {}]
+
+    game = Game()
+    game.start_game([PracticeDecks['Normal'][rng.choice(classes)] for _ in range(2)], seed=rng.getrandbits(32))
+    players = [get_agent_by_name(name)(game, player_id, **kwargs)
+               for player_id, (name, kwargs) in enumerate(zip(agents, agent_kwargs))]
+    for player in players:
+        game.run_player_action(pa.ReplaceStartCard(game, player.player_id, player.get_replace_card()))
+
+    buffer.n_rows = 0
+    step = 0
+    while game.running:
+        player_id = game.current_player
+        out = buffer.features()
+        arrays = buffer.arrays
+        featuriser.encode(game, player_id, out=out, index=buffer.n_rows)
+        action = players[player_id].get_player_action()
+        arrays['actions'][buffer.n_rows] = encode_action(action, game, player_id, featuriser.vocabulary)
+        arrays['meta'][buffer.n_rows] = (game_id, game.n_turns, player_id, step)
+        buffer.n_rows += 1
+        step += 1
+        game.run_player_action(action)
+
+    result = game.game_result
+    arrays = buffer.arrays
+    player_ids = arrays['meta'][:buffer.n_rows, 2]
+    if result == Game.ResultDraw:
+        arrays['outcomes'][:buffer.n_rows] = 0.0
+    else:
+        winner = 0 if result == Game.ResultWin0 else 1
+        arrays['outcomes'][:buffer.n_rows] = np.where(player_ids == winner, 1.0, -1.0)
+    return game
+
+
+def _init_worker():
+    reload_packages()
+
+
+def _run_worker(directory, worker_id, game_ids, options):
+    """Task of a worker process: play games and write shards.
+
+    :return: Index of the worker.
+    """
+    featuriser = features.Featuriser()
+    buffer = PositionBuffer()
+    writer = ShardWriter(directory, 'worker-{}'.format(worker_id), options['shard_size'])
+    classes = valid_classes()
+    n_games, n_failed = 0, 0
+    start_time = time.perf_counter()
+    for game_id in game_ids:
+        try:
+            play_game(game_id, options['agents'], featuriser, buffer, seed=options['seed'] * 1000003 + game_id,
+                      agent_kwargs=options['agent_kwargs'], classes=classes)
+        except Exception as e:
+            # Skip games that crash the engine, do not lose the whole shard.
+            warning('Game {} failed: {!r}'.format(game_id, e))
+            n_failed += 1
+            continue
+        writer.write(buffer.arrays, buffer.n_rows)
+        n_games += 1
+    writer.close()
+    return {
+        'worker_id': worker_id,
+        'shards': writer.shards,
+        'games': n_games,
+        'failed_games': n_failed,
+        'positions': writer.n_rows,
+        'time': time.perf_counter() - start_time,
+    }
+
+
+def run_selfplay(directory, n_games, **kwargs):
+    """Run the self-play pipeline.
+
+    :param directory: The output directory (created if not exists).
+    :param n_games: Number of games.
+    :param kwargs:
+        :keyword agents: Names of agents of player 0 and 1 (agents from ``ai.standard``).
+        :keyword agent_kwargs: Keyword arguments of agents of player 0 and 1.
+        :keyword n_workers: Number of worker processes, 0 means the number of CPUs.
+        :keyword shard_size: Number of positions of each shard.
+        :keyword seed: Random seed of the pipeline (decks and seeds of games).
+    :return: The manifest.
+    :rtype: dict
+    """
+    sp_c = C.AI.SelfPlay
+    agents = list(kwargs.pop('agents', sp_c.Agents))
+    n_workers = kwargs.pop('n_workers', sp_c.Workers)
+    if n_workers <= 0:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, n_games))
+    options = {
+        'agents': agents,
+        'agent_kwargs': kwargs.pop('agent_kwargs', None) or [{}, {}],
+        'shard_size': kwargs.pop('shard_size', sp_c.ShardSize),
+        'seed': kwargs.pop('seed', 0),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    start_time = time.perf_counter()
+    with multiprocessing.get_context().Pool(n_workers, initializer=_init_worker) as pool:
+        results = pool.starmap(_run_worker, [
+            (directory, worker_id, list(range(worker_id, n_games, n_workers)), options)
+            for worker_id in range(n_workers)])
+    elapsed = time.perf_counter() - start_time
+
+    n_positions = sum(result['positions'] for result in results)
+    manifest = {
+        'version': ManifestVersion,
+        'fields': [[name, dtype, list(shape)] for name, dtype, shape in Fields],
+        'entity_features': list(features.EntityFeatures),
+        'global_features': list(features.GlobalFeatures),
+        'slots': [[owner, zone, n] for owner, zone, n in features.Slots],
+        'vocabulary_size': len(features.CardVocabulary()),
+        'action_types': list(ActionTypes),
+        'action_fields': list(ActionFields),
+        'shard_size': options['shard_size'],
+        'shards': [shard for result in results for shard in result['shards'] if shard['n_rows'] > 0],
+        'options': options,
+        'statistics': {
+            'games': sum(result['games'] for result in results),
+            'failed_games': sum(result['failed_games'] for result in results),
+            'positions': n_positions,
+            'workers': n_workers,
+            'time': elapsed,
+            'positions_per_hour': n_positions / elapsed * 3600 if elapsed > 0 else 0.0,
+        },
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    info('Self-play: {games} games ({failed_games} failed), {positions} positions in {time:.1f}s '
+         '({positions_per_hour:.0f} positions per hour)'.format(**manifest['statistics']))
+    return manifest
+
+
+class SelfPlayDataset:
+    """Read a self-play dataset written by ``run_selfplay``.
+
+    Shards are memory-mapped, so only accessed rows are read from disk.
+
+    :param directory: The dataset directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest['version'] != ManifestVersion:
+            raise ValueError('Unsupported manifest version {}'.format(self.manifest['version']))
+        self.fields = [name for name, _, _ in self.manifest['fields']]
+        self.shards = self.manifest['shards']
+
+    def __len__(self):
+        return sum(shard['n_rows'] for shard in self.shards)
+
+    def __repr__(self):
+        return 'SelfPlayDataset({!r}, shards={}, positions={})'.format(self.directory, len(self.shards), len(self))
+
+    def load_shard(self, i, fields=None, mmap=True):
+        """Load the shard.
+
+        :param fields: Names of fields to load, default to all fields.
+        :param mmap: Memory-map the shard (default), or load it into memory.
+        :return: Dict of field name to array (only the used rows).
+        """
+        shard = self.shards[i]
+        return {
+            field: np.load(os.path.join(self.directory, '{}.{}.npy'.format(shard['name'], field)),
+                           mmap_mode='r' if mmap else None)[:shard['n_rows']]
+            for field in (self.fields if fields is None else fields)
+        }
+
+    def iter_batches(self, batch_size, fields=None, shuffle=False, seed=None):
+        """Stream batches of positions.
+
+        Batches do not cross shards, so the last batch of each shard may be smaller.
+        If shuffle, shards are visited in random order, and positions are shuffled in each shard.
+
+        :return: Iterator of dicts of field name to array.
+        """
+        rng = np.random.RandomState(seed)
+        order = rng.permutation(len(self.shards)) if shuffle else range(len(self.shards))
+        for i in order:
+            arrays = self.load_shard(i, fields=fields)
+            n_rows = self.shards[i]['n_rows']
+            indices = rng.permutation(n_rows) if shuffle else None
+            for start in range(0, n_rows, batch_size):
+                if indices is None:
+                    yield {field: np.asarray(array[start:start + batch_size]) for field, array in arrays.items()}
+                else:
+                    # Sorted indices read memory-mapped pages sequentially.
+                    batch = np.sort(indices[start:start + batch_size])
+                    yield {field: array[batch] for field, array in arrays.items()}
+
+
+__all__ = [
+    'ActionTypes',
+    'ActionFields',
+    'Fields',
+    'encode_action',
+    'valid_classes',
+    'PositionBuffer',
+    'ShardWriter',
+    'play_game',
+    'run_selfplay',
+    'SelfPlayDataset',
+]
@@ -5,6 +5,7 @@ from . import agent
 
 # Import them to register agents.
 from .rule_based import basic
+from . import mcts, parallel
 
 __author__ = 'fyabc'
 
@@ -0,0 +1,408 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Deck tournaments: play matchups of (deck, agent) entrants across worker processes, with a persistent result cache.
+
+Each game is identified by a ``GameKey``: (deck code of player 0, deck code of player 1, agent of player 0,
+agent of player 1, seed, engine version). Results are cached in a SQLite file (``ResultCache``), so rerunning a
+tournament only plays new matchups (e.g. after adding a deck into the pool, or after the engine version changes).
+
+Schedules:
+
+    round robin:    Each pair of entrants plays each seed in both seats.
+    swiss:          In each round, entrants are sorted by scores and paired with the next entrant not played yet
+                    (if possible), the last entrant gets a bye (scores 1) if the number of entrants is odd.
+                    Each pairing plays each seed in both seats.
+
+Outputs are the win-rate matrix and Elo ratings of entrants (see ``TournamentResult``).
+Run ``test/run_tournament.py`` to run a tournament from the command line.
+"""
+
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from .standard import get_agent_by_name
+from ..game import player_action as pa
+from ..game.core import Game
+from ..game.deck import Deck
+from ..game.default_data import PracticeDecks
+from ..utils.constants import C, UserDataPath
+from ..utils.game import DefaultClassHeroMap, Klass
+from ..utils.message import info, warning
+from ..utils.package_io import all_heroes, reload_packages
+
+__author__ = 'fyabc'
+
+Entrant = namedtuple('Entrant', ['name', 'deck_code', 'agent'])
+
+GameKey = namedtuple('GameKey', ['deck0', 'deck1', 'agent0', 'agent1', 'seed', 'version'])
+
+# Result of a game: (score of player 0 (1 win, 0 lose, 0.5 draw), number of turns).
+GameResult = namedtuple('GameResult', ['score', 'n_turns'])
+
+
+def canonical_code(deck_code):
+    """Get the canonical code of a deck code (comment lines removed), used in cache keys.
+
+    :raise ValueError: If the deck code is invalid.
+    """
+    deck = Deck.from_code(deck_code)
+    if deck is None:
+        raise ValueError('Invalid deck code {!r}'.format(deck_code))
+    return deck.to_code(comment=False)
+
+
+def practice_entrants(agents=('BaseAgent',)):
+    """Get entrants of practice decks (of classes that have heroes) and agents."""
+    heroes = all_heroes()
+    return [
+        Entrant('{}-{}'.format(Klass.Idx2Str[klass], agent), deck.to_code(comment=False), agent)
+        for agent in agents
+        for klass, deck in sorted(PracticeDecks['Normal'].items())
+        if DefaultClassHeroMap.get(klass) in heroes
+    ]
+
+
+class ResultCache:
+    """The SQLite cache of game results.
+
+    :param path: Path of the SQLite file, ``':memory:'`` for an in-memory cache.
+    """
+
+    _Schema = '''
+        CREATE TABLE IF NOT EXISTS results (
+            deck0 TEXT NOT NULL,
+            deck1 TEXT NOT NULL,
+            agent0 TEXT NOT NULL,
+            agent1 TEXT NOT NULL,
+            seed INTEGER NOT NULL,
+            version TEXT NOT NULL,
+            score REAL NOT NULL,
+            n_turns INTEGER NOT NULL,
+            time REAL NOT NULL,
+            PRIMARY KEY (deck0, deck1, agent0, agent1, seed, version)
+        )'''
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(self._Schema)
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, key):
+        row = self._conn.execute(
+            'SELECT score, n_turns FROM results WHERE deck0=? AND deck1=? AND agent0=? AND agent1=? AND seed=? '
+            'AND version=?', key).fetchone()
+        return None if row is None else GameResult(*row)
+
+    def get_many(self, keys):
+        """Get cached results of keys.
+
+        :return: Dict of cached keys to results.
+        """
+        return {key: result for key, result in ((key, self.get(key)) for key in keys) if result is not None}
+
+    def put_many(self, items):
+        """Put results into the cache.
+
+        :param items: Iterable of (key, result, time).
+        """
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [tuple(key) + (result.score, result.n_turns, elapsed) for key, result, elapsed in items])
+
+
+def play_game(key):
+    """Play a game of the key.
+
+    :return: The result.
+    :rtype: GameResult
+    """
+    decks = [Deck.from_code(key.deck0), Deck.from_code(key.deck1)]
+    game = Game()
+    game.start_game(decks, mode=decks[0].mode, seed=key.seed)
+    agents = [get_agent_by_name(name)(game, player_id) for player_id, name in enumerate((key.agent0, key.agent1))]
+    for agent in agents:
+        game.run_player_action(pa.ReplaceStartCard(game, agent.player_id, agent.get_replace_card()))
+    while game.running:
+        game.run_player_action(agents[game.current_player].get_player_action())
+    return GameResult((game.game_result + 1) / 2, game.n_turns)
+
+
+def _init_worker():
+    reload_packages()
+
+
+def _run_game(key):
+    start_time = time.perf_counter()
+    try:
+        result = play_game(key)
+    except Exception as e:
+        return key, None, repr(e)
+    return key, result, time.perf_counter() - start_time
+
+
+class Tournament:
+    """The tournament of entrants.
+
+    :param entrants: List of ``Entrant``, names must be unique.
+    :param cache: The ``ResultCache`` or path of the SQLite file, default to C.AI.Tournament.Cache
+        (relative to the user data directory). None means no cache.
+    :param kwargs:
+        :keyword seeds: Number of seeds of each pairing in each seat.
+        :keyword n_workers: Number of worker processes, 0 means the number of CPUs.
+        :keyword version: Engine version in cache keys, default to C.Game.Version.
+    """
+
+    def __init__(self, entrants, cache='default', **kwargs):
+        names = [entrant.name for entrant in entrants]
+        if len(set(names)) != len(names):
+            raise ValueError('Names of entrants must be unique, got {}'.format(names))
+        t_c = C.AI.Tournament
+        self.entrants = [entrant._replace(deck_code=canonical_code(entrant.deck_code)) for entrant in entrants]
+        for entrant in self.entrants:
+            get_agent_by_name(entrant.agent)
+        self.n_seeds = kwargs.pop('seeds', t_c.Seeds)
+        self.n_workers = kwargs.pop('n_workers', t_c.Workers)
+        if self.n_workers <= 0:
+            self.n_workers = os.cpu_count() or 1
+        self.version = kwargs.pop('version', C.Game.Version)
+
+        if cache == 'default':
+            cache = os.path.join(UserDataPath, t_c.Cache)
+        # Caches opened from paths are closed with the tournament.
+        self._own_cache = isinstance(cache, str)
+        self.cache = ResultCache(cache) if self._own_cache else cache
+
+        # Results: list of (index of player 0, index of player 1, key, result).
+        self.games = []
+        self.byes = [0] * len(self.entrants)
+        self.statistics = {'cached': 0, 'played': 0, 'failed': 0, 'time': 0.0}
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._own_cache and self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def _pairing_keys(self, i, j):
+        a, b = self.entrants[i], self.entrants[j]
+        for seed in range(self.n_seeds):
+            yield i, j, GameKey(a.deck_code, b.deck_code, a.agent, b.agent, seed, self.version)
+            yield j, i, GameKey(b.deck_code, a.deck_code, b.agent, a.agent, seed, self.version)
+
+    def _play(self, pairings):
+        """Play games of pairings, cached games are not played again."""
+        scheduled = [item for i, j in pairings for item in self._pairing_keys(i, j)]
+        entrants = {key: (i, j) for i, j, key in scheduled}
+        keys = list(entrants)
+        results = self.cache.get_many(keys) if self.cache is not None else {}
+        self.statistics['cached'] += len(results)
+
+        new_keys = [key for key in keys if key not in results]
+        if new_keys:
+            start_time = time.perf_counter()
+            if self._pool is None:
+                self._pool = multiprocessing.get_context().Pool(self.n_workers, initializer=_init_worker)
+            new_items = []
+            for key, result, elapsed in self._pool.imap_unordered(_run_game, new_keys):
+                if result is None:
+                    i, j = entrants[key]
+                    warning('Game {} vs {} (seed {}) failed: {}'.format(
+                        self.entrants[i].name, self.entrants[j].name, key.seed, elapsed))
+                    self.statistics['failed'] += 1
+                    continue
+                results[key] = result
+                new_items.append((key, result, elapsed))
+            if self.cache is not None:
+                self.cache.put_many(new_items)
+            self.statistics['played'] += len(new_items)
+            self.statistics['time'] += time.perf_counter() - start_time
+
+        self.games.extend((i, j, key, results[key]) for i, j, key in scheduled if key in results)
+
+    def round_robin(self):
+        """Play the round robin tournament.
+
+        :rtype: TournamentResult
+        """
+        n = len(self.entrants)
+        self._play([(i, j) for i in range(n) for j in range(i + 1, n)])
+        return self.result()
+
+    def swiss(self, n_rounds):
+        """Play the swiss tournament.
+
+        :rtype: TournamentResult
+        """
+        n = len(self.entrants)
+        played = set()
+        for _ in range(n_rounds):
+            scores = self.result().scores()
+            order = sorted(range(n), key=lambda i: (-scores[i], i))
+            if n % 2 == 1:
+                # The lowest entrant without a bye gets the bye.
+                bye = min(reversed(order), key=lambda i: self.byes[i])
+                self.byes[bye] += 1
+                order.remove(bye)
+            pairings = []
+            while order:
+                i = order.pop(0)
+                j = next((j for j in order if frozenset((i, j)) not in played), order[0])
+                order.remove(j)
+                played.add(frozenset((i, j)))
+                pairings.append((i, j))
+            self._play(pairings)
+        return self.result()
+
+    def result(self):
+        return TournamentResult(self.entrants, self.games, self.byes, dict(self.statistics))
+
+
+class TournamentResult:
+    """Results of a tournament.
+
+    :param entrants: List of entrants.
+    :param games: List of (index of player 0, index of player 1, key, result).
+    :param byes: Number of byes of each entrant.
+    """
+
+    def __init__(self, entrants, games, byes=None, statistics=None):
+        self.entrants = entrants
+        self.games = games
+        self.byes = byes or [0] * len(entrants)
+        self.statistics = statistics or {}
+
+    def _score_matrix(self):
+        n = len(self.entrants)
+        scores = [[0.0] * n for _ in range(n)]
+        counts = [[0] * n for _ in range(n)]
+        for i, j, _, result in self.games:
+            scores[i][j] += result.score
+            scores[j][i] += 1.0 - result.score
+            counts[i][j] += 1
+            counts[j][i] += 1
+        return scores, counts
+
+    def scores(self):
+        """Get total scores of entrants (win 1, draw 0.5, bye 1)."""
+        scores, _ = self._score_matrix()
+        return [sum(row) + bye for row, bye in zip(scores, self.byes)]
+
+    def win_rates(self):
+        """Get the win-rate matrix: ``m[i][j]`` is the win rate (draws count half) of entrant i against j,
+        or None if they did not play.
+        """
+        scores, counts = self._score_matrix()
+        return [[s / c if c else None for s, c in zip(score_row, count_row)]
+                for score_row, count_row in zip(scores, counts)]
+
+    def elo(self, base=1500.0, n_iterations=200, tol=1e-6):
+        """Get Elo ratings of entrants.
+
+        Ratings are the maximum likelihood estimation of the Bradley-Terry model on the Elo scale, so they do not
+        depend on the order of games (cached results have no order). Each entrant plays a virtual draw against
+        an entrant of rating ``base`` as the prior, so ratings are finite if an entrant wins (or loses) all games.
+
+        :return: List of ratings.
+        """
+        scores, counts = self._score_matrix()
+        n = len(self.entrants)
+        # Strengths: 10 ** (rating / 400), the virtual entrant has strength 1.
+        strengths = [1.0] * n
+        for _ in range(n_iterations):
+            new_strengths = []
+            for i in range(n):
+                wins = sum(scores[i]) + 0.5
+                denominator = 1.0 / (strengths[i] + 1.0)
+                denominator += sum(counts[i][j] / (strengths[i] + strengths[j]) for j in range(n) if counts[i][j])
+                new_strengths.append(wins / denominator)
+            delta = max(abs(math.log(a / b)) for a, b in zip(new_strengths, strengths)) if n else 0.0
+            strengths = new_strengths
+            if delta < tol:
+                break
+        return [base + 400.0 * math.log10(s) for s in strengths]
+
+    def standings(self):
+        """Get standings, sorted by Elo ratings.
+
+        :return: List of (entrant, Elo rating, score, number of games).
+        """
+        ratings, scores = self.elo(), self.scores()
+        _, counts = self._score_matrix()
+        return sorted(
+            ((entrant, rating, score, sum(count_row))
+             for entrant, rating, score, count_row in zip(self.entrants, ratings, scores, counts)),
+            key=lambda item: -item[1])
+
+    def format(self):
+        """Format standings and the win-rate matrix as text."""
+        names = [entrant.name for entrant in self.entrants]
+        width = max([len(name) for name in names] + [6])
+        lines = ['{:<{w}} {:>7} {:>7} {:>6}'.format('Entrant', 'Elo', 'Score', 'Games', w=width)]
+        for entrant, rating, score, n_games in self.standings():
+            lines.append('{:<{w}} {:>7.1f} {:>7.1f} {:>6}'.format(entrant.name, rating, score, n_games, w=width))
+        lines.append('')
+        lines.append(' ' * width + ''.join(' {:>6}'.format(i) for i in range(len(names))))
+        for i, (name, row) in enumerate(zip(names, self.win_rates())):
+            lines.append('{:<{w}}'.format(name, w=width) + ''.join(
+                ' {:>6}'.format('-' if rate is None else '{:.2f}'.format(rate)) for rate in row) + '  ({})'.format(i))
+        return '\n'.join(lines)
+
+
+def run_tournament(entrants, mode='round_robin', n_rounds=None, **kwargs):
+    """Run a tournament.
+
+    :param entrants: List of ``Entrant``.
+    :param mode: 'round_robin' or 'swiss'.
+    :param n_rounds: Number of rounds of the swiss tournament, default to ``ceil(log2(number of entrants))``.
+    :param kwargs: Arguments of ``Tournament``.
+    :rtype: TournamentResult
+    """
+    with Tournament(entrants, **kwargs) as tournament:
+        if mode == 'round_robin':
+            result = tournament.round_robin()
+        elif mode == 'swiss':
+            if n_rounds is None:
+                n_rounds = max(1, math.ceil(math.log2(max(len(entrants), 2))))
+            result = tournament.swiss(n_rounds)
+        else:
+            raise ValueError('Unknown tournament mode {!r}'.format(mode))
+    info('Tournament: {played} games played, {cached} cached, {failed} failed in {time:.1f}s'.format(
+        **result.statistics))
+    return result
+
+
+__all__ = [
+    'Entrant',
+    'GameKey',
+    'GameResult',
+    'canonical_code',
+    'practice_entrants',
+    'ResultCache',
+    'play_game',
+    'Tournament',
+    'TournamentResult',
+    'run_tournament',
+]
@@ -0,0 +1,119 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Bounded transposition table of search agents.
+
+Keys are 64-bit state hashes (see ``game.zobrist``). The table has a fixed number of buckets, each bucket has two
+slots (the two-tier replacement policy of chess engines):
+
+    1. Slot 0 (weight-preferred): the new entry replaces the old one if the old one is of an old generation,
+        or the weight of the new one is not less than the weight of the old one. The replaced entry is moved to slot 1.
+    2. Slot 1 (always-replace): otherwise the new entry is put here.
+
+Weights are computed when entries are replaced (e.g. visit counts of search nodes, which grow after storing).
+Agents start a new generation for each move (``new_generation``), so entries of old moves are replaced first.
+"""
+
+__author__ = 'fyabc'
+
+
+class TranspositionTable:
+    """The bounded transposition table.
+
+    :param size: Max number of entries.
+    :param weight: Function to get the weight of a value, default to 0 (the newest entry is preferred).
+    """
+
+    def __init__(self, size, weight=None):
+        if size < 2:
+            raise ValueError('Transposition table size must be at least 2, got {}'.format(size))
+        self.n_buckets = size // 2
+        self.weight = weight
+        self.generation = 0
+
+        self._keys = [None] * (2 * self.n_buckets)
+        self._values = [None] * (2 * self.n_buckets)
+        self._generations = [0] * (2 * self.n_buckets)
+
+        # Statistics.
+        self.hits = 0
+        self.misses = 0
+        self.replaced = 0
+
+    def __repr__(self):
+        return 'TranspositionTable(size={}, entries={})'.format(2 * self.n_buckets, len(self))
+
+    def __len__(self):
+        return sum(key is not None for key in self._keys)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def _find(self, key):
+        i = 2 * (key % self.n_buckets)
+        keys = self._keys
+        if keys[i] == key:
+            return i
+        if keys[i + 1] == key:
+            return i + 1
+        return None
+
+    def _weight(self, value):
+        return 0 if self.weight is None else self.weight(value)
+
+    def get(self, key, default=None):
+        i = self._find(key)
+        if i is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        # Refresh the generation of used entries.
+        self._generations[i] = self.generation
+        return self._values[i]
+
+    def put(self, key, value):
+        keys, values, generations = self._keys, self._values, self._generations
+
+        i = self._find(key)
+        if i is not None:
+            values[i] = value
+            generations[i] = self.generation
+            return
+
+        i = 2 * (key % self.n_buckets)
+        if keys[i] is not None:
+            if keys[i + 1] is not None:
+                self.replaced += 1
+            if generations[i] == self.generation and self._weight(value) < self._weight(values[i]):
+                # Keep the more valuable entry of slot 0.
+                i += 1
+            else:
+                # Move the old entry of slot 0 to slot 1.
+                keys[i + 1], values[i + 1], generations[i + 1] = keys[i], values[i], generations[i]
+        keys[i], values[i], generations[i] = key, value, self.generation
+
+    def new_generation(self):
+        self.generation += 1
+
+    def clear(self):
+        n = len(self._keys)
+        self._keys = [None] * n
+        self._values = [None] * n
+        self._generations = [0] * n
+        self.generation = 0
+        self.hits = self.misses = self.replaced = 0
+
+    def stats(self):
+        n_probes = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / n_probes if n_probes else 0.0,
+            'replaced': self.replaced,
+        }
+
+
+__all__ = [
+    'TranspositionTable',
+]
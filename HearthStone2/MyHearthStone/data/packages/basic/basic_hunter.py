@@ -3,8 +3,6 @@
 
 # TODO: Apply DH values.
 
-import random
-
 from MyHearthStone import ext
 from MyHearthStone.ext import enc_common
 from MyHearthStone.ext import std_events, std_triggers
@@ -179,7 +177,7 @@ class 动物伙伴(Spell):
     can_do_action = ext.require_board_not_full
 
     def run(self, target, **kwargs):
-        summon_id = random.choice(["20010", "20011", "20012"])
+        summon_id = self.game.random.choice(["20010", "20011", "20012"])
         return std_events.pure_summon_events(self.game, summon_id, self.player_id, 'last')
 
 
@@ -235,7 +233,7 @@ class 多重射击(Spell):
         elif len(zone) < 2:
             real_targets = zone
         else:
-            real_targets = random.sample(zone, 2)
+            real_targets = self.game.random.sample(zone, 2)
         return [std_events.AreaDamage(self.game, self, real_targets, [self.dh_values[0] for _ in real_targets])]
 
 
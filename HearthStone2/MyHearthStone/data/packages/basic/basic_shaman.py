@@ -1,8 +1,6 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
-from random import choice
-
 from MyHearthStone import ext
 from MyHearthStone.ext import Minion, Spell, Hero, HeroPower
 from MyHearthStone.ext import std_events
@@ -34,7 +32,7 @@ class 图腾召唤(HeroPower):
 
     def _candidates(self):
         my_minions = {m.id for m in self.game.get_zone(Zone.Play, self.player_id)}
-        return list(self.BasicTotems.difference(my_minions))
+        return sorted(self.BasicTotems.difference(my_minions))
 
     def can_do_action(self, msg_fn=None):
         super_result = super().can_do_action(msg_fn=msg_fn)
@@ -52,7 +50,7 @@ class 图腾召唤(HeroPower):
         return super_result
 
     def run(self, target, **kwargs):
-        return std_events.pure_summon_events(self.game, choice(self._candidates()), self.player_id, 'last')
+        return std_events.pure_summon_events(self.game, self.game.random.choice(self._candidates()), self.player_id, 'last')
 
 
 # 火舌图腾 (70000)
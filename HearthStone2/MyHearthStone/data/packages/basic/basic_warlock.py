@@ -1,8 +1,6 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
-from random import choice
-
 from MyHearthStone import ext
 from MyHearthStone.ext import Minion, Spell, Hero, HeroPower
 from MyHearthStone.ext import std_events
@@ -52,7 +50,7 @@ class 魅魔(Minion):
     }
 
     def run_battlecry(self, target, **kwargs):
-        target = choice(self.game.get_zone(Zone.Hand, self.player_id))
+        target = self.game.random.choice(self.game.get_zone(Zone.Hand, self.player_id))
         return [std_events.DiscardCard(self.game, self, target)]
 
 
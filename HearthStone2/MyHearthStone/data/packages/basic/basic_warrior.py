@@ -1,8 +1,6 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
-import random
-
 from MyHearthStone import ext
 from MyHearthStone.ext import Minion, Spell, Hero, HeroPower
 from MyHearthStone.ext import std_events
@@ -110,7 +108,7 @@ class 顺劈斩(Spell):
         elif len(zone) < 2:
             real_targets = zone
         else:
-            real_targets = random.sample(zone, 2)
+            real_targets = self.game.random.sample(zone, 2)
         return [std_events.AreaDamage(self.game, self, real_targets, [self.dh_values[0] for _ in real_targets])]
 
 
@@ -14,7 +14,9 @@ Contains:
 """
 
 from itertools import chain
+from types import MethodType
 
+from ...game.player_operation import translate_po_tree
 from ...utils.game import Type, Zone, Race, order_of_play
 
 __author__ = 'fyabc'
@@ -97,12 +99,36 @@ have_friendly_beast = make_have_friendly_race(Race.Beast)
 # Player operation tree generators.
 
 
-def make_conditional_targeted_po_tree(cond_fn, data_key='po_tree'):
-    def _player_operation_tree(self):
-        if cond_fn(self):
-            self.data[data_key] = '$HaveTarget'
-        return super(type(self), self).player_operation_tree()
-    return _player_operation_tree
+class _ConditionalTargetedPoTree:
+    """The ``player_operation_tree`` method of cards that require a target if the condition holds when played.
+
+    [NOTE]: Do not store the tree into the entity data, frontends and agents query it at any time,
+    the query must not change the game state.
+    """
+
+    def __init__(self, cond_fn):
+        self.cond_fn = cond_fn
+        # The class that defines the method, other trees (e.g. attack trees in play) are got from its base classes.
+        self.owner = None
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return MethodType(self, instance)
+
+    def __call__(self, entity):
+        if entity.zone == Zone.Hand and self.cond_fn(entity):
+            return translate_po_tree('$HaveTarget', entity=entity)
+        return getattr(super(self.owner, entity), self.name)()
+
+
+def make_conditional_targeted_po_tree(cond_fn):
+    return _ConditionalTargetedPoTree(cond_fn)
 
 
 # Target checkers.
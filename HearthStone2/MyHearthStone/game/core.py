@@ -3,10 +3,15 @@
 
 import random
 from typing import *
+from weakref import WeakValueDictionary
 
 from .game_entity import IndependentEntity, make_property
+from .journal import Journal, undo_insert
 from .player import Player
 from .player_action import process_special_pa
+from .legal_actions import legal_actions
+from .state_sync import game_snapshot
+from .zobrist import ZobristHash
 from .triggers.trigger import Trigger
 from .events.standard import game_begin_standard_events, DeathPhase, create_death_event
 from .events.event import Event
@@ -17,6 +22,65 @@ from ..utils.package_io import all_cards
 
 __author__ = 'fyabc'
 
+class _ModuleRandom:
+    """The random number generator of functions of the ``random`` module (e.g. ``random.seed``).
+
+    Games without seeds use it, so they can be still reproduced by ``random.seed``.
+    It only delegates to module functions (``random.choice``, ``random.getstate``, etc.), so it has no states.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(random, name)
+
+    def __repr__(self):
+        return '_ModuleRandom()'
+
+
+_GlobalRandom = _ModuleRandom()
+
+# Zones of entities found by ``Game.get_entity_by_eid`` (same as ``Player.get_all_entities``).
+_EidZones = frozenset([Zone.Deck, Zone.Hand, Zone.Secret, Zone.Play, Zone.Weapon, Zone.Hero, Zone.HeroPower])
+
+
+class CallbackSubscription:
+    """A callback added with event types or buffered delivery. See ``Game.add_callback`` for details.
+
+    The subscription is put into ``Game.callbacks`` as a callback, so the event engine calls it as usual.
+    Calls with other types of the first argument are ignored. Buffered calls are queued (as argument tuples),
+    and delivered as batches (lists of argument tuples) by ``flush``.
+    """
+
+    Buffers = (None, 'frame', 'idle')
+
+    def __init__(self, callback, types=None, buffered=None):
+        if buffered not in self.Buffers:
+            raise ValueError('Unknown buffered {!r}'.format(buffered))
+        self.callback = callback
+        self.types = None if types is None else tuple(types)
+        self.buffered = buffered
+        self.pending = []
+
+    def __repr__(self):
+        return 'CallbackSubscription({!r}, buffered={!r}, pending={})'.format(
+            self.callback, self.buffered, len(self.pending))
+
+    def __call__(self, *args):
+        if self.types is not None and not isinstance(args[0], self.types):
+            return
+        if self.buffered is None:
+            self.callback(*args)
+        else:
+            self.pending.append(args)
+
+    def flush(self):
+        """Deliver pending calls as a batch, do nothing if no pending calls."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.callback(batch)
+
 
 class Game:
     """The core game system in the server. Include an event engine and some game data."""
@@ -64,15 +128,18 @@ class Game:
         # Players.
         self.players = [None, None]     # type: List[Player]
 
+        # Random seed and random number generator of the game, see ``start_game``.
+        # [NOTE]: All random things in the game (shuffle, random targets, etc.) must use ``self.random``,
+        # so games with the same seed and player actions are identical (see ``network.local_server``).
+        self.seed = None
+        self.random = _GlobalRandom
+
         # Auras. It is convenient to share it between players.
         self.auras = {t: set() for t in AuraType.Idx2Str}           # type: Dict[int, Set]
         # Auras that have been removed since last aura update step.
         # Their granted enchantments will be removed at next aura update step.
         self.removed_auras = {t: set() for t in AuraType.Idx2Str}   # type: Dict[int, Set]
 
-        # Contains arbitrary data (need it?)
-        self.data = self._init_data()
-
         ################
         # Event engine #
         ################
@@ -89,6 +156,10 @@ class Game:
             'resolve': [],
             'game_start': [],
             'game_end': [],
+            'tag': [],
+            'zone': [],
+            'enchantment': [],
+            'action': [],
         }
 
         # Current order of play id
@@ -112,6 +183,27 @@ class Game:
         # All history events. Store in `Event` instance or its string representation?
         self.event_history = []
 
+        # Entity id counter, see ``new_eid``.
+        self._eid_counter = 0
+        # Entity id -> entity, filled when entities are created, see ``get_entity_by_eid``.
+        # [NOTE]: Values are weak references, so entities that left the game (and are not referenced by
+        # zones, events, etc.) are removed, and the dict does not grow with the game.
+        self.entities = WeakValueDictionary()
+
+        # Cached legal player actions of the current player, see ``get_legal_actions``.
+        self._legal_actions = None
+
+        # The active undo journal, see ``begin_journal``.
+        self.journal = None
+
+        # Incremental state hash, maintained by entities, see ``zobrist_hash``.
+        # [NOTE]: It must be created before any entities.
+        self.zobrist = ZobristHash(self, debug=kwargs.pop('debug_hash', C.Game.DebugHash))
+
+        # Contains arbitrary data (need it?)
+        # [NOTE]: It creates the game entity, so it must be called after the event engine is initialized.
+        self.data = self._init_data()
+
     ########################
     # Event engine methods #
     ########################
@@ -120,16 +212,26 @@ class Game:
         for event_type, timing in zip(trigger.respond, trigger.timing):
             if (event_type, timing) not in self.triggers:
                 self.triggers[event_type, timing] = set()
+                if self.journal is not None:
+                    self.journal.record(self.triggers.pop, (event_type, timing), None)
             debug('Register trigger {} to event type {} and timing "{}"'.format(
                 trigger, event_type.__name__, 'Before' if timing == trigger.Before else 'After'))
-            self.triggers[event_type, timing].add(trigger)
+            triggers = self.triggers[event_type, timing]
+            if trigger not in triggers:
+                triggers.add(trigger)
+                if self.journal is not None:
+                    self.journal.record(triggers.discard, trigger)
 
     def remove_trigger(self, trigger):
         for event_type, timing in zip(trigger.respond, trigger.timing):
             if (event_type, timing) in self.triggers:
                 debug('Remove trigger {} from event type {} and timing "{}"'.format(
                     trigger, event_type.__name__, 'Before' if timing == trigger.Before else 'After'))
-                self.triggers[event_type, timing].discard(trigger)
+                triggers = self.triggers[event_type, timing]
+                if trigger in triggers:
+                    triggers.discard(trigger)
+                    if self.journal is not None:
+                        self.journal.record(triggers.add, trigger)
 
     def _remove_dead_triggers(self):
         for key, triggers in self.triggers.items():
@@ -137,7 +239,11 @@ class Game:
 
     def register_aura(self, aura):
         debug('Register aura {} of type {}'.format(aura, AuraType.Idx2Str[aura.type]))
-        self.auras[aura.type].add(aura)
+        auras = self.auras[aura.type]
+        if aura not in auras:
+            auras.add(aura)
+            if self.journal is not None:
+                self.journal.record(auras.discard, aura)
 
     def remove_aura(self, aura):
         """Remove an aura.
@@ -148,10 +254,15 @@ class Game:
             due to minions being stolen in the middle of a Phase.
         """
         debug('Remove aura {} of type {}'.format(aura, AuraType.Idx2Str[aura.type]))
-        self.auras[aura.type].discard(aura)
+        auras = self.auras[aura.type]
+        if aura in auras:
+            auras.discard(aura)
+            if self.journal is not None:
+                self.journal.record(auras.add, aura)
+        # [NOTE]: Removed auras are saved by journal marks, see ``journal``.
         self.removed_auras[aura.type].add(aura)
 
-    def add_callback(self, callback, when='resolve'):
+    def add_callback(self, callback, when='resolve', types=None, buffered=None):
         """Add a callback as a hook in the processing of the system.
 
         :param callback: Callback to be added.
@@ -175,20 +286,63 @@ class Game:
             5. Game end: called when the game end.
 
                 (game_result) -> Any (return value ignored)
+            6. Tag: called when an entity-level tag is set or deleted. See ``TagDict`` for details.
+
+                (entity, tag, old_value, new_value) -> Any (return value ignored)
+            7. Zone: called after an entity is moved (or generated) into a zone.
+                If the entity is generated, ``from_player``, ``from_zone`` and ``from_index`` are None.
+
+                (entity, from_player, from_zone, from_index, to_player, to_zone, to_index) -> Any
+            8. Enchantment: called after an enchantment is attached to or detached from an entity.
+
+                (entity, enchantment, attached) -> Any (return value ignored)
+            9. Action: called after a player action is completely run (after the game end callbacks if the game ends).
+
+                (player_action) -> Any (return value ignored)
         :type callback: function
-        :param when: When to call the callback, candidates: ('resolve', 'event', 'trigger', 'game_end')
+        :param when: When to call the callback, candidates:
+            ('resolve', 'event', 'trigger', 'game_start', 'game_end', 'tag', 'zone', 'enchantment', 'action')
         :type when: str
-        :return: None
+        :param types: Classes (e.g. event or trigger classes) of the first argument that the callback cares about,
+            calls with other types are ignored. Default is None (all calls).
+        :param buffered: The buffered delivery mode, candidates:
+
+            None: Call the callback synchronously (default).
+            'frame': Queue calls, deliver them when ``flush_callbacks`` is called (e.g. at frame boundaries of frontends).
+            'idle': Queue calls, deliver them when the game is idle (after each player action is run),
+                or when ``flush_callbacks`` is called.
+
+            Buffered callbacks are called with a batch (list of argument tuples) instead, e.g. ``[(event,), ...]``
+            of 'event' callbacks, and they are not called if no calls are queued.
+        :type buffered: str
+        :return: The added callback (a ``CallbackSubscription`` if ``types`` or ``buffered`` is given).
 
         [NOTE]: Different timing between 'resolve' and 'event' / 'trigger':
             Since the event processing order is depth-first, the 'resolve' is a post-order traversal,
             and the 'event' / 'trigger' are pre-order traversals.
         """
 
-        try:
-            self.callbacks[when].append(callback)
-        except KeyError:
+        if when not in self.callbacks:
             raise ValueError('Unknown when {!r}'.format(when))
+        if types is not None or buffered is not None:
+            if when == 'game_start' and types is not None:
+                raise ValueError('Cannot filter types of game start callbacks')
+            callback = CallbackSubscription(callback, types, buffered)
+        self.callbacks[when].append(callback)
+        return callback
+
+    def flush_callbacks(self, buffered=None):
+        """Deliver queued calls of buffered callbacks. See ``add_callback`` for details.
+
+        Batches are delivered in order of ``when`` (event, trigger, resolve, ...), then in order of adding.
+
+        :param buffered: Only deliver callbacks of this buffered mode, default is None (all buffered callbacks).
+        """
+        for callbacks in self.callbacks.values():
+            for callback in callbacks:
+                if type(callback) is CallbackSubscription and callback.buffered is not None and \
+                        (buffered is None or callback.buffered == buffered):
+                    callback.flush()
 
     def run_player_action(self, player_action):
         # TODO: Change this, return final event list, executed by clients (with animations) slowly.
@@ -201,12 +355,22 @@ class Game:
         stop = process_special_pa(self, player_action)
         if stop:
             info('Player action {} is special and does not resolve events.'.format(player_action))
+            if self.zobrist.debug:
+                self.zobrist.check()
+            self.flush_callbacks('idle')
+            for callback in self.callbacks['action']:
+                callback(player_action)
             return
 
         self.resolve_events(player_action.phases(), 0)
+        if self.zobrist.debug:
+            self.zobrist.check()
 
         if self.game_result is not None:
             self.end_game()
+        self.flush_callbacks('idle')
+        for callback in self.callbacks['action']:
+            callback(player_action)
         return self.game_result
 
     def _collect_resolve_triggers(self, event, timing, depth):
@@ -250,6 +414,7 @@ class Game:
                 # Do the event and log history.
                 if e.enable:
                     cons_events = e.do()
+                    self._legal_actions = None
 
                     # TODO: Log disabled events or not?
                     e.message()
@@ -322,6 +487,8 @@ class Game:
             # [NOTE]: These calls are after the all processing of events (just before idle),
             # so user will always see the up-to-date result.
             if isinstance(e, Event):
+                # Aura updates and deaths may change the state after the event.
+                self._legal_actions = None
                 for callback in self.callbacks['resolve']:
                     callback(e, None)
 
@@ -351,6 +518,7 @@ class Game:
                 return
 
             new_queue = t.process(current_event)
+            self._legal_actions = None
             t.message(current_event)
             for callback in self.callbacks['trigger']:
                 callback(t, current_event)
@@ -463,6 +631,9 @@ class Game:
         removed_auras.clear()
 
         # For each entity, Scan all given auras to grant enchantments.
+        # [NOTE]: Use the order of play, the order of set iteration is different between game instances,
+        # so granted enchantments (and lockstep games, see ``network.local_server``) may be different.
+        auras = order_of_play(auras)
         for aura in auras:
             aura.prepare_update()
 
@@ -487,23 +658,26 @@ class Game:
             'entity': IndependentEntity(self),
         }
 
-    def start_game(self, decks, mode='standard', class_hero_maps=(None, None)):
+    def start_game(self, decks, mode='standard', class_hero_maps=(None, None), seed=None):
         """Start the game.
 
         :param decks:
         :param mode:
         :param class_hero_maps:
+        :param seed: The random seed of the game. If None, use the global random number generator.
         :return:
         """
 
         class_hero_maps = [DefaultClassHeroMap if m is None else m for m in class_hero_maps]
 
+        self.seed = seed
+        self.random = _GlobalRandom if seed is None else random.Random(seed)
         self.mode = mode
         self.running = True
         info('Start a new game: {}'.format(self))
 
         # Select start player.
-        start_player = random.randint(0, 1)
+        start_player = self.random.randint(0, 1)
 
         # Initialize some counters.
         self.n_turns = -1
@@ -511,12 +685,14 @@ class Game:
         self.current_oop = 1
         self._stop_subsequent_phases = False
         self.players = [Player(self) for _ in range(2)]
+        self.zobrist.rebuild()
         self.entity.oop = 0
 
         for player_id, (player, deck, m) in enumerate(zip(self.players, decks, class_hero_maps)):
             player.start_game(deck, player_id, start_player, m)
 
         self.state = self.GameState.WaitReplace
+        self._legal_actions = None
 
     def on_replace_done(self):
         for player, replace in zip(self.players, self.data['replaces']):
@@ -524,6 +700,7 @@ class Game:
 
         self.state = self.GameState.Main
         self.entity.zone = Zone.Play
+        self._legal_actions = None
 
         for callback in self.callbacks['game_start']:
             callback()
@@ -541,6 +718,7 @@ class Game:
         }[self.game_result]))
         self.running = False
         self.state = self.GameState.Invalid
+        self._legal_actions = None
         for callback in self.callbacks['game_end']:
             callback(self.game_result)
 
@@ -647,6 +825,8 @@ class Game:
         else:
             entity = fz[from_index]
             del fz[from_index]
+        if self.journal is not None:
+            self.journal.record(fz.insert, from_index, entity)
 
         if (from_zone, from_index) != (to_zone, to_index) and self.full(to_zone, to_player):
             if on_full == 'destroy':
@@ -662,8 +842,13 @@ class Game:
 
                 # Move it to graveyard.
                 to_zone = Zone.Graveyard
-                self.get_zone(to_zone, from_player).append(entity)
+                to_zone_list = self.get_zone(to_zone, from_player)
+                to_zone_list.append(entity)
+                if self.journal is not None:
+                    self.journal.record(undo_insert, to_zone_list, len(to_zone_list) - 1)
                 entity.set_zp(to_zone, player_id=None)
+                for callback in self.callbacks['zone']:
+                    callback(entity, from_player, from_zone, from_index, from_player, to_zone, len(to_zone_list) - 1)
 
                 return entity, {
                     'success': False,
@@ -683,6 +868,8 @@ class Game:
                 raise ValueError('Unknown on-full strategy {!r}'.format(on_full))
 
         index = self._insert_entity(entity, to_zone, to_player, to_index)
+        for callback in self.callbacks['zone']:
+            callback(entity, from_player, from_zone, from_index, to_player, to_zone, index)
 
         return entity, {
             'success': True,
@@ -718,10 +905,21 @@ class Game:
 
         self.players[player_id].add_mana(value, action)
 
+    def new_eid(self):
+        """Get a new entity id, which is unique in this game."""
+        self._eid_counter += 1
+        return self._eid_counter
+
     def inc_oop(self):
         self.current_oop += 1
         return self.current_oop
 
+    def new_oop(self, entity):
+        """Set a new order of play to the entity (e.g. when it is played or summoned)."""
+        if self.journal is not None:
+            self.journal.record(setattr, entity, 'oop', entity.oop)
+        entity.oop = self.inc_oop()
+
     ###############################################
     # Game attributes methods and other utilities #
     ###############################################
@@ -732,10 +930,15 @@ class Game:
     def __getstate__(self):
         state = self.__dict__.copy()
         del state['_player_iter']
+        state['_legal_actions'] = None
+        state['journal'] = None
+        # Weak references cannot be pickled.
+        state['entities'] = dict(self.entities)
         return state
 
     def __setstate__(self, state):
         self.__dict__.update(state)
+        self.entities = WeakValueDictionary(self.entities)
         self._player_iter = self._player_generator()
 
     def displayed_mana(self):
@@ -758,6 +961,25 @@ class Game:
     def get_entity(self, zone, player_id, location=0):
         return self.players[player_id].get_entity(zone, location)
 
+    def get_entity_by_eid(self, eid):
+        """Get the entity by its entity id. Entities in the graveyard and enchantments are not included.
+
+        :return: The entity, or None if not found.
+        """
+        entity = self.entities.get(eid)
+        if entity is None:
+            return None
+        if entity.player_id not in (0, 1):
+            return None
+        player = self.players[entity.player_id]
+        if entity is player:
+            return entity
+        # [NOTE]: The dict also contains removed entities that are still referenced (e.g. dead or undone by the
+        # journal), check the zone.
+        if entity.zone not in _EidZones or not any(e is entity for e in player.get_zone(entity.zone)):
+            return None
+        return entity
+
     def get_location(self, entity, zone, player_id, error_not_found=False):
         z = self.get_zone(zone, player_id)
         try:
@@ -805,9 +1027,50 @@ class Game:
     def create_card(self, card_id, **kwargs):
         return all_cards()[card_id](self, **kwargs)
 
-    def game_status(self):
-        """Parse game status into a dict."""
+    def get_legal_actions(self):
+        """Get all legal player actions of the current player. See ``legal_actions`` for details.
 
-        return {
-            # todo
-        }
+        The result is cached until the next resolved event or trigger.
+        If the game is changed without events (e.g. by AI determinisations or tests),
+        call ``invalidate_legal_actions`` to clear the cache.
+
+        [NOTE]: The returned list is shared by all callers until the cache is cleared, do not change it.
+
+        :return: List of ``PlayerAction`` instances.
+        :rtype: list
+        """
+        if self._legal_actions is None:
+            self._legal_actions = legal_actions(self)
+        return self._legal_actions
+
+    def invalidate_legal_actions(self):
+        self._legal_actions = None
+
+    def begin_journal(self):
+        """Start recording mutations into an undo journal, see ``journal`` for details.
+
+        :return: The active journal (a new one if there is no active journal).
+        :rtype: Journal
+        """
+        if self.journal is None:
+            self.journal = Journal(self)
+        return self.journal
+
+    def end_journal(self):
+        """Stop recording mutations, the active journal is dropped."""
+        self.journal = None
+
+    def zobrist_hash(self):
+        """Get the incremental 64-bit hash of the game state. See ``zobrist`` for details.
+
+        Unlike ``state_sync.state_hash``, it is O(1), and does not contain positions of entities in zones.
+        """
+        return self.zobrist.hash()
+
+    def game_status(self, viewer=None):
+        """Parse game status into a snapshot batch. See ``state_sync`` for details.
+
+        :param viewer: The player id of the viewer, None means omniscient.
+        """
+
+        return game_snapshot(self, viewer)
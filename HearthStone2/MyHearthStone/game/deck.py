@@ -68,11 +68,12 @@ class Deck:
         return result
 
     @classmethod
-    def from_code(cls, code):
-        """Convert deck from code.
+    def parse_code(cls, code):
+        """Convert deck from code, raise errors if the code is invalid.
 
         :param code: A string of deck.
         :return: A ``Deck`` instance.
+        :raise ValueError: If the code is invalid (bad base64 data, unknown mode, etc.).
         """
 
         lines = code.split('\n')
@@ -83,19 +84,28 @@ class Deck:
                 code_line = line
                 break
 
-        try:
-            str_deck = base64.b64decode(code_line).decode('utf-8')
+        str_deck = base64.b64decode(code_line).decode('utf-8')
+
+        klass, name, mode, *card_id_list = str_deck.strip(cls._delimiter).split(cls._delimiter)
+
+        if mode not in cls.AllModes:
+            raise ValueError('Unknown deck mode {!r}'.format(mode))
+
+        klass = int(klass)
+        card_id_list = [str(e) for e in card_id_list]
 
-            klass, name, mode, *card_id_list = str_deck.strip(cls._delimiter).split(cls._delimiter)
+        return cls(klass, card_id_list, mode, name=name)
 
-            if mode not in cls.AllModes:
-                error('Unknown deck mode, return None')
-                return None
+    @classmethod
+    def from_code(cls, code):
+        """Convert deck from code.
 
-            klass = int(klass)
-            card_id_list = [str(e) for e in card_id_list]
+        :param code: A string of deck.
+        :return: A ``Deck`` instance, or None if the code is invalid.
+        """
 
-            return cls(klass, card_id_list, mode, name=name)
+        try:
+            return cls.parse_code(code)
         except binascii.Error as e:
             error(e)
             error('Error when loading deck code, return None')
@@ -0,0 +1,156 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Bulk validation of deck codes against the card pool of loaded packages.
+
+Deck codes are read line by line and validated in batches, so large deck lists (ladder dumps, tournament
+submissions) are never loaded into memory at once::
+
+    validator = DeckValidator()
+    for batch in validator.validate_lines(open('decks.txt')):
+        for report in batch:
+            if report.errors:
+                ...     # Invalid deck
+            else:
+                ...     # report.code is the normalised deck code
+
+Checks (``DeckValidator.validate``):
+
+    decode:         The code cannot be decoded (see ``Deck.parse_code``).
+    klass:          The deck class is not a playable class.
+    mode:           The deck mode is not the expected mode of the validator.
+    unknown_card:   The card id is not in the card pool.
+    derivative:     The card is not collectible.
+    class_card:     The card belongs to another class.
+    wild_card:      The card is not legal in standard mode (package in ``C.Game.WildPackages``).
+    copies:         Too many copies of the card (``C.Game.SameCardMax`` of its rarity, standard and wild only).
+    size:           The deck size is not ``C.Game.DeckSize`` (all modes except brawl).
+
+Normalised codes have no comments, and card ids are sorted by cost and id.
+Run ``test/run_validate_decks.py`` to validate deck files from the command line.
+"""
+
+from collections import namedtuple
+from itertools import islice
+
+from .deck import Deck
+from ..utils.constants import C
+from ..utils.game import Klass
+from ..utils.package_io import all_cards
+
+__author__ = 'fyabc'
+
+# Validation result of a line.
+# line: the line number (starting from 1); code: the normalised code, or None if invalid;
+# errors: list of (error kind, detail).
+DeckReport = namedtuple('DeckReport', ['line', 'code', 'errors'])
+
+_CopyLimitModes = frozenset(['standard', 'wild'])
+_SizeLimitModes = frozenset(['standard', 'wild', 'arena'])
+
+
+def _id_key(card_id):
+    return (0, int(card_id), '') if card_id.isdigit() else (1, 0, card_id)
+
+
+class DeckValidator:
+    """The deck validator of the card pool of loaded packages.
+
+    :param mode: The expected deck mode, None means any mode in ``Deck.AllModes``.
+    """
+
+    def __init__(self, mode=None):
+        if mode is not None and mode not in Deck.AllModes:
+            raise ValueError('Unknown deck mode {!r}'.format(mode))
+        self.mode = mode
+        self.deck_size = C.Game.DeckSize
+
+        same_card_max = C.Game.SameCardMax
+        wild_packages = frozenset(C.Game.WildPackages)
+        # Card table: card id -> (klass, max copies, is wild, is derivative, sort key).
+        self._cards = {}
+        for card_id, card_cls in all_cards().items():
+            data = card_cls.data
+            rarity = data['rarity']
+            self._cards[card_id] = (
+                data['klass'],
+                same_card_max[rarity] if 0 <= rarity < len(same_card_max) else 0,
+                data['package'] in wild_packages,
+                data['derivative'],
+                (data['cost'], _id_key(card_id)),
+            )
+        self._playable_classes = frozenset(k for k in Klass.Idx2Str if k != Klass.Neutral)
+
+    def validate(self, code):
+        """Validate a deck code.
+
+        :return: (normalised code or None, errors)
+        """
+        try:
+            deck = Deck.parse_code(code)
+        except ValueError as e:
+            return None, [('decode', str(e))]
+
+        errors = []
+        klass, mode = deck.klass, deck.mode
+        if klass not in self._playable_classes:
+            errors.append(('klass', klass))
+        if self.mode is not None and mode != self.mode:
+            errors.append(('mode', mode))
+
+        counts = {}
+        for card_id in deck.card_id_list:
+            counts[card_id] = counts.get(card_id, 0) + 1
+
+        cards = self._cards
+        check_copies, check_wild = mode in _CopyLimitModes, mode == 'standard'
+        for card_id, count in counts.items():
+            entry = cards.get(card_id)
+            if entry is None:
+                errors.append(('unknown_card', card_id))
+                continue
+            card_klass, max_copies, wild, derivative, _ = entry
+            if derivative:
+                errors.append(('derivative', card_id))
+            if card_klass != Klass.Neutral and card_klass != klass:
+                errors.append(('class_card', card_id))
+            if check_wild and wild:
+                errors.append(('wild_card', card_id))
+            if check_copies and count > max_copies:
+                errors.append(('copies', card_id))
+
+        if mode in _SizeLimitModes and len(deck.card_id_list) != self.deck_size:
+            errors.append(('size', len(deck.card_id_list)))
+
+        if errors:
+            return None, errors
+        deck.card_id_list.sort(key=lambda card_id: cards[card_id][4])
+        return deck.to_code(comment=False), errors
+
+    def validate_lines(self, lines, batch_size=4096):
+        """Validate deck codes of lines (e.g. a file object), blank lines and comment lines (start with '#') are skipped.
+
+        :param lines: Iterable of lines, consumed lazily.
+        :param batch_size: Number of lines of each batch.
+        :return: Iterator of batches (lists of ``DeckReport``).
+        """
+        validate = self.validate
+        numbered_lines = enumerate(lines, start=1)
+        while True:
+            batch = list(islice(numbered_lines, batch_size))
+            if not batch:
+                return
+            reports = []
+            for line_no, line in batch:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                code, errors = validate(line)
+                reports.append(DeckReport(line_no, code, errors))
+            yield reports
+
+
+__all__ = [
+    'DeckReport',
+    'DeckValidator',
+]
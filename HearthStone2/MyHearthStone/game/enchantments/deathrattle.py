@@ -34,7 +34,10 @@ class DrEnchantment(Enchantment):
         del self._kw
 
         # Add the deathrattle trigger into dr_list.
-        self.target.dr_list.append(self.dr_trigger)
+        dr_list = self.target.dr_list
+        dr_list.append(self.dr_trigger)
+        if self.game.journal is not None:
+            self.game.journal.record(dr_list.pop)
 
 
 __all__ = [
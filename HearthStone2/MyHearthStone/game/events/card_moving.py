@@ -3,8 +3,6 @@
 
 """Card moving events."""
 
-import random
-
 from .event import Event, DelayResolvedEvent, AreaEvent
 from .damage import Damage
 from .utils import dynamic_pid_prop
@@ -82,7 +80,7 @@ class PutIntoHand(GenericDrawCard):
             return []
 
         # Random select a card, can use other distributions here.
-        index = random.choice(candidates)
+        index = self.game.random.choice(candidates)
 
         card, status = self.game.move(self.player_id, Zone.Deck, index, self.player_id, Zone.Hand, 'last')
         success, new_events = status['success'], status['events']
@@ -166,7 +164,7 @@ def replace_events(game, target, new_entity, loc=None):
 
     if zone == Zone.Play:
         # [NOTE]: move it to `Game.move`?
-        new_entity.oop = game.inc_oop()
+        game.new_oop(new_entity)
 
     return old_status['events'] + new_status['events']
 
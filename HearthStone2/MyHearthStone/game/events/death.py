@@ -41,6 +41,8 @@ class HeroDeath(DeathEvent):
     def do(self):
         owner = self.owner
         _push_death_cache(self.game, owner)
+        if self.game.journal is not None:
+            self.game.journal.record(setattr, owner, 'play_state', owner.play_state)
         owner.play_state = False
         return []
 
@@ -60,7 +60,7 @@ class OnPlaySpell(OnPlay):
         player.spend_mana(self.spell.cost)
 
         # [NOTE]: move it to `Game.move`?
-        self.spell.oop = self.game.inc_oop()
+        self.game.new_oop(self.spell)
 
         tz = Zone.Graveyard
         if self.spell.data['secret'] or self.spell.data['quest']:
@@ -155,7 +155,7 @@ class OnPlayWeapon(OnPlay):
         player.spend_mana(self.weapon.cost)
 
         # [NOTE]: move it to `Game.move`?
-        self.weapon.oop = self.game.inc_oop()
+        self.game.new_oop(self.weapon)
 
         # [NOTE]: Insert the new weapon into the first one (index 0).
         _, status = self.game.move(self.player_id, Zone.Hand, self.weapon, self.player_id, Zone.Weapon, 0)
@@ -233,7 +233,7 @@ def pure_equip_events(game, weapon, to_player, from_player=None, from_zone=None)
     assert status['success'], 'The equipment of weapon must succeed'
 
     # [NOTE]: move it to ``Game.move``?
-    weapon.oop = game.inc_oop()
+    game.new_oop(weapon)
 
     return [EquipWeapon(game, weapon, None, to_player, is_played=False)]
 
@@ -269,7 +269,7 @@ class OnPlayMinion(OnPlay):
         self.game.summon_events.add(se)
 
         # [NOTE]: move it to `Game.move`?
-        self.minion.oop = self.game.inc_oop()
+        self.game.new_oop(self.minion)
 
         _, status = self.game.move(se.player_id, Zone.Hand, self.minion, se.player_id, Zone.Play, se.loc)
 
@@ -360,7 +360,7 @@ def pure_summon_events(game, minion, to_player, loc, from_player=None, from_zone
         game.summon_events.add(summon_event)
 
         # [NOTE]: move it to ``Game.move``?
-        minion.oop = game.inc_oop()
+        game.new_oop(minion)
 
         # [NOTE] ``AfterSummon`` phase appears before ``Summon`` event.
         # Is this a bug or not?
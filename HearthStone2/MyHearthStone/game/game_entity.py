@@ -16,6 +16,95 @@ __author__ = 'fyabc'
 _sentinel = object()
 
 
+class _MissingTag:
+    """The marker of a missing tag, used in tag change callbacks."""
+
+    def __repr__(self):
+        return '<missing>'
+
+    def __reduce__(self):
+        return 'MissingTag'
+
+
+MissingTag = _MissingTag()
+
+
+class TagDict(dict):
+    """The entity-level data dict.
+
+    All writes to this dict will be reported to the 'tag' callbacks of the game, so subsystems such as state sync
+    can track what changed without scanning all entities. Changed tags are also reported to the state hash of the game
+    (see ``zobrist``), which is maintained even if there are no callbacks.
+
+    Callback prototype: (entity, tag, old_value, new_value) -> Any
+        If the tag does not exist before (or is deleted), the old (or new) value will be ``MissingTag``.
+    """
+
+    __slots__ = ('entity',)
+
+    def __init__(self, entity, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.entity = entity
+
+    def __reduce__(self):
+        return self.__class__, (self.entity, dict(self))
+
+    def _changed(self, key, old_value, new_value):
+        entity = self.entity
+        game = entity.game
+        if old_value is not new_value:
+            game.zobrist.on_tag(entity, key, old_value, new_value)
+            if game.journal is not None:
+                game.journal.record(_undo_tag, self, key, old_value)
+        for callback in game.callbacks['tag']:
+            callback(entity, key, old_value, new_value)
+
+    def __setitem__(self, key, value):
+        old_value = self.get(key, MissingTag)
+        dict.__setitem__(self, key, value)
+        self._changed(key, old_value, value)
+
+    def __delitem__(self, key):
+        old_value = self[key]
+        dict.__delitem__(self, key)
+        self._changed(key, old_value, MissingTag)
+
+    def pop(self, key, *args):
+        if key not in self:
+            return dict.pop(self, key, *args)
+        old_value = dict.pop(self, key)
+        self._changed(key, old_value, MissingTag)
+        return old_value
+
+    def clear(self):
+        # Delete tags one by one, so each change is reported with a consistent entity (e.g. the zone of the entity).
+        for key in list(self):
+            self._changed(key, dict.pop(self, key), MissingTag)
+
+
+def _undo_tag(tags, key, old_value):
+    """Restore the tag (without callbacks), the inverse operation in the undo journal (see ``journal``)."""
+    current_value = tags.get(key, MissingTag)
+    if old_value is MissingTag:
+        dict.pop(tags, key, None)
+    else:
+        dict.__setitem__(tags, key, old_value)
+    if current_value is not old_value:
+        entity = tags.entity
+        entity.game.zobrist.on_tag(entity, key, current_value, old_value)
+
+
+def _undo_attach(entity, a, index):
+    """Detach the enchantment inserted at the index (without callbacks)."""
+    entity.game.zobrist.on_enchantment(entity, a.pop(index), False)
+
+
+def _undo_detach(entity, a, index, enchantment):
+    """Attach the enchantment removed from the index (without callbacks)."""
+    a.insert(index, enchantment)
+    entity.game.zobrist.on_enchantment(entity, enchantment, True)
+
+
 def make_property(name, setter=True, deleter=False, default=_sentinel, callable_default=False):
     if default is _sentinel:
         def _getter(self):
@@ -118,19 +207,29 @@ class GameEntity(metaclass=SetDataMeta):
     # Class-level data.
     cls_data = {}
 
+    # Is this entity included in the state hash of the game or not. See ``zobrist`` for details.
+    hashed = False
+
     def __init__(self, game):
         self.game = game
 
+        # Entity id, unique in the game. Used to identify entities outside the game process (e.g. state sync).
+        self.eid = game.new_eid()
+        game.entities[self.eid] = self
+
+        # Hash of tags and enchantments of this entity, maintained by ``zobrist.ZobristHash``.
+        self.zobrist = 0
+
         # oop(Order Of Play).
         # All game entities have this attribute, and share the same oop list.
         # TODO: Check the oop settings in all situations.
         self.oop = None
 
         # Entity-level data dict (highest priority, commonly variable between different entities).
-        self.data = self.data.new_child({
+        self.data = self.data.new_child(TagDict(self, {
             # 'zone': Zone.Invalid,
             # 'player_id': None,  # Same as 'controller'.
-        })
+        }))
         self._reset_tags()
 
         self.init_zone = Zone.Invalid
@@ -278,7 +377,10 @@ class GameEntity(metaclass=SetDataMeta):
         :param trigger:
         :return:
         """
-        self.triggers.add(trigger)
+        if trigger not in self.triggers:
+            self.triggers.add(trigger)
+            if self.game.journal is not None:
+                self.game.journal.record(self.triggers.discard, trigger)
 
         # Update the currently added trigger to the correct zone.
         self.update_triggers(Zone.Invalid, self.zone, (trigger,))
@@ -305,7 +407,10 @@ class GameEntity(metaclass=SetDataMeta):
 
     def add_aura(self, aura):
         """Add an aura."""
-        self.auras.add(aura)
+        if aura not in self.auras:
+            self.auras.add(aura)
+            if self.game.journal is not None:
+                self.game.journal.record(self.auras.discard, aura)
 
         # Update the currently added aura to the correct zone.
         self.update_auras(Zone.Invalid, self.zone, (aura,))
@@ -340,6 +445,8 @@ class IndependentEntity(GameEntity):
         'race': [],
     }
 
+    hashed = True
+
     def __init__(self, game):
         super().__init__(game)
 
@@ -383,6 +490,9 @@ class IndependentEntity(GameEntity):
         a = self.aura_enchantments if enchantment.aura else self.enchantments
         lo = _bisect(a, enchantment)
         a.insert(lo, enchantment)
+        if self.game.journal is not None:
+            self.game.journal.record(_undo_attach, self, a, lo)
+        self._enchantment_changed(enchantment, True)
 
     def remove_enchantment(self, enchantment, error_not_found=False):
         """Recalculate enchantments.
@@ -397,6 +507,9 @@ class IndependentEntity(GameEntity):
                 raise ValueError('Enchantment {} not found in the enchantment list'.format(enchantment))
         else:
             del a[lo]
+            if self.game.journal is not None:
+                self.game.journal.record(_undo_detach, self, a, lo, enchantment)
+            self._enchantment_changed(enchantment, False)
 
     def _find_aura_enchantment(self, aura, return_idx=True):
         a = self.aura_enchantments
@@ -417,7 +530,16 @@ class IndependentEntity(GameEntity):
             if error_not_found:
                 raise ValueError('Enchantment of source {} not found in the aura enchantment list'.format(aura))
         else:
-            del self.aura_enchantments[i]
+            enchantment = self.aura_enchantments.pop(i)
+            if self.game.journal is not None:
+                self.game.journal.record(_undo_detach, self, self.aura_enchantments, i, enchantment)
+            self._enchantment_changed(enchantment, False)
+
+    def _enchantment_changed(self, enchantment, attached):
+        """Report the attached (or detached) enchantment to the state hash and 'enchantment' callbacks."""
+        self.game.zobrist.on_enchantment(self, enchantment, attached)
+        for callback in self.game.callbacks['enchantment']:
+            callback(self, enchantment, attached)
 
     def all_enchantments(self):
         return chain(self.enchantments, self.aura_enchantments)
@@ -429,9 +551,16 @@ class IndependentEntity(GameEntity):
             # Modify enchantments.
             for e_list in (self.enchantments, self.aura_enchantments):
                 # Removed from play. Detach all enchantments (with some exceptions). See "RuleZ5a".
+                journal = self.game.journal
                 for enchantment in e_list:
                     enchantment.detach(remove_from_target=False)
-                e_list.clear()
+                    self._enchantment_changed(enchantment, False)
+                # Detach them from the end, so the journal can insert them back in order.
+                while e_list:
+                    index = len(e_list) - 1
+                    enchantment = e_list.pop()
+                    if journal is not None:
+                        journal.record(_undo_detach, self, e_list, index, enchantment)
 
     def _aura_update_before(self):
         """Set base status before aura update."""
@@ -0,0 +1,160 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Transactional undo journal of game mutations (make / unmake).
+
+Search agents try a move and undo it, instead of cloning the game before each try::
+
+    journal = game.begin_journal()
+    mark = journal.mark()
+    game.run_player_action(action)
+    ...     # Evaluate the game.
+    journal.rollback(mark)      # The game is restored exactly, the mark can be reused.
+    game.end_journal()
+
+While a journal is active (``game.journal is not None``), mutations of the engine record their inverse operations:
+
+    1. Writes and deletions of entity-level tags (see ``TagDict``).
+    2. Inserts and deletions of zone lists (``Game.move`` and ``Player.insert_entity``).
+    3. Registration of triggers and auras (in the game and in entities).
+    4. Edits of enchantment lists of entities.
+    5. Other attributes of entities changed by events: order of play, deathrattle lists and play states of heroes.
+
+Scalar states of the game and players (``current_oop``, mana counters, the random state, etc.) and append-only
+histories (``event_history`` and ``death_cache``) are saved when creating marks, they have fixed sizes (or are only
+truncated when rolling back), so the cost of a try is proportional to the number of mutations, not the game size.
+
+The state hash (see ``zobrist``) is restored with the game. Callbacks of the game are NOT called when rolling back.
+Inverse operations of tags and enchantments are in ``game_entity``.
+
+[NOTE]: Mutations outside of the engine interface (e.g. replacing zone lists directly like AI determinisations,
+or changing attributes of triggers in card packages) are not recorded.
+"""
+
+__author__ = 'fyabc'
+
+# Scalar attributes of the game and players, saved when creating marks.
+GameScalars = (
+    'running', 'mode', 'state', 'n_turns', 'game_result', 'current_player', 'current_oop',
+    'current_events', 'current_triggers', '_stop_subsequent_phases', '_eid_counter',
+)
+PlayerScalars = (
+    'max_mana', 'temp_mana', 'used_mana', 'overload', 'overload_next',
+    'number_hp_this_turn', 'number_hp_this_game', 'tire_counter', 'start_player',
+)
+
+
+def undo_insert(a, index):
+    """The inverse operation of inserting into the list."""
+    del a[index]
+
+
+def _snapshot(game):
+    return (
+        tuple(getattr(game, name) for name in GameScalars),
+        [tuple(getattr(player, name) for name in PlayerScalars) for player in game.players if player is not None],
+        list(game.player_buffer),
+        game.random.getstate(),
+        len(game.event_history),
+        len(game.death_cache),
+        set(game.summon_events),
+        list(game.data['instant_death_events']),
+        {t: set(auras) for t, auras in game.removed_auras.items()},
+    )
+
+
+def _restore(game, snapshot):
+    (game_scalars, player_scalars, player_buffer, random_state, n_events, n_deaths,
+     summon_events, instant_death_events, removed_auras) = snapshot
+
+    for name, value in zip(GameScalars, game_scalars):
+        setattr(game, name, value)
+    for player, values in zip(game.players, player_scalars):
+        for name, value in zip(PlayerScalars, values):
+            setattr(player, name, value)
+    game.player_buffer[:] = player_buffer
+    game.random.setstate(random_state)
+    del game.event_history[n_events:]
+    del game.death_cache[n_deaths:]
+    game.summon_events.clear()
+    game.summon_events.update(summon_events)
+    game.data['instant_death_events'][:] = instant_death_events
+    for t, auras in removed_auras.items():
+        game.removed_auras[t].clear()
+        game.removed_auras[t].update(auras)
+
+
+class Journal:
+    """The undo journal of a game. Create it by ``Game.begin_journal``.
+
+    :param game: The game.
+    """
+
+    def __init__(self, game):
+        self.game = game
+
+        # Inverse operations: list of (function, args).
+        self._undo = []
+
+        # Marks: list of (length of inverse operations, snapshot of scalars).
+        self._marks = []
+
+    def __repr__(self):
+        return 'Journal(marks={}, records={})'.format(len(self._marks), len(self._undo))
+
+    def __len__(self):
+        return len(self._undo)
+
+    def record(self, fn, *args):
+        """Record an inverse operation, which is called as ``fn(*args)`` when rolling back."""
+        self._undo.append((fn, args))
+
+    def mark(self):
+        """Create a mark of the current state.
+
+        :return: The mark.
+        :rtype: int
+        """
+        self._marks.append((len(self._undo), _snapshot(self.game)))
+        return len(self._marks) - 1
+
+    def _check_mark(self, mark):
+        if not 0 <= mark < len(self._marks):
+            raise ValueError('Invalid journal mark {!r}, {} marks available'.format(mark, len(self._marks)))
+
+    def rollback(self, mark):
+        """Restore the game to the state of the mark.
+
+        Marks created after it are released, the mark itself is kept (so it can be rolled back again).
+        """
+        self._check_mark(mark)
+        length, snapshot = self._marks[mark]
+        del self._marks[mark + 1:]
+
+        game, undo = self.game, self._undo
+        # Do not record inverse operations of the rollback itself.
+        game.journal = None
+        try:
+            while len(undo) > length:
+                fn, args = undo.pop()
+                fn(*args)
+            _restore(game, snapshot)
+        finally:
+            game.journal = self
+        game.invalidate_legal_actions()
+
+    def release(self, mark):
+        """Release the mark and marks created after it (keep all changes).
+
+        If no marks remain, recorded operations are dropped.
+        """
+        self._check_mark(mark)
+        del self._marks[mark:]
+        if not self._marks:
+            self._undo.clear()
+
+
+__all__ = [
+    'undo_insert',
+    'Journal',
+]
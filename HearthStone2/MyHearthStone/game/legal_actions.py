@@ -0,0 +1,130 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Enumerate legal player actions of the current player.
+
+The enumerator walks the player operation tree of each active entity (see ``player_operation``),
+in the same way as the frontend selection manager:
+
+    ConfirmPlay: the card is valid without target (``validate_target``).
+    SelectTarget: all characters in play that pass ``validate_target`` (``check_target`` of the card).
+    SelectChoice: all choices (**Choose One**, "Tracking", etc).
+    SelectMinionPosition: all positions of the own play zone.
+    SelectDefender: all enemy characters that pass ``check_defender`` of the attacker.
+    Run: the player action created by the run node.
+
+Use ``Game.get_legal_actions``, which caches the result until the next resolved event or trigger.
+"""
+
+from . import player_action as pa
+from .game_entity import GameEntity
+from .player_operation import PlayerOps
+from ..utils.frontend import validate_target
+from ..utils.game import Zone
+
+__author__ = 'fyabc'
+
+
+def _ignore_msg(msg):
+    pass
+
+
+def _characters(game, player_id):
+    return game.get_zone(Zone.Play, player_id) + game.get_zone(Zone.Hero, player_id)
+
+
+def _walk_po_tree(game, tree, po_data, result, targets):
+    if tree is None:
+        return
+    op = tree.op
+    source = po_data['source']
+    if op == PlayerOps.Run:
+        result.append(tree.run(game, po_data))
+    elif op == PlayerOps.ConfirmPlay:
+        if validate_target(source, None, _ignore_msg, po_data=po_data):
+            _walk_po_tree(game, tree.next_op(), po_data, result, targets)
+    elif op == PlayerOps.SelectTarget:
+        for target in targets:
+            if validate_target(source, target, _ignore_msg, po_data=po_data):
+                _walk_po_tree(game, tree.next_op(), dict(po_data, target=target), result, targets)
+    elif op == PlayerOps.SelectChoice:
+        choices = tree.get_choices()
+        for choice in choices:
+            _walk_po_tree(game, tree.next_op(choice), dict(po_data, **{
+                'choice.{}'.format(tree.title): choice,
+                'choice.{}.all'.format(tree.title): choices,
+            }), result, targets)
+    elif op == PlayerOps.SelectMinionPosition:
+        # The rightmost position first.
+        for index in reversed(range(len(game.get_zone(Zone.Play, source.player_id)) + 1)):
+            _walk_po_tree(game, tree.next_op(), dict(po_data, index=index), result, targets)
+    elif op == PlayerOps.SelectDefender:
+        for target in _characters(game, 1 - source.player_id):
+            if source.check_defender(target):
+                _walk_po_tree(game, tree.next_op(), dict(po_data, target=target), result, targets)
+    else:
+        raise ValueError('Unknown or not implemented op {}'.format(op))
+
+
+def legal_actions(game):
+    """Enumerate all legal player actions of the current player.
+
+    Actions are ordered by sources: cards in hand (from left to right), the hero power, attackers in play,
+    the hero, then the turn end. Actions of the same source (with different positions, choices or targets)
+    are adjacent.
+
+    [NOTE]: This function does not use the cache, use ``Game.get_legal_actions`` instead.
+
+    :return: List of ``PlayerAction`` instances, empty if the game is not in the main state.
+    :rtype: list
+    """
+    if not game.running or game.state != game.GameState.Main:
+        return []
+
+    player_id = game.current_player
+    player = game.get_player(player_id)
+    targets = _characters(game, 0) + _characters(game, 1)
+
+    result = []
+    for source in player.hand + player.hero_powers + player.play + player.heroes:
+        if source.can_do_action() == source.Inactive:
+            continue
+        _walk_po_tree(game, source.player_operation_tree(), {'source': source, 'target': None, 'index': None},
+                      result, targets)
+    result.append(pa.TurnEnd(game, player_id))
+    return result
+
+
+def action_source(action):
+    """Get the source entity of the player action, or None (turn end, concede, etc)."""
+    if isinstance(action, pa.ToAttack):
+        return action.attacker
+    if isinstance(action, pa.Play):
+        return action.source
+    return None
+
+
+def _freeze(value):
+    if isinstance(value, GameEntity):
+        return 'eid', value.eid
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def action_key(action):
+    """Get the hashable key of the player action.
+
+    Entities (include entities in ``po_data``) are represented by entity ids,
+    so keys of the same action in different copies of a game are equal.
+    """
+    return _freeze(action.to_dict())
+
+
+__all__ = [
+    'legal_actions',
+    'action_source',
+    'action_key',
+]
@@ -4,9 +4,9 @@
 """The class of player."""
 
 import itertools
-import random
 
 from .game_entity import IndependentEntity
+from .journal import undo_insert
 from .alive_mixin import AliveMixin
 from .enchantments.dh_bonus import DHBonusMixin
 from ..utils.constants import C
@@ -96,8 +96,10 @@ class Player(IndependentEntity):
 
         self.hero = all_heroes()[class_hero_map[deck.klass]](self.game, player_id)
         self.hero_power = all_hero_powers()[self.hero.init_hero_power_id](self.game, player_id)
-        self.deck = [all_cards()[card_id](self.game, player_id) for card_id in deck.card_id_list]
-        random.shuffle(self.deck)
+        # [NOTE]: Shuffle card ids before creating cards, so entity ids of cards do not leak the deck order.
+        card_id_list = list(deck.card_id_list)
+        self.game.random.shuffle(card_id_list)
+        self.deck = [all_cards()[card_id](self.game, player_id) for card_id in card_id_list]
 
         if player_id == start_player:
             self.hand = self.deck[:self.StartCardOffensive]
@@ -111,10 +113,10 @@ class Player(IndependentEntity):
     def on_replace_done(self, replace):
         replace = sorted(set(replace))  # Get sorted unique elements
         info('Replace hand {} of player {}'.format(replace, self.player_id))
-        replace_index = random.sample(list(range(len(self.deck))), k=len(replace))
+        replace_index = self.game.random.sample(list(range(len(self.deck))), k=len(replace))
         for hand_index, deck_index in zip(replace, replace_index):
             self.deck[deck_index], self.hand[hand_index] = self.hand[hand_index], self.deck[deck_index]
-        random.shuffle(self.deck)
+        self.game.random.shuffle(self.deck)
 
         # Add coin into defensive hand
         if self.player_id != self.start_player:
@@ -191,6 +193,8 @@ class Player(IndependentEntity):
             entity = self.create_card(entity, player_id=self.player_id)
 
         index = self.insert_entity(entity, to_zone, to_index)
+        for callback in self.game.callbacks['zone']:
+            callback(entity, None, None, None, self.player_id, to_zone, index)
 
         return entity, {
             'success': True,
@@ -217,6 +221,10 @@ class Player(IndependentEntity):
             to_index = len(tz) - 1
         else:
             tz.insert(to_index, entity)
+        if self.game.journal is not None:
+            # [NOTE]: ``list.insert`` clamps the index, record the real index.
+            n = len(tz) - 1
+            self.game.journal.record(undo_insert, tz, min(to_index, n) if to_index >= 0 else max(0, n + to_index))
         entity.set_zp(to_zone, self.player_id)
 
         return to_index
@@ -2,13 +2,24 @@
 # -*- coding: utf-8 -*-
 
 from .events import standard
+from ..utils.error import GameError
 from ..utils.message import entity_message
 
 __author__ = 'fyabc'
 
 
 class PlayerAction:
-    """"""
+    """The base class of player actions.
+
+    Player actions can be serialized into dicts of plain values (see ``to_dict`` and ``from_dict``),
+    entities are referenced by their entity ids. Entities in ``po_data`` (e.g. choices) are
+    serialized as ``{'$eid': eid}``.
+    """
+
+    # Serialized fields, they are also the argument names of the constructor.
+    Fields = ()
+    # Fields that are entities.
+    EntityFields = ()
 
     def __init__(self, game):
         self.game = game
@@ -25,10 +36,48 @@ class PlayerAction:
 
         raise NotImplementedError('implemented by subclasses')
 
+    def to_dict(self):
+        """Serialize the player action into a dict.
+
+        Example: ``{'action': 'PlayMinion', 'minion': 13, 'loc': 0, 'target': None, 'player_id': 0, 'po_data': {}}``.
+        """
+        d = {'action': self.__class__.__name__}
+        for name in self.Fields:
+            value = getattr(self, name)
+            if name in self.EntityFields and value is not None:
+                value = value.eid
+            elif name == 'po_data':
+                value = {k: _encode_po_value(v) for k, v in value.items()}
+            d[name] = value
+        return d
+
+    @staticmethod
+    def from_dict(game, d):
+        """Deserialize the player action from a dict, entities are searched in the game.
+
+        :raise GameError: The action type or the entity is not found.
+        """
+        cls = _action_classes().get(d.get('action'))
+        if cls is None:
+            raise GameError('Unknown player action {!r}'.format(d.get('action')))
+        kwargs = {}
+        for name in cls.Fields:
+            value = d.get(name)
+            if name in cls.EntityFields and value is not None:
+                eid, value = value, game.get_entity_by_eid(value)
+                if value is None:
+                    raise GameError('Entity {} of player action {!r} not found'.format(eid, d['action']))
+            elif name == 'po_data' and value is not None:
+                value = {k: _decode_po_value(game, v) for k, v in value.items()}
+            kwargs[name] = value
+        return cls(game, **kwargs)
+
 
 class ReplaceStartCard(PlayerAction):
     """"""
 
+    Fields = ('player_id', 'replace_list')
+
     def __init__(self, game, player_id, replace_list):
         super().__init__(game)
         self.player_id = player_id
@@ -44,6 +93,8 @@ class ReplaceStartCard(PlayerAction):
 class TurnEnd(PlayerAction):
     """"""
 
+    Fields = ('player_id',)
+
     def __init__(self, game, player_id=None):
         super().__init__(game)
         self.player_id = game.current_player if player_id is None else player_id
@@ -62,6 +113,8 @@ class TurnEnd(PlayerAction):
 class Concede(PlayerAction):
     """May be useless?"""
 
+    Fields = ('player_id',)
+
     def __init__(self, game, player_id=None):
         super().__init__(game)
         self.player_id = game.current_player if player_id is None else player_id
@@ -91,6 +144,9 @@ class Play(PlayerAction):
 class PlaySpell(Play):
     """"""
 
+    Fields = ('spell', 'target', 'player_id', 'po_data')
+    EntityFields = ('spell', 'target')
+
     def __init__(self, game, spell, target, player_id=None, po_data=None):
         super().__init__(game, spell, target, player_id, po_data)
 
@@ -114,6 +170,9 @@ class PlaySpell(Play):
 class PlayWeapon(Play):
     """"""
 
+    Fields = ('weapon', 'target', 'player_id', 'po_data')
+    EntityFields = ('weapon', 'target')
+
     def __init__(self, game, weapon, target, player_id=None, po_data=None):
         super().__init__(game, weapon, target, player_id, po_data)
 
@@ -142,6 +201,9 @@ class PlayMinion(Play):
             who then takes over from the playing hero. (in `BattlecryPhase`)
     """
 
+    Fields = ('minion', 'loc', 'target', 'player_id', 'po_data')
+    EntityFields = ('minion', 'target')
+
     def __init__(self, game, minion, loc, target, player_id=None, po_data=None):
         super().__init__(game, minion, target, player_id, po_data)
         self.loc = loc
@@ -167,6 +229,9 @@ class PlayMinion(Play):
 class ToAttack(PlayerAction):
     """"""
 
+    Fields = ('attacker', 'defender', 'po_data')
+    EntityFields = ('attacker', 'defender')
+
     def __init__(self, game, attacker, defender, po_data=None):
         super().__init__(game)
         self.attacker = attacker
@@ -189,6 +254,9 @@ class ToAttack(PlayerAction):
 class UseHeroPower(Play):
     """"""
 
+    Fields = ('target', 'player_id', 'po_data')
+    EntityFields = ('target',)
+
     def __init__(self, game, target, player_id, po_data=None):
         super().__init__(game, None, target, player_id, po_data)
         self.source = self.game.get_player(self.player_id).hero_power
@@ -209,6 +277,38 @@ class UseHeroPower(Play):
         return super()._repr(P=self.player_id, target=self.target)
 
 
+def _encode_po_value(value):
+    if isinstance(value, (list, tuple)):
+        return [_encode_po_value(v) for v in value]
+    eid = getattr(value, 'eid', None)
+    if eid is not None:
+        return {'$eid': eid}
+    return value
+
+
+def _decode_po_value(game, value):
+    if isinstance(value, list):
+        return [_decode_po_value(game, v) for v in value]
+    if isinstance(value, dict) and '$eid' in value:
+        entity = game.get_entity_by_eid(value['$eid'])
+        if entity is None:
+            raise GameError('Entity {} of player operation data not found'.format(value['$eid']))
+        return entity
+    return value
+
+
+def _action_classes():
+    """Get all player action classes that can be serialized. Key: class name, value: class."""
+    result = {}
+    classes = [PlayerAction]
+    while classes:
+        cls = classes.pop()
+        if cls.Fields:
+            result[cls.__name__] = cls
+        classes.extend(cls.__subclasses__())
+    return result
+
+
 def process_special_pa(game, player_action):
     """Process special player actions.
 
@@ -83,6 +83,14 @@ class PlayerOpTree:
             )
         return result
 
+    def __iter__(self):
+        """Iterate over operations of all nodes in the tree (depth-first)."""
+        yield self.op
+        if self._child_or_map is None:
+            return
+        for child in ([self._child_or_map] if self._single_child else self._child_or_map.values()):
+            yield from child
+
     @classmethod
     def chain(cls, op_list, can_undo_list=None):
         if can_undo_list is None:
@@ -0,0 +1,357 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Compact binary replays: record the decks, the seed and player actions of a game, and play them back.
+
+A replay file is the magic ``b'HSRP'`` followed by a sequence of objects encoded by ``utils.codec``::
+
+    Header:     {'format', 'version' (engine version), 'seed', 'mode', 'decks' (deck codes), 'actions' (action names),
+                 'checkpoint_interval'}
+    Records:
+        [RecordAction, turn, [action index, *fields], hash]
+            A player action (fields in order of ``PlayerAction.Fields``, see ``PlayerAction.to_dict``),
+            ``turn`` is the turn number before the action, ``hash`` is the low 32 bits of the state hash
+            (see ``zobrist``) after the action, used to catch behaviour drift.
+        [RecordCheckpoint, n_actions, turn, full hash, data]
+            The compressed pickled game after ``n_actions`` actions, ``full hash`` is ``state_sync.state_hash``.
+            Checkpoints are taken at the start of every ``checkpoint_interval`` turns, so seeking far into a long game
+            does not replay from turn 0.
+        [RecordEnd, game result, n_turns, full hash]
+            The game is finished.
+
+Record a game by ``ReplayRecorder`` (it uses the 'action' callbacks of the game), read it by ``Replay``.
+Run ``test/run_replays.py`` to record replays of agent games or verify replays against the current engine.
+
+[NOTE]: Checkpoints are pickles, they can only be loaded with the same packages (and compatible engine code).
+If a checkpoint cannot be loaded, seeking falls back to an earlier checkpoint (or the start of the game).
+Replays may come from others, so checkpoints are loaded by a restricted unpickler: only classes of the engine
+(``MyHearthStone.game``), classes of loaded card packages and a few containers can be referenced,
+nothing is imported and no other function can be called.
+Games that cannot be pickled (e.g. cards with lambda deathrattles) are recorded without the checkpoint.
+"""
+
+import io
+import pickle
+import random
+import sys
+import zlib
+from collections import ChainMap
+
+from .core import Game
+from .deck import Deck
+from .player_action import PlayerAction, _action_classes
+from .state_sync import state_hash
+from ..utils import codec
+from ..utils.constants import C
+from ..utils.error import GameError
+from ..utils.message import warning
+from ..utils.package_io import _load_entity_class
+
+__author__ = 'fyabc'
+
+Magic = b'HSRP'
+FormatVersion = 1
+
+RecordAction, RecordCheckpoint, RecordEnd = 0, 1, 2
+
+_HashMask = 0xffffffff
+
+
+class ReplayError(GameError):
+    """The replay is invalid, or the current engine does not reproduce it."""
+
+
+def _dump_checkpoint(game):
+    # [NOTE]: Callbacks (of the recorder, frontends, etc.) and the event history are not saved, like ``ai.mcts``.
+    callbacks, event_history = game.callbacks, game.event_history
+    game.callbacks, game.event_history = {when: [] for when in callbacks}, []
+    try:
+        return zlib.compress(pickle.dumps(game, protocol=pickle.HIGHEST_PROTOCOL))
+    finally:
+        game.callbacks, game.event_history = callbacks, event_history
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """Unpickler of checkpoints, only engine and package classes are allowed."""
+
+    EngineModule = __name__.rpartition('.')[0]
+    PackageModulePrefix = '_hs_package_'
+    # Other globals in games: entity data, the random generator and the loader of entity classes.
+    Allowed = {(obj.__module__, obj.__name__): obj for obj in (ChainMap, random.Random, _load_entity_class)}
+
+    def find_class(self, module, name):
+        if (module, name) in self.Allowed:
+            return self.Allowed[module, name]
+        if module == self.EngineModule or module.startswith(self.EngineModule + '.') or \
+                module.startswith(self.PackageModulePrefix):
+            # [NOTE]: Modules are never imported here, packages must be loaded before.
+            obj = sys.modules.get(module)
+            for part in name.split('.'):
+                if obj is None or part.startswith('__'):
+                    obj = None
+                    break
+                obj = getattr(obj, part, None)
+            if isinstance(obj, type) and obj.__module__ == module:
+                return obj
+        raise pickle.UnpicklingError('Global {}.{} is forbidden in checkpoints'.format(module, name))
+
+
+def _load_checkpoint(data):
+    game = _CheckpointUnpickler(io.BytesIO(zlib.decompress(data))).load()
+    if not isinstance(game, Game):
+        raise pickle.UnpicklingError('The checkpoint is not a game: {!r}'.format(type(game)))
+    return game
+
+
+class ReplayRecorder:
+    """Record a game into a replay.
+
+    Create it just after ``Game.start_game`` (the game must have a seed), then run player actions as usual.
+
+    :param game: The game.
+    :param decks: Decks of players (the same as ``Game.start_game``).
+    :param checkpoint_interval: Interval (in turns) of checkpoints, default to C.Game.ReplayCheckpointInterval,
+        0 means no checkpoints.
+    """
+
+    def __init__(self, game, decks, checkpoint_interval=None):
+        if game.state != Game.GameState.WaitReplace:
+            raise ValueError('The recorder must be created just after the game start')
+        if game.seed is None:
+            raise ValueError('Games without seeds cannot be replayed')
+        if checkpoint_interval is None:
+            checkpoint_interval = C.Game.ReplayCheckpointInterval
+        self.game = game
+        self.checkpoint_interval = checkpoint_interval
+
+        self._action_names = sorted(_action_classes())
+        self._action_indices = {name: i for i, name in enumerate(self._action_names)}
+        self.n_actions = 0
+        self.finished = False
+        # Turn number before the current action.
+        self._last_turn = game.n_turns
+
+        self.data = bytearray(Magic)
+        codec.dump_into({
+            'format': FormatVersion,
+            'version': C.Game.Version,
+            'seed': game.seed,
+            'mode': game.mode,
+            'decks': [deck.to_code(comment=False) for deck in decks],
+            'actions': self._action_names,
+            'checkpoint_interval': checkpoint_interval,
+        }, self.data)
+
+        game.add_callback(self._on_action, 'action')
+
+    def _on_action(self, player_action):
+        game = self.game
+        d = player_action.to_dict()
+        action = [self._action_indices[d['action']]]
+        action.extend(d[name] for name in type(player_action).Fields)
+        turn = self._last_turn
+        codec.dump_into([RecordAction, turn, action, game.zobrist_hash() & _HashMask], self.data)
+        self.n_actions += 1
+
+        interval = self.checkpoint_interval
+        if interval and game.running and game.n_turns != turn and game.n_turns % interval == 0 \
+                and game.state == Game.GameState.Main:
+            try:
+                data = _dump_checkpoint(game)
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                # [NOTE]: Some cards cannot be pickled (e.g. lambda deathrattles), seeking replays from earlier.
+                warning('Cannot take the checkpoint of turn {}: {}'.format(game.n_turns, e))
+            else:
+                codec.dump_into([RecordCheckpoint, self.n_actions, game.n_turns, state_hash(game), data], self.data)
+        self._last_turn = game.n_turns
+
+        if game.game_result is not None and not self.finished:
+            self.finished = True
+            codec.dump_into([RecordEnd, game.game_result, game.n_turns, state_hash(game)], self.data)
+
+    def to_bytes(self):
+        return bytes(self.data)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.data)
+
+
+class Replay:
+    """A replay read from bytes.
+
+    :param data: Bytes of the replay.
+    :raise ReplayError: The data is not a valid replay.
+    """
+
+    def __init__(self, data):
+        if data[:len(Magic)] != Magic:
+            raise ReplayError('Not a replay (bad magic {!r})'.format(bytes(data[:len(Magic)])))
+        try:
+            header, offset = codec.load_from(data, len(Magic))
+            records = []
+            while offset < len(data):
+                record, offset = codec.load_from(data, offset)
+                records.append(record)
+        except codec.CodecError as e:
+            raise ReplayError('Corrupted replay: {}'.format(e)) from e
+        if not isinstance(header, dict):
+            raise ReplayError('Corrupted replay: bad header {!r}'.format(header))
+        if header.get('format') != FormatVersion:
+            raise ReplayError('Unsupported replay format {!r}'.format(header.get('format')))
+
+        self.header = header
+        try:
+            self.version = header['version']
+            self.seed = header['seed']
+            self.mode = header['mode']
+            self.deck_codes = header['decks']
+            self._action_names = header['actions']
+        except KeyError as e:
+            raise ReplayError('Corrupted replay: missing {} in the header'.format(e)) from e
+
+        # List of (turn, encoded action, hash).
+        self.actions = []
+        # List of (number of actions, turn, full hash, data).
+        self.checkpoints = []
+        # (game result, n_turns, full hash) of the finished game, or None.
+        self.end = None
+        for record in records:
+            if not isinstance(record, list) or not record:
+                raise ReplayError('Corrupted replay: bad record {!r}'.format(record))
+            if record[0] == RecordAction:
+                self.actions.append(tuple(record[1:]))
+            elif record[0] == RecordCheckpoint:
+                self.checkpoints.append(tuple(record[1:]))
+            elif record[0] == RecordEnd:
+                self.end = tuple(record[1:])
+            else:
+                raise ReplayError('Unknown record type {!r}'.format(record[0]))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            return cls(f.read())
+
+    def __repr__(self):
+        return 'Replay(version={}, seed={}, actions={}, checkpoints={}, finished={})'.format(
+            self.version, self.seed, len(self.actions), len(self.checkpoints), self.end is not None)
+
+    def __len__(self):
+        return len(self.actions)
+
+    @property
+    def n_turns(self):
+        """Number of turns of the recorded game."""
+        if self.end is not None:
+            return self.end[1]
+        return self.actions[-1][0] if self.actions else -1
+
+    def new_game(self):
+        """Start a new game with the decks and the seed of the replay."""
+        decks = [Deck.from_code(code) for code in self.deck_codes]
+        if None in decks:
+            raise ReplayError('Invalid deck codes in the replay')
+        game = Game()
+        game.start_game(decks, mode=self.mode, seed=self.seed)
+        return game
+
+    def decode_action(self, game, index):
+        """Decode the player action of the index in the game.
+
+        :raise ReplayError: The action cannot be decoded (e.g. the entity is not found).
+        """
+        action = self.actions[index][1]
+        name = self._action_names[action[0]]
+        cls = _action_classes().get(name)
+        if cls is None:
+            raise ReplayError('Unknown player action {!r} at action {}'.format(name, index))
+        d = dict(zip(cls.Fields, action[1:]))
+        d['action'] = name
+        try:
+            return PlayerAction.from_dict(game, d)
+        except GameError as e:
+            raise ReplayError('Cannot decode action {} at turn {}: {}'.format(index, self.actions[index][0], e)) from e
+
+    def play(self, game, start=0, stop=None, verify=False):
+        """Run actions ``[start, stop)`` in the game (the game must be at the state after ``start`` actions).
+
+        :param verify: Check state hashes after each action.
+        :raise ReplayError: If verify and the hash mismatch.
+        """
+        stop = len(self.actions) if stop is None else stop
+        for index in range(start, stop):
+            game.run_player_action(self.decode_action(game, index))
+            if verify and game.zobrist_hash() & _HashMask != self.actions[index][2]:
+                raise ReplayError('State mismatch after action {} at turn {}'.format(index, self.actions[index][0]))
+        return game
+
+    def index_of_turn(self, turn):
+        """Get the index of the first action of the turn (or the number of actions if the turn is not reached)."""
+        return next((i for i, (t, _, _) in enumerate(self.actions) if t >= turn), len(self.actions))
+
+    def game_at(self, index, use_checkpoints=True):
+        """Get the game after ``index`` actions, starting from the latest usable checkpoint."""
+        start, game = 0, None
+        if use_checkpoints:
+            for n_actions, turn, _, data in reversed(self.checkpoints):
+                if n_actions > index:
+                    continue
+                try:
+                    # [NOTE]: Forbidden globals raise ``pickle.UnpicklingError``, see ``_CheckpointUnpickler``.
+                    game = _load_checkpoint(data)
+                except Exception as e:
+                    warning('Cannot load the checkpoint of turn {}: {!r}'.format(turn, e))
+                    continue
+                start = n_actions
+                break
+        if game is None:
+            game = self.new_game()
+        return self.play(game, start, index)
+
+    def seek(self, turn, use_checkpoints=True):
+        """Get the game at the start of the turn.
+
+        :return: The game and the index of the next action.
+        """
+        index = self.index_of_turn(turn)
+        return self.game_at(index, use_checkpoints=use_checkpoints), index
+
+    def verify(self):
+        """Replay the whole game from turn 0 and check it against the recorded hashes, checkpoints and result.
+
+        :return: The replayed game.
+
+        :raise ReplayError: The current engine does not reproduce the replay.
+        """
+        game = self.new_game()
+        start = 0
+        for n_actions, turn, full_hash, data in self.checkpoints:
+            self.play(game, start, n_actions, verify=True)
+            start = n_actions
+            if state_hash(game) != full_hash:
+                raise ReplayError('State mismatch at the checkpoint of turn {}'.format(turn))
+            # Seeking needs checkpoints, so they must be loaded by the current engine.
+            try:
+                checkpoint_hash = state_hash(_load_checkpoint(data))
+            except Exception as e:
+                raise ReplayError('Cannot load the checkpoint of turn {}: {!r}'.format(turn, e)) from e
+            if checkpoint_hash != full_hash:
+                raise ReplayError('State mismatch of the loaded checkpoint of turn {}'.format(turn))
+        self.play(game, start, verify=True)
+
+        if self.end is not None:
+            game_result, n_turns, full_hash = self.end
+            if game.running or (game.game_result, game.n_turns) != (game_result, n_turns):
+                raise ReplayError('Result mismatch: expect ({}, turn {}), got ({}, turn {})'.format(
+                    game_result, n_turns, game.game_result, game.n_turns))
+            if state_hash(game) != full_hash:
+                raise ReplayError('State mismatch at the end of the game')
+        return game
+
+
+__all__ = [
+    'ReplayError',
+    'ReplayRecorder',
+    'Replay',
+]
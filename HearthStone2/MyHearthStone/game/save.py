@@ -0,0 +1,380 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Fast save and restore of in-progress games.
+
+Unlike pickle, the saved game does not contain class-level data or module paths of card classes::
+
+    data = save_game(game)          # bytes
+    game = restore_game(data)       # A new game, the state is same as the saved game.
+
+Format: the magic ``b'HSSG'`` followed by a ``marshal`` dump of::
+
+    [format version, globals, random state, game state, objects]
+
+    globals:    Type ids of classes (and functions) used in the game, referenced by index.
+    objects:    [global index of the class, state], ...
+                Entities, triggers, auras and events reachable from the game, referenced by index.
+    state:      The instance dict. The ``data`` of entities is stored as entity-level tags only (``data.maps[0]``),
+                class-level data is retrieved from the class when restored.
+
+Type ids:
+
+    Cards, heroes, hero powers and enchantments of packages are stored by their ids, e.g. ``'C30'``
+    (the card "30"), ``'H2'`` (the hero 2) and ``'E3'`` (the enchantment "3").
+    Classes nested in them (e.g. triggers and auras of cards) are stored by the attribute name,
+    e.g. ``'C30.Trig_古拉巴什狂暴者'``.
+    Other classes (e.g. engine triggers and events) are stored by ``'module:qualname'``.
+
+Values of states are None, bool, int, float, str, lists, tuples, sets and dicts of them,
+references of objects and globals. Other values (e.g. lambda deathrattle functions) raise ``SaveError``.
+
+Callbacks, the event history and the undo journal are not saved, like ``ai.mcts.dump_game``.
+
+[NOTE]: Restored games use a random number generator of the saved state, even if the saved game used
+the global generator (no seed).
+[NOTE]: Plain containers (lists, dicts, etc.) shared by different objects are saved as copies.
+"""
+
+from array import array
+from collections import ChainMap
+from contextlib import contextmanager
+from functools import partial
+import gc
+from importlib import import_module
+import marshal
+import random
+import types
+from weakref import WeakValueDictionary
+
+from .core import Game
+from .events.event import Event
+from .enchantments.aura import Aura
+from .game_entity import GameEntity, TagDict
+from .triggers.trigger import Trigger
+from .zobrist import ZobristHash
+from ..utils.error import GameError
+from ..utils.package_io import all_cards, all_heroes, all_hero_powers, all_enchantments
+
+__author__ = 'fyabc'
+
+Magic = b'HSSG'
+FormatVersion = 1
+
+# Tags of encoded values (the first item of tuples, all tuples in states are encoded values).
+_Ref, _RefList, _RefSet, _List, _Tuple, _Set, _FrozenSet, _Dict, _Global, _GameRef, _Tags = range(11)
+
+_PlainTypes = frozenset([type(None), bool, int, float, str])
+_EmptyContainerTypes = frozenset([list, set, dict])
+_ObjectTypes = (GameEntity, Trigger, Aura, Event)
+
+_new_chain_map = partial(object.__new__, ChainMap)
+
+# Attributes of the game that are not saved, they are reset (or rebuilt) when restored.
+_TransientGameAttributes = frozenset([
+    'random', 'callbacks', 'event_history', 'current_events', 'current_triggers', '_legal_actions', 'journal',
+    'zobrist', '_player_iter', 'entities',
+])
+
+
+class SaveError(GameError):
+    """The game cannot be saved, or the data cannot be restored."""
+
+
+class _GlobalRegistry:
+    """Map classes (and functions) to stable type ids, see the module docstring."""
+
+    def __init__(self):
+        self.ids = {}
+        self.globals = {}
+
+        top_level = []
+        for prefix, data in (('C', all_cards()), ('H', all_heroes()), ('P', all_hero_powers()),
+                             ('E', all_enchantments())):
+            for id_, cls in data.items():
+                top_level.append(cls)
+                self._add(cls, '{}{}'.format(prefix, id_))
+        # Register nested classes after all top-level classes, so aliases do not change ids of top-level classes.
+        for cls in top_level:
+            self._add_nested(cls)
+
+    def _add(self, obj, global_id):
+        if obj in self.ids or global_id in self.globals:
+            return False
+        self.ids[obj] = global_id
+        self.globals[global_id] = obj
+        return True
+
+    def _add_nested(self, cls):
+        for name, value in vars(cls).items():
+            if isinstance(value, type) and self._add(value, '{}.{}'.format(self.ids[cls], name)):
+                self._add_nested(value)
+
+    def global_id(self, obj):
+        result = self.ids.get(obj)
+        if result is None:
+            result = '{}:{}'.format(obj.__module__, obj.__qualname__)
+            try:
+                found = self.load(result)
+            except SaveError:
+                found = None
+            if found is not obj:
+                raise SaveError('Cannot save {!r}: not found by {!r}'.format(obj, result))
+            self.ids[obj] = result
+        return result
+
+    def load(self, global_id):
+        result = self.globals.get(global_id)
+        if result is None:
+            if ':' not in global_id:
+                raise SaveError('Unknown type id {!r} (is the package loaded?)'.format(global_id))
+            module_name, qualname = global_id.split(':', 1)
+            try:
+                result = import_module(module_name)
+                for name in qualname.split('.'):
+                    result = getattr(result, name)
+            except (ImportError, AttributeError) as e:
+                raise SaveError('Cannot find {!r}: {}'.format(global_id, e)) from e
+            self.globals[global_id] = result
+        return result
+
+
+# (card dict, registry) of the loaded packages, rebuilt when packages are reloaded.
+_RegistryCache = [None, None]
+
+
+def _registry():
+    cards = all_cards()
+    if _RegistryCache[0] is not cards:
+        _RegistryCache[:] = cards, _GlobalRegistry()
+    return _RegistryCache[1]
+
+
+class _Saver:
+    def __init__(self, game):
+        self.game = game
+        self.registry = _registry()
+
+        self.globals = []
+        self._global_indices = {}
+
+        self.objects = []
+        self._object_indices = {}
+
+    def global_index(self, obj):
+        index = self._global_indices.get(obj)
+        if index is None:
+            index = self._global_indices[obj] = len(self.globals)
+            self.globals.append(self.registry.global_id(obj))
+        return index
+
+    def ref(self, obj):
+        index = self._object_indices.get(id(obj))
+        if index is None:
+            index = self._object_indices[id(obj)] = len(self.objects)
+            self.objects.append(obj)
+        return index
+
+    def value(self, v):
+        t = type(v)
+        if t in _PlainTypes:
+            return v
+        plain = _PlainTypes
+        if t is list or t is set:
+            # Containers of plain values (include empty containers) are dumped as is.
+            for x in v:
+                if type(x) not in plain:
+                    break
+            else:
+                return v
+            if all(isinstance(x, _ObjectTypes) for x in v):
+                return _RefList if t is list else _RefSet, [self.ref(x) for x in v]
+            return _List if t is list else _Set, [self.value(x) for x in v]
+        if t is dict or t is TagDict:
+            for k, x in v.items():
+                if type(k) not in plain or (type(x) not in plain and (x or type(x) not in _EmptyContainerTypes)):
+                    break
+            else:
+                return v if t is dict else dict(v)
+            return _Dict, [self.value(k) for k in v], [self.value(x) for x in v.values()]
+        if t is tuple or t is frozenset:
+            return _Tuple if t is tuple else _FrozenSet, [self.value(x) for x in v]
+        if isinstance(v, _ObjectTypes):
+            return _Ref, self.ref(v)
+        if v is self.game:
+            return _GameRef,
+        if t is ChainMap:
+            # Entity-level tags only.
+            return _Tags, self.value(v.maps[0])
+        if isinstance(v, (type, types.FunctionType)):
+            return _Global, self.global_index(v)
+        raise SaveError('Cannot save value {!r} of type {}'.format(v, t.__name__))
+
+    def object_state(self, obj):
+        try:
+            d = vars(obj)
+        except TypeError:
+            raise SaveError('Cannot save object {!r} without instance dict'.format(obj)) from None
+        plain, value = _PlainTypes, self.value
+        return [self.global_index(type(obj)), {k: v if type(v) in plain else value(v) for k, v in d.items()}]
+
+    def save(self):
+        game = self.game
+        game_state = {k: self.value(v) for k, v in vars(game).items() if k not in _TransientGameAttributes}
+        game_state['callbacks'] = list(game.callbacks)
+        game_state['zobrist'] = [game.zobrist.value, game.zobrist.debug]
+        game_state['entities'] = self.value(dict(game.entities))
+
+        records = []
+        # [NOTE]: Objects found when saving states are appended to the list.
+        i = 0
+        while i < len(self.objects):
+            records.append(self.object_state(self.objects[i]))
+            i += 1
+
+        version, internal_state, gauss_next = game.random.getstate()
+        random_state = [version, array('I', internal_state).tobytes(), gauss_next]
+        return Magic + marshal.dumps([FormatVersion, self.globals, random_state, game_state, records])
+
+
+class _Loader:
+    def __init__(self, game, globals_, records):
+        self.game = game
+        self.globals = globals_
+        self.objects = [globals_[record[0]].__new__(globals_[record[0]]) for record in records]
+
+    def value(self, v):
+        tag = v[0]
+        if tag == _Ref:
+            return self.objects[v[1]]
+        if tag == _RefList:
+            objects = self.objects
+            return [objects[i] for i in v[1]]
+        if tag == _RefSet:
+            objects = self.objects
+            return {objects[i] for i in v[1]}
+        if tag == _Global:
+            return self.globals[v[1]]
+        if tag == _GameRef:
+            return self.game
+        if tag == _Dict:
+            return {self.item(k): self.item(x) for k, x in zip(v[1], v[2])}
+        items = [self.item(x) for x in v[1]]
+        if tag == _List:
+            return items
+        if tag == _Tuple:
+            return tuple(items)
+        if tag == _Set:
+            return set(items)
+        if tag == _FrozenSet:
+            return frozenset(items)
+        raise SaveError('Unknown value tag {!r}'.format(tag))
+
+    def item(self, v):
+        return self.value(v) if type(v) is tuple else v
+
+    def restore_objects(self, records):
+        game, value = self.game, self.value
+        for obj, (_, state) in zip(self.objects, records):
+            for k, v in state.items():
+                if type(v) is tuple:
+                    tag = v[0]
+                    if tag == _GameRef:
+                        state[k] = game
+                    elif tag == _Tags:
+                        tags = v[1]
+                        # [NOTE]: Same as ``ChainMap.new_child``, but faster.
+                        data = state[k] = _new_chain_map()
+                        data.maps = [TagDict(obj, value(tags) if type(tags) is tuple else tags)]
+                        data.maps.extend(type(obj).data.maps)
+                    else:
+                        state[k] = value(v)
+            obj.__dict__ = state
+
+
+@contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector.
+
+    Saving and restoring create many small containers, which trigger collections of young objects again and again.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def save_game(game):
+    """Save the game into bytes.
+
+    :param game: The game, it must not be resolving events (e.g. save it between player actions).
+    :return: The saved data.
+    :rtype: bytes
+
+    :raise SaveError: Some states of the game cannot be saved.
+    """
+    with _gc_paused():
+        return _Saver(game).save()
+
+
+def restore_game(data):
+    """Restore the game from bytes saved by ``save_game``.
+
+    The packages of the saved game must be loaded.
+
+    :param data: The saved data.
+    :return: The restored game.
+    :rtype: Game
+
+    :raise SaveError: The data is invalid, or some classes of the game are not found.
+    """
+    if data[:len(Magic)] != Magic:
+        raise SaveError('Not a saved game (bad magic {!r})'.format(bytes(data[:len(Magic)])))
+    try:
+        format_version, global_ids, random_state, game_state, records = marshal.loads(data[len(Magic):])
+    except (EOFError, ValueError, TypeError) as e:
+        raise SaveError('Corrupted saved game: {}'.format(e)) from e
+    if format_version != FormatVersion:
+        raise SaveError('Unsupported saved game format {!r}'.format(format_version))
+
+    with _gc_paused():
+        return _restore(game_state, global_ids, random_state, records)
+
+
+def _restore(game_state, global_ids, random_state, records):
+    registry = _registry()
+    game = Game.__new__(Game)
+    loader = _Loader(game, [registry.load(global_id) for global_id in global_ids], records)
+    loader.restore_objects(records)
+
+    zobrist_value, debug_hash = game_state.pop('zobrist')
+    callbacks = game_state.pop('callbacks')
+    for k, v in game_state.items():
+        if type(v) is tuple:
+            game_state[k] = loader.value(v)
+    game.__dict__.update(game_state)
+    game.entities = WeakValueDictionary(game.entities)
+
+    version, internal_state, gauss_next = random_state
+    game.random = random.Random()
+    game.random.setstate((version, tuple(array('I', internal_state)), gauss_next))
+    game.callbacks = {when: [] for when in callbacks}
+    game.event_history = []
+    game.current_events = None
+    game.current_triggers = None
+    game._legal_actions = None
+    game.journal = None
+    game.zobrist = ZobristHash(game, debug=debug_hash)
+    game.zobrist.value = zobrist_value
+    game._player_iter = game._player_generator()
+    return game
+
+
+__all__ = [
+    'SaveError',
+    'save_game',
+    'restore_game',
+]
@@ -0,0 +1,452 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Game state synchronization.
+
+The state sync subsystem listens to engine callbacks ('tag', 'zone', 'enchantment' and 'resolve'),
+and produces a versioned stream of small deltas. Changes between two flushes are coalesced, so the size of each
+batch scales with what changed, not with the size of the board.
+
+Batch format::
+
+    [version, [delta, delta, ...]]
+
+Delta formats (all are plain lists, can be dumped into JSON directly)::
+
+    [Snapshot]                                          Clear the mirror, following deltas describe the full state.
+    [Turn, n_turns, current_player, state]              Turn changed.
+    [Mana, player_id, [max, temp, used, overload, overload_next]]
+    [Zone, player_id, zone, [eid, ...]]                 New order of the zone. Hidden positions are None.
+    [Entity, eid, player_id, zone, card_id, tags, [[enchantment_eid, enchantment_id], ...]]
+                                                        Full state of the entity. Hidden entities have None values.
+    [Tag, eid, player_id, zone, {tag: value}, [deleted_tag, ...]]
+    [Attach, eid, player_id, zone, enchantment_eid, enchantment_id]
+    [Detach, eid, player_id, zone, enchantment_eid]
+
+[NOTE]: Only entity-level tags (``entity.data.maps[0]``) are synced, class-level data can be retrieved by the card id.
+    Tags with values that cannot be dumped into JSON are ignored.
+
+Visibility (see ``visible``):
+    Deck: hidden to all players.
+    Hand & Secret: visible to the owner only.
+    Others: visible to all players.
+    Viewer None: visible everything (used by the server itself and replays).
+"""
+
+import zlib
+
+from ..utils import codec
+from ..utils.error import GameError
+from ..utils.game import EnumMeta, Type, Zone
+
+__author__ = 'fyabc'
+
+
+class DeltaTypes(metaclass=EnumMeta):
+    Snapshot = 0
+    Turn = 1
+    Mana = 2
+    Zone = 3
+    Entity = 4
+    Tag = 5
+    Attach = 6
+    Detach = 7
+
+
+class SyncError(GameError):
+    """The mirror cannot apply the batch (e.g. version mismatch)."""
+
+
+# Entity types that are synced. Players, enchantments and the game entity are synced in other ways.
+SyncedTypes = frozenset([
+    Type.Minion, Type.Spell, Type.Weapon, Type.HeroCard, Type.Permanent, Type.Hero, Type.HeroPower,
+])
+
+SyncedZones = (Zone.Deck, Zone.Hand, Zone.Secret, Zone.Play, Zone.Graveyard, Zone.Weapon, Zone.Hero, Zone.HeroPower)
+
+# These tags are synced by zone and entity deltas.
+_ZPTags = frozenset(['zone', 'player_id'])
+_PlainTypes = (int, float, str, bool, type(None))
+
+
+def _jsonable(value):
+    if isinstance(value, _PlainTypes):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(isinstance(v, _PlainTypes) for v in value)
+    return False
+
+
+def _synced(entity):
+    return entity.data.get('type', None) in SyncedTypes
+
+
+def visible(zone, player_id, viewer):
+    """Test if the entity in the zone of the player is visible to the viewer."""
+    if viewer is None:
+        return True
+    if zone == Zone.Deck:
+        return False
+    if zone in (Zone.Hand, Zone.Secret):
+        return player_id == viewer
+    return True
+
+
+def mana_status(player):
+    return [player.max_mana, player.temp_mana, player.used_mana, player.overload, player.overload_next]
+
+
+def turn_status(game):
+    return [game.n_turns, game.current_player, game.state]
+
+
+def entity_tags(entity):
+    # [NOTE]: Sorted by keys, so the result does not depend on the order of tag writes
+    # (e.g. states restored by the undo journal, see ``journal``).
+    tags = entity.data.maps[0]
+    return {k: tags[k] for k in sorted(tags) if k not in _ZPTags and _jsonable(tags[k])}
+
+
+def entity_enchantments(entity):
+    return [[e.eid, e.id] for e in entity.enchantments + entity.aura_enchantments]
+
+
+def entity_delta(entity):
+    return [DeltaTypes.Entity, entity.eid, entity.player_id, entity.zone,
+            entity.id, entity_tags(entity), entity_enchantments(entity)]
+
+
+def zone_delta(game, player_id, zone):
+    eids = [None if e is None else e.eid for e in game.get_zone(zone, player_id)]
+    return [DeltaTypes.Zone, player_id, zone, eids]
+
+
+def filter_deltas(deltas, viewer):
+    """Filter deltas for the viewer, hide all invisible information.
+
+    :param deltas: Omniscient deltas.
+    :param viewer: The player id of the viewer, None means omniscient.
+    :return: Filtered delta list.
+    """
+    if viewer is None:
+        return deltas
+    result = []
+    for delta in deltas:
+        t = delta[0]
+        if t == DeltaTypes.Zone:
+            if not visible(delta[2], delta[1], viewer) and delta[2] == Zone.Deck:
+                delta = [t, delta[1], delta[2], [None] * len(delta[3])]
+        elif t == DeltaTypes.Entity:
+            if not visible(delta[3], delta[2], viewer):
+                delta = [t, delta[1], delta[2], delta[3], None, None, None]
+        elif t in (DeltaTypes.Tag, DeltaTypes.Attach, DeltaTypes.Detach):
+            if not visible(delta[3], delta[2], viewer):
+                continue
+        result.append(delta)
+    return result
+
+
+def filter_batch(batch, viewer):
+    version, deltas = batch
+    return [version, filter_deltas(deltas, viewer)]
+
+
+def game_snapshot(game, viewer=None, version=0):
+    """Get the full snapshot batch of the game.
+
+    :param game: The game.
+    :param viewer: The player id of the viewer, None means omniscient.
+    :param version: The version of the snapshot.
+    :return: The snapshot batch.
+    """
+    deltas = [[DeltaTypes.Snapshot], [DeltaTypes.Turn] + turn_status(game)]
+    if game.players[0] is None:
+        return [version, deltas]
+    for player_id, player in enumerate(game.players):
+        deltas.append([DeltaTypes.Mana, player_id, mana_status(player)])
+        for zone in SyncedZones:
+            deltas.append(zone_delta(game, player_id, zone))
+            deltas.extend(entity_delta(e) for e in game.get_zone(zone, player_id) if e is not None)
+    return [version, filter_deltas(deltas, viewer)]
+
+
+def state_hash(game):
+    """Get the hash of the full state of the game, used to detect divergence of games in lockstep mode.
+
+    [NOTE]: It does not use the builtin ``hash``, so the result is same in different processes.
+    """
+    return zlib.crc32(codec.dumps(game_snapshot(game)[1]))
+
+
+class StateSync:
+    """Record changes of the game and produce versioned delta batches.
+
+    Usage::
+
+        sync = StateSync(game)
+        game.start_game(...)
+        snapshot = sync.snapshot(viewer=0)         # Send to the joined client.
+        game.run_player_action(...)
+        for batch in sync.pop_batches():
+            send(filter_batch(batch, viewer=0))
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.version = 0
+
+        # Flushed batches (omniscient), popped by ``pop_batches``.
+        self.batches = []
+
+        # Pending changes.
+        self._full = {}             # eid -> entity, need full entity delta
+        self._tags = {}             # eid -> (entity, set of tags)
+        self._enchantments = []     # (entity, enchantment, attached)
+        self._zones = set()         # (player_id, zone)
+
+        # Last flushed mana and turn status.
+        self._mana = [None, None]
+        self._turn = None
+
+        game.add_callback(self._cb_tag, 'tag')
+        game.add_callback(self._cb_zone, 'zone')
+        game.add_callback(self._cb_enchantment, 'enchantment')
+        game.add_callback(self._cb_resolve, 'resolve')
+
+    def __repr__(self):
+        return 'StateSync(version={})'.format(self.version)
+
+    def detach(self):
+        """Remove all callbacks of this object from the game."""
+        for when, callback in (('tag', self._cb_tag), ('zone', self._cb_zone),
+                               ('enchantment', self._cb_enchantment), ('resolve', self._cb_resolve)):
+            self.game.callbacks[when].remove(callback)
+
+    # Callbacks.
+
+    def _cb_tag(self, entity, tag, _old, _new):
+        if tag in _ZPTags or not _synced(entity):
+            return
+        eid = entity.eid
+        if eid in self._full:
+            return
+        record = self._tags.get(eid)
+        if record is None:
+            self._tags[eid] = (entity, {tag})
+        else:
+            record[1].add(tag)
+
+    def _cb_zone(self, entity, from_player, from_zone, _from_index, to_player, to_zone, _to_index):
+        if from_zone is not None:
+            self._zones.add((from_player, from_zone))
+        self._zones.add((to_player, to_zone))
+        if _synced(entity):
+            self._full[entity.eid] = entity
+            self._tags.pop(entity.eid, None)
+
+    def _cb_enchantment(self, entity, enchantment, attached):
+        if _synced(entity):
+            self._enchantments.append((entity, enchantment, attached))
+
+    def _cb_resolve(self, *_):
+        self.flush()
+
+    # Flush and output.
+
+    def _clear_pending(self):
+        self._full.clear()
+        self._tags.clear()
+        self._enchantments.clear()
+        self._zones.clear()
+
+    def flush(self):
+        """Flush pending changes into a new batch.
+
+        :return: The new batch, or None if nothing changed.
+        """
+        game = self.game
+        deltas = []
+
+        turn = turn_status(game)
+        if turn != self._turn:
+            self._turn = turn
+            deltas.append([DeltaTypes.Turn] + turn)
+        if game.players[0] is not None:
+            for player_id, player in enumerate(game.players):
+                mana = mana_status(player)
+                if mana != self._mana[player_id]:
+                    self._mana[player_id] = mana
+                    deltas.append([DeltaTypes.Mana, player_id, mana])
+
+        for player_id, zone in sorted(self._zones):
+            if zone in SyncedZones:
+                deltas.append(zone_delta(game, player_id, zone))
+        for entity in self._full.values():
+            if entity.zone in SyncedZones:
+                deltas.append(entity_delta(entity))
+        for eid, (entity, tags) in self._tags.items():
+            if entity.zone not in SyncedZones:
+                continue
+            data = entity.data.maps[0]
+            changed, deleted = {}, []
+            for tag in tags:
+                if tag not in data:
+                    deleted.append(tag)
+                elif _jsonable(data[tag]):
+                    changed[tag] = data[tag]
+            if changed or deleted:
+                deltas.append([DeltaTypes.Tag, eid, entity.player_id, entity.zone, changed, deleted])
+        for entity, enchantment, attached in self._enchantments:
+            if entity.eid in self._full or entity.zone not in SyncedZones:
+                continue
+            if attached:
+                deltas.append([DeltaTypes.Attach, entity.eid, entity.player_id, entity.zone,
+                               enchantment.eid, enchantment.id])
+            else:
+                deltas.append([DeltaTypes.Detach, entity.eid, entity.player_id, entity.zone, enchantment.eid])
+
+        self._clear_pending()
+        if not deltas:
+            return None
+        self.version += 1
+        batch = [self.version, deltas]
+        self.batches.append(batch)
+        return batch
+
+    def pop_batches(self):
+        """Flush and pop all batches (omniscient) since last call."""
+        self.flush()
+        batches, self.batches = self.batches, []
+        return batches
+
+    def snapshot(self, viewer=None):
+        """Get the full snapshot of the current version.
+
+        [NOTE]: Batches that are not popped are still kept, mirrors will ignore batches older than the snapshot.
+        """
+        self.flush()
+        return game_snapshot(self.game, viewer, self.version)
+
+
+class MirrorEntity:
+    """The mirror of an entity, maintained by clients."""
+
+    __slots__ = ('eid', 'player_id', 'zone', 'id', 'tags', 'enchantments')
+
+    def __init__(self, eid, player_id, zone, card_id=None, tags=None, enchantments=()):
+        self.eid = eid
+        self.player_id = player_id
+        self.zone = zone
+        self.id = card_id
+        self.tags = {} if tags is None else tags
+        # Enchantment eid -> enchantment id.
+        self.enchantments = dict(enchantments or ())
+
+    def __repr__(self):
+        return 'MirrorEntity(eid={}, id={}, P{}#{})'.format(
+            self.eid, self.id, self.player_id, Zone.Idx2Str.get(self.zone, self.zone))
+
+
+class MirrorGame:
+    """The client-side mirror of the game, built from snapshots and deltas."""
+
+    def __init__(self):
+        self.version = -1
+        self.n_turns = None
+        self.current_player = None
+        self.state = None
+        self.mana = [None, None]
+        self.zones = [{}, {}]       # player_id -> zone -> list of eids
+        self.entities = {}          # eid -> MirrorEntity
+
+    def __repr__(self):
+        return 'MirrorGame(version={})'.format(self.version)
+
+    def get_zone(self, zone, player_id):
+        return self.zones[player_id].get(zone, [])
+
+    def get_entities(self, zone, player_id):
+        return [None if eid is None else self.entities.get(eid) for eid in self.get_zone(zone, player_id)]
+
+    def apply_batch(self, batch):
+        """Apply a batch.
+
+        Batches older than the mirror are ignored; snapshot batches are always applied.
+
+        :return: The batch is applied or not.
+        :raise SyncError: There are missing batches between the mirror and the batch.
+        """
+        version, deltas = batch
+        is_snapshot = bool(deltas) and deltas[0][0] == DeltaTypes.Snapshot
+        if not is_snapshot:
+            if version <= self.version:
+                return False
+            if version != self.version + 1:
+                raise SyncError('Version gap: mirror {}, batch {}'.format(self.version, version))
+        for delta in deltas:
+            self._apply_delta(delta)
+        self.version = version
+        return True
+
+    def apply_batches(self, batches):
+        for batch in batches:
+            self.apply_batch(batch)
+
+    def snapshot(self):
+        """Get the snapshot batch of the mirror, which can be applied by other mirrors."""
+        deltas = [[DeltaTypes.Snapshot], [DeltaTypes.Turn, self.n_turns, self.current_player, self.state]]
+        for player_id, zones in enumerate(self.zones):
+            if self.mana[player_id] is not None:
+                deltas.append([DeltaTypes.Mana, player_id, self.mana[player_id]])
+            for zone, eids in zones.items():
+                deltas.append([DeltaTypes.Zone, player_id, zone, list(eids)])
+                for eid in eids:
+                    entity = self.entities.get(eid)
+                    if entity is not None:
+                        deltas.append([
+                            DeltaTypes.Entity, eid, entity.player_id, entity.zone, entity.id, dict(entity.tags),
+                            [[k, v] for k, v in entity.enchantments.items()]])
+        return [self.version, deltas]
+
+    def _apply_delta(self, delta):
+        t = delta[0]
+        if t == DeltaTypes.Snapshot:
+            self.__init__()
+        elif t == DeltaTypes.Turn:
+            self.n_turns, self.current_player, self.state = delta[1:]
+        elif t == DeltaTypes.Mana:
+            self.mana[delta[1]] = delta[2]
+        elif t == DeltaTypes.Zone:
+            self.zones[delta[1]][delta[2]] = delta[3]
+        elif t == DeltaTypes.Entity:
+            _, eid, player_id, zone, card_id, tags, enchantments = delta
+            self.entities[eid] = MirrorEntity(eid, player_id, zone, card_id, tags, enchantments)
+        else:
+            entity = self.entities.get(delta[1])
+            if entity is None:
+                raise SyncError('Unknown entity {} in delta {}'.format(delta[1], delta))
+            entity.player_id, entity.zone = delta[2], delta[3]
+            if t == DeltaTypes.Tag:
+                entity.tags.update(delta[4])
+                for tag in delta[5]:
+                    entity.tags.pop(tag, None)
+            elif t == DeltaTypes.Attach:
+                entity.enchantments[delta[4]] = delta[5]
+            elif t == DeltaTypes.Detach:
+                entity.enchantments.pop(delta[4], None)
+            else:
+                raise SyncError('Unknown delta type {!r}'.format(t))
+
+
+__all__ = [
+    'DeltaTypes',
+    'SyncError',
+    'visible',
+    'filter_deltas',
+    'filter_batch',
+    'game_snapshot',
+    'state_hash',
+    'StateSync',
+    'MirrorEntity',
+    'MirrorGame',
+]
@@ -0,0 +1,211 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Incremental 64-bit hash of the game state (Zobrist hashing).
+
+Each (entity id, tag, value) triple has a fixed pseudo-random 64-bit key. The hash of an entity is the sum of keys of
+its entity-level tags and attached enchantments, and the hash of the game is the sum of hashes of entities in
+hashed zones, plus the key of global status (turn, current player and mana of players) and keys of positions of
+minions in play (see ``position_hash``).
+
+The engine maintains the hash on each tag change (``TagDict``, include zone moves of ``GameEntity.set_zp``)
+and enchantment attach/detach, so ``Game.zobrist_hash`` is O(1) (positions of at most 14 minions in play are
+summed when getting the hash, instead of hooking each move in zone lists).
+
+[NOTE]: Keys are combined by addition modulo 2 ** 64 instead of xor, so equal keys (e.g. two same enchantments
+attached to the same minion) do not cancel each other.
+[NOTE]: Only scalar tag values (None, bool, int, float and str) are hashed. Positions of minions in play are hashed
+(adjacent effects depend on them), but positions in other zones and the order of play are not, so playing two minions
+in different orders into the same board reaches the same hash.
+[NOTE]: Keys do not use the builtin ``hash``, so the result is same in different processes.
+
+Set ``debug_hash`` of the game (or ``C.Game.DebugHash``) to recompute the full hash after each player action,
+a mismatch raises ``AssertionError``.
+"""
+
+import hashlib
+
+from ..utils.game import Zone
+
+__author__ = 'fyabc'
+
+_Mask = (1 << 64) - 1
+
+# Entities in other zones (Invalid, SetAside and RFG) are not hashed.
+HashedZones = frozenset([
+    Zone.Deck, Zone.Hand, Zone.Play, Zone.Secret, Zone.Graveyard, Zone.Weapon, Zone.Hero, Zone.HeroPower])
+
+_ScalarTypes = frozenset([type(None), bool, int, float, str])
+
+# Cache of keys, cleared when too large.
+_Keys = {}
+_KeysMax = 1 << 20
+
+
+def _digest(key):
+    return int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), 'little')
+
+
+def tag_key(eid, tag, value):
+    """Get the key of the (entity id, tag, value) triple, 0 if the value is not hashed."""
+    if type(value) not in _ScalarTypes:
+        return 0
+    key = (eid, tag, value)
+    result = _Keys.get(key)
+    if result is None:
+        if len(_Keys) >= _KeysMax:
+            _Keys.clear()
+        # Normalize values, since ``True == 1`` and ``1.0 == 1`` share the same cache entry.
+        if type(value) is bool or (type(value) is float and value.is_integer()):
+            value = int(value)
+        result = _Keys[key] = _digest((eid, tag, value))
+    return result
+
+
+def enchantment_key(entity, enchantment):
+    return tag_key(entity.eid, '$enchantment', enchantment.id)
+
+
+def is_hashed(entity, zone=None):
+    """Test if the entity is hashed (in the given zone, default to its current zone)."""
+    return entity.hashed and (entity.zone if zone is None else zone) in HashedZones
+
+
+def entity_hash(entity):
+    """Compute the hash of the entity from scratch."""
+    eid = entity.eid
+    result = 0
+    for tag, value in entity.data.maps[0].items():
+        result += tag_key(eid, tag, value)
+    for enchantment in entity.all_enchantments():
+        result += enchantment_key(entity, enchantment)
+    return result & _Mask
+
+
+def global_hash(game):
+    """Compute the hash of global status: game state, turn, current player and mana of players."""
+    return _digest((game.state, game.n_turns, game.current_player, tuple(
+        None if player is None else
+        (player.max_mana, player.temp_mana, player.used_mana, player.overload, player.overload_next)
+        for player in game.players)))
+
+
+def position_hash(game):
+    """Compute the hash of positions of minions in play zones (the sum of keys of (entity id, position) pairs)."""
+    result = 0
+    for player in game.players:
+        if player is None:
+            continue
+        for index, entity in enumerate(player.play):
+            result += tag_key(entity.eid, '$position', index)
+    return result & _Mask
+
+
+def hashed_entities(game):
+    """Iterate over all hashed entities of the game, include the game entity, players and graveyards."""
+    candidates = [game.entity]
+    for player in game.players:
+        if player is None:
+            continue
+        candidates.append(player)
+        candidates.extend(player.get_all_entities())
+        candidates.extend(player.graveyard)
+    for entity in candidates:
+        if is_hashed(entity):
+            yield entity
+
+
+class ZobristHash:
+    """The incremental hash of the game, maintained by the engine.
+
+    :param game: The game.
+    :param debug: Recompute the full hash and assert equality in ``check``.
+    """
+
+    __slots__ = ('game', 'value', 'debug')
+
+    def __init__(self, game, debug=False):
+        self.game = game
+        self.debug = debug
+
+        # Sum of hashes of hashed entities.
+        self.value = 0
+
+    def __repr__(self):
+        return 'ZobristHash({:016x})'.format(self.hash())
+
+    def rebuild(self):
+        """Rebuild the game hash from hashes of current entities (e.g. players are replaced when the game starts)."""
+        self.value = sum(entity.zobrist for entity in hashed_entities(self.game)) & _Mask
+
+    def _update(self, entity, delta, old_zone):
+        """Add delta to the hash of the entity, and update the game hash."""
+        old_entity_value = entity.zobrist
+        entity.zobrist = new_entity_value = (old_entity_value + delta) & _Mask
+        if not entity.hashed:
+            return
+        if old_zone in HashedZones:
+            self.value -= old_entity_value
+        if entity.zone in HashedZones:
+            self.value += new_entity_value
+        self.value &= _Mask
+
+    def on_tag(self, entity, tag, old_value, new_value):
+        """Called when an entity-level tag is changed (``old_value`` is not equal to ``new_value``)."""
+        eid = entity.eid
+        delta = tag_key(eid, tag, new_value) - tag_key(eid, tag, old_value)
+        self._update(entity, delta, old_value if tag == 'zone' else entity.zone)
+
+    def on_enchantment(self, entity, enchantment, attached):
+        delta = enchantment_key(entity, enchantment)
+        self._update(entity, delta if attached else -delta, entity.zone)
+
+    def hash(self):
+        """Get the 64-bit hash of the game."""
+        return (self.value + global_hash(self.game) + position_hash(self.game)) & _Mask
+
+    def full_hash(self):
+        """Compute the hash of the game from scratch."""
+        result = sum(entity_hash(entity) for entity in hashed_entities(self.game))
+        return (result + global_hash(self.game) + position_hash(self.game)) & _Mask
+
+    def check(self):
+        """Recompute the full hash and assert equality.
+
+        :raise AssertionError: If the incremental hash is not equal to the full hash.
+        """
+        for entity in hashed_entities(self.game):
+            expected = entity_hash(entity)
+            if entity.zobrist != expected:
+                raise AssertionError('Hash of {} mismatch: {:016x} != {:016x}'.format(
+                    entity, entity.zobrist, expected))
+        full_hash = self.full_hash()
+        if self.hash() != full_hash:
+            raise AssertionError('Hash of {} mismatch: {:016x} != {:016x}'.format(self.game, self.hash(), full_hash))
+
+
+def observer_hash(game, player_id):
+    """Get the hash of the game from the view of the player.
+
+    Hidden entities (the hand and the deck of the opponent) are replaced by the number of them, so determinisations
+    of the same information set (see ``ai.mcts``) have the same hash.
+    """
+    opponent = game.get_player(1 - player_id)
+    result = game.zobrist.hash()
+    for entity in opponent.hand + opponent.deck:
+        if is_hashed(entity):
+            result -= entity.zobrist
+    result += tag_key(opponent.eid, '$hidden', '{}/{}'.format(len(opponent.hand), len(opponent.deck)))
+    return result & _Mask
+
+
+__all__ = [
+    'HashedZones',
+    'tag_key',
+    'enchantment_key',
+    'entity_hash',
+    'global_hash',
+    'position_hash',
+    'ZobristHash',
+    'observer_hash',
+]
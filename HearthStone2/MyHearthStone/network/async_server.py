@@ -0,0 +1,405 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""An asyncio-based game server for LAN.
+
+Differences with ``lan_server.LanServer``:
+    1. All connections are served by coroutines in one event loop, idle connections cost almost nothing.
+    2. Game status is pushed only when the engine fires its callbacks, instead of polling and resending it every second.
+        A full snapshot is sent when the game starts, then only small deltas (see ``game.state_sync``).
+    3. Each connection has a bounded write queue, writing to a socket never holds a global lock.
+        Messages queued at the same time are written in one batch.
+        Slow connections skip state messages and catch up with the latest snapshot (see ``fanout``).
+    4. The game engine runs in a single worker thread (off the event loop), so the loop is never blocked by
+        the resolving of events.
+    5. Users can join as watchers (send 'user_data' with "watch": true), they receive the public view of the game.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from . import utils2 as utils
+from .fanout import StateStream
+from .protocol import JsonLineProtocol, ProtocolError, negotiate, create_protocol
+from .room import Room
+from ..utils.constants import C
+from ..utils.message import info, warning
+
+__author__ = 'fyabc'
+
+
+class AsyncConnection:
+    """A connection of a user to the asyncio server.
+
+    Messages are sent through a bounded queue and written by the writer task of this connection,
+    so senders never wait for the socket. The writer packs all queued messages into one write.
+
+    State messages (see ``send_state``) are coalesced when the peer is slow.
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.user = None
+        # The 'user_data' message of the handshake.
+        self.user_data = None
+        self.closed = False
+        # Time of the last received message (in the clock of the server timers), used by idle timeouts.
+        self.last_active = None
+
+        # The first message is always in protocol version 1, see ``protocol`` for details.
+        self.protocol = JsonLineProtocol()
+
+        self._queue = asyncio.Queue(maxsize=C.LAN.WriteQueueSize)
+        self._writer_task = None
+
+        # The state stream to resync from, set when state messages are dropped.
+        self._lagging = None
+
+    def __repr__(self):
+        return 'AsyncConnection(address={}, user={})'.format(
+            self.address, None if self.user is None else self.user.nickname)
+
+    def start(self):
+        self._writer_task = asyncio.ensure_future(self._write_loop())
+
+    def send(self, msg_type, **kwargs):
+        return self.send_bytes(self.protocol.encode_message(msg_type, kwargs))
+
+    def send_bytes(self, data):
+        """Put an encoded message chunk (encoded by the protocol of this connection) into the write queue.
+
+        If the write queue is full, the peer is too slow to receive messages, close the connection.
+
+        :return: The data is queued or not.
+        :rtype: bool
+        """
+        if self.closed:
+            return False
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            warning('Write queue of {} is full, close it'.format(self))
+            self.close()
+            return False
+        return True
+
+    def send_state(self, data, stream):
+        """Put an encoded state message chunk of the stream into the write queue.
+
+        If the peer is slow (``C.LAN.CoalesceQueueSize`` chunks are pending), the state message is dropped.
+        When the queue drains, the latest snapshot of the stream is sent instead of all dropped messages.
+
+        :param data: The encoded message chunk.
+        :param stream: The ``fanout.StateStream`` of the message.
+        :return: The data is queued or not.
+        :rtype: bool
+        """
+        if self.closed:
+            return False
+        if self._lagging is not None or self._queue.qsize() >= C.LAN.CoalesceQueueSize:
+            if self._lagging is None:
+                info('{} is too slow, coalesce its state messages'.format(self))
+            self._lagging = stream
+            return False
+        return self.send_bytes(data)
+
+    @property
+    def lagging(self):
+        return self._lagging is not None
+
+    def send_text(self, text, error=False):
+        msg_type = 'error' if error else 'text'
+        self.send(msg_type, text=text)
+
+    def switch_protocol(self, version):
+        """Reply the negotiated version in the current protocol, then switch to it.
+
+        [NOTE]: The reply is written directly, so this must be called before any other messages are queued.
+        """
+        self.writer.write(self.protocol.pack([self.protocol.encode_message('protocol', {'version': version})]))
+        self.protocol = create_protocol(version)
+
+    async def recv(self):
+        """Receive a message.
+
+        :return: The message dict, or None if the connection is closed.
+        """
+        return await self.protocol.recv_async(self.reader)
+
+    async def handshake(self):
+        """Receive user data from the client, and negotiate the protocol version.
+
+        :return: The user is created or not.
+        """
+        user_data = await self.recv()
+        if user_data is None or user_data.get('type') != 'user_data':
+            self.send_text('User data expected!', error=True)
+            return False
+        self.user_data = user_data
+        self.user = utils.NetworkUser(self.address, user_data['nickname'], user_data.get('deck_code'))
+
+        # Negotiate the protocol version. Old clients do not send their versions.
+        if 'protocols' in user_data:
+            self.switch_protocol(negotiate(user_data['protocols']))
+        self.user.protocol = self.protocol
+        return True
+
+    async def _write_loop(self):
+        queue = self._queue
+        try:
+            while True:
+                data = await queue.get()
+                if data is None:
+                    break
+
+                # Collect all queued messages into one batch.
+                chunks, stop = [data], False
+                while not queue.empty():
+                    data = queue.get_nowait()
+                    if data is None:
+                        stop = True
+                        break
+                    chunks.append(data)
+                self.writer.write(self.protocol.pack(chunks))
+                await self.writer.drain()
+                if stop:
+                    break
+
+                # Catch up with the latest state after pending messages are written.
+                if self._lagging is not None and queue.qsize() < C.LAN.CoalesceQueueSize:
+                    stream, self._lagging = self._lagging, None
+                    self.send_bytes(stream.encoded_snapshot(self.protocol))
+        except ConnectionError:
+            pass
+        finally:
+            self.closed = True
+            self.writer.close()
+
+    def close(self):
+        """Close the connection after all queued messages are written."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            # The queue is full, drop pending messages.
+            self._writer_task.cancel()
+            self.writer.close()
+
+
+class AsyncLanServer:
+    """The asyncio LAN server class."""
+
+    # This server only support 2 users now.
+    MaxUsers = 2
+
+    def __init__(self, address):
+        self.address = address
+
+        # The game room.
+        self.room = Room(0)
+
+        # Users (players) in this local network.
+        # Key: ``NetworkUser`` instance
+        # Value: ``AsyncConnection`` instance
+        self.users = {}
+        # Watchers, same as users.
+        self.watchers = {}
+
+        # State streams of all viewers of the room.
+        self.streams = {viewer: StateStream(viewer) for viewer in Room.Viewers}
+
+        self._loop = None
+        self._server = None
+
+        # All engine work run in this single thread, so the game is never accessed concurrently.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self._game_starting = False
+
+    def __repr__(self):
+        return 'AsyncLanServer(address={})'.format(self.address)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        host, port = self.address
+        self._server = await asyncio.start_server(self._handle, host, port)
+        info('Start {}'.format(self))
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        for conn in list(self.users.values()) + list(self.watchers.values()):
+            conn.close()
+        self._executor.shutdown(wait=False)
+
+    # User management.
+
+    def add_user(self, user, conn, watch=False):
+        if user in self.users or user in self.watchers:
+            raise utils.ClientError('{} already exists!'.format(user))
+        if watch:
+            self.watchers[user] = conn
+            self.streams[Room.Watchers].add(conn)
+            return
+        if len(self.users) >= self.MaxUsers:
+            raise utils.ClientError('Server full, cannot join this game!')
+        self.users[user] = conn
+
+    def remove_user(self, user):
+        if user in self.watchers:
+            conn = self.watchers.pop(user)
+        elif user in self.users:
+            conn = self.users.pop(user)
+        else:
+            raise utils.ClientError('{} not in the network!'.format(user))
+        for stream in self.streams.values():
+            stream.remove(conn)
+
+    @property
+    def game(self):
+        return self.room.game
+
+    @property
+    def game_started(self):
+        return self.room.started
+
+    def broadcast(self, msg_type, obj, exclude=None):
+        """Send a message to all users and watchers. The message is encoded only once for each protocol version."""
+        encoded = {}
+        for user, conn in list(self.users.items()) + list(self.watchers.items()):
+            if exclude is not None and user == exclude:
+                continue
+            version = conn.protocol.version
+            if version not in encoded:
+                encoded[version] = conn.protocol.encode_message(msg_type, obj)
+            conn.send_bytes(encoded[version])
+
+    def broadcast_text(self, text, exclude=None):
+        self.broadcast('text', {'text': text}, exclude=exclude)
+
+    def dispatch(self, outputs):
+        """Send outputs of the room to users. See ``room`` for details."""
+        for target, msg_type, obj in outputs:
+            if target is None:
+                self.broadcast(msg_type, obj)
+            else:
+                self.streams[target].publish(msg_type, obj)
+
+    # Connection handling.
+
+    async def _handle(self, reader, writer):
+        conn = AsyncConnection(self, reader, writer)
+        conn.start()
+
+        try:
+            # 1. Ask user data from client.
+            if not await conn.handshake():
+                return
+
+            watch = bool(conn.user_data.get('watch'))
+            try:
+                self.add_user(conn.user, conn, watch=watch)
+            except utils.ClientError as e:
+                conn.send_text(e.args[0], error=True)
+                conn.user = None
+                return
+
+            if watch:
+                conn.send_text('Hello {}, you are watching the game.'.format(conn.user.nickname))
+                info('{} is watching the game.'.format(conn.user.nickname))
+                while await conn.recv() is not None:
+                    # Watchers can only receive messages.
+                    conn.send_text('Watchers cannot send messages!', error=True)
+                return
+
+            conn.send_text('Hello {}, welcome to the HearthStone local server!'.format(conn.user.nickname))
+            self.broadcast_text('{} has joined into the game.'.format(conn.user.nickname), exclude=conn.user)
+            info('{} has joined into the game.'.format(conn.user.nickname))
+            await self.try_start_game()
+
+            # 2. Main loop: wait for messages, no polling.
+            while True:
+                msg = await conn.recv()
+                if msg is None:
+                    break
+                await self._on_message(conn, msg)
+        except (ConnectionError, ValueError, ProtocolError) as e:
+            warning('Connection error of {}: {}'.format(conn, e))
+        finally:
+            await self._on_disconnect(conn)
+            conn.close()
+
+    async def _on_message(self, conn, msg):
+        msg_type = msg.get('type')
+        if msg_type == 'player_action':
+            if not self.game_started:
+                conn.send_text('The game is not started!', error=True)
+                return
+            await self.run_in_engine(self.room.run_player_action, conn.user.player_id, msg)
+        elif msg_type == 'text':
+            self.broadcast_text('{}: {}'.format(conn.user.nickname, msg.get('text', '')))
+        else:
+            conn.send_text('Unknown message type {!r}'.format(msg_type), error=True)
+
+    async def _on_disconnect(self, conn):
+        if conn.user is None or (conn.user not in self.users and conn.user not in self.watchers):
+            return
+        watching = conn.user in self.watchers
+        self.remove_user(conn.user)
+        info('{} has quit.'.format(conn.user.nickname))
+        if watching:
+            return
+        self.broadcast_text('{} has quit.'.format(conn.user.nickname))
+
+        if self.room.running and conn.user.player_id is not None:
+            # The player leaves the game, concede it.
+            await self.run_in_engine(self.room.leave, conn.user.player_id)
+
+    # Engine related methods.
+
+    async def run_in_engine(self, fn, *args):
+        """Run a room method in the engine thread, then send its outputs."""
+        outputs = await self._loop.run_in_executor(self._executor, fn, *args)
+        self.dispatch(outputs)
+
+    async def try_start_game(self):
+        # If all users in, try to start the game.
+        if len(self.users) < self.MaxUsers or self._game_starting:
+            return
+        self._game_starting = True
+
+        users = list(self.users.keys())
+        for player_id, user in enumerate(users):
+            user.player_id = player_id
+            self.streams[player_id].add(self.users[user])
+
+        await self.run_in_engine(self.room.start, [user.deck_code for user in users])
+
+        self.broadcast_text('Game ({} vs {}) start!'.format(users[0].nickname, users[1].nickname))
+
+
+def start_async_server(address):
+    server = AsyncLanServer(address)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+__all__ = [
+    'AsyncConnection',
+    'AsyncLanServer',
+    'start_async_server',
+]
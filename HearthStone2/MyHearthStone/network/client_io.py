@@ -0,0 +1,348 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Non-blocking I/O layer of clients, shared by ``lan_client`` and ``local_client``.
+
+All connections and the user input of a client are multiplexed by one ``selectors`` selector in one thread
+(``ClientLoop``), nothing spins or blocks:
+
+    1. Received data goes into a reusable buffer (``RecvBuffer``) by ``recv_into``, messages are extracted from
+        the memoryview of the buffer (see ``JsonLineProtocol.extract``).
+    2. Data is sent directly if the socket is writable, the rest is buffered and sent when the selector
+        reports the socket writable.
+    3. Other threads talk to the loop by ``call_soon_threadsafe``, which wakes up the selector.
+
+Many clients can share one loop, e.g. the load test (test/load_test.py) runs hundreds of clients in one thread.
+"""
+
+import os
+import selectors
+import socket
+import sys
+import threading
+from collections import deque
+
+from .protocol import JsonLineProtocol, ProtocolError, FrameHeaderSize
+from ..utils.constants import C
+from ..utils.message import warning
+
+__author__ = 'fyabc'
+
+
+class RecvBuffer:
+    """A reusable receive buffer.
+
+    Data is received into the free space at the end of the buffer, and messages are extracted from the memoryview
+    of the buffer. Remaining data of incomplete messages is moved to the front only when the buffer is full,
+    and the buffer grows only if a single frame (or line) is larger than it.
+    """
+
+    def __init__(self, size=None):
+        self.buffer = None
+        self.view = None
+        self._alloc(C.LAN.RecvBufferSize if size is None else size)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _alloc(self, size, pending=b''):
+        buffer = bytearray(size)
+        buffer[:len(pending)] = pending
+        self.buffer, self.view = buffer, memoryview(buffer)
+
+    def _make_room(self):
+        pending = bytes(self.view[self.start:self.end])
+        if self.start == 0:
+            # A single frame is larger than the buffer.
+            size = len(self.buffer) * 2
+            if size > C.LAN.MaxFrameSize + FrameHeaderSize:
+                raise ProtocolError('Message too large (> {} bytes)'.format(C.LAN.MaxFrameSize))
+            self._alloc(size, pending)
+        else:
+            self.buffer[:len(pending)] = pending
+        self.start, self.end = 0, len(pending)
+
+    def recv_from(self, sock):
+        """Receive data from the socket.
+
+        :return: Number of received bytes, 0 means EOF.
+        :raise BlockingIOError: No data available.
+        """
+        if self.end == len(self.buffer):
+            self._make_room()
+        n = sock.recv_into(self.view[self.end:])
+        self.end += n
+        return n
+
+    def read_from(self, fd):
+        """Read available data from the file descriptor (e.g. stdin), which must be readable.
+
+        :return: Number of read bytes, 0 means EOF.
+        """
+        if self.end == len(self.buffer):
+            self._make_room()
+        data = os.read(fd, len(self.buffer) - self.end)
+        n = len(data)
+        self.view[self.end:self.end + n] = data
+        self.end += n
+        return n
+
+    def extract_line(self):
+        """Extract the next line (without the line end).
+
+        :return: Bytes of the line, or None if the line is incomplete.
+        """
+        index = self.buffer.find(b'\n', self.start, self.end)
+        if index < 0:
+            return None
+        line = bytes(self.view[self.start:index]).rstrip(b'\r')
+        if index + 1 == self.end:
+            self.start = self.end = 0
+        else:
+            self.start = index + 1
+        return line
+
+    def extract(self, protocol):
+        """Extract messages of the next unit (a line or a frame).
+
+        :return: List of messages, or None if the next unit is incomplete.
+        """
+        messages, start = protocol.extract(self.view, self.start, self.end)
+        if start == self.start:
+            return None
+        if start == self.end:
+            self.start = self.end = 0
+        else:
+            self.start = start
+        return messages
+
+
+class ClientConnection:
+    """A non-blocking connection of a ``ClientLoop``.
+
+    :param on_message: Callback of received messages, signature: (connection, message dict) -> None.
+        It can switch the protocol of the connection, following messages are extracted by the new protocol.
+    :param on_close: Callback when the connection is closed, signature: (connection) -> None.
+    """
+
+    # Max number of reads in one event, so one busy connection cannot starve others.
+    MaxReadsPerEvent = 16
+
+    def __init__(self, loop, sock, on_message, on_close=None, protocol=None):
+        self.loop = loop
+        self.sock = sock
+        self.address = sock.getpeername()
+        self.on_message = on_message
+        self.on_close = on_close
+        self.protocol = JsonLineProtocol() if protocol is None else protocol
+        self.closed = False
+
+        self._recv_buffer = RecvBuffer()
+        self._send_buffer = bytearray()
+        self._close_after_flush = False
+
+        sock.setblocking(False)
+        loop.selector.register(sock, selectors.EVENT_READ, self._on_event)
+
+    def __repr__(self):
+        return 'ClientConnection(address={})'.format(self.address)
+
+    def send(self, msg_type, **kwargs):
+        self.send_bytes(self.protocol.pack([self.protocol.encode_message(msg_type, kwargs)]))
+
+    def send_bytes(self, data):
+        if self.closed or self._close_after_flush:
+            return
+        if self._send_buffer:
+            self._send_buffer += data
+            return
+        try:
+            n = self.sock.send(data)
+        except BlockingIOError:
+            n = 0
+        except OSError as e:
+            warning('Failed to send data to {}: {}'.format(self, e))
+            self._close()
+            return
+        if n < len(data):
+            self._send_buffer += memoryview(data)[n:]
+            self.loop.selector.modify(self.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, self._on_event)
+
+    def close(self):
+        """Close the connection after all buffered data is sent."""
+        if self._send_buffer:
+            self._close_after_flush = True
+        else:
+            self._close()
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.loop.selector.unregister(self.sock)
+        self.sock.close()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def _on_event(self, mask):
+        if mask & selectors.EVENT_WRITE:
+            self._flush()
+        if mask & selectors.EVENT_READ and not self.closed:
+            self._read()
+
+    def _flush(self):
+        try:
+            n = self.sock.send(self._send_buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            warning('Failed to send data to {}: {}'.format(self, e))
+            self._close()
+            return
+        del self._send_buffer[:n]
+        if not self._send_buffer:
+            if self._close_after_flush:
+                self._close()
+            else:
+                self.loop.selector.modify(self.sock, selectors.EVENT_READ, self._on_event)
+
+    def _read(self):
+        buffer = self._recv_buffer
+        for _ in range(self.MaxReadsPerEvent):
+            if self.closed:
+                return
+            try:
+                n = buffer.recv_from(self.sock)
+            except BlockingIOError:
+                return
+            except (ConnectionError, ProtocolError) as e:
+                warning('Connection error of {}: {}'.format(self, e))
+                self._close()
+                return
+            if n == 0:
+                self._close()
+                return
+            try:
+                while not self.closed:
+                    messages = buffer.extract(self.protocol)
+                    if messages is None:
+                        break
+                    for msg in messages:
+                        self.on_message(self, msg)
+            except ProtocolError as e:
+                warning('Malformed data from {}: {}'.format(self, e))
+                self._close()
+                return
+
+
+class ClientLoop:
+    """The selector-based event loop of clients."""
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+
+        # Callbacks from other threads.
+        self._ready = deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._on_wakeup)
+
+    def connect(self, address, on_message, on_close=None, protocol=None):
+        """Connect to the server, return the ``ClientConnection``."""
+        sock = socket.create_connection(address)
+        return ClientConnection(self, sock, on_message, on_close, protocol)
+
+    def add_line_input(self, callback, file=None):
+        """Call the callback with each line of the input file (default to stdin), or None at EOF.
+
+        [NOTE]: The file descriptor is registered into the selector if supported, and read by ``os.read``
+        into a ``RecvBuffer``, so all complete lines (e.g. of pasted or piped input) are delivered at once.
+        The buffered file object is not used, it would keep lines after the first one until the next event.
+        Else (e.g. stdin on Windows) the file is read by a blocking thread, which passes lines to the loop.
+        """
+        file = sys.stdin if file is None else file
+        encoding = getattr(file, 'encoding', None) or 'utf-8'
+        buffer = RecvBuffer()
+
+        def _on_readable(_mask):
+            try:
+                n = buffer.read_from(fd)
+            except ProtocolError as e:
+                warning('Input line too long: {}'.format(e))
+                buffer.start = buffer.end = 0
+                return
+            except OSError as e:
+                warning('Failed to read input: {}'.format(e))
+                n = 0
+            while True:
+                line = buffer.extract_line()
+                if line is None:
+                    break
+                callback(line.decode(encoding, errors='replace'))
+            if n == 0:
+                self.selector.unregister(fd)
+                if len(buffer):
+                    callback(bytes(buffer.view[buffer.start:buffer.end]).decode(encoding, errors='replace'))
+                callback(None)
+
+        try:
+            fd = file.fileno()
+            self.selector.register(fd, selectors.EVENT_READ, _on_readable)
+        except (ValueError, OSError):
+            def _read_lines():
+                for line in file:
+                    self.call_soon_threadsafe(callback, line.rstrip('\r\n'))
+                self.call_soon_threadsafe(callback, None)
+            threading.Thread(target=_read_lines, name='LineInput', daemon=True).start()
+
+    def call_soon_threadsafe(self, fn, *args):
+        self._ready.append((fn, args))
+        try:
+            self._wakeup_w.send(b'\0')
+        except BlockingIOError:
+            # The wakeup socket is full, the loop will wake up anyway.
+            pass
+
+    def _on_wakeup(self, _mask):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def run(self, timeout=None):
+        """Run the loop until ``stop`` is called.
+
+        :param timeout: Stop the loop if no events in this time (in seconds), None means wait forever.
+        """
+        self.running = True
+        while self.running:
+            events = self.selector.select(timeout)
+            if not events and not self._ready:
+                break
+            for key, mask in events:
+                key.data(mask)
+            while self._ready:
+                fn, args = self._ready.popleft()
+                fn(*args)
+
+    def stop(self):
+        """Stop the loop. Call ``call_soon_threadsafe(loop.stop)`` from other threads."""
+        self.running = False
+
+    def close(self):
+        self.selector.unregister(self._wakeup_r)
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+        self.selector.close()
+
+
+__all__ = [
+    'RecvBuffer',
+    'ClientConnection',
+    'ClientLoop',
+]
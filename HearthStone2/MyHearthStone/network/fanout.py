@@ -0,0 +1,151 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Fan-out of game state messages to many connections (players and watchers).
+
+Each view of a room (player 0, player 1 and the public view of watchers) is a ``StateStream``.
+A stream keeps the latest state of its view in a ``MirrorGame`` (updated by the messages it publishes), so:
+
+    1. Each message is encoded only once for each protocol version, the bytes are shared by all receivers.
+    2. Slow receivers skip queued deltas and receive the latest snapshot of the stream when they catch up
+        (see ``AsyncConnection.send_state``), the room never waits for them.
+    3. Reconnected receivers send the version of their mirrors, and receive the missing delta batches or
+        the latest snapshot, whichever is smaller (see ``missing_batches``). The stream keeps a checkpoint
+        (a snapshot of the mirror) and the batch log after it, the checkpoint is taken every
+        ``C.LAN.SnapshotInterval`` batches by a scheduled callback, not in ``publish``.
+"""
+
+from ..game.state_sync import MirrorGame
+from ..utils.constants import C
+
+__author__ = 'fyabc'
+
+
+class StateStream:
+    """The state message stream of one view of a room."""
+
+    # State message types, other messages are not coalesced.
+    StateTypes = ('game_status', 'game_delta')
+
+    def __init__(self, viewer, schedule=None):
+        """
+        :param viewer: The viewer of the stream.
+        :param schedule: Function to schedule a callback (e.g. ``loop.call_soon``) to take checkpoints,
+            default to take them immediately.
+        """
+        self.viewer = viewer
+        self.mirror = MirrorGame()
+        # Receivers (``AsyncConnection``).
+        self.receivers = set()
+
+        # Protocol version -> encoded snapshot of the current mirror version.
+        self._snapshot_cache = {}
+
+        # The latest checkpoint (a snapshot batch), and batches after it.
+        self.checkpoint = None
+        self.log = []
+        self._schedule = schedule
+        self._checkpoint_scheduled = False
+
+    def __repr__(self):
+        return 'StateStream(viewer={}, receivers={}, version={})'.format(
+            self.viewer, len(self.receivers), self.mirror.version)
+
+    @property
+    def started(self):
+        return self.mirror.version >= 0
+
+    def add(self, conn, version=None):
+        """Add a receiver. If the stream is started, the receiver gets the latest state first.
+
+        :param version: Version of the mirror of the receiver (e.g. a reconnected player), see
+            ``missing_batches``. Default to send the latest snapshot.
+        """
+        self.receivers.add(conn)
+        if not self.started:
+            return
+        batches = None if version is None else self.missing_batches(version)
+        if batches is None:
+            conn.send_bytes(self.encoded_snapshot(conn.protocol))
+        elif batches:
+            conn.send('game_delta', batches=batches)
+
+    def remove(self, conn):
+        self.receivers.discard(conn)
+
+    def publish(self, msg_type, obj, exclude=None):
+        """Send a message to all receivers.
+
+        State messages are applied to the mirror, and can be coalesced by slow receivers.
+        """
+        if msg_type == 'game_status':
+            self.mirror = MirrorGame()
+            self.mirror.apply_batch(obj['snapshot'])
+            self._snapshot_cache.clear()
+            self.checkpoint, self.log = obj['snapshot'], []
+        elif msg_type == 'game_delta':
+            self.mirror.apply_batches(obj['batches'])
+            self._snapshot_cache.clear()
+            self.log.extend(obj['batches'])
+            if len(self.log) >= C.LAN.SnapshotInterval and not self._checkpoint_scheduled:
+                if self._schedule is None:
+                    self.take_checkpoint()
+                else:
+                    self._checkpoint_scheduled = True
+                    self._schedule(self.take_checkpoint)
+        is_state = msg_type in self.StateTypes
+
+        encoded = {}
+        for conn in list(self.receivers):
+            if conn is exclude:
+                continue
+            version = conn.protocol.version
+            if version not in encoded:
+                encoded[version] = conn.protocol.encode_message(msg_type, obj)
+            if is_state:
+                conn.send_state(encoded[version], self)
+            else:
+                conn.send_bytes(encoded[version])
+
+    def take_checkpoint(self):
+        """Take a snapshot of the mirror as the checkpoint, and clear the batch log."""
+        self._checkpoint_scheduled = False
+        self.checkpoint, self.log = self.mirror.snapshot(), []
+
+    def missing_batches(self, version):
+        """Get batches to update a mirror of the given version to the latest state.
+
+        The size of batches is measured by the number of deltas, and the size of the latest snapshot is estimated
+        by the checkpoint.
+
+        :return: List of missing batches (empty if the mirror is the latest), or None if they are not in the log
+            or larger than the snapshot, the snapshot should be sent instead.
+        """
+        if version == self.mirror.version:
+            return []
+        if self.checkpoint is None or not self.checkpoint[0] <= version < self.mirror.version:
+            return None
+        missing = [batch for batch in self.log if batch[0] > version]
+        if sum(len(deltas) for _, deltas in missing) >= len(self.checkpoint[1]):
+            return None
+        return missing
+
+    def encoded_snapshot(self, protocol):
+        """Get the 'game_status' message of the latest state, encoded by the protocol.
+
+        The encoded message is cached until the next state message, so receivers share it.
+        """
+        data = self._snapshot_cache.get(protocol.version)
+        if data is None:
+            if self.checkpoint is not None and self.checkpoint[0] == self.mirror.version:
+                snapshot = self.checkpoint
+            else:
+                snapshot = self.mirror.snapshot()
+            data = protocol.encode_message('game_status', {'snapshot': snapshot})
+            self._snapshot_cache[protocol.version] = data
+        return data
+
+
+__all__ = [
+    'StateStream',
+]
@@ -1,53 +1,87 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
-import socket
-import threading
+"""A simple game client for LAN.
+
+The client runs in one ``client_io.ClientLoop``: server messages and user input lines (sent as chat messages)
+are multiplexed by the loop, no threads are spinning.
+
+When the client reconnects, it sends the reconnect token of its seat and the version of its mirror,
+so the server gives the seat back and sends only the missing deltas (see ``room_server``).
+"""
 
 from . import utils2 as utils
+from .client_io import ClientLoop
+from .protocol import SupportedVersions, create_protocol
+from ..game.state_sync import MirrorGame, SyncError
 from ..utils.message import info, error
 
 __author__ = 'fyabc'
 
 
 class LanClient:
-    def __init__(self, user):
+    def __init__(self, user, loop=None, read_input=True):
         self.user = user
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.connect(self.user.address)
-        self.rfile = self.socket.makefile('rb', 0)
-        self.wfile = self.socket.makefile('wb', 0)
-        self.input_thread = None
+        self.loop = ClientLoop() if loop is None else loop
+        self._own_loop = loop is None
+        self.read_input = read_input
+        self.conn = self.loop.connect(self.user.address, self._on_message, self._on_close)
 
-        self.start()
+        # Mirror of the game in the server.
+        self.mirror = MirrorGame()
+        # The reconnect token of the seat, received in the 'match' message.
+        self.reconnect_token = None
 
-        self.run()
+    @property
+    def protocol(self):
+        return self.conn.protocol
 
     def start(self):
         # 1. Send user data to server.
-        self.send('user_data', nickname=self.user.nickname, deck_code=self.user.deck_code)
-
-        self.input_thread = self.InputThread(self.wfile)
-        t = threading.Thread(target=self.input_thread.run)
-        t.setDaemon(True)
-        t.start()
+        self._send_user_data()
+
+        # 2. Send input lines as chat messages.
+        if self.read_input:
+            self.loop.add_line_input(self._on_input)
+
+    def _send_user_data(self):
+        kwargs = {}
+        if self.mirror.version >= 0:
+            kwargs['state_version'] = self.mirror.version
+        if self.reconnect_token is not None:
+            kwargs['reconnect_token'] = self.reconnect_token
+        self.send('user_data', nickname=self.user.nickname, deck_code=self.user.deck_code,
+                  protocols=list(SupportedVersions), **kwargs)
+
+    def reconnect(self):
+        """Connect to the server again (e.g. after the connection is dropped), and resume the game."""
+        self.conn = self.loop.connect(self.user.address, self._on_message, self._on_close)
+        self._send_user_data()
 
     def run(self):
-        running = True
-        while running:
-            try:
-                msg = self.recv()
-            except ConnectionError:
-                break
+        self.start()
+        self.loop.run()
+
+    def close(self):
+        self.conn.close()
 
-            result = self.parse_msg(msg)
+    def _on_message(self, _conn, msg):
+        self.parse_msg(msg)
+        if msg['type'] == 'terminated':
+            self.close()
 
-            if msg['type'] == 'terminated':
-                running = False
-        self.input_thread.done = True
+    def _on_close(self, conn):
+        if self._own_loop and conn is self.conn:
+            self.loop.stop()
+
+    def _on_input(self, line):
+        if line is None:
+            self.close()
+        elif line:
+            self.send_text(line)
 
     def send(self, msg_type, **kwargs):
-        utils.send_msg(self.wfile, msg_type, **kwargs)
+        self.conn.send(msg_type, **kwargs)
 
     def send_text(self, text, error=False):
         msg_type = 'error' if error else 'text'
@@ -56,9 +90,6 @@ class LanClient:
     def send_ok(self):
         self.send('ok')
 
-    def recv(self):
-        return utils.recv_msg(self.rfile)
-
     def parse_msg(self, msg):
         msg_type = msg['type']
         if msg_type == 'text':
@@ -69,23 +100,21 @@ class LanClient:
             pass
         elif msg_type == 'user_data':
             pass
+        elif msg_type == 'match':
+            self.reconnect_token = msg.get('reconnect_token')
+        elif msg_type == 'protocol':
+            self.conn.protocol = create_protocol(msg['version'])
+            info('Use protocol version {}'.format(msg['version']))
         elif msg_type == 'game_status':
-            pass
+            self.mirror.apply_batch(msg['snapshot'])
+        elif msg_type == 'game_delta':
+            try:
+                self.mirror.apply_batches(msg['batches'])
+            except SyncError as e:
+                error('Game status out of sync: {}'.format(e))
         else:
             pass
 
-    class InputThread:
-        def __init__(self, wfile):
-            self.wfile = wfile
-            self.done = False
-
-        def run(self):
-            """Echo standard input to the chat server until told to stop."""
-
-            # todo: add input method
-            while not self.done:
-                pass
-
 
 def start_client(address, nickname, deck_code):
-    LanClient(utils.NetworkUser(address, nickname, deck_code))
+    LanClient(utils.NetworkUser(address, nickname, deck_code)).run()
@@ -9,6 +9,7 @@ import socket
 import socketserver
 
 from . import utils2 as utils
+from .protocol import JsonLineProtocol, negotiate, create_protocol
 from ..game.core import Game
 from ..game.player_action import ReplaceStartCard
 from ..game.deck import Deck
@@ -29,21 +30,21 @@ class LanServer(socketserver.ThreadingTCPServer):
         # The game to play.
         self.game = None
 
-        # Users in this local network, contains game players (will add watchers in future).
+        # Users in this local network, contains game players (see ``async_server`` for watchers).
         # Key: ``User`` instance
-        # Value: user output fd
+        # Value: ``LanHandler`` instance of the user
         self.users = {}
 
         # Lock for users in the network.
         self._user_lock = threading.Lock()
 
-    def add_user(self, user, output_fd):
+    def add_user(self, user, handler):
         with self._user_lock:
             if len(self.users) >= self.MaxUsers:
                 raise utils.ClientError('Server full, cannot join this game!')
             elif user in self.users:
                 raise utils.ClientError('{} already exists!'.format(user))
-            self.users[user] = output_fd
+            self.users[user] = handler
 
     def remove_user(self, user):
         with self._user_lock:
@@ -56,17 +57,33 @@ class LanServer(socketserver.ThreadingTCPServer):
         with self._user_lock:
             return self.game is not None
 
-    def broadcast(self, msg_type, obj, locked=True):
+    def broadcast(self, msg_type, obj, locked=True, exclude=None):
+        """Send a message to all users. The message is encoded only once for each protocol version.
+
+        [NOTE]: The lock is only held when copying users, so a slow user never blocks other threads on the lock.
+        Set ``locked`` to False if the caller already holds the lock.
+        Writes to each user are serialized by its write lock (see ``LanHandler.send_bytes``).
+        """
         if locked:
             with self._user_lock:
-                for user, f_out in self.users.items():
-                    utils.send_msg(f_out, msg_type, **obj)
+                users = list(self.users.items())
         else:
-            for user, f_out in self.users.items():
-                utils.send_msg(f_out, msg_type, **obj)
+            users = list(self.users.items())
+
+        encoded = {}
+        for user, handler in users:
+            if exclude is not None and user == exclude:
+                continue
+            protocol = user.protocol
+            if protocol.version not in encoded:
+                encoded[protocol.version] = protocol.pack([protocol.encode_message(msg_type, obj)])
+            try:
+                handler.send_bytes(encoded[protocol.version])
+            except socket.error as e:
+                warning('Failed to send message to {}: {}'.format(user, e))
 
-    def broadcast_text(self, text, locked=True):
-        self.broadcast('text', {'text': text}, locked=locked)
+    def broadcast_text(self, text, locked=True, exclude=None):
+        self.broadcast('text', {'text': text}, locked=locked, exclude=exclude)
 
     def try_start_game(self):
         with self._user_lock:
@@ -89,9 +106,12 @@ class LanServer(socketserver.ThreadingTCPServer):
             )
             self.game.run_player_action(ReplaceStartCard(self.game, 0, []))
             self.game.run_player_action(ReplaceStartCard(self.game, 1, []))
+            outputs = [(handler, self.game.game_status(user.player_id)) for user, handler in self.users.items()]
 
-            self.broadcast_text('Game ({} vs {}) start!'.format(users[0].nickname, users[1].nickname), locked=False)
-            self.broadcast('game_status', self.game.game_status(), locked=False)
+        # Send messages after releasing the lock.
+        self.broadcast_text('Game ({} vs {}) start!'.format(users[0].nickname, users[1].nickname))
+        for handler, snapshot in outputs:
+            handler.send('game_status', snapshot=snapshot)
 
 
 class LanHandler(socketserver.StreamRequestHandler):
@@ -101,6 +121,10 @@ class LanHandler(socketserver.StreamRequestHandler):
 
     def __init__(self, request, client_address, server):
         self.user = None
+        # The first message is always in protocol version 1, see ``protocol`` for details.
+        self.protocol = JsonLineProtocol()
+        # Other handlers (e.g. broadcasting) may write to this connection, frames must not be interleaved.
+        self._write_lock = threading.Lock()
 
         super().__init__(request, client_address, server)
 
@@ -113,9 +137,16 @@ class LanHandler(socketserver.StreamRequestHandler):
         assert user_data['type'] == 'user_data'
         self.user = utils.NetworkUser(self.client_address, user_data['nickname'], user_data['deck_code'])
 
+        # Negotiate the protocol version. Old clients do not send their versions.
+        if 'protocols' in user_data:
+            version = negotiate(user_data['protocols'])
+            self.send('protocol', version=version)
+            self.protocol = create_protocol(version)
+        self.user.protocol = self.protocol
+
         failed = False
         try:
-            self.server.add_user(self.user, self.wfile)
+            self.server.add_user(self.user, self)
             self.send_text('Hello {}, welcome to the HearthStone local server!'.format(self.user.nickname))
             self.broadcast_text('{} has joined into the game.'.format(self.user.nickname), False)
             info('{} has joined into the game.'.format(self.user.nickname))
@@ -142,7 +173,7 @@ class LanHandler(socketserver.StreamRequestHandler):
         while not failed:
             try:
                 # todo: receive action; send game status after each action (of all users)
-                self.send('game_status', **self.server.game.game_status())
+                self.send('game_status', snapshot=self.server.game.game_status(self.user.player_id))
                 time.sleep(1)
             except socket.error:
                 failed = True
@@ -159,7 +190,11 @@ class LanHandler(socketserver.StreamRequestHandler):
         super().finish()
 
     def send(self, msg_type, **kwargs):
-        utils.send_msg(self.wfile, msg_type, **kwargs)
+        self.send_bytes(self.protocol.pack([self.protocol.encode_message(msg_type, kwargs)]))
+
+    def send_bytes(self, data):
+        with self._write_lock:
+            self.wfile.write(data)
 
     def send_text(self, text, error=False):
         msg_type = 'error' if error else 'text'
@@ -169,16 +204,11 @@ class LanHandler(socketserver.StreamRequestHandler):
         self.send('ok')
 
     def recv(self):
-        return utils.recv_msg(self.rfile)
+        return self.protocol.recv(self.rfile)
 
     def broadcast(self, msg_type, obj, include_this_user=True):
         """Send a message to every connected user, possibly exempting the user who's the cause of the message."""
-
-        # todo: change this usage of ``self.server.users`` into thread-safe.
-        for user, f_out in self.server.users.items():
-            if user == self.user and not include_this_user:
-                continue
-            utils.send_msg(f_out, msg_type, **obj)
+        self.server.broadcast(msg_type, obj, exclude=None if include_this_user else self.user)
 
     def broadcast_text(self, text, include_this_user=True):
         self.broadcast('text', {'text': text}, include_this_user)
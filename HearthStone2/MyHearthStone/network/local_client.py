@@ -1,22 +1,39 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
-import socket
-
 from .utils import *
-from ..utils.message import entity_message, info
+from .client_io import ClientLoop
+from .protocol import SupportedVersions, create_protocol
+from ..ai.standard import get_agent_by_name
+from ..game.core import Game
+from ..game.deck import Deck
+from ..game.legal_actions import action_key
+from ..game.player_action import PlayerAction, ReplaceStartCard, TurnEnd, Concede
+from ..game.state_sync import state_hash
+from ..utils.constants import C
+from ..utils.error import GameError
+from ..utils.message import entity_message, info, warning, error
 
 __author__ = 'fyabc'
 
 
 class BaseLocalClient:
+    """The base class of LAN clients. Messages are processed in a ``client_io.ClientLoop``.
+
+    Subclasses override ``on_connected`` and ``on_message``.
+    """
+
     def __init__(self, user, server_address, **kwargs):
         self.user = user
         self.server_address = server_address
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.connect(server_address)
-        self.rfile = self.socket.makefile('rb', 0)
-        self.wfile = self.socket.makefile('wb', 0)
+
+        # Clients can share one loop (e.g. in load tests), the loop is run by its owner.
+        loop = kwargs.pop('loop', None)
+        self.loop = ClientLoop() if loop is None else loop
+        self._own_loop = loop is None
+        # The protocol is switched after the negotiation.
+        self.conn = self.loop.connect(server_address, self._on_message, self._on_close)
+        self.connected = False
 
         # TODO: Load other information, such as mode, deck, etc.
         info('Create LAN client {}'.format(self))
@@ -24,20 +41,64 @@ class BaseLocalClient:
     def __repr__(self):
         return entity_message(self, {'user': self.user, 'server_address': self.server_address})
 
+    @property
+    def protocol(self):
+        return self.conn.protocol
+
+    def user_data(self):
+        """Get fields of the 'user_data' message (except the protocol versions)."""
+        return {'nickname': self.user}
+
+    def start(self):
+        """Start the client without running the loop.
+
+        Send user data with supported protocol versions, switch to the selected version when the server replies
+        (see ``protocol`` for the negotiation).
+        """
+        self.send(MsgTypes.UserData, protocols=list(SupportedVersions), **self.user_data())
+
     def run(self):
-        try:
-            self.send(MsgTypes.Text, a=1, b=2)
-            self.send_ok()
-            self.send_text('Hello from {}'.format(self))
-            self.wfile.flush()
-        except ConnectionError:
-            return
+        self.start()
+        self.loop.run()
 
-    def send(self, msg_type, **kwargs):
-        send_msg(self.wfile, msg_type, **kwargs)
+    def close(self):
+        self.conn.close()
+
+    def _on_message(self, _conn, d):
+        msg_type = d.get('type', MsgTypes.Default)
+        if not self.connected:
+            self.connected = True
+            if msg_type == MsgTypes.Protocol:
+                self.conn.protocol = create_protocol(d['version'])
+                info('{} use protocol version {}'.format(self, self.protocol.version))
+                self.on_connected()
+                return
+            # Old servers never reply the protocol version, keep version 1.
+            self.on_connected()
+        if not self.on_message(msg_type, d):
+            self.close()
+
+    def _on_close(self, _conn):
+        if self._own_loop:
+            self.loop.stop()
+
+    def on_connected(self):
+        """Called after the protocol negotiation (the user data is already sent)."""
+        self.send(MsgTypes.Text, a=1, b=2)
+        self.send_ok()
+        self.send_text('Hello from {}'.format(self))
+        self.close()
 
-    def recv(self):
-        return recv_msg(self.rfile)
+    def on_message(self, msg_type, d):
+        """Process a message from the server.
+
+        :return: Keep the connection or not.
+        """
+        info('Message from server: {}'.format(d))
+        return True
+
+    def send(self, msg_type, **kwargs):
+        self.conn.send(msg_type, **kwargs)
 
     def send_text(self, text, error=False):
         msg_type = MsgTypes.Error if error else MsgTypes.Text
@@ -52,7 +113,197 @@ class LocalClientV1(BaseLocalClient):
 
 
 class LocalClientV2(BaseLocalClient):
-    pass
+    """The client class (fat-client version, lockstep).
+
+    The client runs its own game, and applies player actions relayed by the server in order of their
+    sequence numbers. See ``local_server`` for details.
+    Subclasses (UI, AI, etc.) override ``on_game_start``, ``on_update`` and ``on_game_end``,
+    and call ``send_action`` to run player actions.
+    """
+
+    def __init__(self, user, server_address, **kwargs):
+        self.deck_code = kwargs.pop('deck_code', None)
+        super().__init__(user, server_address, **kwargs)
+
+        self.game = None
+        self.player_id = None
+        self.users = None
+        self.desync = False
+
+        # Sequence number of the next action to apply.
+        self._next_seq = 0
+        # Received actions that are not applied, key: sequence number.
+        self._pending = {}
+
+    @property
+    def is_player(self):
+        return self.player_id is not None
+
+    def user_data(self):
+        return dict(super().user_data(), deck_code=self.deck_code)
+
+    def on_connected(self):
+        pass
+
+    def on_message(self, msg_type, d):
+        """Process a message from the server.
+
+        :return: Keep receiving messages or not.
+        """
+        if msg_type == MsgTypes.GameStart:
+            self.start_game(d)
+        elif msg_type == MsgTypes.PlayerAction:
+            if d['seq'] >= self._next_seq:
+                self._pending[d['seq']] = d
+        elif msg_type == MsgTypes.Desync:
+            error('Game of {} is different with other players at turn {}: {}'.format(self, d['turn'], d['hashes']))
+            self.desync = True
+            return False
+        elif msg_type == MsgTypes.Error:
+            warning('Error from server: {}'.format(d.get('text')))
+        else:
+            super().on_message(msg_type, d)
+
+        if self.game is not None:
+            while self._next_seq in self._pending:
+                self._apply(self._pending.pop(self._next_seq))
+                self._next_seq += 1
+            if not self.game.running:
+                return False
+        return True
+
+    def start_game(self, d):
+        self.player_id = d['player_id']
+        self.users = d['users']
+        self.game = Game()
+        self.game.start_game([Deck.from_code(code) for code in d['deck_codes']], mode=d['mode'], seed=d['seed'])
+        info('{} start game {} with seed {} as player {}'.format(self, self.users, d['seed'], self.player_id))
+        self.on_game_start()
+
+    def send_action(self, player_action):
+        """Send the player action to the server. It is applied when the server relays it back."""
+        self.send(MsgTypes.PlayerAction, action=player_action.to_dict())
+
+    def _decode_action(self, msg):
+        """Decode the relayed action message, and find it in legal actions of the sender.
+
+        [NOTE]: All clients run the same game, so invalid actions are dropped by all clients in the same way.
+
+        :return: The legal player action, or None if the action is invalid.
+        """
+        game = self.game
+        player_id, d = msg.get('player_id'), msg.get('action')
+        if player_id not in (0, 1) or not isinstance(d, dict):
+            warning('Malformed player action {}'.format(msg))
+            return None
+        try:
+            # [NOTE]: The player id is always the sender (set by the server), fields not needed are ignored.
+            player_action = PlayerAction.from_dict(game, dict(d, player_id=player_id))
+        except (GameError, TypeError, ValueError, AttributeError) as e:
+            warning('Invalid player action {}: {}'.format(msg, e))
+            return None
+
+        if isinstance(player_action, Concede):
+            # Players can concede at any time.
+            return player_action
+        if isinstance(player_action, ReplaceStartCard):
+            replace_list = player_action.replace_list
+            if game.state == game.GameState.WaitReplace and game.data['replaces'][player_id] is None and \
+                    isinstance(replace_list, list) and \
+                    all(type(i) is int and 0 <= i < len(game.get_player(player_id).hand) for i in replace_list):
+                return player_action
+        elif player_id == game.current_player:
+            key = action_key(player_action)
+            for legal_action in game.get_legal_actions():
+                if action_key(legal_action) == key:
+                    return legal_action
+        warning('Player {} try to run illegal action {}'.format(player_id, player_action))
+        return None
+
+    def _apply(self, msg):
+        game = self.game
+        if not game.running:
+            return
+        player_action = self._decode_action(msg)
+        if player_action is None:
+            return
+
+        game.run_player_action(player_action)
+
+        if self.is_player:
+            if isinstance(player_action, TurnEnd):
+                self.send(MsgTypes.StateHash, turn=game.n_turns, hash=state_hash(game))
+            if not game.running:
+                self.send(MsgTypes.GameEnd, result=game.game_result)
+        if game.running:
+            self.on_update(player_action)
+        else:
+            self.on_game_end()
+
+    def on_game_start(self):
+        """Called when the game starts. Default to keep all start cards."""
+        if self.is_player:
+            self.send_action(ReplaceStartCard(self.game, self.player_id, []))
+
+    def on_update(self, player_action):
+        """Called after each player action is applied."""
+        pass
+
+    def on_game_end(self):
+        """Called when the game ends."""
+        info('{} game end in result {}'.format(self, self.game.game_result))
+
+
+class AgentClientV2(LocalClientV2):
+    """The lockstep client played by an AI agent (see ``ai.standard``).
+
+    The agent chooses actions by the client game when it is the turn of the player. Only one action is sent
+    at a time (the next one is chosen after it is relayed back), and the turn is ended after ``max_actions``
+    actions, so an agent that repeats an action without effect cannot block the game.
+    """
+
+    def __init__(self, user, server_address, **kwargs):
+        self.agent_class = get_agent_by_name(kwargs.pop('agent', C.AI.InnKeeperAgent))
+        self.max_actions = kwargs.pop('max_actions', 20)
+        super().__init__(user, server_address, **kwargs)
+
+        self.agent = None
+        self._in_flight = False
+        self._n_actions = 0
+
+    def on_message(self, msg_type, d):
+        keep = super().on_message(msg_type, d)
+        if keep:
+            self._act()
+        return keep
+
+    def on_game_start(self):
+        if self.is_player:
+            self.agent = self.agent_class(self.game, self.player_id)
+            self.send_action(ReplaceStartCard(self.game, self.player_id, self.agent.get_replace_card()))
+            self._in_flight = True
+
+    def _apply(self, msg):
+        if msg.get('player_id') == self.player_id:
+            self._in_flight = False
+        super()._apply(msg)
+
+    def _act(self):
+        game = self.game
+        if self.agent is None or self._in_flight or not game.running or game.state != game.GameState.Main \
+                or game.current_player != self.player_id:
+            return
+        if self._n_actions >= self.max_actions:
+            player_action = TurnEnd(game, self.player_id)
+        else:
+            player_action = self.choose_action()
+        self._n_actions = 0 if isinstance(player_action, TurnEnd) else self._n_actions + 1
+        self._in_flight = True
+        self.send_action(player_action)
+
+    def choose_action(self):
+        """Choose the next player action, default to ask the agent."""
+        return self.agent.get_player_action()
 
 
 def create_client(version, address, user, **kwargs):
@@ -74,6 +325,7 @@ __all__ = [
     'BaseLocalClient',
     'LocalClientV1',
     'LocalClientV2',
+    'AgentClientV2',
     'create_client',
     'start_client',
 ]
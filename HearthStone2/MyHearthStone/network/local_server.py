@@ -1,25 +1,58 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
-"""The LAN server of HearthStone."""
-
-# TODO: Two designs:
-#   1. Fat-client:
-#       Each client (user) maintain a game instance, broadcast player actions between them.
-#   2. Fat-server:
-#       Only the server maintain a game instance, broadcast its status between them.
-
+"""The LAN server of HearthStone.
+
+Two designs:
+    1. Fat-server (``LocalServerV1``, TODO):
+        Only the server maintain a game instance, broadcast its status between them.
+        (See ``async_server`` and ``room_server`` for implemented fat-server designs.)
+    2. Fat-client (``LocalServerV2``, lockstep):
+        Each client (user) maintain a game instance, broadcast player actions between them.
+
+Lockstep mode (version 2):
+    The server never runs the game. It assigns player ids and the random seed of the game,
+    gives each player action a sequence number, and compares state hashes of clients.
+    So the server CPU cost of a game is almost zero, and each action costs only a few bytes.
+
+    Messages::
+
+        client -> server:
+            'user_data'     {nickname, deck_code, protocols}
+                                                    The first message, see ``protocol`` for the version negotiation.
+            'player_action' {action}                The serialized ``PlayerAction`` (see ``PlayerAction.to_dict``).
+            'state_hash'    {turn, hash}            The state hash (see ``state_sync.state_hash``) after each turn end.
+            'game_end'      {result}
+        server -> client:
+            'game_start'    {seed, mode, deck_codes, users, player_id}
+                                                    Users except the first two players are watchers (player id None).
+            'player_action' {seq, player_id, action}
+                                                    Clients apply actions in the order of ``seq``. Clients find
+                                                    actions in legal actions of their own games (see
+                                                    ``LocalClientV2._decode_action``), so invalid actions are dropped
+                                                    by all clients in the same way.
+            'desync'        {turn, hashes}          State hashes of players are different, the game is aborted.
+
+    Users joined after the game start receive the 'game_start' message and all previous actions.
+"""
+
+import random
 import socketserver
 import threading
 
 from .utils import *
+from .protocol import JsonLineProtocol, ProtocolError, negotiate, create_protocol
 from ..utils.constants import C
-from ..utils.message import warning, info, entity_message
+from ..utils.error import GameError
+from ..utils.message import warning, info, error, debug, entity_message
 
 __author__ = 'fyabc'
 
 
 class BaseLocalServer(socketserver.ThreadingTCPServer):
+    # Do not wait for handler threads when the server is closed.
+    daemon_threads = True
+
     def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True, **kwargs):
         super().__init__(server_address, RequestHandlerClass, bind_and_activate=bind_and_activate)
 
@@ -41,19 +74,32 @@ class LocalServerV1(BaseLocalServer):
 
 
 class LocalServerV2(BaseLocalServer):
-    """The server class (fat-client version)."""
+    """The server class (fat-client version). See the module docstring for details."""
+
+    NumPlayers = 2
 
     def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True, **kwargs):
+        self.mode = kwargs.pop('mode', 'standard')
         super().__init__(server_address, RequestHandlerClass, bind_and_activate=bind_and_activate, **kwargs)
 
+        # Key: user nickname, value: handler.
         self.users = {}
         self.master = None
         self.game_users = []
 
-        # Lock for users in the network.
+        # Game data.
+        self.seed = None
+        self.deck_codes = None
+        self.game_running = False
+        # All relayed 'player_action' messages, sent to users joined later.
+        self.actions = []
+        # State hashes of players. Key: turn, value: {player_id: hash}.
+        self._hashes = {}
+
+        # Lock for users in the network and game data.
         self._user_lock = threading.Lock()
 
-    def add_user(self, user, output_fd, is_master=False):
+    def add_user(self, user, handler, is_master=False):
         with self._user_lock:
             if len(self.users) >= self.capacity:
                 raise ServerFull(self)
@@ -61,11 +107,20 @@ class LocalServerV2(BaseLocalServer):
                 raise UserAlreadyExists(self, user)
             else:
                 if is_master:
-                    if self.master is not user:
+                    if self.master is not None:
                         raise MasterAlreadyExists(self, user)
                     else:
                         self.master = user
-                self.users[user] = output_fd
+                self.users[user] = handler
+
+            if not self.game_users:
+                return
+            # The game is started, send the game and previous actions to the new user.
+            start_msg = self._game_start_msg(None)
+            actions = list(self.actions)
+        handler.send(MsgTypes.GameStart, **start_msg)
+        for msg in actions:
+            handler.send(MsgTypes.PlayerAction, **msg)
 
     def remove_user(self, user):
         with self._user_lock:
@@ -76,18 +131,102 @@ class LocalServerV2(BaseLocalServer):
                     # TODO: Assign the new master?
                     pass
                 del self.users[user]
+            concede = self.game_running and user in self.game_users
+        if concede:
+            # The player leaves the game, concede it.
+            self.relay_action(user, {'action': 'Concede', 'player_id': self.game_users.index(user)})
+
+    def _game_start_msg(self, player_id):
+        return {
+            'seed': self.seed,
+            'mode': self.mode,
+            'deck_codes': self.deck_codes,
+            'users': self.game_users,
+            'player_id': player_id,
+        }
 
     def prepare_start_game(self):
-        pass
-
-    # TODO: LAN-specific callbacks, send updates to all users.
+        """Start the game if there are enough players."""
+        with self._user_lock:
+            if self.game_users:
+                return
+            players = [user for user, handler in self.users.items() if handler.deck_code][:self.NumPlayers]
+            if len(players) < self.NumPlayers:
+                return
+            self.game_users = players
+            self.deck_codes = [self.users[user].deck_code for user in players]
+            self.seed = random.getrandbits(32)
+            self.game_running = True
+            handlers = list(self.users.items())
+        info('Start game {} with seed {}'.format(self.game_users, self.seed))
+        for user, handler in handlers:
+            player_id = self.game_users.index(user) if user in self.game_users else None
+            handler.send(MsgTypes.GameStart, **self._game_start_msg(player_id))
+
+    def broadcast(self, msg_type, obj):
+        """Send a message to all users. The message is encoded only once for each protocol version.
+
+        [NOTE]: The lock is only held when copying users.
+        """
+        with self._user_lock:
+            handlers = list(self.users.values())
+        encoded = {}
+        for handler in handlers:
+            protocol = handler.protocol
+            if protocol.version not in encoded:
+                encoded[protocol.version] = protocol.pack([protocol.encode_message(msg_type, obj)])
+            try:
+                handler.send_bytes(encoded[protocol.version])
+            except ConnectionError as e:
+                warning('Failed to send message to {}: {}'.format(handler.user, e))
+
+    def relay_action(self, user, action):
+        """Give the player action a sequence number, and broadcast it to all users.
+
+        [NOTE]: Actions may be received in different order of their sequence numbers, clients must reorder them.
+        """
+        with self._user_lock:
+            if not self.game_running or user not in self.game_users:
+                raise GameError('{} is not a player of the running game'.format(user))
+            msg = {'seq': len(self.actions), 'player_id': self.game_users.index(user), 'action': action}
+            self.actions.append(msg)
+        self.broadcast(MsgTypes.PlayerAction, msg)
+
+    def check_state_hash(self, user, turn, value):
+        """Record the state hash of the player, and compare it with the hash of other players."""
+        with self._user_lock:
+            if user not in self.game_users:
+                return
+            hashes = self._hashes.setdefault(turn, {})
+            hashes[self.game_users.index(user)] = value
+            if len(hashes) < self.NumPlayers:
+                return
+            del self._hashes[turn]
+            if len(set(hashes.values())) == 1:
+                return
+            self.game_running = False
+        error('Games of players are different at turn {}: {}'.format(turn, hashes))
+        self.broadcast(MsgTypes.Desync, {'turn': turn, 'hashes': [hashes[i] for i in range(self.NumPlayers)]})
+
+    def end_game(self, user, result):
+        with self._user_lock:
+            if not self.game_running or user not in self.game_users:
+                return
+            self.game_running = False
+        info('Game {} end in result {}'.format(self.game_users, result))
 
 
 class BaseLocalHandler(socketserver.StreamRequestHandler):
     def __init__(self, request, client_address, server):
         self.user = None
+        self.deck_code = None
         self.state = UserState.Invalid
 
+        # The first message is always in protocol version 1, see ``protocol`` for details.
+        self.protocol = JsonLineProtocol()
+        # Other handlers (e.g. broadcasting) may write to this connection.
+        self._write_lock = threading.Lock()
+
         super().__init__(request, client_address, server)
 
     def setup(self):
@@ -95,7 +234,6 @@ class BaseLocalHandler(socketserver.StreamRequestHandler):
         super().setup()
 
     def handle(self):
-        # TODO
         try:
             while True:
                 if self.state == UserState.Invalid:
@@ -104,23 +242,50 @@ class BaseLocalHandler(socketserver.StreamRequestHandler):
                     self._close_connection()
                     break
                 else:
-                    pass
-            pass
-        except ConnectionError as e:
-            print('Connection error:', e)
+                    msg_type, d = self.recv()
+                    if d is None:
+                        self.state = UserState.CloseConnection
+                    else:
+                        self.on_message(msg_type, d)
+        except (ConnectionError, ProtocolError) as e:
+            warning('Connection error of {}: {}'.format(self.client_address, e))
 
     def _handle_init(self):
-        """Ask user data from client, do the initialize."""
-        # TODO: Replace this debug impl into real impl.
+        """Receive user data from the client, negotiate the protocol version and do the initialize."""
         msg_type, d = self.recv()
-        print('Receive message of type {}'.format(msg_type))
-        print('Message value: {}'.format(d))
+        debug('Receive message of type {}: {}'.format(msg_type, d))
+
+        # 1. Negotiate the protocol version (see ``protocol``). Old clients do not send their versions.
+        if d is not None and 'protocols' in d:
+            try:
+                version = negotiate(d['protocols'])
+            except ProtocolError as e:
+                self.send_text(str(e), error=True)
+                self.state = UserState.CloseConnection
+                return
+            self.send(MsgTypes.Protocol, version=version)
+            self.protocol = create_protocol(version)
+
+        # TODO:
+        # 2. Get game version info and check it.
 
+        self._handle_user_data(msg_type, d)
+
+    def _handle_user_data(self, msg_type, d):
         if d is None:
             self.state = UserState.CloseConnection
+            return
+        if msg_type != MsgTypes.UserData:
+            self.send_text('User data expected!', error=True)
+            self.state = UserState.CloseConnection
+            return
+        self.user = d['nickname']
+        self.deck_code = d.get('deck_code')
+        self.state = UserState.Main
 
-        # TODO:
-        # 1. Get game version info and check it.
+    def on_message(self, msg_type, d):
+        """Process messages in the main state, implemented by subclasses."""
+        self.send_text('Unknown message type {!r}'.format(msg_type), error=True)
 
     def _close_connection(self):
         info('Connection to {} closed'.format(self.client_address))
@@ -129,10 +294,17 @@ class BaseLocalHandler(socketserver.StreamRequestHandler):
         super().finish()
 
     def send(self, msg_type, **kwargs):
-        send_msg(self.wfile, msg_type, **kwargs)
+        self.send_bytes(self.protocol.pack([self.protocol.encode_message(msg_type, kwargs)]))
+
+    def send_bytes(self, data):
+        with self._write_lock:
+            self.wfile.write(data)
 
     def recv(self):
-        return recv_msg(self.rfile)
+        d = self.protocol.recv(self.rfile)
+        if d is None:
+            return None, None
+        return d.get('type', MsgTypes.Default), d
 
     def send_text(self, text, error=False):
         msg_type = MsgTypes.Error if error else MsgTypes.Text
@@ -163,7 +335,45 @@ class LocalHandlerV2(BaseLocalHandler):
     def setup(self):
         super().setup()
 
+    def _handle_user_data(self, msg_type, d):
+        super()._handle_user_data(msg_type, d)
+        if self.state != UserState.Main:
+            return
+        try:
+            self.server.add_user(self.user, self)
+        except GameError as e:
+            self.send_text(str(e), error=True)
+            self.user = None
+            self.state = UserState.CloseConnection
+            return
+        info('{} has joined into the server.'.format(self.user))
+        self.server.prepare_start_game()
+
+    def on_message(self, msg_type, d):
+        if msg_type == MsgTypes.PlayerAction:
+            try:
+                self.server.relay_action(self.user, d.get('action'))
+            except GameError as e:
+                self.send_text(str(e), error=True)
+        elif msg_type == MsgTypes.StateHash:
+            self.server.check_state_hash(self.user, d['turn'], d['hash'])
+        elif msg_type == MsgTypes.GameEnd:
+            self.server.end_game(self.user, d.get('result'))
+        elif msg_type == MsgTypes.Text:
+            self.broadcast(MsgTypes.Text, {'text': '{}: {}'.format(self.user, d.get('text', ''))})
+        else:
+            super().on_message(msg_type, d)
+
+    def broadcast(self, msg_type, d):
+        self.server.broadcast(msg_type, d)
+
     def finish(self):
+        if self.user is not None:
+            try:
+                self.server.remove_user(self.user)
+                info('{} has quit.'.format(self.user))
+            except GameError as e:
+                warning(str(e))
         super().finish()
 
 
@@ -183,6 +393,8 @@ def start_server(server):
 
 
 __all__ = [
+    'LocalServerV1',
+    'LocalServerV2',
     'create_server',
     'start_server',
 ]
@@ -0,0 +1,300 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Wire protocols of the network module.
+
+Version 1: JSON lines.
+    One newline-terminated JSON object per message, the message type is in the "type" field.
+
+Version 2: Length-prefixed binary frames.
+    Each write is a frame which contains a batch of messages::
+
+        frame   := length (u32) | flags (u8) | payload (length bytes)
+        payload := message*                 (zlib compressed if flags & FlagZlib)
+        message := type_id (u8) | body      (body is encoded by ``utils.codec``, self-delimited)
+
+    Type ids are indices of ``MessageTypeIds``, unknown types use ``OtherTypeId`` and keep the "type" field in body.
+    Payloads larger than ``C.LAN.CompressThreshold`` are compressed if it makes them smaller.
+
+Version negotiation:
+    The client sends the first message 'user_data' in version 1, with a "protocols" field of its
+    supported versions. The server selects the highest common version and replies a 'protocol' message
+    in version 1, then both sides switch to the selected version.
+    Old clients do not send "protocols" and stay in version 1; old servers never reply 'protocol',
+    so clients should keep version 1 until they receive it.
+    All servers (``lan_server``, ``async_server``, ``room_server`` and the lockstep ``local_server``)
+    and clients (``lan_client`` and ``local_client``) use this handshake.
+
+Each connection owns a protocol object (see ``create_protocol``), since receiving a batched frame
+may produce several messages.
+"""
+
+import asyncio
+import json
+import struct
+import zlib
+from collections import deque
+
+from .utils import NetworkError
+from ..utils import codec
+from ..utils.constants import C
+
+__author__ = 'fyabc'
+
+SupportedVersions = (2, 1)
+
+# [NOTE]: Only append new types to this tuple, never change the order.
+MessageTypeIds = (
+    'text',
+    'error',
+    'ok',
+    'user_data',
+    'game_status',
+    'game_delta',
+    'player_action',
+    'game_end',
+    'protocol',
+    'match',
+    'room_list',
+    'watch',
+    'game_start',
+    'state_hash',
+    'desync',
+)
+MessageTypeStr2Id = {t: i for i, t in enumerate(MessageTypeIds)}
+OtherTypeId = 0xff
+
+FlagZlib = 0x01
+
+_FrameHeader = struct.Struct('!IB')
+FrameHeaderSize = _FrameHeader.size
+
+
+class ProtocolError(NetworkError):
+    """The peer sends malformed data."""
+
+
+def negotiate(peer_versions):
+    """Select the highest version supported by both sides.
+
+    :param peer_versions: Versions supported by the peer, None means an old peer (version 1 only).
+    :return: The selected version.
+    """
+    if not peer_versions:
+        return 1
+    common = set(SupportedVersions).intersection(peer_versions)
+    if not common:
+        raise ProtocolError('No common protocol versions: {} vs {}'.format(SupportedVersions, peer_versions))
+    return max(common)
+
+
+class JsonLineProtocol:
+    """Protocol version 1: JSON lines."""
+
+    version = 1
+
+    def __init__(self):
+        # Buffer of ``feed``.
+        self._buffer = bytearray()
+
+    def __repr__(self):
+        return '{}(version={})'.format(self.__class__.__name__, self.version)
+
+    def encode_message(self, msg_type, obj):
+        """Encode a message into a chunk. Chunks can be shared between connections of the same protocol."""
+        obj = dict(obj)
+        obj['type'] = msg_type
+        return (json.dumps(obj, separators=(',', ':')) + '\n').encode()
+
+    def pack(self, chunks):
+        """Pack chunks into the data of one write."""
+        return b''.join(chunks)
+
+    def feed(self, data):
+        """Feed received data, return the list of complete messages (incomplete data is kept for the next feed)."""
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        start = 0
+        with memoryview(buffer) as view:
+            while True:
+                msgs, new_start = self.extract(view, start, len(buffer))
+                if new_start == start:
+                    break
+                messages.extend(msgs)
+                start = new_start
+        del buffer[:start]
+        return messages
+
+    def extract(self, view, start, end):
+        """Extract messages of the next unit (a line or a frame) from a receive buffer, without copying the buffer.
+
+        [NOTE]: Only one unit is extracted each time, since the protocol may be switched after a message.
+
+        :param view: The memoryview of the receive buffer (a bytearray).
+        :param start: Start offset of received data.
+        :param end: End offset of received data.
+        :return: Tuple of (messages, new start offset). If the unit is incomplete, return ([], start).
+        """
+        i = view.obj.find(b'\n', start, end)
+        if i < 0:
+            return [], start
+        msg = self._decode_line(bytes(view[start:i]))
+        return ([] if msg is None else [msg]), i + 1
+
+    # Blocking file API.
+
+    def send(self, fd, msg_type, **kwargs):
+        fd.write(self.pack([self.encode_message(msg_type, kwargs)]))
+
+    def send_batch(self, fd, messages):
+        """Send several (msg_type, obj) pairs in one write."""
+        fd.write(self.pack([self.encode_message(t, obj) for t, obj in messages]))
+
+    def recv(self, fd):
+        """Receive a message. Return None if the connection is closed."""
+        return self._decode_line(fd.readline())
+
+    # Asyncio stream API.
+
+    async def recv_async(self, reader):
+        return self._decode_line(await reader.readline())
+
+    @staticmethod
+    def _decode_line(line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            return json.loads(line.decode())
+        except ValueError as e:
+            raise ProtocolError('Malformed JSON message: {}'.format(e)) from e
+
+
+class FramedProtocol(JsonLineProtocol):
+    """Protocol version 2: length-prefixed binary frames."""
+
+    version = 2
+
+    def __init__(self, compress_threshold=None, max_frame_size=None):
+        super().__init__()
+        self.compress_threshold = C.LAN.CompressThreshold if compress_threshold is None else compress_threshold
+        self.max_frame_size = C.LAN.MaxFrameSize if max_frame_size is None else max_frame_size
+
+        # Received messages that are not returned.
+        self._pending = deque()
+
+    def encode_message(self, msg_type, obj):
+        type_id = MessageTypeStr2Id.get(msg_type, OtherTypeId)
+        out = bytearray((type_id,))
+        if type_id == OtherTypeId:
+            obj = dict(obj)
+            obj['type'] = msg_type
+        codec.dump_into(obj, out)
+        return out
+
+    def pack(self, chunks):
+        payload = b''.join(chunks)
+        flags = 0
+        if len(payload) > self.compress_threshold:
+            compressed = zlib.compress(payload, 1)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= FlagZlib
+        return _FrameHeader.pack(len(payload), flags) + payload
+
+    def decode_payload(self, payload, flags):
+        """Decode the payload of a frame into a list of messages."""
+        if flags & FlagZlib:
+            try:
+                payload = zlib.decompress(payload)
+            except zlib.error as e:
+                raise ProtocolError('Bad compressed frame: {}'.format(e)) from e
+        messages = []
+        i, n = 0, len(payload)
+        try:
+            while i < n:
+                type_id = payload[i]
+                msg, i = codec.load_from(payload, i + 1)
+                if not isinstance(msg, dict) or i > n:
+                    raise ProtocolError('Malformed message of type id {}'.format(type_id))
+                if type_id != OtherTypeId:
+                    msg['type'] = MessageTypeIds[type_id]
+                messages.append(msg)
+        except (codec.CodecError, IndexError) as e:
+            raise ProtocolError('Malformed frame: {}'.format(e)) from e
+        return messages
+
+    def _parse_header(self, header):
+        length, flags = _FrameHeader.unpack(header)
+        if length > self.max_frame_size:
+            raise ProtocolError('Frame too large ({} > {})'.format(length, self.max_frame_size))
+        return length, flags
+
+    def extract(self, view, start, end):
+        if end - start < FrameHeaderSize:
+            return [], start
+        length, flags = self._parse_header(view[start:start + FrameHeaderSize])
+        frame_end = start + FrameHeaderSize + length
+        if end < frame_end:
+            return [], start
+        return self.decode_payload(view[start + FrameHeaderSize:frame_end], flags), frame_end
+
+    def recv(self, fd):
+        while not self._pending:
+            header = _read_exactly(fd, FrameHeaderSize)
+            if header is None:
+                return None
+            length, flags = self._parse_header(header)
+            payload = _read_exactly(fd, length)
+            if payload is None:
+                return None
+            self._pending.extend(self.decode_payload(payload, flags))
+        return self._pending.popleft()
+
+    async def recv_async(self, reader):
+        while not self._pending:
+            try:
+                header = await reader.readexactly(FrameHeaderSize)
+                length, flags = self._parse_header(header)
+                payload = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                return None
+            self._pending.extend(self.decode_payload(payload, flags))
+        return self._pending.popleft()
+
+
+def _read_exactly(fd, n):
+    """Read exactly n bytes from the file. Return None if EOF."""
+    data = fd.read(n)
+    if data is None or len(data) == n:
+        return data
+    chunks = [data]
+    remain = n - len(data)
+    while remain > 0:
+        if not data:
+            return None
+        data = fd.read(remain)
+        chunks.append(data)
+        remain -= len(data)
+    return b''.join(chunks)
+
+
+def create_protocol(version):
+    if version == 1:
+        return JsonLineProtocol()
+    elif version == 2:
+        return FramedProtocol()
+    else:
+        raise ValueError('Unknown protocol version {!r}'.format(version))
+
+
+__all__ = [
+    'SupportedVersions',
+    'MessageTypeIds',
+    'ProtocolError',
+    'negotiate',
+    'JsonLineProtocol',
+    'FramedProtocol',
+    'create_protocol',
+]
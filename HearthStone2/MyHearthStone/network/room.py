@@ -0,0 +1,194 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""The game room, which owns a game and produces messages to its users.
+
+A room does not do any I/O. Each method returns a list of outputs, the server sends them to users::
+
+    (target, msg_type, obj)
+        target: player id of the receiver, ``Room.Watchers`` for watchers, or None to send to all users of the room.
+
+So a room can run in the engine thread of a server, or in a worker process (see ``room_server``).
+
+A room does not have clocks either, its owner schedules the turn deadline (see ``turn``), and calls
+``turn_timeout`` when the deadline expires.
+"""
+
+from ..game.core import Game
+from ..game.deck import Deck
+from ..game import player_action as pa
+from ..game.legal_actions import action_key
+from ..game.state_sync import StateSync, filter_batch
+from ..utils.constants import C
+from ..utils.error import GameError
+from ..utils.message import info, warning
+
+__author__ = 'fyabc'
+
+
+class Room:
+    """The game room class."""
+
+    # The viewer of watchers, who can only see public zones.
+    Watchers = -1
+
+    # Viewers of state messages: player ids of the game and watchers.
+    Viewers = (0, 1, Watchers)
+
+    def __init__(self, room_id, max_timeouts=None):
+        self.room_id = room_id
+        self.game = None
+        self.sync = None
+
+        # The player concedes after so many consecutive turn timeouts.
+        self.max_timeouts = C.LAN.MaxTurnTimeouts if max_timeouts is None else max_timeouts
+        self.timeouts = [0, 0]
+
+        self._outputs = []
+
+    def __repr__(self):
+        return 'Room(id={}, game={})'.format(self.room_id, self.game)
+
+    @property
+    def started(self):
+        return self.game is not None
+
+    @property
+    def running(self):
+        return self.game is not None and self.game.running
+
+    @property
+    def turn(self):
+        """The current turn number of the running game (or None), owners reset the turn deadline when it changes."""
+        return self.game.n_turns if self.running else None
+
+    def _emit(self, target, msg_type, obj):
+        self._outputs.append((target, msg_type, obj))
+
+    def _pop_outputs(self):
+        outputs, self._outputs = self._outputs, []
+        return outputs
+
+    def _push_deltas(self):
+        # Batches are flushed by the 'resolve' callbacks, and pushed once after the whole action is resolved.
+        if self.sync is None:
+            return
+        batches = self.sync.pop_batches()
+        if batches:
+            for viewer in self.Viewers:
+                self._emit(viewer, 'game_delta', {'batches': [filter_batch(b, viewer) for b in batches]})
+
+    def _cb_game_end(self, game_result):
+        # Push final deltas before the game end message.
+        self._push_deltas()
+        self._emit(None, 'game_end', {'result': game_result})
+
+    def start(self, deck_codes, mode='standard'):
+        """Start the game.
+
+        :param deck_codes: Deck codes of player 0 and player 1.
+        :param mode: The game mode.
+        :return: Outputs.
+        """
+        game = Game()
+        sync = StateSync(game)
+        game.add_callback(self._cb_game_end, when='game_end')
+
+        game.start_game(decks=[Deck.from_code(code) for code in deck_codes], mode=mode)
+        game.run_player_action(pa.ReplaceStartCard(game, 0, []))
+        game.run_player_action(pa.ReplaceStartCard(game, 1, []))
+        self.game = game
+
+        # Push the initial snapshot, clients apply following deltas on it.
+        sync.pop_batches()
+        for viewer in self.Viewers:
+            self._emit(viewer, 'game_status', {'snapshot': sync.snapshot(viewer)})
+        self.sync = sync
+        info('{} started'.format(self))
+        return self._pop_outputs()
+
+    def _decode_action(self, player_id, msg):
+        """Decode the player action message, and find it in legal actions of the player.
+
+        :return: The legal player action, or None if the action is invalid (the error is sent to the player).
+        """
+        game = self.game
+        if msg.get('action') == 'Concede':
+            # Players can concede at any time.
+            return pa.Concede(game, player_id)
+        try:
+            # [NOTE]: The player id is always the sender, fields not needed by the action are ignored.
+            action = pa.PlayerAction.from_dict(game, dict(msg, player_id=player_id))
+        except GameError as e:
+            self._emit(player_id, 'error', {'text': 'Invalid player action: {}'.format(e)})
+            return None
+        key = action_key(action)
+        for legal_action in game.get_legal_actions():
+            if action_key(legal_action) == key:
+                return legal_action
+        warning('Player {} try to run illegal action {}'.format(player_id, action))
+        self._emit(player_id, 'error', {'text': 'Illegal player action {!r}'.format(msg.get('action'))})
+        return None
+
+    def run_player_action(self, player_id, msg):
+        """Run a player action message sent by the player.
+
+        :param player_id: The sender.
+        :param msg: The serialized player action (see ``PlayerAction.to_dict``), e.g. ``{'action': 'TurnEnd'}``.
+            Actions except 'Concede' must be legal actions (see ``Game.get_legal_actions``).
+        :return: Outputs.
+        """
+        game = self.game
+        if not self.running:
+            self._emit(player_id, 'error', {'text': 'The game is not running!'})
+            return self._pop_outputs()
+        action_name = msg.get('action')
+        if player_id != game.current_player and action_name != 'Concede':
+            warning('Player {} try to run {} in the turn of player {}'.format(
+                player_id, action_name, game.current_player))
+            self._emit(player_id, 'error', {'text': 'Not your turn!'})
+            return self._pop_outputs()
+        action = self._decode_action(player_id, msg)
+        if action is None:
+            return self._pop_outputs()
+        self.timeouts[player_id] = 0
+        game.run_player_action(action)
+        self._push_deltas()
+        return self._pop_outputs()
+
+    def turn_timeout(self, turn):
+        """The deadline of the turn expires, end the turn for the current player.
+        The player concedes if its turns are timeout ``max_timeouts`` times in a row.
+
+        :param turn: The turn of the deadline, nothing happens if the turn is already ended.
+        :return: Outputs.
+        """
+        if self.turn != turn:
+            return self._pop_outputs()
+        game = self.game
+        player_id = game.current_player
+        self.timeouts[player_id] += 1
+        if self.timeouts[player_id] >= self.max_timeouts:
+            self._emit(None, 'text', {'text': 'Player {} timed out {} times, concede the game'.format(
+                player_id, self.timeouts[player_id])})
+            game.run_player_action(pa.Concede(game, player_id))
+        else:
+            self._emit(None, 'text', {'text': 'Turn {} of player {} timed out'.format(turn, player_id)})
+            game.run_player_action(pa.TurnEnd(game, player_id))
+        self._push_deltas()
+        return self._pop_outputs()
+
+    def leave(self, player_id):
+        """The player leaves the room, concede the game if it is running.
+
+        :return: Outputs.
+        """
+        if self.running:
+            self.game.run_player_action(pa.Concede(self.game, player_id))
+            self._push_deltas()
+        return self._pop_outputs()
+
+
+__all__ = [
+    'Room',
+]
@@ -0,0 +1,547 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""A multi-room game server, rooms are sharded across worker processes.
+
+Architecture::
+
+    clients <--> front end (asyncio, lobby & matchmaking) <--> worker processes (rooms)
+
+Front end:
+    Serves all connections in one event loop (see ``async_server.AsyncConnection``).
+    Users stay in the lobby after joining. The lobby supports these messages:
+        'match': Enter the matchmaking queue, the first two waiting users are put into a new room.
+        'room_list': Get the list of running rooms.
+        'watch': Watch the room of the given id ("room" field), or stop watching if the id is null.
+        'text': Chat with users in the same room (or in the lobby).
+    Messages of users in a room (e.g. 'player_action') are routed to the worker of the room by room id.
+    Users return to the lobby when the game of their room ends.
+
+    If a player disconnects from a running room, the server waits ``reconnect_grace`` seconds before conceding
+    the game for it. A user with the same nickname joined in this period takes the seat back, if its 'user_data'
+    message contains the reconnect token of the seat ("reconnect_token" field, sent to the player in the 'match'
+    message, and a new token is sent after each reconnection). Users with the nickname but without the token are
+    rejected until the seat is taken back or the game is conceded. If its 'user_data' message contains the version
+    of its mirror ("state_version" field, an integer), it receives only the missing delta batches when they are
+    smaller than the snapshot (see ``StateStream.missing_batches``), else the latest snapshot.
+    Connections that are idle for ``idle_timeout`` seconds (not in rooms) are closed.
+
+    State messages of each view of the room (players and watchers) are sent through a ``fanout.StateStream``,
+    so they are encoded once for all receivers, and slow receivers never block the room.
+
+Workers:
+    Each worker process owns many rooms (``room.Room``) and runs their engines.
+    The engine work is CPU-bound and limited by the GIL, so the number of workers is the number of cores
+    by default (``C.LAN.Workers``). New rooms are assigned to the worker with the fewest rooms.
+
+    Turn deadlines of rooms are kept in a ``timer.TimerService`` of the worker, the worker waits for commands
+    until the next deadline. When the deadline of a turn expires, the turn is ended (or conceded, see
+    ``Room.turn_timeout``) as if the player did it.
+
+    Commands (front end -> worker), put into the command queue of the worker::
+
+        ('start', room_id, deck_codes)
+        ('action', room_id, player_id, msg)
+        ('leave', room_id, player_id)
+        ('close', room_id)
+        None        (stop the worker)
+
+    Results (worker -> front end), put into the shared result queue::
+
+        (room_id, outputs)      (see ``room`` for details of outputs)
+"""
+
+import asyncio
+import hmac
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+from collections import deque
+
+from .async_server import AsyncConnection
+from .fanout import StateStream
+from .protocol import ProtocolError
+from .room import Room
+from .timer import TimerService, LoopTimerService
+from ..utils.constants import C
+from ..utils.message import info, warning, error
+
+__author__ = 'fyabc'
+
+
+def _run_worker(worker_id, commands, results, turn_timeout, max_timeouts):
+    """The main loop of worker processes."""
+    rooms = {}
+    # Turn deadlines, key: room id.
+    timers = TimerService()
+
+    def _on_turn_timeout(room, turn):
+        results.put((room.room_id, room.turn_timeout(turn)))
+        _update_deadline(room)
+
+    def _update_deadline(room):
+        turn = room.turn
+        if turn is None or turn_timeout <= 0:
+            timers.cancel(room.room_id)
+            return
+        # Reset the deadline when the turn changes.
+        timer = timers.get(room.room_id)
+        if timer is None or timer.args[1] != turn:
+            timers.call_later(turn_timeout, _on_turn_timeout, room, turn, key=room.room_id)
+
+    while True:
+        timers.run_expired()
+        try:
+            command = commands.get(timeout=timers.timeout())
+        except queue.Empty:
+            continue
+        if command is None:
+            break
+        op, room_id = command[0], command[1]
+        try:
+            if op == 'start':
+                room = rooms[room_id] = Room(room_id, max_timeouts)
+                outputs = room.start(command[2])
+            elif op == 'action':
+                outputs = rooms[room_id].run_player_action(command[2], command[3])
+            elif op == 'leave':
+                outputs = rooms[room_id].leave(command[2])
+            elif op == 'close':
+                rooms.pop(room_id, None)
+                timers.cancel(room_id)
+                continue
+            else:
+                raise ValueError('Unknown worker command {!r}'.format(op))
+        except Exception as e:
+            error('Error in worker {} when running {} of room {}: {}'.format(worker_id, op, room_id, e))
+            outputs = [(None, 'error', {'text': 'Room {} failed: {}'.format(room_id, e)})]
+        results.put((room_id, outputs))
+        if room_id in rooms:
+            _update_deadline(rooms[room_id])
+
+
+class RoomWorker:
+    """The front end handle of a worker process."""
+
+    def __init__(self, worker_id, results, ctx, turn_timeout=None, max_timeouts=None):
+        self.worker_id = worker_id
+        self.commands = ctx.Queue()
+        if turn_timeout is None:
+            turn_timeout = C.LAN.TurnTimeout
+        if max_timeouts is None:
+            max_timeouts = C.LAN.MaxTurnTimeouts
+        self.process = ctx.Process(target=_run_worker,
+                                   args=(worker_id, self.commands, results, turn_timeout, max_timeouts),
+                                   name='RoomWorker-{}'.format(worker_id), daemon=True)
+        self.n_rooms = 0
+
+    def __repr__(self):
+        return 'RoomWorker(id={}, rooms={})'.format(self.worker_id, self.n_rooms)
+
+    def start(self):
+        self.process.start()
+
+    def send(self, *command):
+        self.commands.put(command)
+
+    def stop(self):
+        self.commands.put(None)
+
+
+class RoomInfo:
+    """The front end information of a room."""
+
+    def __init__(self, room_id, worker, conns, schedule=None):
+        self.room_id = room_id
+        self.worker = worker
+        # Player id -> connection.
+        self.conns = dict(enumerate(conns))
+        # Connections of watchers.
+        self.watchers = set()
+        # Nicknames of disconnected players waiting for reconnection. Key: player id.
+        self.disconnected = {}
+        # Reconnect tokens of seats. Key: player id.
+        self.tokens = {}
+
+        # State streams of all viewers of the room.
+        self.streams = {viewer: StateStream(viewer, schedule) for viewer in Room.Viewers}
+        for player_id, conn in self.conns.items():
+            self.streams[player_id].add(conn)
+
+    def to_dict(self):
+        return {
+            'id': self.room_id,
+            'worker': self.worker.worker_id,
+            'users': [conn.user.nickname for _, conn in sorted(self.conns.items())],
+            'watchers': len(self.watchers),
+        }
+
+    def add_watcher(self, conn):
+        self.watchers.add(conn)
+        self.streams[Room.Watchers].add(conn)
+
+    def remove_watcher(self, conn):
+        self.watchers.discard(conn)
+        self.streams[Room.Watchers].remove(conn)
+
+
+class RoomServer:
+    """The multi-room server class (front end).
+
+    :param kwargs: Timeouts (in seconds, default to values in ``C.LAN``):
+        turn_timeout, max_timeouts: see ``Room.turn_timeout``.
+        idle_timeout: Idle connections (not in rooms) are closed after this time.
+        reconnect_grace: Wait time for disconnected players to reconnect.
+    """
+
+    def __init__(self, address, n_workers=None, **kwargs):
+        self.address = address
+        turn_timeout = kwargs.pop('turn_timeout', None)
+        max_timeouts = kwargs.pop('max_timeouts', None)
+        self.idle_timeout = kwargs.pop('idle_timeout', C.LAN.IdleTimeout)
+        self.reconnect_grace = kwargs.pop('reconnect_grace', C.LAN.ReconnectGrace)
+
+        if n_workers is None:
+            n_workers = C.LAN.Workers
+        if n_workers <= 0:
+            n_workers = os.cpu_count() or 1
+        self._ctx = multiprocessing.get_context()
+        self._results = self._ctx.Queue()
+        self.workers = [RoomWorker(i, self._results, self._ctx, turn_timeout, max_timeouts) for i in range(n_workers)]
+
+        # All connected users. Key: ``NetworkUser``, value: ``AsyncConnection``.
+        self.users = {}
+        # Room id -> ``RoomInfo``.
+        self.rooms = {}
+        # Room id of users in rooms. Key: ``NetworkUser``, value: room id.
+        self.user_rooms = {}
+        # Room id of watchers, same as above.
+        self.watching = {}
+        # Matchmaking queue of connections.
+        self.waiting = deque()
+        # Room id of disconnected players waiting for reconnection. Key: nickname.
+        self.disconnected = {}
+
+        # Idle timeouts and reconnect grace periods, created in the event loop.
+        self.timers = None
+
+        self._next_room_id = 0
+        self._loop = None
+        self._server = None
+        self._pump_thread = None
+
+    def __repr__(self):
+        return 'RoomServer(address={}, workers={})'.format(self.address, len(self.workers))
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.timers = LoopTimerService(self._loop)
+        for worker in self.workers:
+            worker.start()
+        self._pump_thread = threading.Thread(target=self._pump_results, name='RoomResultPump', daemon=True)
+        self._pump_thread.start()
+
+        host, port = self.address
+        self._server = await asyncio.start_server(self._handle, host, port)
+        info('Start {}'.format(self))
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self.timers is not None:
+            self.timers.close()
+        for conn in list(self.users.values()):
+            conn.close()
+        for worker in self.workers:
+            worker.stop()
+        # Stop the pump thread.
+        self._results.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=1)
+
+    # Workers.
+
+    def _pump_results(self):
+        # [NOTE]: Run in the pump thread, pass results into the event loop.
+        while True:
+            result = self._results.get()
+            if result is None:
+                break
+            self._loop.call_soon_threadsafe(self._on_result, *result)
+
+    def _on_result(self, room_id, outputs):
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        game_end = False
+        for target, msg_type, obj in outputs:
+            if target is None:
+                self.broadcast_room(room, msg_type, obj)
+            else:
+                room.streams[target].publish(msg_type, obj)
+            if msg_type == 'game_end':
+                game_end = True
+        if game_end:
+            self.close_room(room)
+
+    # Rooms and matchmaking.
+
+    def create_room(self, conns):
+        """Create a room of the connections, and start the game in a worker."""
+        worker = min(self.workers, key=lambda w: w.n_rooms)
+        room_id = self._next_room_id
+        self._next_room_id += 1
+
+        # Checkpoints of state streams are taken after the current messages are sent.
+        room = self.rooms[room_id] = RoomInfo(room_id, worker, conns, self._loop.call_soon)
+        worker.n_rooms += 1
+        for player_id, conn in room.conns.items():
+            conn.user.player_id = player_id
+            self.user_rooms[conn.user] = room_id
+            room.tokens[player_id] = secrets.token_hex(16)
+            conn.send('match', room=room.to_dict(), player_id=player_id, reconnect_token=room.tokens[player_id])
+        info('Create room {} in {}'.format(room_id, worker))
+        worker.send('start', room_id, [conn.user.deck_code for _, conn in sorted(room.conns.items())])
+        return room
+
+    def close_room(self, room):
+        if self.rooms.pop(room.room_id, None) is None:
+            return
+        room.worker.n_rooms -= 1
+        room.worker.send('close', room.room_id)
+        for conn in room.conns.values():
+            self.user_rooms.pop(conn.user, None)
+            conn.user.player_id = None
+        for conn in room.watchers:
+            self.watching.pop(conn.user, None)
+        for nickname in room.disconnected.values():
+            self.disconnected.pop(nickname, None)
+            self.timers.cancel(('grace', nickname))
+        info('Close room {}'.format(room.room_id))
+
+    def try_match(self):
+        while len(self.waiting) >= 2:
+            self.create_room([self.waiting.popleft(), self.waiting.popleft()])
+
+    def broadcast_room(self, room, msg_type, obj):
+        """Send a message to all users and watchers of the room.
+        The message is encoded only once for each protocol version.
+        """
+        encoded = {}
+        for conn in list(room.conns.values()) + list(room.watchers):
+            version = conn.protocol.version
+            if version not in encoded:
+                encoded[version] = conn.protocol.encode_message(msg_type, obj)
+            conn.send_bytes(encoded[version])
+
+    # Connection handling.
+
+    async def _handle(self, reader, writer):
+        conn = AsyncConnection(self, reader, writer)
+        conn.start()
+        conn.last_active = self.timers.clock()
+        self._schedule_idle(conn)
+
+        try:
+            if not await conn.handshake():
+                return
+            conn.last_active = self.timers.clock()
+            if conn.user in self.users:
+                conn.send_text('{} already exists!'.format(conn.user.nickname), error=True)
+                conn.user = None
+                return
+            if conn.user.nickname in self.disconnected and not self._check_reconnect_token(conn):
+                warning('{} try to take the seat of {} without the reconnect token'.format(conn, conn.user.nickname))
+                conn.send_text('Invalid reconnect token of {}!'.format(conn.user.nickname), error=True)
+                conn.user = None
+                return
+            self.users[conn.user] = conn
+            conn.send_text('Hello {}, welcome to the HearthStone lobby!'.format(conn.user.nickname))
+            info('{} has joined into the lobby.'.format(conn.user.nickname))
+            self.reconnect(conn)
+
+            while True:
+                msg = await conn.recv()
+                if msg is None:
+                    break
+                conn.last_active = self.timers.clock()
+                self._on_message(conn, msg)
+        except (ConnectionError, ValueError, ProtocolError) as e:
+            warning('Connection error of {}: {}'.format(conn, e))
+        finally:
+            self.timers.cancel(('idle', conn))
+            self._on_disconnect(conn)
+            conn.close()
+
+    def _schedule_idle(self, conn):
+        if self.idle_timeout > 0:
+            self.timers.call_at(conn.last_active + self.idle_timeout, self._on_idle_timeout, conn, key=('idle', conn))
+
+    def _on_idle_timeout(self, conn):
+        # [NOTE]: The timer is not reset by each message, it checks the time of the last message when expired.
+        if conn.closed:
+            return
+        now = self.timers.clock()
+        if conn.user in self.user_rooms or conn.user in self.watching or conn in self.waiting:
+            # Users in rooms are limited by the turn timeout.
+            conn.last_active = now
+        if now - conn.last_active < self.idle_timeout:
+            self._schedule_idle(conn)
+            return
+        info('{} is idle for {:.1f} seconds, close it'.format(conn, now - conn.last_active))
+        conn.send_text('Idle timeout, bye!', error=True)
+        conn.close()
+
+    def _on_message(self, conn, msg):
+        msg_type = msg.get('type')
+        room_id = self.user_rooms.get(conn.user)
+        watch_id = self.watching.get(conn.user)
+        if msg_type == 'player_action':
+            if room_id is None:
+                conn.send_text('You are not in a room!', error=True)
+                return
+            self.rooms[room_id].worker.send('action', room_id, conn.user.player_id, msg)
+        elif msg_type == 'match':
+            if room_id is not None or watch_id is not None or conn in self.waiting:
+                conn.send_text('You are already in a room or waiting!', error=True)
+                return
+            if 'deck_code' in msg:
+                conn.user.deck_code = msg['deck_code']
+            if not conn.user.deck_code:
+                conn.send_text('Deck code expected!', error=True)
+                return
+            self.waiting.append(conn)
+            self.try_match()
+        elif msg_type == 'room_list':
+            conn.send('room_list', rooms=[room.to_dict() for room in self.rooms.values()])
+        elif msg_type == 'watch':
+            self.watch(conn, msg.get('room'))
+        elif msg_type == 'text':
+            text = '{}: {}'.format(conn.user.nickname, msg.get('text', ''))
+            if room_id is None:
+                room_id = watch_id
+            if room_id is None:
+                conn.send_text(text)
+            else:
+                self.broadcast_room(self.rooms[room_id], 'text', {'text': text})
+        else:
+            conn.send_text('Unknown message type {!r}'.format(msg_type), error=True)
+
+    def watch(self, conn, room_id):
+        """Watch the room, or stop watching if room id is None."""
+        if conn.user in self.user_rooms or conn in self.waiting:
+            conn.send_text('Players cannot watch other rooms!', error=True)
+            return
+        old_id = self.watching.pop(conn.user, None)
+        if old_id is not None:
+            self.rooms[old_id].remove_watcher(conn)
+        if room_id is None:
+            conn.send('watch', room=None)
+            return
+        room = self.rooms.get(room_id)
+        if room is None:
+            conn.send_text('Room {!r} not found!'.format(room_id), error=True)
+            return
+        self.watching[conn.user] = room_id
+        conn.send('watch', room=room.to_dict())
+        # The watcher gets the latest snapshot if the game is started.
+        room.add_watcher(conn)
+        info('{} is watching room {}'.format(conn.user.nickname, room_id))
+
+    def _on_disconnect(self, conn):
+        if conn.user is None or conn.user not in self.users:
+            return
+        del self.users[conn.user]
+        info('{} has quit.'.format(conn.user.nickname))
+        try:
+            self.waiting.remove(conn)
+        except ValueError:
+            pass
+        watch_id = self.watching.pop(conn.user, None)
+        if watch_id is not None:
+            self.rooms[watch_id].remove_watcher(conn)
+        room_id = self.user_rooms.get(conn.user)
+        if room_id is not None:
+            room = self.rooms[room_id]
+            player_id = conn.user.player_id
+            del room.conns[player_id]
+            room.streams[player_id].remove(conn)
+            del self.user_rooms[conn.user]
+            if self.reconnect_grace > 0:
+                nickname = conn.user.nickname
+                room.disconnected[player_id] = nickname
+                self.disconnected[nickname] = room_id
+                self.timers.call_later(self.reconnect_grace, self._on_grace_timeout, nickname, key=('grace', nickname))
+                info('Wait {} seconds for {} to reconnect'.format(self.reconnect_grace, nickname))
+            else:
+                # The player leaves the game, concede it.
+                room.worker.send('leave', room_id, player_id)
+
+    def _on_grace_timeout(self, nickname):
+        room = self.rooms[self.disconnected.pop(nickname)]
+        for player_id, name in list(room.disconnected.items()):
+            if name == nickname:
+                del room.disconnected[player_id]
+                info('{} does not reconnect, concede the game'.format(nickname))
+                room.worker.send('leave', room.room_id, player_id)
+
+    def _check_reconnect_token(self, conn):
+        """Check the reconnect token of the user, whose nickname is disconnected from a running room."""
+        room = self.rooms[self.disconnected[conn.user.nickname]]
+        player_id = next(p for p, name in room.disconnected.items() if name == conn.user.nickname)
+        token = conn.user_data.get('reconnect_token')
+        return isinstance(token, str) and hmac.compare_digest(token, room.tokens[player_id])
+
+    def reconnect(self, conn):
+        """Put the player back to its room if it is disconnected from a running room.
+
+        [NOTE]: The reconnect token must be checked before (see ``_check_reconnect_token``).
+
+        :return: The player is reconnected or not.
+        """
+        room_id = self.disconnected.pop(conn.user.nickname, None)
+        if room_id is None:
+            return False
+        self.timers.cancel(('grace', conn.user.nickname))
+        room = self.rooms[room_id]
+        player_id = next(p for p, name in room.disconnected.items() if name == conn.user.nickname)
+        del room.disconnected[player_id]
+
+        room.conns[player_id] = conn
+        conn.user.player_id = player_id
+        self.user_rooms[conn.user] = room_id
+        room.tokens[player_id] = secrets.token_hex(16)
+        conn.send('match', room=room.to_dict(), player_id=player_id, reconnect=True,
+                  reconnect_token=room.tokens[player_id])
+        # The player gets missing batches or the latest snapshot of its view.
+        # [NOTE]: The version is sent by the client, invalid versions (not integers) get the latest snapshot.
+        version = conn.user_data.get('state_version')
+        if type(version) is not int:
+            version = None
+        room.streams[player_id].add(conn, version)
+        info('{} reconnected to room {}'.format(conn.user.nickname, room_id))
+        return True
+
+
+def start_room_server(address, n_workers=None):
+    server = RoomServer(address, n_workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+__all__ = [
+    'RoomWorker',
+    'RoomServer',
+    'start_room_server',
+]
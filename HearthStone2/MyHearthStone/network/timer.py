@@ -0,0 +1,208 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Heap-based timer service of servers.
+
+All timers of a server (turn deadlines, idle connections, reconnect grace periods, etc.) are kept in one heap,
+and are run by the thread that owns the service, so no thread is created for each timer:
+
+    1. Worker processes of ``room_server`` wait for commands with the timeout of the next deadline
+        (see ``TimerService.timeout``), then run expired timers.
+    2. Event loops (``LoopTimerService``) keep only one loop timer handle, for the earliest deadline.
+
+Timers can be scheduled with a key, scheduling a new timer of the same key cancels the old one, so the owner need
+not keep timer handles. Cancelled timers are removed from the heap lazily, and the heap is rebuilt when most of
+its entries are cancelled, so frequently rescheduled timers do not make the heap grow.
+
+[NOTE]: The service is not thread-safe, only the owner thread can use it.
+"""
+
+import heapq
+import itertools
+import time
+
+from ..utils.message import error
+
+__author__ = 'fyabc'
+
+
+class Timer:
+    """The handle of a scheduled timer."""
+
+    __slots__ = ('deadline', 'callback', 'args', 'key', 'cancelled')
+
+    def __init__(self, deadline, callback, args, key=None):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.key = key
+        self.cancelled = False
+
+    def __repr__(self):
+        return 'Timer(deadline={}, callback={}, key={!r}, cancelled={})'.format(
+            self.deadline, getattr(self.callback, '__name__', self.callback), self.key, self.cancelled)
+
+
+class TimerService:
+    """The heap-based timer service.
+
+    :param clock: The clock function, default to ``time.monotonic``.
+    """
+
+    # The heap is rebuilt if it has so many entries and most of them are cancelled.
+    CompactThreshold = 256
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+
+        # Heap of (deadline, sequence number, timer), the sequence number keeps the order of equal deadlines.
+        self._heap = []
+        self._counter = itertools.count()
+        self._n_cancelled = 0
+        # Key -> timer.
+        self._keys = {}
+
+    def __len__(self):
+        """Number of active timers."""
+        return len(self._heap) - self._n_cancelled
+
+    def __repr__(self):
+        return '{}(timers={})'.format(self.__class__.__name__, len(self))
+
+    def call_at(self, deadline, callback, *args, key=None):
+        """Call ``callback(*args)`` at the deadline (in the time of the clock).
+
+        :param key: Key of the timer, the old timer of the same key is cancelled.
+        :return: The ``Timer`` handle.
+        """
+        if key is not None:
+            self.cancel(key)
+        timer = Timer(deadline, callback, args, key)
+        if key is not None:
+            self._keys[key] = timer
+        heapq.heappush(self._heap, (deadline, next(self._counter), timer))
+        self._on_scheduled(deadline)
+        return timer
+
+    def call_later(self, delay, callback, *args, key=None):
+        """Call ``callback(*args)`` after the delay (in seconds). See ``call_at``."""
+        return self.call_at(self.clock() + delay, callback, *args, key=key)
+
+    def get(self, key):
+        """Get the active timer of the key, or None."""
+        return self._keys.get(key)
+
+    def cancel(self, timer_or_key):
+        """Cancel the timer (or the timer of the key).
+
+        :return: The timer is cancelled or not (already run or cancelled).
+        """
+        if isinstance(timer_or_key, Timer):
+            timer = timer_or_key
+            if timer.key is not None and self._keys.get(timer.key) is timer:
+                del self._keys[timer.key]
+        else:
+            timer = self._keys.pop(timer_or_key, None)
+            if timer is None:
+                return False
+        if timer.cancelled:
+            return False
+        timer.cancelled = True
+        self._n_cancelled += 1
+        if len(self._heap) > self.CompactThreshold and self._n_cancelled * 2 > len(self._heap):
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._n_cancelled = 0
+        return True
+
+    def next_deadline(self):
+        """Get the deadline of the next timer, or None if no timers."""
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self._n_cancelled -= 1
+        return heap[0][0] if heap else None
+
+    def timeout(self):
+        """Get the time (in seconds) until the next deadline, or None if no timers."""
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
+
+    def run_expired(self, now=None):
+        """Run all expired timers in order of their deadlines.
+
+        Timers scheduled by callbacks are run in the same call if they are already expired.
+        Exceptions of callbacks are logged, they do not stop other timers.
+
+        :return: Number of run timers.
+        """
+        if now is None:
+            now = self.clock()
+        heap = self._heap
+        n = 0
+        while heap and heap[0][0] <= now:
+            _, _, timer = heapq.heappop(heap)
+            if timer.cancelled:
+                self._n_cancelled -= 1
+                continue
+            # Mark the timer as done, so it cannot be cancelled again.
+            timer.cancelled = True
+            if timer.key is not None and self._keys.get(timer.key) is timer:
+                del self._keys[timer.key]
+            n += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                error('Error in timer {}: {}'.format(timer, e))
+        return n
+
+    def _on_scheduled(self, deadline):
+        """Called after a timer is scheduled, subclasses override this to wake up the owner."""
+        pass
+
+
+class LoopTimerService(TimerService):
+    """The timer service run by an asyncio event loop.
+
+    It uses the clock of the loop, and keeps one loop timer handle for the earliest deadline.
+    """
+
+    def __init__(self, loop):
+        super().__init__(clock=loop.time)
+        self.loop = loop
+        self._handle = None
+        self._handle_deadline = None
+
+    def _on_scheduled(self, deadline):
+        if self._handle_deadline is None or deadline < self._handle_deadline:
+            self._arm(deadline)
+
+    def _arm(self, deadline):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = self.loop.call_at(deadline, self._on_wakeup)
+        self._handle_deadline = deadline
+
+    def _on_wakeup(self):
+        # The loop may run the handle a little earlier (in the clock resolution) than the deadline.
+        now = max(self.clock(), self._handle_deadline)
+        self._handle = self._handle_deadline = None
+        self.run_expired(now)
+        deadline = self.next_deadline()
+        if deadline is not None and deadline != self._handle_deadline:
+            self._arm(deadline)
+
+    def close(self):
+        """Stop running timers."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = self._handle_deadline = None
+
+
+__all__ = [
+    'Timer',
+    'TimerService',
+    'LoopTimerService',
+]
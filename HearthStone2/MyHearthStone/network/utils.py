@@ -4,11 +4,15 @@
 """Utilities of network.
 
 Message format:
-Compressed JSON string
+A dict with the message type:
 {
     "type": "text",
     # Other information ...
 }
+
+Wire format:
+JSON lines before the protocol negotiation, then the negotiated protocol (length-prefixed binary frames).
+See ``protocol`` for details.
 """
 
 import json
@@ -68,6 +72,13 @@ class MsgTypes:
     Text = 'text'
     OK = 'ok'
     Error = 'error'
+    Protocol = 'protocol'
+    UserData = 'user_data'
+    GameStart = 'game_start'
+    PlayerAction = 'player_action'
+    StateHash = 'state_hash'
+    Desync = 'desync'
+    GameEnd = 'game_end'
 
     Default = Text
 
@@ -94,6 +105,7 @@ def recv_msg(fd):
 class UserState:
     Invalid = -1
     WaitUserData = 0
+    Main = 1
     CloseConnection = 10
 
 
@@ -3,6 +3,8 @@
 
 import json
 
+from .protocol import JsonLineProtocol
+
 __author__ = 'fyabc'
 
 
@@ -12,8 +14,13 @@ def _ensure_newline(s):
     return s
 
 
+def encode_obj(obj):
+    """Encode an object into a newline-terminated JSON line."""
+    return (json.dumps(obj, separators=(',', ':')) + '\n').encode()
+
+
 def send_obj(fd, obj):
-    fd.write((json.dumps(obj, separators=(',', ':')) + '\n').encode())
+    fd.write(encode_obj(obj))
 
 
 def recv_obj(fd):
@@ -48,6 +55,9 @@ class NetworkUser:
         self.deck_code = deck_code
         self.player_id = None
 
+        # Wire protocol of the connection of this user, set after the version negotiation.
+        self.protocol = JsonLineProtocol()
+
     def __eq__(self, other):
         return (self.address, self.nickname) == (other.address, other.nickname)
 
@@ -61,4 +71,14 @@ MessageTypes = {
     'ok',
     'user_data',
     'game_status',
+    'game_delta',
+    'player_action',
+    'game_end',
+    'protocol',
+    'match',
+    'room_list',
+    'watch',
+    'game_start',
+    'state_hash',
+    'desync',
 }
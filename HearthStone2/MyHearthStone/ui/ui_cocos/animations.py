@@ -194,6 +194,9 @@ _EventAnimationMap = {
     std_e.HeroPowerPhase: [run_opponent_hero_power_animations],
 }
 
+# Event types that have animations (subclasses are also animated, see ``run_event_animations``).
+AnimationEventTypes = tuple(_EventAnimationMap)
+
 
 def run_event_animations(layer, event):
     for klass in event.ancestors():
@@ -231,6 +234,7 @@ def run_animations(layer, event_or_trigger, current_event):
 
 
 __all__ = [
+    'AnimationEventTypes',
     'run_event_animations',
     'run_trigger_animations',
     'run_animations',
@@ -0,0 +1,168 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""The view model of the game board: snapshots of the visible board, diffed against the last rendered snapshot.
+
+Each sprite of the board has a key ``(kind, entity)`` and a view ``(i, index, n, content)``:
+
+    kind:       One of ``Kinds`` (hand cards, minions, heroes, hero powers and weapons).
+    i:          The board side (0 is the bottom, see ``GameBoardLayer.player_id_to_i``).
+    index, n:   The index in the zone and the size of the zone, which determine the position of the sprite.
+    content:    Displayed values of the entity (see ``ContentAttributes``).
+
+When refreshing the board, the layer takes a snapshot and asks ``BoardSnapshot.changed`` for each sprite;
+only sprites that are new (e.g. created by animations), moved or changed since the last rendered snapshot are updated.
+Labels of players (deck size and mana) are diffed in the same way.
+
+Status borders are diffed separately (``BoardViewModel.status_changed``), since they are updated before animations.
+
+[NOTE]: This module does not depend on Cocos.
+"""
+
+__author__ = 'fyabc'
+
+Hand, Play, Hero, HeroPower, Weapon = 'hand', 'play', 'hero', 'hero_power', 'weapon'
+Kinds = (Hand, Play, Hero, HeroPower, Weapon)
+
+# Attributes shown by sprites of each kind.
+ContentAttributes = {
+    Hand: ('type', 'cost', 'attack', 'health', 'max_health', 'armor', 'name', 'description'),
+    Play: ('type', 'attack', 'health', 'max_health', 'divine_shield', 'taunt', 'frozen', 'stealth', 'dr_list'),
+    Hero: ('attack', 'health', 'max_health', 'armor', 'frozen'),
+    HeroPower: ('cost', 'exhausted'),
+    Weapon: ('attack', 'health', 'max_health', 'sheathed'),
+}
+
+_Missing = object()
+
+
+def _content(kind, entity):
+    values = []
+    for name in ContentAttributes[kind]:
+        value = getattr(entity, name, None)
+        # [NOTE]: Lists (e.g. deathrattles) are changed in place, only their presence is shown.
+        values.append(bool(value) if isinstance(value, list) else value)
+    return tuple(values)
+
+
+def player_label(player):
+    """Get values shown in labels of the player."""
+    return len(player.deck), player.displayed_mana(), player.max_mana, player.overload, player.overload_next, \
+        player.player_id
+
+
+def board_views(players):
+    """Get views of the board.
+
+    :param players: Players in i-order (the bottom player first).
+    :return: Dict of sprite keys to views.
+    """
+    views = {}
+    for i, player in enumerate(players):
+        for kind, entities in ((Hand, player.hand), (Play, player.play)):
+            n = len(entities)
+            for index, entity in enumerate(entities):
+                views[kind, entity] = (i, index, n, _content(kind, entity))
+        for kind, entity in ((Hero, player.hero), (HeroPower, player.hero_power), (Weapon, player.weapon)):
+            if entity is not None:
+                views[kind, entity] = (i, 0, 1, _content(kind, entity))
+    return views
+
+
+class BoardSnapshot:
+    """A snapshot of the board, being rendered.
+
+    :param views: Views of the board (see ``board_views``).
+    :param labels: Labels of players in i-order (see ``player_label``).
+    :param last: The last rendered snapshot, or None.
+    """
+
+    def __init__(self, views, labels, last=None):
+        self.views = views
+        self.labels = labels
+        self.last = last
+
+        # Rendered sprites of keys.
+        self.sprites = {}
+
+    def __repr__(self):
+        return 'BoardSnapshot(sprites={})'.format(len(self.views))
+
+    def label_changed(self, i):
+        return self.last is None or self.last.labels[i] != self.labels[i]
+
+    def changed(self, key, sprite):
+        """Test if the sprite of the key must be updated, and record it as rendered.
+
+        :param key: The sprite key ``(kind, entity)``.
+        :param sprite: The current sprite of the key.
+        """
+        self.sprites[key] = sprite
+        last = self.last
+        if last is None or last.sprites.get(key) is not sprite:
+            return True
+        return last.views.get(key) != self.views.get(key)
+
+    def diff(self):
+        """Get keys of sprites to be created, removed, moved (the layout changed) and updated (the content changed).
+
+        :return: (created, removed, moved, updated), lists of keys.
+        """
+        last_views = {} if self.last is None else self.last.views
+        created, moved, updated = [], [], []
+        for key, view in self.views.items():
+            last_view = last_views.get(key)
+            if last_view is None:
+                created.append(key)
+                continue
+            if last_view[:3] != view[:3]:
+                moved.append(key)
+            if last_view[3] != view[3]:
+                updated.append(key)
+        removed = [key for key in last_views if key not in self.views]
+        return created, removed, moved, updated
+
+
+class BoardViewModel:
+    """The board view model of a game board layer."""
+
+    def __init__(self):
+        self.last = None
+        # Status shown by sprites (sprite -> status).
+        self.statuses = {}
+
+    def reset(self):
+        """Forget the rendered board, the next refresh updates all sprites."""
+        self.last = None
+        self.statuses.clear()
+
+    def snapshot(self, players):
+        """Take a snapshot of the board.
+
+        :param players: Players in i-order (the bottom player first).
+        :rtype: BoardSnapshot
+        """
+        return BoardSnapshot(board_views(players), [player_label(player) for player in players], self.last)
+
+    def commit(self, snapshot):
+        """Mark the snapshot as rendered."""
+        snapshot.last = None
+        self.last = snapshot
+        rendered = set(snapshot.sprites.values())
+        for sprite in [sprite for sprite in self.statuses if sprite not in rendered]:
+            del self.statuses[sprite]
+
+    def status_changed(self, sprite, status):
+        """Test if the status of the sprite changed, and record the new status."""
+        if self.statuses.get(sprite, _Missing) == status:
+            return False
+        self.statuses[sprite] = status
+        return True
+
+
+__all__ = [
+    'Kinds',
+    'board_views',
+    'BoardSnapshot',
+    'BoardViewModel',
+]
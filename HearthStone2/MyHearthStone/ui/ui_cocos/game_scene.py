@@ -9,6 +9,7 @@ from cocos import scene, draw, director, rect, cocosnode
 from cocos.scenes import transitions
 
 from .animations import *
+from .board_view import BoardViewModel
 from .card_sprite import HandSprite, HeroSprite, MinionSprite, HeroPowerSprite, WeaponSprite
 from .selection_manager import SelectionManager
 from .utils.active import ActiveLayer, ActiveLabel, set_color_action
@@ -102,6 +103,10 @@ class GameBoardLayer(ActiveLayer):
         self._animation_container = cocosnode.CocosNode()
         self.add(self._animation_container)
 
+        # The board view model, only changed sprites and labels are updated (see ``board_view``).
+        self._view_model = BoardViewModel()
+        self._content_scheduled = False
+
     def on_enter(self):
         super().on_enter()
 
@@ -109,6 +114,9 @@ class GameBoardLayer(ActiveLayer):
         if isinstance(director.director.scene, transitions.TransitionScene):
             return
 
+        # Deliver buffered game callbacks once per frame (see ``prepare_start_game``).
+        self.schedule(self._flush_game_callbacks)
+
         # TODO: Play start game animation, etc.
 
         self._replace_dialog(self.ctrl.game.current_player)
@@ -121,6 +129,11 @@ class GameBoardLayer(ActiveLayer):
 
         self.users = [None, None]
 
+        self.unschedule(self._flush_game_callbacks)
+        self.unschedule(self.update_content_after_animations)
+        self._content_scheduled = False
+        self._view_model.reset()
+
         # Clear sprites and reset labels.
         for i in range(2):
             self.get('label_deck_{}'.format(i)).element.text = '牌库：0'
@@ -192,17 +205,21 @@ class GameBoardLayer(ActiveLayer):
     def prepare_start_game(self, game, selected_decks, users, **kwargs):
         """Start game preparations. Called by select deck layer before transitions."""
 
-        def _cb_event_animations(event):
-            run_event_animations(self, event)
+        # [NOTE]: UI callbacks are buffered, the game engine only queues them,
+        # and they are delivered in batches at frame boundaries (see ``_flush_game_callbacks``).
+        def _cb_event_animations(batch):
+            for event, in batch:
+                run_event_animations(self, event)
 
-        def _cb_trigger_animations(trigger, current_event):
-            run_trigger_animations(self, trigger, current_event)
+        def _cb_trigger_animations(batch):
+            for trigger, current_event in batch:
+                run_trigger_animations(self, trigger, current_event)
 
         if C.UI.Cocos.RunAnimations:
-            game.add_callback(_cb_event_animations, when='event')
-            game.add_callback(_cb_trigger_animations, when='trigger')
+            game.add_callback(_cb_event_animations, when='event', types=AnimationEventTypes, buffered='frame')
+            game.add_callback(_cb_trigger_animations, when='trigger', buffered='frame')
 
-        game.add_callback(self._update_content, when='resolve')
+        game.add_callback(self._update_content, when='resolve', buffered='frame')
         game.add_callback(self._log_update_time, when='resolve')
         game.add_callback(self._game_end_dialog, when='game_end')
         game.start_game(selected_decks, mode='standard',
@@ -262,13 +279,14 @@ class GameBoardLayer(ActiveLayer):
         )
         self.get('label_player_{}'.format(i)).element.text = 'Player {}'.format(player.player_id)
 
-    def _update_weapon_sprites(self, i, player):
+    def _update_weapon_sprites(self, i, player, snapshot):
         def _new_w_sprite():
             if player.weapon is None:
                 return
             w_sprite = WeaponSprite(player.weapon, pos(self.WeaponX, self.WeaponY[i]), scale=1.0)
             self.weapon_sprites[player.player_id] = w_sprite
             w_sprite.add_to_layer(self, z=1)
+            snapshot.changed(('weapon', player.weapon), w_sprite)
 
         current_w_spr = self.weapon_sprites[player.player_id]  # type: WeaponSprite
         if current_w_spr is None:
@@ -281,19 +299,20 @@ class GameBoardLayer(ActiveLayer):
                 # Weapon should be replaced with a new one.
                 self.try_remove(current_w_spr)
                 _new_w_sprite()
-            else:
+            elif snapshot.changed(('weapon', player.weapon), current_w_spr):
                 # Same weapon.
                 current_w_spr.update_content(**{
                     'position': pos(self.WeaponX, self.WeaponY[i]),
                     'scale': 1.0})
 
-    def _update_hp_sprites(self, i, player):
+    def _update_hp_sprites(self, i, player, snapshot):
         def _new_hp_sprite():
             if player.hero_power is None:
                 return
             hp_sprite = HeroPowerSprite(player.hero_power, pos(self.HeroPowerX, self.HeroPowerY[i]), scale=1.0)
             self.hero_power_sprites[player.player_id] = hp_sprite
             hp_sprite.add_to_layer(self, z=1)
+            snapshot.changed(('hero_power', player.hero_power), hp_sprite)
 
         current_hp_spr = self.hero_power_sprites[player.player_id]  # type: HeroPowerSprite
         if current_hp_spr is None:
@@ -304,13 +323,13 @@ class GameBoardLayer(ActiveLayer):
                 # Hero power should be replaced with a new one.
                 self.try_remove(current_hp_spr)
                 _new_hp_sprite()
-            else:
+            elif snapshot.changed(('hero_power', player.hero_power), current_hp_spr):
                 # Same hero power.
                 current_hp_spr.update_content(**{
                     'position': pos(self.HeroPowerX, self.HeroPowerY[i]),
                     'scale': 1.0})
 
-    def _update_hero_sprites(self, i, player):
+    def _update_hero_sprites(self, i, player, snapshot):
         # TODO: Support replacing heroes.
         hero_sprite = self.hero_sprites[player.player_id]
         if hero_sprite not in self:
@@ -319,12 +338,13 @@ class GameBoardLayer(ActiveLayer):
                 pos(self.HeroL + (self.RightL - self.HeroL) * 0.5, self.HeroY[i]), scale=0.8)
             self.hero_sprites[player.player_id] = hero_sprite
             hero_sprite.add_to_layer(self)
-        else:
+            snapshot.changed(('hero', player.hero), hero_sprite)
+        elif snapshot.changed(('hero', player.hero), hero_sprite):
             hero_sprite.update_content(**{
                 'position': pos(self.HeroL + (self.RightL - self.HeroL) * 0.5, self.HeroY[i]),
                 'scale': 0.8})
 
-    def _update_hand_sprites(self):
+    def _update_hand_sprites(self, snapshot):
         _hand_sprite_cache = {hand_sprite.entity: hand_sprite
                               for hand_sprite in chain(*self.hand_sprites)}
         for card_sprite_list in self.hand_sprites:
@@ -338,15 +358,17 @@ class GameBoardLayer(ActiveLayer):
                     'sel_mgr_kwargs': {'set_default': i == 0}, 'selected_effect': None, 'unselected_effect': None}
                 if card in _hand_sprite_cache:
                     hand_sprite = _hand_sprite_cache.pop(card)
-                    hand_sprite.update_content(**spr_kw)
+                    if snapshot.changed(('hand', card), hand_sprite):
+                        hand_sprite.update_content(**spr_kw)
                 else:
                     hand_sprite = HandSprite(card, **spr_kw)
                     hand_sprite.add_to_layer(self)
+                    snapshot.changed(('hand', card), hand_sprite)
                 self.hand_sprites[i].append(hand_sprite)
         for card_sprite in _hand_sprite_cache.values():
             self.remove(card_sprite)
 
-    def _update_minion_sprites(self):
+    def _update_minion_sprites(self, snapshot):
         _play_sprite_cache = {play_sprite.entity: play_sprite for play_sprite in chain(*self.play_sprites)}
         for card_sprite_list in self.play_sprites:
             card_sprite_list.clear()
@@ -358,10 +380,12 @@ class GameBoardLayer(ActiveLayer):
                     'scale': 1.0}
                 if card in _play_sprite_cache:
                     play_sprite = _play_sprite_cache.pop(card)
-                    play_sprite.update_content(**spr_kw)
+                    if snapshot.changed(('play', card), play_sprite):
+                        play_sprite.update_content(**spr_kw)
                 else:
                     play_sprite = MinionSprite(card, **spr_kw)
                     play_sprite.add_to_layer(self)
+                    snapshot.changed(('play', card), play_sprite)
                 self.play_sprites[i].append(play_sprite)
         for card_sprite in _play_sprite_cache.values():
             self.remove(card_sprite)
@@ -382,22 +406,39 @@ class GameBoardLayer(ActiveLayer):
         if scheduled:
             if not self._animation_container.are_actions_running():
                 self.unschedule(self.update_content_after_animations)
+                self._content_scheduled = False
             else:
                 return
+        else:
+            # Deliver buffered callbacks first, since animations create sprites of new entities.
+            self.ctrl.game.flush_callbacks()
+
+        # Only update changed sprites and labels (sprites created by animations are always updated).
+        players = self._player_list()
+        snapshot = self._view_model.snapshot(players)
+        for i, player in enumerate(players):
+            if snapshot.label_changed(i):
+                self._update_right_border(i, player)
+            self._update_weapon_sprites(i, player, snapshot)
+            self._update_hp_sprites(i, player, snapshot)
+            self._update_hero_sprites(i, player, snapshot)
+
+        self._update_hand_sprites(snapshot)
+        self._update_minion_sprites(snapshot)
+        self._view_model.commit(snapshot)
+
+    def _flush_game_callbacks(self, dt):
+        game = self.ctrl.game
+        if game is not None:
+            game.flush_callbacks('frame')
 
-        for i, player in enumerate(self._player_list()):
-            self._update_right_border(i, player)
-            self._update_weapon_sprites(i, player)
-            self._update_hp_sprites(i, player)
-            self._update_hero_sprites(i, player)
-
-        self._update_hand_sprites()
-        self._update_minion_sprites()
-
-    def _update_content(self, event_or_trigger, current_event):
+    def _update_content(self, batch):
         """Update the game board content, called by game event engine.
 
         Registered at `SelectDeckLayer.on_start_game`.
+
+        [NOTE]: This is a buffered 'resolve' callback, all resolves of a frame (e.g. a whole AI turn)
+        share one board refresh.
         """
 
         # Refresh selection manager.
@@ -405,11 +446,16 @@ class GameBoardLayer(ActiveLayer):
 
         # Update status border BEFORE all animations.
         for sprite in self.all_entity_sprites():
-            if sprite is not None:
+            if sprite is None:
+                continue
+            status = sprite.entity.can_do_action() if sprite.in_control() else None
+            if self._view_model.status_changed(sprite, status):
                 sprite.update_status_border()
 
         # Schedule the content update after animations.
-        self.schedule(self.update_content_after_animations)
+        if not self._content_scheduled:
+            self._content_scheduled = True
+            self.schedule(self.update_content_after_animations)
 
     def do_animation(self, action, target):
         self._animation_container.do(action, target=target)
@@ -0,0 +1,289 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""A compact binary codec for JSON-like objects.
+
+Supported types: None, bool, int (64 bits), float, str, bytes, list (tuple) and dict.
+Tuples are decoded as lists.
+
+The format is a subset of MessagePack <https://msgpack.org/>, so other programs can decode it
+with any MessagePack library. Small integers (-32 ~ 127) and short containers only cost one byte of header,
+which is the common case of game messages (entity ids, zones, tags, etc).
+"""
+
+import struct
+
+__author__ = 'fyabc'
+
+_S_B = struct.Struct('!B')
+_S_H = struct.Struct('!H')
+_S_I = struct.Struct('!I')
+_S_Q = struct.Struct('!Q')
+_S_b = struct.Struct('!b')
+_S_h = struct.Struct('!h')
+_S_i = struct.Struct('!i')
+_S_q = struct.Struct('!q')
+_S_d = struct.Struct('!d')
+
+
+class CodecError(ValueError):
+    """Error when encoding or decoding."""
+
+
+def _encode_int(v, out):
+    if 0 <= v < 0x80:
+        out.append(v)
+    elif -0x20 <= v < 0:
+        out.append(v & 0xff)
+    elif 0 <= v:
+        if v < 0x100:
+            out.append(0xcc)
+            out.append(v)
+        elif v < 0x10000:
+            out += b'\xcd' + _S_H.pack(v)
+        elif v < 0x100000000:
+            out += b'\xce' + _S_I.pack(v)
+        elif v < 0x10000000000000000:
+            out += b'\xcf' + _S_Q.pack(v)
+        else:
+            raise CodecError('Integer {} out of range'.format(v))
+    else:
+        if v >= -0x80:
+            out += b'\xd0' + _S_b.pack(v)
+        elif v >= -0x8000:
+            out += b'\xd1' + _S_h.pack(v)
+        elif v >= -0x80000000:
+            out += b'\xd2' + _S_i.pack(v)
+        elif v >= -0x8000000000000000:
+            out += b'\xd3' + _S_q.pack(v)
+        else:
+            raise CodecError('Integer {} out of range'.format(v))
+
+
+def _encode_str(v, out):
+    b = v.encode('utf-8')
+    n = len(b)
+    if n < 0x20:
+        out.append(0xa0 | n)
+    elif n < 0x100:
+        out.append(0xd9)
+        out.append(n)
+    elif n < 0x10000:
+        out += b'\xda' + _S_H.pack(n)
+    else:
+        out += b'\xdb' + _S_I.pack(n)
+    out += b
+
+
+def _encode_bytes(v, out):
+    n = len(v)
+    if n < 0x100:
+        out.append(0xc4)
+        out.append(n)
+    elif n < 0x10000:
+        out += b'\xc5' + _S_H.pack(n)
+    else:
+        out += b'\xc6' + _S_I.pack(n)
+    out += v
+
+
+def _encode_list(v, out):
+    n = len(v)
+    if n < 0x10:
+        out.append(0x90 | n)
+    elif n < 0x10000:
+        out += b'\xdc' + _S_H.pack(n)
+    else:
+        out += b'\xdd' + _S_I.pack(n)
+    for item in v:
+        _encoders.get(type(item), _encode_other)(item, out)
+
+
+def _encode_dict(v, out):
+    n = len(v)
+    if n < 0x10:
+        out.append(0x80 | n)
+    elif n < 0x10000:
+        out += b'\xde' + _S_H.pack(n)
+    else:
+        out += b'\xdf' + _S_I.pack(n)
+    for key, value in v.items():
+        _encoders.get(type(key), _encode_other)(key, out)
+        _encoders.get(type(value), _encode_other)(value, out)
+
+
+def _encode_float(v, out):
+    out += b'\xcb' + _S_d.pack(v)
+
+
+def _encode_none(_v, out):
+    out.append(0xc0)
+
+
+def _encode_bool(v, out):
+    out.append(0xc3 if v else 0xc2)
+
+
+def _encode_other(v, out):
+    """Encode subclasses of supported types (e.g. ``TagDict``)."""
+    for t in _EncodeOrder:
+        if isinstance(v, t):
+            return _encoders[t](v, out)
+    raise CodecError('Cannot encode object {!r} of type {}'.format(v, type(v).__name__))
+
+
+_encoders = {
+    type(None): _encode_none,
+    bool: _encode_bool,
+    int: _encode_int,
+    float: _encode_float,
+    str: _encode_str,
+    bytes: _encode_bytes,
+    bytearray: _encode_bytes,
+    list: _encode_list,
+    tuple: _encode_list,
+    dict: _encode_dict,
+}
+_EncodeOrder = (bool, int, float, str, bytes, bytearray, list, tuple, dict)
+
+
+def dump_into(obj, out):
+    """Encode the object and append it into the bytearray ``out``."""
+    _encoders.get(type(obj), _encode_other)(obj, out)
+
+
+def dumps(obj):
+    """Encode the object into bytes."""
+    out = bytearray()
+    _encoders.get(type(obj), _encode_other)(obj, out)
+    return bytes(out)
+
+
+def _decode(data, i):
+    b = data[i]
+    i += 1
+    if b < 0x80:
+        return b, i
+    if b >= 0xe0:
+        return b - 0x100, i
+    if b < 0x90:
+        return _decode_dict(data, i, b & 0x0f)
+    if b < 0xa0:
+        return _decode_list(data, i, b & 0x0f)
+    if b < 0xc0:
+        n = b & 0x1f
+        return str(data[i:i + n], 'utf-8'), i + n
+    if b == 0xc0:
+        return None, i
+    if b == 0xc2:
+        return False, i
+    if b == 0xc3:
+        return True, i
+    if b == 0xcc:
+        return data[i], i + 1
+    if b == 0xcd:
+        return _S_H.unpack_from(data, i)[0], i + 2
+    if b == 0xce:
+        return _S_I.unpack_from(data, i)[0], i + 4
+    if b == 0xcf:
+        return _S_Q.unpack_from(data, i)[0], i + 8
+    if b == 0xd0:
+        return _S_b.unpack_from(data, i)[0], i + 1
+    if b == 0xd1:
+        return _S_h.unpack_from(data, i)[0], i + 2
+    if b == 0xd2:
+        return _S_i.unpack_from(data, i)[0], i + 4
+    if b == 0xd3:
+        return _S_q.unpack_from(data, i)[0], i + 8
+    if b == 0xcb:
+        return _S_d.unpack_from(data, i)[0], i + 8
+    if b == 0xd9:
+        n = data[i]
+        i += 1
+        return str(data[i:i + n], 'utf-8'), i + n
+    if b == 0xda:
+        n = _S_H.unpack_from(data, i)[0]
+        i += 2
+        return str(data[i:i + n], 'utf-8'), i + n
+    if b == 0xdb:
+        n = _S_I.unpack_from(data, i)[0]
+        i += 4
+        return str(data[i:i + n], 'utf-8'), i + n
+    if b == 0xc4:
+        n = data[i]
+        i += 1
+        return bytes(data[i:i + n]), i + n
+    if b == 0xc5:
+        n = _S_H.unpack_from(data, i)[0]
+        i += 2
+        return bytes(data[i:i + n]), i + n
+    if b == 0xc6:
+        n = _S_I.unpack_from(data, i)[0]
+        i += 4
+        return bytes(data[i:i + n]), i + n
+    if b == 0xdc:
+        return _decode_list(data, i + 2, _S_H.unpack_from(data, i)[0])
+    if b == 0xdd:
+        return _decode_list(data, i + 4, _S_I.unpack_from(data, i)[0])
+    if b == 0xde:
+        return _decode_dict(data, i + 2, _S_H.unpack_from(data, i)[0])
+    if b == 0xdf:
+        return _decode_dict(data, i + 4, _S_I.unpack_from(data, i)[0])
+    raise CodecError('Unknown type byte 0x{:02x} at {}'.format(b, i - 1))
+
+
+def _decode_list(data, i, n):
+    result = []
+    append = result.append
+    for _ in range(n):
+        item, i = _decode(data, i)
+        append(item)
+    return result, i
+
+
+def _decode_dict(data, i, n):
+    result = {}
+    for _ in range(n):
+        key, i = _decode(data, i)
+        value, i = _decode(data, i)
+        result[key] = value
+    return result, i
+
+
+def load_from(data, offset=0):
+    """Decode an object from the buffer at the given offset.
+
+    :param data: bytes, bytearray or memoryview.
+    :param offset: Start offset.
+    :return: Tuple of (object, end offset).
+    :raise CodecError: The data is truncated or invalid (e.g. invalid UTF-8 strings or unhashable dict keys).
+    """
+    try:
+        obj, end = _decode(data, offset)
+    except (IndexError, struct.error) as e:
+        raise CodecError('Truncated data: {}'.format(e)) from e
+    except CodecError:
+        raise
+    except (ValueError, TypeError, RecursionError) as e:
+        raise CodecError('Invalid data: {}'.format(e)) from e
+    # [NOTE]: Slices of truncated strings (and bytes) are shorter, but do not raise errors.
+    if end > len(data):
+        raise CodecError('Truncated data: {} bytes expected, got {}'.format(end, len(data)))
+    return obj, end
+
+
+def loads(data):
+    """Decode bytes into object. The data must contain exactly one object."""
+    obj, end = load_from(data, 0)
+    if end != len(data):
+        raise CodecError('Extra data after the object ({} / {} bytes used)'.format(end, len(data)))
+    return obj
+
+
+__all__ = [
+    'CodecError',
+    'dump_into',
+    'dumps',
+    'load_from',
+    'loads',
+]
@@ -3,6 +3,8 @@
 
 """I/O utilities for package data (project built-in or user extension)."""
 
+import copyreg
+import pickle
 import sys
 import os
 from locale import getdefaultlocale
@@ -40,14 +42,20 @@ def _load_module_variables(root_package_path, package_name, ext='.py'):
 
     full_package_name = os.path.join(root_package_path, package_name)
 
+    # [NOTE]: The module is registered in ``sys.modules`` with a unique name, so classes in it can be pickled
+    # (e.g. games sent to AI worker processes, which load the same packages, see ``ai.parallel``).
+    module_name = '_hs_package_{}_{}'.format(os.path.basename(root_package_path), package_name).replace('.', '_')
+
     try:
-        spec = spec_from_file_location(package_name, location=os.path.join(root_package_path, package_name + ext))
+        spec = spec_from_file_location(module_name, location=os.path.join(root_package_path, package_name + ext))
         module = module_from_spec(spec)
+        sys.modules[module_name] = module
         spec.loader.exec_module(module)
         module_vars = vars(module)
 
     except ImportError:
         error('Error when loading package {}'.format(full_package_name))
+        sys.modules.pop(module_name, None)
         module_vars = None
     finally:
         sys.path = _origin_sys_path
@@ -332,6 +340,29 @@ def search_by_name(name):
     return None
 
 
+def _load_entity_class(key, id_):
+    return _get_all_data(key)[id_]
+
+
+def _reduce_entity_class(cls):
+    """Pickle classes of entities by reference.
+
+    Classes that are not module attributes (e.g. enchantments created by ``ext.create_enchantment``)
+    are pickled by their ids in the package data.
+    """
+    module = sys.modules.get(cls.__module__)
+    if module is not None and getattr(module, cls.__qualname__, None) is cls:
+        return cls.__qualname__
+    id_ = cls.data.get('id', None)
+    for key in ('cards', 'heroes', 'hero_powers', 'enchantments'):
+        if _get_all_data(key).get(id_) is cls:
+            return _load_entity_class, (key, id_)
+    raise pickle.PicklingError('Cannot pickle entity class {!r}: not found in packages'.format(cls))
+
+
+copyreg.pickle(SetDataMeta, _reduce_entity_class)
+
+
 def reload_packages(force=False):
     global _AllData
     if force or any(map(lambda e: e is None, _AllData.values())):
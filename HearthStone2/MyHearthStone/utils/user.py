@@ -8,8 +8,9 @@ import uuid
 
 from ..game.deck import Deck
 from ..utils.game import DefaultClassHeroMap
-from .constants import UserListFilename, UserDataPath
+from .constants import C, UserListFilename, UserDataPath
 from .message import info
+from .user_store import get_user_store
 
 __author__ = 'fyabc'
 
@@ -50,7 +51,8 @@ class AppUser(User):
     """The app user class.
 
     This class contain user data, such as decks, cards, packs and dusts.
-    Instances of this class will be dumped as JSON files.
+    Instances of this class will be saved into the user store (see ``utils.user_store``),
+    or dumped as JSON files if ``C.User.Storage`` is "json".
     """
 
     IsAI = False
@@ -67,6 +69,10 @@ class AppUser(User):
         if self.uuid is None:
             self.uuid = str(uuid.uuid1())
 
+        # The user store, and the saved state (see ``_saved_state``) used to save changes only.
+        self._store = None
+        self._saved = None
+
     def __repr__(self):
         return 'User(id={}, name={}, uuid={})'.format(self.user_id, self._nickname, self.uuid)
 
@@ -82,15 +88,47 @@ class AppUser(User):
             'uuid': self.uuid,
         }
 
+    def _saved_state(self):
+        return {
+            'profile': {
+                'nickname': self.nickname,
+                'uuid': self.uuid,
+                'dusts': self.dusts,
+                'class_hero_map': dict(self.class_hero_map),
+            },
+            'cards': {str(k): v for k, v in self.cards.items()},
+            'packs': {str(k): v for k, v in self.packs.items()},
+            'decks': [deck.to_code() if isinstance(deck, Deck) else deck for deck in self.decks],
+        }
+
+    @staticmethod
+    def _default_store():
+        return get_user_store() if C.User.Storage == 'sqlite' else None
+
     @staticmethod
-    def get_user_list():
+    def get_user_list(store=None):
+        """Get the user list: list of [user_id, nickname], the last used user first, or None if no users."""
+        if store is None:
+            store = AppUser._default_store()
+        if store is not None:
+            return store.user_list() or None
         if not os.path.exists(UserListFilename):
             return None
         with open(UserListFilename, 'r') as f:
             return json.load(f)
 
     @classmethod
-    def load_or_create(cls, user_id_or_name):
+    def load_or_create(cls, user_id_or_name, store=None):
+        """Load the user of the id or the name, or create it if not found.
+
+        :param user_id_or_name: The user id (int), the nickname (str), or None (the last used user).
+        :param store: The user store, default to the store of the config (None if the JSON storage is used).
+        """
+        if store is None:
+            store = cls._default_store()
+        if store is not None:
+            return cls._load_or_create_from_store(user_id_or_name, store)
+
         nickname = ''
         while True:
             if isinstance(user_id_or_name, int):
@@ -134,12 +172,52 @@ class AppUser(User):
             info('Create {}'.format(result))
         return result
 
+    @classmethod
+    def _load_or_create_from_store(cls, user_id_or_name, store):
+        nickname = ''
+        if isinstance(user_id_or_name, int):
+            user_id = user_id_or_name
+        elif isinstance(user_id_or_name, str):
+            user_ids = store.find(user_id_or_name)
+            if len(user_ids) >= 2:
+                raise ValueError('there are more than one user that has name {}, '
+                                 'please give user id'.format(user_id_or_name))
+            if user_ids:
+                user_id = user_ids[0]
+            else:
+                nickname = user_id_or_name
+                user_id = store.next_user_id()
+        elif user_id_or_name is None:
+            user_id = store.last_user_id()
+            if user_id is None:
+                user_id = 0
+        else:
+            raise ValueError('argument "user_id_or_name" must be int or str')
+
+        user_data = store.load(user_id)
+        if user_data is not None:
+            result = cls(**user_data)
+            result._saved = result._saved_state()
+            info('Load {}'.format(result))
+        else:
+            result = cls(user_id=user_id, nickname=nickname)
+            info('Create {}'.format(result))
+        result._store = store
+        return result
+
     def dump(self):
         """Dump the user and update the user list.
 
         [NOTE]: This method will update the user list and put the current user as the first element.
+        [NOTE]: With the user store, only changes since the last load or dump are written.
         """
 
+        if self._store is None:
+            self._store = self._default_store()
+        if self._store is not None:
+            self._dump_to_store()
+            return
+
         users = self.get_user_list()
 
         if users is None:
@@ -161,6 +239,28 @@ class AppUser(User):
         with open(user_data_filename, 'w') as f:
             json.dump(self.to_dict(), f, indent=4)
 
+    def _dump_to_store(self):
+        state = self._saved_state()
+        saved = self._saved
+        if saved is None or self.user_id not in self._store:
+            saved = {'profile': None, 'cards': {}, 'packs': {}, 'decks': []}
+
+        def _changes(new, old):
+            changes = {k: v for k, v in new.items() if old.get(k) != v}
+            changes.update((k, 0) for k in old if k not in new)
+            return changes
+
+        decks, old_decks = state['decks'], saved['decks']
+        self._store.save(
+            self.user_id,
+            profile=state['profile'] if state['profile'] != saved['profile'] else None,
+            cards=_changes(state['cards'], saved['cards']),
+            packs=_changes(state['packs'], saved['packs']),
+            decks={i: code for i, code in enumerate(decks) if i >= len(old_decks) or old_decks[i] != code},
+            n_decks=len(decks) if len(decks) < len(old_decks) else None,
+        )
+        self._saved = state
+
 
 class AIUser(User):
     """The AI user class."""
@@ -0,0 +1,244 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""The SQLite storage of app users (see ``utils.user.AppUser``).
+
+Tables::
+
+    users:  user_id (primary key), nickname (indexed), uuid (unique), dusts, class_hero_map (JSON), last_used
+    cards:  (user_id, card_id) -> count
+    packs:  (user_id, pack_id) -> count
+    decks:  (user_id, index) -> deck code
+
+Cards, packs and decks are stored one row per item, so saving a user only writes changed rows
+(see ``UserStore.save``), instead of rewriting the whole user file.
+``last_used`` is a counter increased when saving, the user list is ordered by it (the last used user first).
+
+The database uses the WAL journal mode, so readers (e.g. other server processes) are not blocked by the writer.
+
+Users of the old JSON storage (``users.json`` and ``<user_id>.json`` in the user data directory) are migrated
+by ``migrate_json_users``, which is called when the database of ``get_user_store`` is created.
+"""
+
+import json
+import os
+import sqlite3
+import uuid
+
+from .constants import C, UserDataPath, UserListFilename
+from .game import DefaultClassHeroMap
+from .message import info, warning
+
+__author__ = 'fyabc'
+
+
+class UserStore:
+    """The SQLite user storage.
+
+    :param path: Path of the SQLite file, ``':memory:'`` for an in-memory storage.
+    """
+
+    _Schema = '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            nickname TEXT NOT NULL,
+            uuid TEXT NOT NULL UNIQUE,
+            dusts INTEGER NOT NULL,
+            class_hero_map TEXT NOT NULL,
+            last_used INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS users_nickname ON users (nickname);
+        CREATE INDEX IF NOT EXISTS users_last_used ON users (last_used);
+        CREATE TABLE IF NOT EXISTS cards (
+            user_id INTEGER NOT NULL,
+            card_id TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, card_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS packs (
+            user_id INTEGER NOT NULL,
+            pack_id TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, pack_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS decks (
+            user_id INTEGER NOT NULL,
+            deck_index INTEGER NOT NULL,
+            code TEXT NOT NULL,
+            PRIMARY KEY (user_id, deck_index)
+        ) WITHOUT ROWID;
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self._Schema)
+        self._conn.commit()
+
+    def __repr__(self):
+        return 'UserStore({!r})'.format(self.path)
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def user_list(self):
+        """Get the user list: list of [user_id, nickname], the last used user first."""
+        return [list(row) for row in self._conn.execute(
+            'SELECT user_id, nickname FROM users ORDER BY last_used DESC, user_id')]
+
+    def find(self, nickname):
+        """Get ids of users of the nickname."""
+        return [row[0] for row in self._conn.execute(
+            'SELECT user_id FROM users WHERE nickname=? ORDER BY user_id', (nickname,))]
+
+    def find_uuid(self, uuid_):
+        """Get the id of the user of the uuid, or None if not found."""
+        row = self._conn.execute('SELECT user_id FROM users WHERE uuid=?', (uuid_,)).fetchone()
+        return None if row is None else row[0]
+
+    def last_user_id(self):
+        """Get the id of the last used user, or None if there are not any users."""
+        row = self._conn.execute('SELECT user_id FROM users ORDER BY last_used DESC, user_id LIMIT 1').fetchone()
+        return None if row is None else row[0]
+
+    def next_user_id(self):
+        """Get an unused user id."""
+        return self._conn.execute('SELECT COALESCE(MAX(user_id) + 1, 0) FROM users').fetchone()[0]
+
+    def __contains__(self, user_id):
+        return self._conn.execute('SELECT 1 FROM users WHERE user_id=?', (user_id,)).fetchone() is not None
+
+    def load(self, user_id):
+        """Load the user.
+
+        :return: The user data (same as ``AppUser.to_dict``), or None if not found.
+        :rtype: dict
+        """
+        conn = self._conn
+        row = conn.execute(
+            'SELECT nickname, uuid, dusts, class_hero_map FROM users WHERE user_id=?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        nickname, uuid_, dusts, class_hero_map = row
+        return {
+            'user_id': user_id,
+            'nickname': nickname,
+            'decks': [code for code, in conn.execute(
+                'SELECT code FROM decks WHERE user_id=? ORDER BY deck_index', (user_id,))],
+            'cards': dict(conn.execute('SELECT card_id, count FROM cards WHERE user_id=?', (user_id,))),
+            'packs': dict(conn.execute('SELECT pack_id, count FROM packs WHERE user_id=?', (user_id,))),
+            'dusts': dusts,
+            'class_hero_map': json.loads(class_hero_map),
+            'uuid': uuid_,
+        }
+
+    def save(self, user_id, profile=None, cards=None, packs=None, decks=None, n_decks=None):
+        """Save changes of the user in one transaction, and mark the user as the last used user.
+
+        :param user_id: The user id.
+        :param profile: Dict of 'nickname', 'uuid', 'dusts' and 'class_hero_map', or None if not changed.
+            It must be given when saving a new user.
+        :param cards: Dict of changed cards to counts (count 0 means removed).
+        :param packs: Dict of changed packs to counts (count 0 means removed).
+        :param decks: Dict of changed deck indices to deck codes.
+        :param n_decks: Number of decks, decks after it are removed. None means not changed.
+        """
+        with self._conn as conn:
+            last_used = conn.execute('SELECT COALESCE(MAX(last_used), 0) + 1 FROM users').fetchone()[0]
+            if profile is not None:
+                conn.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)', (
+                    user_id, profile['nickname'], profile['uuid'], profile['dusts'],
+                    json.dumps(profile['class_hero_map']), last_used))
+            else:
+                conn.execute('UPDATE users SET last_used=? WHERE user_id=?', (last_used, user_id))
+
+            for table, column, changes in (('cards', 'card_id', cards), ('packs', 'pack_id', packs)):
+                if not changes:
+                    continue
+                conn.executemany('DELETE FROM {} WHERE user_id=? AND {}=?'.format(table, column), [
+                    (user_id, str(k)) for k, count in changes.items() if not count])
+                conn.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?, ?)'.format(table), [
+                    (user_id, str(k), count) for k, count in changes.items() if count])
+
+            if decks:
+                conn.executemany('INSERT OR REPLACE INTO decks VALUES (?, ?, ?)', [
+                    (user_id, index, code) for index, code in decks.items()])
+            if n_decks is not None:
+                conn.execute('DELETE FROM decks WHERE user_id=? AND deck_index>=?', (user_id, n_decks))
+
+    def insert_user(self, user_data):
+        """Insert a new user of the data (in the format of ``AppUser.to_dict``, missing items use default values)."""
+        user_id = user_data['user_id']
+        decks = user_data.get('decks', [])
+        self.save(user_id, profile={
+            'nickname': user_data.get('nickname', ''),
+            'uuid': user_data.get('uuid') or str(uuid.uuid1()),
+            'dusts': user_data.get('dusts', 0),
+            'class_hero_map': user_data.get('class_hero_map', DefaultClassHeroMap),
+        }, cards=user_data.get('cards'), packs=user_data.get('packs'),
+            decks=dict(enumerate(decks)), n_decks=len(decks))
+
+
+def migrate_json_users(store, user_list_filename=UserListFilename, user_data_path=UserDataPath):
+    """Migrate users of the JSON storage into the store.
+
+    Users already in the store are skipped, so it is safe to call it again. The JSON files are not changed.
+
+    :return: Number of migrated users.
+    :rtype: int
+    """
+    if not os.path.exists(user_list_filename):
+        return 0
+    with open(user_list_filename, 'r') as f:
+        users = json.load(f)
+
+    n_migrated = 0
+    # The first user of the JSON list is the last used user, so insert it last.
+    for user_id, nickname in reversed(users):
+        if user_id in store:
+            continue
+        user_data_filename = os.path.join(user_data_path, '{}.json'.format(user_id))
+        user_data = {'user_id': user_id, 'nickname': nickname}
+        if os.path.exists(user_data_filename):
+            try:
+                with open(user_data_filename, 'r') as f:
+                    user_data.update(json.load(f))
+            except ValueError as e:
+                warning('Cannot migrate the user data file {!r}: {}'.format(user_data_filename, e))
+        user_data['user_id'] = user_id
+        store.insert_user(user_data)
+        n_migrated += 1
+    return n_migrated
+
+
+# Opened stores: path -> store.
+_Stores = {}
+
+
+def get_user_store(path=None):
+    """Get the user store of the path (default to ``C.User.Database`` in the user data directory).
+
+    When the database is created, users of the JSON storage are migrated into it.
+    """
+    if path is None:
+        path = os.path.join(UserDataPath, C.User.Database)
+    store = _Stores.get(path)
+    if store is None:
+        store = _Stores[path] = UserStore(path)
+        if len(store) == 0:
+            n_migrated = migrate_json_users(store)
+            if n_migrated:
+                info('Migrate {} users from JSON files into {}'.format(n_migrated, path))
+    return store
+
+
+__all__ = [
+    'UserStore',
+    'migrate_json_users',
+    'get_user_store',
+]
@@ -29,6 +29,7 @@ setup(
     extras_require={
         'pyqt-frontend': ['PyQt5>=5.6.0'],
         'kivy-frontend': ['kivy>=1.8.0'],
+        'learning': ['numpy>=1.13'],
     },
 
     scripts=[],
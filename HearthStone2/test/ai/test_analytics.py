@@ -0,0 +1,106 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    import numpy as np
+    from MyHearthStone.ai import analytics
+except ImportError:
+    np = analytics = None
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.core import Game
+
+from game.utils import ExampleDecks, Seed
+
+__author__ = 'fyabc'
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestAnalytics(unittest.TestCase):
+    def setUp(self):
+        self.recorder = analytics.EventRecorder()
+        self.damages = []
+        rng = random.Random(Seed)
+        for seed in range(2):
+            game = Game()
+            game.start_game(ExampleDecks, mode='standard', seed=seed)
+            self.assertEqual(self.recorder.attach(game), seed)
+            game.add_callback(self._on_event, 'event')
+            game.run_player_action(pa.ReplaceStartCard(game, 0, []))
+            game.run_player_action(pa.ReplaceStartCard(game, 1, []))
+            for _ in range(40):
+                if not game.running:
+                    break
+                game.run_player_action(rng.choice(game.get_legal_actions()))
+            if game.running:
+                game.end_game()
+        self.table = self.recorder.to_table()
+
+    def _on_event(self, event):
+        if type(event).__name__ == 'Damage':
+            self.damages.append((event.owner, event.value))
+
+    def testRecord(self):
+        table = self.table
+        self.assertEqual(len(table), len(self.recorder))
+        self.assertGreater(len(table), 0)
+        self.assertEqual(set(table['game'].tolist()), {0, 1})
+        for name in analytics.Columns:
+            self.assertEqual(table[name].dtype, np.int32)
+            self.assertEqual(len(table[name]), len(table))
+        self.assertTrue(all(name.startswith(analytics.TriggerPrefix) or name[0].isupper() for name in table.types))
+
+    def testStats(self):
+        table = self.table
+        self.assertGreater(len(self.damages), 0)
+        stats = analytics.type_stats(table)
+        self.assertEqual(stats.count.sum(), len(table))
+        self.assertEqual(stats.count[table.type_index('Damage')], len(self.damages))
+
+        damage = analytics.card_stats(table, 'Damage')
+        self.assertEqual(damage.total.sum(), sum(value for _, value in self.damages))
+        for key, total in analytics.top(damage, n=3, by='total'):
+            index = table.cards.index(key)
+            self.assertAlmostEqual(damage.mean[index], total / damage.count[index])
+            self.assertLessEqual(damage.games[index], 2)
+
+        with self.assertRaises(ValueError):
+            analytics.card_stats(table, by='turn')
+
+    def testSaveAndConcatenate(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'events.npz')
+            self.table.save(filename)
+            loaded = analytics.EventTable.load(filename)
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(loaded.types, self.table.types)
+        for name in analytics.Columns:
+            np.testing.assert_array_equal(loaded[name], self.table[name])
+
+        other = analytics.EventTable({name: column[::-1].copy() for name, column in self.table.columns.items()},
+                                     self.table.types[::-1], self.table.cards[::-1])
+        other.columns['type'] = len(other.types) - 1 - other.columns['type']
+        for name in ('owner', 'target'):
+            column = other.columns[name]
+            other.columns[name] = np.where(column >= 0, len(other.cards) - 1 - column, -1).astype(np.int32)
+
+        merged = analytics.EventTable.concatenate([self.table, other])
+        self.assertEqual(len(merged), 2 * len(self.table))
+        self.assertEqual(merged.types, self.table.types)
+        stats, merged_stats = analytics.card_stats(self.table, 'Damage'), analytics.card_stats(merged, 'Damage')
+        np.testing.assert_array_equal(merged_stats.total, 2 * stats.total)
+
+
+if __name__ == '__main__':
+    unittest.main()
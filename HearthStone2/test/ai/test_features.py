@@ -0,0 +1,89 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    import numpy as np
+    from MyHearthStone.ai import features
+except ImportError:
+    np = features = None
+from MyHearthStone.ai.mcts import clone_game
+from MyHearthStone.game import player_action as pa
+
+from game.utils import example_game
+
+__author__ = 'fyabc'
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestFeatures(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        for _ in range(6):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+        self.player_id = self.game.current_player
+        self.featuriser = features.Featuriser()
+
+    def tearDown(self):
+        self.game.end_game()
+
+    def _feature(self, out, slot, name, index=0):
+        return out.entities[index, slot, features.EntityFeatures.index(name)]
+
+    def testEncode(self):
+        game, player_id = self.game, self.player_id
+        out = self.featuriser.encode(game, player_id)
+        self.assertEqual(out.entities.shape, (1, features.NumSlots, features.NumEntityFeatures))
+        self.assertEqual(out.entities.dtype, np.float32)
+
+        player, opponent = game.get_player(player_id), game.get_player(1 - player_id)
+        hand_slot = sum(n for owner, zone, n in features.Slots[:4])
+        self.assertEqual(self._feature(out, 0, 'health'), player.hero.health)
+        for i, card in enumerate(player.hand):
+            self.assertEqual(self._feature(out, hand_slot + i, 'cost'), card.cost)
+            self.assertEqual(out.card_ids[0, hand_slot + i], self.featuriser.vocabulary.index(card))
+            self.assertGreater(out.card_ids[0, hand_slot + i], features.CardVocabulary.Hidden)
+        self.assertEqual(out.card_ids[0, hand_slot + len(player.hand)], features.CardVocabulary.Pad)
+
+        # Hand of the opponent is hidden.
+        opponent_hand_slot = hand_slot + features.NumSlots // 2
+        self.assertEqual(list(out.card_ids[0, opponent_hand_slot:opponent_hand_slot + len(opponent.hand)]),
+                         [features.CardVocabulary.Hidden] * len(opponent.hand))
+        self.assertEqual(out.entities[0, opponent_hand_slot, 1:].sum(), 0)
+
+        globals_ = dict(zip(features.GlobalFeatures, out.globals[0]))
+        self.assertEqual(globals_['me.max_mana'], player.max_mana)
+        self.assertEqual(globals_['opponent.hand_size'], len(opponent.hand))
+        self.assertEqual(globals_['my_turn'], 1)
+
+    def testBatch(self):
+        game, player_id = self.game, self.player_id
+        after = clone_game(game)
+        minion = next(c for c in after.get_player(player_id).hand if c.id == '11')
+        after.run_player_action(pa.PlayMinion(after, minion, 0, None, player_id))
+
+        out = features.Featuriser.new_buffers(4)
+        entities = out.entities
+        self.featuriser.encode_batch([game, after, game], [player_id] * 3, out=out)
+        # Written into the preallocated buffers.
+        self.assertIs(out.entities, entities)
+        np.testing.assert_array_equal(out.entities[0], out.entities[2])
+        play_slot = sum(n for owner, zone, n in features.Slots[:3])
+        self.assertEqual(self._feature(out, play_slot, 'present', index=0), 0)
+        self.assertEqual(self._feature(out, play_slot, 'attack', index=1), minion.attack)
+
+        # Stale values of reused buffers are cleared.
+        self.featuriser.encode_batch([after, game], [player_id] * 2, out=out)
+        self.featuriser.encode_batch([game], [player_id], out=out)
+        self.assertEqual(self._feature(out, play_slot, 'present', index=0), 0)
+        self.assertRaises(ValueError, self.featuriser.encode_batch, [game] * 5, None, out)
+
+
+if __name__ == '__main__':
+    unittest.main()
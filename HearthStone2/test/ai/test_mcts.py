@@ -0,0 +1,88 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from MyHearthStone.ai import mcts
+from MyHearthStone.ai.standard import get_agent_by_name
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.legal_actions import action_key
+from MyHearthStone.utils.game import Zone
+
+from game.utils import example_game
+
+__author__ = 'fyabc'
+
+
+class TestMCTS(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        # Turn 3 of the first player, 3 mana.
+        for _ in range(4):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+        self.player_id = self.game.current_player
+
+    def tearDown(self):
+        self.game.end_game()
+
+    def _agent(self, **kwargs):
+        kwargs.setdefault('time_budget', 60)
+        kwargs.setdefault('seed', 1)
+        return get_agent_by_name('MCTSAgent')(self.game, self.player_id, **kwargs)
+
+    def testClone(self):
+        keys = [action_key(action) for action in self.game.get_legal_actions()]
+
+        # All actions can run in clones, keys are same in clones.
+        for key in keys:
+            clone = mcts.clone_game(self.game)
+            clone_actions = {action_key(action): action for action in clone.get_legal_actions()}
+            clone.run_player_action(clone_actions[key])
+        self.assertEqual(self.game.callbacks, mcts.clone_game(self.game).callbacks)
+
+    def testDeterminise(self):
+        agent = self._agent()
+        opponent_id = 1 - self.player_id
+        game = agent._determinise(mcts.clone_game(self.game))
+        for zone in (Zone.Hand, Zone.Deck):
+            self.assertEqual(len(game.get_zone(zone, opponent_id)), len(self.game.get_zone(zone, opponent_id)))
+            self.assertTrue(all(card.zone == zone for card in game.get_zone(zone, opponent_id)))
+        self.assertEqual(
+            sorted(c.eid for c in game.get_zone(Zone.Hand, opponent_id) + game.get_zone(Zone.Deck, opponent_id)),
+            sorted(c.eid for c in self.game.get_zone(Zone.Hand, opponent_id) +
+                   self.game.get_zone(Zone.Deck, opponent_id)))
+        # The own hand is not changed.
+        self.assertEqual([c.eid for c in game.get_zone(Zone.Hand, self.player_id)],
+                         [c.eid for c in self.game.get_zone(Zone.Hand, self.player_id)])
+
+    def testBudget(self):
+        agent = self._agent(max_iterations=30)
+        action = agent.get_player_action()
+        self.assertIn(action_key(action), [action_key(a) for a in self.game.get_legal_actions()])
+        self.assertEqual(agent.stats['iterations'], 30)
+        self.assertGreater(agent.stats['iterations_per_second'], 0)
+
+        agent = self._agent(time_budget=0.2, max_iterations=10 ** 6)
+        agent.get_player_action()
+        self.assertLess(agent.stats['time'], 1.0)
+
+    def testTreeReuse(self):
+        agent = self._agent(max_iterations=40)
+        action = agent.get_player_action()
+        while isinstance(action, pa.TurnEnd):
+            # Search more if the agent ends the turn directly.
+            agent = self._agent(max_iterations=40, seed=agent.random.random())
+            action = agent.get_player_action()
+        self.game.run_player_action(action)
+        visits = agent.stats['visits']
+        agent.get_player_action()
+        self.assertEqual(agent.stats['reused_visits'], visits)
+
+
+if __name__ == '__main__':
+    unittest.main()
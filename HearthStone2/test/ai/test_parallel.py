@@ -0,0 +1,75 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import pickle
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from MyHearthStone.ai import parallel
+from MyHearthStone.ai.mcts import dump_game, load_game
+from MyHearthStone.ai.standard import get_agent_by_name
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.legal_actions import action_key
+from MyHearthStone.game.state_sync import state_hash
+from MyHearthStone.utils.package_io import all_enchantments
+
+from game.utils import example_game
+
+__author__ = 'fyabc'
+
+
+class TestParallel(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        parallel.close_search_pools()
+
+    def setUp(self):
+        self.game = example_game()
+        for _ in range(4):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+
+    def tearDown(self):
+        self.game.end_game()
+
+    def _agent(self, **kwargs):
+        return get_agent_by_name('ParallelMCTSAgent')(
+            self.game, self.game.current_player, n_workers=2, time_budget=60, seed=1, **kwargs)
+
+    def _assertLegal(self, action):
+        self.assertIn(action_key(action), [action_key(a) for a in self.game.get_legal_actions()])
+
+    def testDumpGame(self):
+        callbacks = self.game.callbacks
+        game = load_game(dump_game(self.game))
+        self.assertEqual(state_hash(game), state_hash(self.game))
+        self.assertEqual(game.event_history, [])
+        self.assertIs(self.game.callbacks, callbacks)
+        self.assertTrue(self.game.event_history)
+
+        # Enchantments created by ``ext.create_enchantment`` are not module attributes, they are pickled by ids.
+        for enchantment in all_enchantments().values():
+            self.assertIs(pickle.loads(pickle.dumps(enchantment)), enchantment)
+
+    def testRoot(self):
+        agent = self._agent(mode='root', max_iterations=20)
+        self._assertLegal(agent.get_player_action())
+        # Each worker runs 10 iterations.
+        self.assertEqual(agent.stats['iterations'], 20)
+
+        # The pool is shared and reused.
+        agent2 = self._agent(mode='root', max_iterations=4)
+        self.assertIs(agent2.pool, agent.pool)
+        self._assertLegal(agent2.get_player_action())
+
+    def testLeaf(self):
+        agent = self._agent(mode='leaf', max_iterations=20, batch_size=8)
+        self._assertLegal(agent.get_player_action())
+        self.assertEqual(agent.stats['iterations'], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+try:
+    import numpy as np
+    from MyHearthStone.ai import selfplay, features
+except ImportError:
+    np = selfplay = features = None
+
+__author__ = 'fyabc'
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestSelfPlay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testShardWriter(self):
+        writer = selfplay.ShardWriter(self.directory, 'w', 4)
+        arrays = {name: np.zeros((10,) + shape, dtype=dtype) for name, dtype, shape in selfplay.Fields}
+        arrays['meta'][:, 0] = np.arange(10)
+        writer.write(arrays, 3)
+        writer.write(arrays, 7)
+        writer.close()
+        self.assertEqual([shard['n_rows'] for shard in writer.shards], [4, 4, 2])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'w.index.json')))
+        meta = np.load(os.path.join(self.directory, 'w-1.meta.npy'), mmap_mode='r')
+        self.assertEqual(list(meta[:, 0]), [1, 2, 3, 4])
+
+    def testPipeline(self):
+        manifest = selfplay.run_selfplay(self.directory, 3, n_workers=2, shard_size=64, seed=1)
+        statistics = manifest['statistics']
+        self.assertEqual(statistics['games'] + statistics['failed_games'], 3)
+        self.assertGreater(statistics['positions'], 0)
+
+        dataset = selfplay.SelfPlayDataset(self.directory)
+        self.assertEqual(len(dataset), statistics['positions'])
+        shard = dataset.load_shard(0)
+        self.assertIsInstance(shard['entities'], np.memmap)
+        self.assertEqual(shard['entities'].shape[1:], (features.NumSlots, features.NumEntityFeatures))
+
+        n_rows, games = 0, set()
+        for batch in dataset.iter_batches(50, fields=['actions', 'outcomes', 'meta']):
+            self.assertLessEqual(len(batch['meta']), 50)
+            n_rows += len(batch['meta'])
+            games.update(batch['meta'][:, 0])
+            # Action types are valid, outcomes are win (1), loss (-1) or draw (0).
+            self.assertTrue(np.all(batch['actions'][:, 0] >= 0))
+            self.assertTrue(set(batch['outcomes']) <= {-1.0, 0.0, 1.0})
+        self.assertEqual(n_rows, len(dataset))
+        self.assertEqual(len(games), statistics['games'])
+
+        shuffled = list(dataset.iter_batches(50, fields=['meta'], shuffle=True, seed=1))
+        self.assertEqual(sum(len(batch['meta']) for batch in shuffled), len(dataset))
+
+
+if __name__ == '__main__':
+    unittest.main()
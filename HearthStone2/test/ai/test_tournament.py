@@ -0,0 +1,80 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.ai.tournament import Entrant, GameKey, GameResult, ResultCache, TournamentResult, \
+    practice_entrants, run_tournament
+from MyHearthStone.utils.package_io import reload_packages
+
+__author__ = 'fyabc'
+
+
+class TestTournament(unittest.TestCase):
+    def setUp(self):
+        reload_packages()
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, 'results.sqlite')
+        self.entrants = practice_entrants()[:3]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testCache(self):
+        cache = ResultCache(':memory:')
+        key = GameKey('a', 'b', 'BaseAgent', 'BaseAgent', 0, '1.0.0')
+        self.assertIsNone(cache.get(key))
+        cache.put_many([(key, GameResult(1.0, 12), 0.5)])
+        self.assertEqual(cache.get(key), GameResult(1.0, 12))
+        self.assertIsNone(cache.get(key._replace(version='1.0.1')))
+        self.assertEqual(len(cache), 1)
+        cache.close()
+
+    def testRoundRobin(self):
+        result = run_tournament(self.entrants, seeds=1, n_workers=2, cache=self.cache_path)
+        statistics = result.statistics
+        self.assertEqual(statistics['played'] + statistics['failed'], 6)
+        self.assertEqual(statistics['cached'], 0)
+        self.assertEqual(len(result.games), statistics['played'])
+        rates = result.win_rates()
+        for i in range(3):
+            self.assertIsNone(rates[i][i])
+
+        # Only new matchups (and failed games) are played again.
+        result = run_tournament(practice_entrants()[:4], seeds=1, n_workers=2, cache=self.cache_path)
+        self.assertEqual(result.statistics['cached'], statistics['played'])
+        self.assertEqual(result.statistics['played'] + result.statistics['failed'], 6 + statistics['failed'])
+
+    def testSwiss(self):
+        result = run_tournament(self.entrants, mode='swiss', n_rounds=2, seeds=1, n_workers=2, cache=None)
+        # Odd number of entrants: one bye in each round.
+        self.assertEqual(sum(result.byes), 2)
+        self.assertAlmostEqual(sum(result.scores()), len(result.games) + 2)
+
+    def testElo(self):
+        entrants = [Entrant(str(i), '', 'BaseAgent') for i in range(3)]
+        key = GameKey('', '', 'BaseAgent', 'BaseAgent', 0, '')
+        # 0 beats 1 and 1 beats 2 in most games.
+        games = [(0, 1, key, GameResult(1.0, 10))] * 3 + [(1, 0, key, GameResult(1.0, 10))] + \
+                [(1, 2, key, GameResult(1.0, 10))] * 3 + [(2, 1, key, GameResult(1.0, 10))]
+        result = TournamentResult(entrants, games)
+        ratings = result.elo()
+        self.assertGreater(ratings[0], ratings[1])
+        self.assertGreater(ratings[1], ratings[2])
+        self.assertEqual(result.win_rates()[0][1], 0.75)
+        self.assertIsNone(result.win_rates()[0][2])
+        self.assertEqual([entrant.name for entrant, *_ in result.standings()], ['0', '1', '2'])
+
+        # Ratings do not depend on the order of games.
+        self.assertEqual([round(r, 6) for r in TournamentResult(entrants, games[::-1]).elo()],
+                         [round(r, 6) for r in ratings])
+
+
+if __name__ == '__main__':
+    unittest.main()
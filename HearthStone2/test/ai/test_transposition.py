@@ -0,0 +1,80 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from MyHearthStone.ai.standard import get_agent_by_name
+from MyHearthStone.ai.transposition import TranspositionTable
+from MyHearthStone.game import player_action as pa
+
+from game.utils import example_game
+
+__author__ = 'fyabc'
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def testGetPut(self):
+        table = TranspositionTable(8)
+        table.put(3, 'a')
+        table.put(3, 'b')
+        self.assertEqual(table.get(3), 'b')
+        self.assertIsNone(table.get(7))
+        self.assertIn(3, table)
+        self.assertEqual(len(table), 1)
+        self.assertEqual((table.hits, table.misses), (1, 1))
+
+    def testReplacement(self):
+        # One bucket, weights are values.
+        table = TranspositionTable(2, weight=lambda value: value)
+        table.put(1, 10)
+        table.put(2, 1)
+        table.put(3, 5)
+        # The heaviest entry is kept, the always-replace slot accepts the newest one.
+        self.assertEqual(table.get(1), 10)
+        self.assertIsNone(table.get(2))
+        self.assertEqual(table.get(3), 5)
+        self.assertEqual(table.replaced, 1)
+
+        # Entries of old generations are replaced first.
+        table.new_generation()
+        table.put(4, 0)
+        self.assertIsNone(table.get(3))
+        self.assertEqual(table.get(4), 0)
+        self.assertEqual(table.get(1), 10)
+
+        table.clear()
+        self.assertEqual(len(table), 0)
+        self.assertRaises(ValueError, TranspositionTable, 1)
+
+
+class TestMCTSTranspositions(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        # Turn 4 of the first player, 4 mana: many minion orders reach the same state.
+        for _ in range(6):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+
+    def tearDown(self):
+        self.game.end_game()
+
+    def testShareNodes(self):
+        agent = get_agent_by_name('MCTSAgent')(
+            self.game, self.game.current_player, time_budget=60, max_iterations=60, seed=1)
+        action = agent.get_player_action()
+        self.assertIn(action, self.game.get_legal_actions())
+        self.assertGreater(agent.stats['transposition_hits'], 0)
+
+        agent = get_agent_by_name('MCTSAgent')(
+            self.game, self.game.current_player, time_budget=60, max_iterations=60, seed=1, transpositions=0)
+        agent.get_player_action()
+        self.assertIsNone(agent.transpositions)
+        self.assertEqual(agent.stats['transposition_hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
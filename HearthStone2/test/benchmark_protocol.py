@@ -0,0 +1,126 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Throughput benchmark of wire protocols: JSON lines (version 1) vs binary frames (version 2).
+
+Messages are real game messages: the snapshot of an example game, delta batches of some turns, and text messages.
+Each batch contains distinct messages (at most ``--batch``), so the compression ratio is not overestimated.
+[NOTE]: Receivers read from unbuffered socket files, as the LAN clients and servers do.
+"""
+
+import argparse
+import json
+import socket
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.state_sync import StateSync, filter_batch
+from MyHearthStone.network.protocol import JsonLineProtocol, FramedProtocol
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game'))
+from utils import example_game
+
+__author__ = 'fyabc'
+
+
+def _sample_messages():
+    game = example_game()
+    sync = StateSync(game)
+    sync.pop_batches()
+
+    snapshot = ('game_status', {'snapshot': sync.snapshot(0)})
+    deltas = []
+    for _ in range(10):
+        game.run_player_action(pa.TurnEnd(game))
+        deltas.append(('game_delta', {'batches': [filter_batch(b, 0) for b in sync.pop_batches()]}))
+    texts = [('text', {'text': 'Player {} has joined into the game.'.format(i)}) for i in range(16)]
+    return {'snapshot': [snapshot], 'delta': deltas, 'text': texts}
+
+
+def _bench_codec(protocol, messages, n, batch):
+    """Encode and decode n messages, return (messages per second, bytes per message)."""
+    messages = messages[:batch]
+    batch = len(messages)
+    n_batches = max(1, n // batch)
+    receiver = protocol.__class__()
+    total_bytes = 0
+
+    start = time.perf_counter()
+    for _ in range(n_batches):
+        if isinstance(protocol, FramedProtocol):
+            data = protocol.pack([protocol.encode_message(t, obj) for t, obj in messages])
+            total_bytes += len(data)
+            result = receiver.feed(data)
+        else:
+            # The original JSON path: one line per message, decode line by line.
+            data = [protocol.encode_message(t, obj) for t, obj in messages]
+            total_bytes += sum(len(line) for line in data)
+            result = [json.loads(line.decode()) for line in data]
+        assert len(result) == batch
+    elapsed = time.perf_counter() - start
+    return n_batches * batch / elapsed, total_bytes / (n_batches * batch)
+
+
+def _bench_socket(protocol, messages, n, batch):
+    """Send n messages through a socket pair, return messages per second."""
+    messages = messages[:batch]
+    batch = len(messages)
+    n_batches = max(1, n // batch)
+    a, b = socket.socketpair()
+
+    def _send():
+        wfile = a.makefile('wb', 0)
+        for _ in range(n_batches):
+            if isinstance(protocol, FramedProtocol):
+                wfile.write(protocol.pack([protocol.encode_message(t, obj) for t, obj in messages]))
+            else:
+                # The original JSON path: one write per message.
+                for t, obj in messages:
+                    protocol.send(wfile, t, **obj)
+        a.shutdown(socket.SHUT_WR)
+
+    start = time.perf_counter()
+    t = threading.Thread(target=_send)
+    t.start()
+    receiver = protocol.__class__()
+    rfile = b.makefile('rb', 0)
+    received = 0
+    while True:
+        msg = receiver.recv(rfile)
+        if msg is None:
+            break
+        received += 1
+    t.join()
+    elapsed = time.perf_counter() - start
+    a.close()
+    b.close()
+    assert received == n_batches * batch
+    return received / elapsed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark of wire protocols.')
+    parser.add_argument('-n', type=int, default=20000, help='Number of messages, default is %(default)r')
+    parser.add_argument('-b', '--batch', type=int, default=16, help='Messages per batch, default is %(default)r')
+    args = parser.parse_args(args)
+
+    samples = _sample_messages()
+    protocols = [('json', JsonLineProtocol()), ('framed', FramedProtocol(compress_threshold=sys.maxsize)),
+                 ('framed+zlib', FramedProtocol(compress_threshold=0))]
+
+    print('{:10}{:14}{:>14}{:>12}{:>14}'.format('message', 'protocol', 'codec msg/s', 'bytes/msg', 'socket msg/s'))
+    for name, messages in samples.items():
+        n = args.n if name != 'snapshot' else args.n // 10
+        for p_name, protocol in protocols:
+            codec_speed, size = _bench_codec(protocol, messages, n, args.batch)
+            socket_speed = _bench_socket(protocol, messages, n, args.batch)
+            print('{:10}{:14}{:>14.0f}{:>12.1f}{:>14.0f}'.format(name, p_name, codec_speed, size, socket_speed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Scaling benchmark of the parallel search (see ``ai.parallel``).
+
+Search a mid-game state (practice decks, some turns played by ``BaseAgent``) with the serial ``MCTSAgent``
+and the ``ParallelMCTSAgent`` (root and leaf modes) of different numbers of workers, in the same time budget.
+Each agent searches several moves, so pools are reused across moves as in real games.
+
+Speedup is the iterations per second relative to the serial agent (1.0 means no gain).
+[NOTE]: The speedup cannot exceed the number of physical cores of the machine.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.ai import parallel
+from MyHearthStone.ai.mcts import MCTSAgent
+from MyHearthStone.ai.rule_based.basic import BaseAgent
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.core import Game
+from MyHearthStone.game.default_data import PracticeDecks
+from MyHearthStone.utils.game import Klass
+
+__author__ = 'fyabc'
+
+
+def _sample_game(n_turns, seed=1):
+    game = Game()
+    game.start_game([PracticeDecks['Normal'][Klass.Str2Idx[k]] for k in ('Mage', 'Hunter')], seed=seed)
+    for player_id in range(2):
+        game.run_player_action(pa.ReplaceStartCard(game, player_id, []))
+    while game.running and game.n_turns < n_turns:
+        game.run_player_action(BaseAgent(game, game.current_player).get_player_action())
+    return game
+
+
+def _bench(agent, n_moves):
+    """Search n moves of the same state, return iterations per second."""
+    iterations, elapsed = 0, 0.0
+    for _ in range(n_moves):
+        # Do not reuse trees, so each move searches the same state from scratch.
+        agent._root = None
+        agent.get_player_action()
+        iterations += agent.stats['iterations']
+        elapsed += agent.stats['time']
+    return iterations / elapsed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the parallel search.')
+    parser.add_argument('-w', '--workers', default=None,
+                        help='Comma separated numbers of workers, default is powers of 2 up to the number of CPUs')
+    parser.add_argument('-t', '--time', type=float, default=2.0, help='Time budget of each move, default is %(default)r')
+    parser.add_argument('-m', '--moves', type=int, default=3, help='Moves of each agent, default is %(default)r')
+    parser.add_argument('--turns', type=int, default=8, help='Turns played before searching, default is %(default)r')
+    parser.add_argument('-b', '--batch', type=int, default=None, help='Leaf batch size, default is 4 * workers')
+    args = parser.parse_args(args)
+
+    if args.workers is None:
+        n_cpus = os.cpu_count() or 1
+        workers = [1 << i for i in range(n_cpus.bit_length()) if 1 << i <= n_cpus]
+    else:
+        workers = [int(w) for w in args.workers.split(',')]
+
+    game = _sample_game(args.turns)
+    player_id = game.current_player
+    kwargs = {'time_budget': args.time, 'max_iterations': 10 ** 9, 'seed': 1}
+
+    serial = _bench(MCTSAgent(game, player_id, **kwargs), args.moves)
+    print('CPUs: {}, time budget: {}s, moves: {}'.format(os.cpu_count(), args.time, args.moves))
+    print('{:8}{:>8}{:>14}{:>10}'.format('mode', 'workers', 'iter/s', 'speedup'))
+    print('{:8}{:>8}{:>14.1f}{:>10.2f}'.format('serial', 1, serial, 1.0))
+    try:
+        for mode in parallel.ParallelMCTSAgent.Modes:
+            for n_workers in workers:
+                batch_size = 4 * n_workers if args.batch is None else args.batch
+                agent = parallel.ParallelMCTSAgent(
+                    game, player_id, mode=mode, n_workers=n_workers, batch_size=batch_size, **kwargs)
+                speed = _bench(agent, args.moves)
+                print('{:8}{:>8}{:>14.1f}{:>10.2f}'.format(mode, n_workers, speed, speed / serial))
+    finally:
+        parallel.close_search_pools()
+
+
+if __name__ == '__main__':
+    main()
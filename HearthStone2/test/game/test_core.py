@@ -1,6 +1,9 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
+import gc
+import pickle
+import random
 import unittest
 import sys
 import os
@@ -10,13 +13,28 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'
 from MyHearthStone.game.player import Player
 from MyHearthStone.game import player_action as pa
 from MyHearthStone.game.events import standard as std_e
-from MyHearthStone.utils.game import Zone
+from MyHearthStone.utils.game import Zone, AuraType
+from MyHearthStone.utils.package_io import all_enchantments
 
 from .utils import ExampleDecks, ExpectedEntities, example_game
 
 __author__ = 'fyabc'
 
 
+class _RecordedAura:
+    """An aura that records the order of updates."""
+
+    def __init__(self, oop, log):
+        self.oop = oop
+        self.log = log
+
+    def prepare_update(self):
+        self.log.append(self.oop)
+
+    def process_entity(self, entity, **kwargs):
+        pass
+
+
 class TestCore(unittest.TestCase):
     test_decks = [None, None]
     expected_entities = ExpectedEntities
@@ -91,6 +109,88 @@ class TestCore(unittest.TestCase):
         self.game.run_player_action(pa.Concede(self.game))
         self._assertZoneAttr()
 
+    def testEntityByEid(self):
+        """Test getting entities by eids."""
+        game = self.game
+        for entity in game.get_all_entities():
+            self.assertIs(game.get_entity_by_eid(entity.eid), entity)
+        self.assertIsNone(game.get_entity_by_eid(game._eid_counter + 1))
+
+        # Entities in the graveyard are not found.
+        game.run_player_action(pa.TurnEnd(game))
+        coin = next(card for card in game.get_zone(Zone.Hand, game.current_player) if card.id == '43')
+        game.run_player_action(pa.PlaySpell(game, coin, None, game.current_player))
+        self.assertIn(coin, game.get_zone(Zone.Graveyard, game.current_player))
+        self.assertIsNone(game.get_entity_by_eid(coin.eid))
+
+        # The dict is kept in pickled games.
+        game2 = pickle.loads(pickle.dumps(game))
+        for entity in game2.get_all_entities():
+            self.assertIs(game2.get_entity_by_eid(entity.eid), entity)
+
+    def testEntitiesReleased(self):
+        """Entities that left the game (and are not referenced) are removed from the entity dict."""
+        game = self.game
+        hero = game.get_hero(game.current_player)
+        n_entities = len(game.entities)
+
+        enchantment = all_enchantments()['20001'](game, hero)
+        eid = enchantment.eid
+        self.assertIs(game.entities[eid], enchantment)
+        enchantment.detach(remove_from_target=True)
+        del enchantment
+        # Entities are in reference cycles (e.g. with their tag dicts), they are released by the garbage collector.
+        gc.collect()
+        self.assertNotIn(eid, game.entities)
+        self.assertEqual(len(game.entities), n_entities)
+
+        # Pickled games do not carry them either.
+        game2 = pickle.loads(pickle.dumps(game))
+        self.assertEqual(set(game2.entities), set(game.entities))
+
+    def testGlobalRandom(self):
+        """Games without seeds use the ``random`` module, so they are reproduced by ``random.seed``."""
+        game = example_game(self.test_decks)
+        try:
+            decks = [[card.id for card in self.game.get_zone(Zone.Deck, i)] for i in (0, 1)]
+            self.assertEqual([[card.id for card in game.get_zone(Zone.Deck, i)] for i in (0, 1)], decks)
+            self.assertIsNone(game.seed)
+            state = game.random.getstate()
+            game.random.random()
+            game.random.setstate(state)
+            self.assertEqual(random.getstate(), state)
+        finally:
+            game.end_game()
+
+    def testBufferedCallbacks(self):
+        """Test callbacks with event types and buffered delivery."""
+        game = self.game
+        events, draws, frame_batches, idle_batches = [], [], [], []
+        game.add_callback(events.append, 'event')
+        game.add_callback(draws.append, 'event', types=[std_e.DrawCard])
+        game.add_callback(frame_batches.append, 'event', buffered='frame')
+        game.add_callback(idle_batches.append, 'resolve', types=(std_e.DrawCard,), buffered='idle')
+
+        game.run_player_action(pa.TurnEnd(game))
+        self.assertTrue(all(isinstance(e, std_e.DrawCard) for e in draws))
+        self.assertIn(std_e.DrawCard, {type(e) for e in events})
+        self.assertEqual(draws, [e for e in events if isinstance(e, std_e.DrawCard)])
+
+        # Frame callbacks are delivered by ``flush_callbacks``, idle callbacks are delivered after the action.
+        self.assertEqual(frame_batches, [])
+        self.assertEqual(idle_batches, [[(e, None) for e in draws]])
+        game.flush_callbacks('idle')
+        self.assertEqual(frame_batches, [])
+        game.flush_callbacks()
+        self.assertEqual(frame_batches, [[(e,) for e in events]])
+        game.flush_callbacks()
+        self.assertEqual(len(frame_batches), 1)
+
+        with self.assertRaises(ValueError):
+            game.add_callback(events.append, 'event', buffered='never')
+        with self.assertRaises(ValueError):
+            game.add_callback(events.append, 'game_start', types=[std_e.DrawCard])
+
     def _assertManas(self, player, m, u, t, o, on, d):
         self.assertEqual(player.max_mana, m, 'Max mana not equal')
         self.assertEqual(player.used_mana, u, 'Used mana not equal')
@@ -111,3 +211,16 @@ class TestCore(unittest.TestCase):
         self._assertManas(player, 4, 4, 3, 0, 0, 3)
         player.add_mana(6, 'T')
         self._assertManas(player, 4, 4, 9, 0, 0, 9)
+
+    def testAuraOrder(self):
+        """Auras are updated in order of play, not in the order of set iteration (different between games)."""
+        game = self.game
+        log = []
+        auras = [_RecordedAura(oop, log) for oop in (7, 3, 11, 1, 5, 9, 2, 13, 4, 8, 6, 12, 10)]
+        game.auras[AuraType.Other].update(auras)
+        try:
+            game._aura_update_other()
+        finally:
+            game.auras[AuraType.Other].difference_update(auras)
+        self.assertEqual(log, sorted(log))
+        self.assertEqual(len(log), len(auras))
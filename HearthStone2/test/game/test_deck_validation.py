@@ -0,0 +1,99 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import io
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game.deck_validation import DeckValidator
+from MyHearthStone.utils.constants import C
+from MyHearthStone.utils.game import Klass
+from MyHearthStone.utils.package_io import all_cards
+
+__author__ = 'fyabc'
+
+
+def _find_cards(**conditions):
+    return sorted(card_id for card_id, card_cls in all_cards().items()
+                  if all(fn(card_cls.data[k]) for k, fn in conditions.items()))
+
+
+class TestDeckValidation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.neutral = _find_cards(klass=lambda k: k == Klass.Neutral, derivative=lambda d: not d,
+                                  rarity=lambda r: 0 <= r <= 3, package=lambda p: p not in C.Game.WildPackages)
+        cls.mage = Klass.Str2Idx['Mage']
+        cls.valid_deck = Deck(cls.mage, [card_id for card_id in cls.neutral[:C.Game.DeckSize // 2] for _ in range(2)],
+                              name='Valid')
+
+    def _errors(self, deck, **kwargs):
+        code, errors = DeckValidator(**kwargs).validate(deck.to_code())
+        return code, sorted(kind for kind, _ in errors)
+
+    def testValid(self):
+        code, errors = self._errors(self.valid_deck)
+        self.assertEqual(errors, [])
+        deck = Deck.parse_code(code)
+        self.assertEqual(sorted(deck.card_id_list), sorted(self.valid_deck.card_id_list))
+        self.assertEqual(deck.name, 'Valid')
+
+        shuffled = self.valid_deck.copy()
+        shuffled.card_id_list.reverse()
+        self.assertEqual(self._errors(shuffled)[0], code)
+
+    def testInvalid(self):
+        validator = DeckValidator()
+        self.assertEqual(validator.validate('not a deck code!')[1][0][0], 'decode')
+
+        deck = self.valid_deck.copy()
+        deck.card_id_list[0] = 'no such card'
+        self.assertEqual(self._errors(deck), (None, ['unknown_card']))
+
+        deck = self.valid_deck.copy()
+        deck.card_id_list[-1] = deck.card_id_list[0]
+        self.assertEqual(self._errors(deck), (None, ['copies']))
+        deck.mode = 'arena'
+        self.assertEqual(self._errors(deck)[1], [])
+
+        deck = self.valid_deck.copy()
+        deck.card_id_list.pop()
+        self.assertEqual(self._errors(deck), (None, ['size']))
+
+        deck = self.valid_deck.copy()
+        deck.klass = Klass.Neutral
+        self.assertEqual(self._errors(deck), (None, ['klass']))
+
+        self.assertEqual(self._errors(self.valid_deck, mode='wild'), (None, ['mode']))
+
+        warlock_cards = _find_cards(klass=lambda k: k == Klass.Str2Idx['Warlock'], derivative=lambda d: not d)
+        derivatives = _find_cards(derivative=lambda d: d)
+        wild_cards = _find_cards(klass=lambda k: k in (Klass.Neutral, self.mage), derivative=lambda d: not d,
+                                 package=lambda p: p in C.Game.WildPackages)
+        for cards, kind in ((warlock_cards, 'class_card'), (derivatives, 'derivative'), (wild_cards, 'wild_card')):
+            if not cards:
+                continue
+            deck = self.valid_deck.copy()
+            deck.card_id_list[0] = cards[0]
+            self.assertIn(kind, self._errors(deck)[1])
+
+    def testValidateLines(self):
+        invalid_deck = self.valid_deck.copy()
+        invalid_deck.card_id_list.pop()
+        lines = io.StringIO('\n'.join([
+            '# Comment', self.valid_deck.to_code(), '', invalid_deck.to_code(), self.valid_deck.to_code(),
+        ]))
+        batches = list(DeckValidator().validate_lines(lines, batch_size=2))
+        self.assertEqual(len(batches), 3)
+        reports = [report for batch in batches for report in batch]
+        self.assertEqual([report.line for report in reports], [2, 4, 5])
+        self.assertEqual([report.code is None for report in reports], [False, True, False])
+        self.assertEqual(reports[1].errors, [('size', C.Game.DeckSize - 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.state_sync import state_hash
+
+from .utils import example_game
+
+__author__ = 'fyabc'
+
+
+def _signature(game):
+    """State hash, plus engine states that are not in the state hash."""
+    return (
+        state_hash(game),
+        game.zobrist_hash(),
+        game.current_oop,
+        len(game.event_history),
+        game.random.getstate(),
+        sorted((key[0].__name__, key[1], len(triggers)) for key, triggers in game.triggers.items()),
+        sorted(len(auras) for auras in game.auras.values()),
+        [(entity.eid, entity.oop, len(entity.triggers), len(entity.enchantments), len(entity.aura_enchantments))
+         for entity in game.get_all_entities()],
+        [[entity.eid for entity in player.graveyard] for player in game.players],
+    )
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        self.game.zobrist.debug = True
+        # Turn 4 of the first player, 4 mana.
+        for _ in range(6):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+
+    def tearDown(self):
+        if self.game.running:
+            self.game.end_game()
+
+    def _play_random(self, n_actions, seed):
+        rng = random.Random(seed)
+        actions = []
+        for _ in range(n_actions):
+            if not self.game.running:
+                break
+            action = rng.choice(self.game.get_legal_actions())
+            actions.append(action)
+            self.game.run_player_action(action)
+        return actions
+
+    def testRollback(self):
+        game = self.game
+        journal = game.begin_journal()
+        mark = journal.mark()
+        before = _signature(game)
+
+        for seed in range(5):
+            self._play_random(30, seed)
+            after = _signature(game)
+            self.assertNotEqual(after, before)
+
+            journal.rollback(mark)
+            game.zobrist.check()
+            self.assertEqual(_signature(game), before)
+            self.assertEqual(len(journal), 0)
+
+            # Same actions from the restored state produce the same state.
+            self._play_random(30, seed)
+            self.assertEqual(_signature(game), after)
+            journal.rollback(mark)
+
+        game.end_journal()
+        self.assertIsNone(game.journal)
+
+    def testNestedMarks(self):
+        game = self.game
+        journal = game.begin_journal()
+        outer = journal.mark()
+        before = _signature(game)
+        self._play_random(3, seed=1)
+        inner = journal.mark()
+        middle = _signature(game)
+        self._play_random(3, seed=2)
+
+        journal.rollback(inner)
+        self.assertEqual(_signature(game), middle)
+        journal.rollback(outer)
+        self.assertEqual(_signature(game), before)
+        self.assertRaises(ValueError, journal.rollback, inner)
+
+        # Released marks keep changes.
+        self._play_random(3, seed=3)
+        after = _signature(game)
+        journal.release(outer)
+        self.assertEqual(_signature(game), after)
+        self.assertEqual(len(journal), 0)
+
+    def testCost(self):
+        # Records are proportional to changes: ending a turn records much less than the number of tags.
+        game = self.game
+        journal = game.begin_journal()
+        mark = journal.mark()
+        game.run_player_action(pa.TurnEnd(game))
+        n_tags = sum(len(entity.data.maps[0]) for entity in game.get_all_entities())
+        self.assertLess(len(journal), n_tags // 4)
+        journal.rollback(mark)
+
+
+if __name__ == '__main__':
+    unittest.main()
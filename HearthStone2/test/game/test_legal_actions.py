@@ -0,0 +1,139 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import copy
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.core import Game
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game.state_sync import state_hash
+from MyHearthStone.game.legal_actions import legal_actions, action_key, action_source
+from MyHearthStone.utils.game import Zone, Klass
+
+from .utils import example_game
+
+__author__ = 'fyabc'
+
+
+class TestLegalActions(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        # Turn 4 of the first player, 4 mana.
+        for _ in range(6):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+
+    def tearDown(self):
+        if self.game.running:
+            self.game.end_game()
+
+    def _keys(self, actions):
+        return [action_key(action) for action in actions]
+
+    def testEnumerate(self):
+        game = self.game
+        player = game.get_player(game.current_player)
+        actions = game.get_legal_actions()
+        self.assertIsInstance(actions[-1], pa.TurnEnd)
+        self.assertEqual(len(set(self._keys(actions))), len(actions))
+
+        for action in actions:
+            source = action_source(action)
+            if source is None:
+                continue
+            self.assertEqual(source.player_id, game.current_player)
+            self.assertTrue(source.can_do_action())
+            if isinstance(action, pa.PlayMinion):
+                self.assertIn(action.loc, range(len(player.play) + 1))
+            if action.target is not None:
+                self.assertTrue(source.check_target(action.target))
+
+        # All playable cards in hand are enumerated, targeted cards with every valid target.
+        playable = [card for card in player.hand if card.can_do_action()]
+        self.assertEqual(playable, [card for card in player.hand
+                                    if any(action_source(action) is card for action in actions)])
+        for card in playable:
+            if card.have_target:
+                targets = [action.target for action in actions if action_source(action) is card]
+                self.assertEqual(len(targets), len(set(targets)))
+                self.assertTrue(all(target.zone in (Zone.Play, Zone.Hero) for target in targets))
+
+    def testPositionsAndAttacks(self):
+        game = self.game
+        player_id = game.current_player
+        minions = [action for action in game.get_legal_actions() if isinstance(action, pa.PlayMinion)]
+        game.run_player_action(minions[0])
+        n_play = len(game.get_zone(Zone.Play, player_id))
+        self.assertEqual(n_play, 1)
+
+        for action in game.get_legal_actions():
+            if isinstance(action, pa.PlayMinion):
+                self.assertIn(action.loc, range(n_play + 1))
+        minion_positions = {}
+        for action in game.get_legal_actions():
+            if isinstance(action, pa.PlayMinion) and action.target is None:
+                minion_positions.setdefault(action.minion, set()).add(action.loc)
+        for positions in minion_positions.values():
+            self.assertEqual(positions, {0, 1})
+
+        # The minion is sleeping, no attacks.
+        self.assertFalse(any(isinstance(action, pa.ToAttack) for action in game.get_legal_actions()))
+        game.run_player_action(pa.TurnEnd(game))
+        game.run_player_action(pa.TurnEnd(game))
+        attacks = [action for action in game.get_legal_actions() if isinstance(action, pa.ToAttack)]
+        self.assertTrue(attacks)
+        self.assertIn(game.get_hero(1 - player_id), [action.defender for action in attacks])
+
+    def testCache(self):
+        game = self.game
+        actions = game.get_legal_actions()
+        self.assertIs(game.get_legal_actions(), actions)
+        self.assertEqual(self._keys(actions), self._keys(legal_actions(game)))
+
+        # The cache is cleared by resolved events.
+        play = next(action for action in actions if isinstance(action, pa.Play))
+        game.run_player_action(play)
+        new_actions = game.get_legal_actions()
+        self.assertIsNot(new_actions, actions)
+        self.assertNotIn(action_key(play), self._keys(new_actions))
+        self.assertEqual(self._keys(new_actions), self._keys(legal_actions(game)))
+
+        # The cache is not copied.
+        game2 = copy.deepcopy(game)
+        self.assertIsNone(game2._legal_actions)
+        self.assertEqual(self._keys(game2.get_legal_actions()), self._keys(new_actions))
+
+        game.run_player_action(pa.Concede(game))
+        self.assertEqual(game.get_legal_actions(), [])
+
+    def testChoices(self):
+        # Decks of "Tracking" (select one of the top 3 cards of the deck).
+        game = Game()
+        game.start_game([Deck(klass=Klass.Str2Idx['Hunter'], card_id_list=['20006'] * 16)] * 2, seed=1)
+        for player_id in range(2):
+            game.run_player_action(pa.ReplaceStartCard(game, player_id, []))
+        player = game.get_player(game.current_player)
+
+        actions = [action for action in game.get_legal_actions() if isinstance(action, pa.PlaySpell)]
+        self.assertEqual(len(actions), 3 * len(player.hand))
+        self.assertEqual({action.po_data['choice.1'] for action in actions}, set(player.deck[:3]))
+
+        # Choices are serialized as entity ids.
+        game2 = copy.deepcopy(game)
+        d = actions[0].to_dict()
+        action2 = pa.PlayerAction.from_dict(game2, d)
+        self.assertEqual(d['po_data']['choice.1'], {'$eid': actions[0].po_data['choice.1'].eid})
+        self.assertIs(action2.po_data['choice.1'], game2.get_entity_by_eid(actions[0].po_data['choice.1'].eid))
+        game.run_player_action(actions[0])
+        game2.run_player_action(action2)
+        self.assertEqual(state_hash(game), state_hash(game2))
+        game.end_game()
+        game2.end_game()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.legal_actions import action_source
+from MyHearthStone.game.player_operation import PlayerOps, PlayerOpTree
+from MyHearthStone.game.events.play import pure_summon_events
+from MyHearthStone.game.state_sync import state_hash
+from MyHearthStone.utils.game import Zone
+
+from .utils import example_game
+
+__author__ = 'fyabc'
+
+
+class TestPlayerOperation(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+
+    def tearDown(self):
+        self.game.end_game()
+
+    def testIterTree(self):
+        """Iterate over operations of all nodes."""
+        tree = PlayerOpTree.chain([PlayerOps.SelectMinionPosition, PlayerOps.SelectTarget, PlayerOps.Run])
+        self.assertEqual(list(tree), [PlayerOps.SelectMinionPosition, PlayerOps.SelectTarget, PlayerOps.Run])
+
+        tree = PlayerOpTree(PlayerOps.SelectChoice, {
+            0: PlayerOpTree.chain([PlayerOps.Run]),
+            1: PlayerOpTree.chain([PlayerOps.SelectTarget, PlayerOps.Run]),
+        })
+        self.assertEqual(list(tree), [PlayerOps.SelectChoice, PlayerOps.Run, PlayerOps.SelectTarget, PlayerOps.Run])
+
+    def testConditionalTarget(self):
+        """Querying conditional targeted po trees must not change the entity."""
+        game = self.game
+        player_id = game.current_player
+        # 破碎残阳祭司: targets a friendly minion if there is one.
+        card = game.create_card('20', player_id=player_id)
+        card.zone = Zone.Hand
+        game.get_zone(Zone.Hand, player_id).append(card)
+        self.assertFalse(card.have_target)
+
+        game.resolve_events(pure_summon_events(game, '20', player_id, 'last'))
+        minion = game.get_zone(Zone.Play, player_id)[-1]
+        data, h = dict(card.data), state_hash(game)
+        self.assertTrue(card.have_target)
+        self.assertEqual(dict(card.data), data)
+        self.assertEqual(state_hash(game), h)
+
+        # The target is not required any more after the minion is removed.
+        game.get_zone(Zone.Play, player_id).remove(minion)
+        self.assertFalse(card.have_target)
+
+    def testConditionalTargetInPlay(self):
+        """Conditional targeted minions in play attack as other minions."""
+        game = self.game
+        player_id = game.current_player
+        # 驯兽师 (Houndmaster) targets a friendly beast (米莎) when played.
+        game.resolve_events(pure_summon_events(game, '20010', player_id, 'last'))
+        game.resolve_events(pure_summon_events(game, '20001', player_id, 'last'))
+        houndmaster = game.get_zone(Zone.Play, player_id)[-1]
+        self.assertEqual(houndmaster.id, '20001')
+        game.run_player_action(pa.TurnEnd(game))
+        game.run_player_action(pa.TurnEnd(game))
+        self.assertEqual(game.current_player, player_id)
+
+        self.assertFalse(houndmaster.have_target)
+        self.assertNotIn(PlayerOps.SelectMinionPosition, list(houndmaster.player_operation_tree()))
+        self.assertIn(PlayerOps.SelectDefender, list(houndmaster.player_operation_tree()))
+        actions = [a for a in game.get_legal_actions() if action_source(a) is houndmaster]
+        self.assertTrue(actions)
+        self.assertTrue(all(isinstance(a, pa.ToAttack) for a in actions))
+
+        # The card in hand still requires the target.
+        card = game.create_card('20001', player_id=player_id)
+        card.zone = Zone.Hand
+        game.get_zone(Zone.Hand, player_id).append(card)
+        self.assertTrue(card.have_target)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import pickle
+import random
+import unittest
+import zlib
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.core import Game
+from MyHearthStone.game.replay import Magic, Replay, ReplayError, ReplayRecorder
+from MyHearthStone.game.state_sync import state_hash
+from MyHearthStone.utils import codec
+
+from .utils import ExampleDecks, Seed
+
+__author__ = 'fyabc'
+
+_Exploited = []
+
+
+def _exploit():
+    _Exploited.append(True)
+    return None
+
+
+class _Exploit:
+    def __reduce__(self):
+        return _exploit, ()
+
+
+def _record_game(n_actions=80, checkpoint_interval=2):
+    game = Game()
+    game.start_game(ExampleDecks, mode='standard', seed=Seed)
+    recorder = ReplayRecorder(game, ExampleDecks, checkpoint_interval=checkpoint_interval)
+    game.run_player_action(pa.ReplaceStartCard(game, 0, [0]))
+    game.run_player_action(pa.ReplaceStartCard(game, 1, []))
+
+    rng = random.Random(Seed)
+    hashes = {}
+    for _ in range(n_actions):
+        if not game.running:
+            break
+        hashes.setdefault(game.n_turns, state_hash(game))
+        game.run_player_action(rng.choice(game.get_legal_actions()))
+    return game, recorder, hashes
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.game, self.recorder, self.turn_hashes = _record_game()
+        self.replay = Replay(self.recorder.to_bytes())
+
+    def tearDown(self):
+        if self.game.running:
+            self.game.end_game()
+
+    def testRoundTrip(self):
+        replay = self.replay
+        self.assertEqual(len(replay), self.recorder.n_actions)
+        self.assertEqual(replay.seed, Seed)
+        self.assertGreater(len(replay.checkpoints), 0)
+
+        game = replay.verify()
+        self.assertEqual(state_hash(game), state_hash(self.game))
+        self.assertEqual(game.n_turns, self.game.n_turns)
+
+    def testSeek(self):
+        replay = self.replay
+        for turn in (1, 2, 5, self.game.n_turns):
+            if turn not in self.turn_hashes:
+                continue
+            game, index = replay.seek(turn)
+            no_checkpoint_game, _ = replay.seek(turn, use_checkpoints=False)
+            self.assertEqual(game.n_turns, turn)
+            self.assertEqual(state_hash(game), self.turn_hashes[turn])
+            self.assertEqual(state_hash(no_checkpoint_game), self.turn_hashes[turn])
+            self.assertEqual(replay.actions[index][0], turn)
+
+    def testMismatch(self):
+        data = bytearray(Magic)
+        codec.dump_into(self.replay.header, data)
+        for i, (turn, action, h) in enumerate(self.replay.actions):
+            if i == len(self.replay.actions) // 2:
+                h ^= 1
+            codec.dump_into([0, turn, action, h], data)
+        with self.assertRaises(ReplayError):
+            Replay(bytes(data)).verify()
+
+    def testInvalid(self):
+        with self.assertRaises(ReplayError):
+            Replay(b'NOPE')
+        with self.assertRaises(ReplayError):
+            Replay(self.recorder.to_bytes()[:-3])
+        with self.assertRaises(ValueError):
+            ReplayRecorder(self.game, ExampleDecks)
+
+        # Invalid strings and bad records.
+        for obj in ['\u6e38\u620f', [], [3]]:
+            data = bytearray(self.recorder.to_bytes())
+            codec.dump_into(obj, data)
+            if isinstance(obj, str):
+                data[-3:] = b'\xff\xfe\xfd'
+            with self.assertRaises(ReplayError):
+                Replay(bytes(data))
+
+    def testMaliciousCheckpoint(self):
+        n_actions, turn, full_hash, _ = self.replay.checkpoints[0]
+        for payload in [_Exploit(), ['not a game']]:
+            data = bytearray(Magic)
+            codec.dump_into(self.replay.header, data)
+            for i, (t, action, h) in enumerate(self.replay.actions):
+                if i == n_actions:
+                    codec.dump_into([1, n_actions, turn, full_hash, zlib.compress(pickle.dumps(payload))], data)
+                codec.dump_into([0, t, action, h], data)
+            replay = Replay(bytes(data))
+
+            # Seeking falls back to the start of the game, verifying fails.
+            game = replay.game_at(n_actions)
+            self.assertEqual(state_hash(game), full_hash)
+            with self.assertRaises(ReplayError):
+                replay.verify()
+        self.assertEqual(_Exploited, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.core import Game
+from MyHearthStone.game.save import SaveError, save_game, restore_game
+from MyHearthStone.game.state_sync import state_hash
+
+from .utils import ExampleDecks, Seed
+
+__author__ = 'fyabc'
+
+
+def _entities(game):
+    for player in game.players:
+        yield player
+        yield from player.get_all_entities()
+        yield from player.graveyard
+
+
+class TestSave(unittest.TestCase):
+    def setUp(self):
+        self.game = Game()
+        self.game.start_game(ExampleDecks, mode='standard', seed=Seed)
+        self.game.run_player_action(pa.ReplaceStartCard(self.game, 0, [0]))
+        self.game.run_player_action(pa.ReplaceStartCard(self.game, 1, []))
+
+        self.rng = random.Random(Seed)
+        for _ in range(30):
+            if not self.game.running:
+                break
+            self.game.run_player_action(self.rng.choice(self.game.get_legal_actions()))
+
+    def tearDown(self):
+        if self.game.running:
+            self.game.end_game()
+
+    def testRoundTrip(self):
+        game = self.game
+        restored = restore_game(save_game(game))
+
+        self.assertIsNot(restored, game)
+        self.assertEqual(state_hash(restored), state_hash(game))
+        self.assertEqual(restored.zobrist_hash(), game.zobrist_hash())
+        restored.zobrist.check()
+        self.assertEqual(set(vars(restored)), set(vars(game)))
+        for entity, restored_entity in zip(_entities(game), _entities(restored)):
+            self.assertIsNot(restored_entity, entity)
+            self.assertIs(type(restored_entity), type(entity))
+            self.assertIs(restored_entity.game, restored)
+            self.assertEqual(set(vars(restored_entity)), set(vars(entity)))
+            self.assertEqual(dict(restored_entity.data), dict(entity.data))
+        for entity in restored.get_all_entities():
+            self.assertIs(restored.get_entity_by_eid(entity.eid), entity)
+
+    def testContinue(self):
+        game = self.game
+        restored = restore_game(save_game(game))
+        for _ in range(40):
+            if not game.running:
+                break
+            actions, restored_actions = game.get_legal_actions(), restored.get_legal_actions()
+            self.assertEqual([a.to_dict() for a in actions], [a.to_dict() for a in restored_actions])
+            i = self.rng.randrange(len(actions))
+            game.run_player_action(actions[i])
+            restored.run_player_action(restored_actions[i])
+            self.assertEqual(restored.zobrist_hash(), game.zobrist_hash())
+        self.assertEqual(state_hash(restored), state_hash(game))
+        self.assertEqual(restored.running, game.running)
+
+    def testInvalid(self):
+        data = save_game(self.game)
+        with self.assertRaises(SaveError):
+            restore_game(b'NOPE' + data[4:])
+        with self.assertRaises(SaveError):
+            restore_game(data[:-3])
+
+        self.game.players[0].hero.data['unsupported'] = lambda: None
+        with self.assertRaises(SaveError):
+            save_game(self.game)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import copy
+import json
+import random
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game.core import Game
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.state_sync import StateSync, MirrorGame, SyncError, DeltaTypes, filter_batch
+from MyHearthStone.utils.game import Zone
+
+from .utils import ExampleDecks, Seed
+
+__author__ = 'fyabc'
+
+
+def _mirror_state(mirror):
+    """Get comparable state of the mirror, only contains entities in zones."""
+    entities = {}
+    for zones in mirror.zones:
+        for eids in zones.values():
+            for eid in eids:
+                if eid is not None:
+                    e = mirror.entities[eid]
+                    entities[eid] = (e.player_id, e.zone, e.id, e.tags, e.enchantments)
+    return [mirror.version, mirror.n_turns, mirror.current_player, mirror.state, mirror.mana, mirror.zones, entities]
+
+
+class TestStateSync(unittest.TestCase):
+    def setUp(self):
+        random.seed(Seed)
+        self.game = Game()
+        self.sync = StateSync(self.game)
+        self.game.start_game(ExampleDecks, mode='standard')
+        self.game.run_player_action(pa.ReplaceStartCard(self.game, 0, []))
+        self.game.run_player_action(pa.ReplaceStartCard(self.game, 1, []))
+        self.sync.pop_batches()
+
+        self.mirrors = [MirrorGame() for _ in range(3)]
+        for viewer, mirror in zip((0, 1, None), self.mirrors):
+            mirror.apply_batch(self.sync.snapshot(viewer))
+
+    def tearDown(self):
+        self.game.end_game()
+
+    def _run(self, player_action):
+        self.game.run_player_action(player_action)
+        batches = self.sync.pop_batches()
+        for viewer, mirror in zip((0, 1, None), self.mirrors):
+            for batch in batches:
+                # Batches must be able to be sent as JSON.
+                mirror.apply_batch(json.loads(json.dumps(filter_batch(batch, viewer))))
+        return batches
+
+    def _play_some_turns(self):
+        for _ in range(6):
+            self._run(pa.TurnEnd(self.game))
+        player = self.game.get_player(self.game.current_player)
+        spell = player.get_zone(Zone.Hand)[1]
+        self._run(pa.PlaySpell(self.game, spell, self.game.get_hero(1 - self.game.current_player)))
+        self._run(pa.UseHeroPower(self.game, self.game.get_hero(1 - self.game.current_player),
+                                  self.game.current_player))
+        self._run(pa.TurnEnd(self.game))
+
+    def testStreamEqualsSnapshot(self):
+        self._play_some_turns()
+        for viewer, mirror in zip((0, 1, None), self.mirrors):
+            fresh = MirrorGame()
+            fresh.apply_batch(json.loads(json.dumps(self.sync.snapshot(viewer))))
+            self.assertEqual(_mirror_state(fresh), _mirror_state(mirror))
+
+    def testMirrorMatchesGame(self):
+        self._play_some_turns()
+        mirror = self.mirrors[2]
+        self.assertEqual(mirror.current_player, self.game.current_player)
+        for player_id in range(2):
+            for zone in (Zone.Deck, Zone.Hand, Zone.Play, Zone.Graveyard, Zone.Hero):
+                self.assertListEqual(
+                    [e.id for e in mirror.get_entities(zone, player_id)],
+                    [e.id for e in self.game.get_zone(zone, player_id)])
+            hero = self.game.get_hero(player_id)
+            self.assertEqual(mirror.entities[hero.eid].tags.get('damage', 0), hero.damage)
+
+    def testHiddenInformation(self):
+        self._play_some_turns()
+        for viewer in (0, 1):
+            mirror = self.mirrors[viewer]
+            for player_id in range(2):
+                self.assertTrue(all(eid is None for eid in mirror.get_zone(Zone.Deck, player_id)))
+                self.assertEqual(len(mirror.get_zone(Zone.Deck, player_id)),
+                                 len(self.game.get_zone(Zone.Deck, player_id)))
+            opponent_hand = mirror.get_entities(Zone.Hand, 1 - viewer)
+            self.assertTrue(all(e.id is None and not e.tags for e in opponent_hand))
+            own_hand = mirror.get_entities(Zone.Hand, viewer)
+            self.assertTrue(all(e.id is not None for e in own_hand))
+
+    def testDeltaSize(self):
+        """Deltas of a single turn end only contain changed things."""
+        self._play_some_turns()
+        batches = self._run(pa.TurnEnd(self.game))
+        n_entities = sum(1 for delta in self.sync.snapshot()[1] if delta[0] == DeltaTypes.Entity)
+        n_delta_entities = sum(1 for _, deltas in batches for delta in deltas if delta[0] == DeltaTypes.Entity)
+        self.assertLess(n_delta_entities, n_entities // 4)
+
+    def testVersionGap(self):
+        self.game.run_player_action(pa.TurnEnd(self.game))
+        batches = self.sync.pop_batches()
+        self.assertGreater(len(batches), 1)
+        mirror = self.mirrors[2]
+        with self.assertRaises(SyncError):
+            mirror.apply_batch(batches[1])
+        self.assertTrue(mirror.apply_batch(batches[0]))
+        self.assertFalse(mirror.apply_batch(batches[0]))
+
+    def testCopyGame(self):
+        game2 = copy.deepcopy(self.game)
+        for e1, e2 in zip(self.game.get_all_entities(), game2.get_all_entities()):
+            self.assertEqual(e1.eid, e2.eid)
+            self.assertIs(e2.data.maps[0].entity, e2)
+
+
+if __name__ == '__main__':
+    unittest.main()
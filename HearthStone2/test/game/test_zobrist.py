@@ -0,0 +1,124 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import pickle
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.ai.mcts import clone_game
+from MyHearthStone.ai.rule_based.basic import BaseAgent
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.state_sync import state_hash
+from MyHearthStone.game.zobrist import observer_hash
+from MyHearthStone.utils.game import Zone
+from MyHearthStone.utils.package_io import all_enchantments
+
+from .utils import example_game
+
+__author__ = 'fyabc'
+
+
+class TestZobrist(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        self.game.zobrist.debug = True
+        # Turn 4 of the first player, 4 mana.
+        for _ in range(6):
+            self.game.run_player_action(pa.TurnEnd(self.game))
+        self.player_id = self.game.current_player
+
+    def tearDown(self):
+        if self.game.running:
+            self.game.end_game()
+
+    def _play_minions(self, game, card_ids, loc=None):
+        player = game.get_player(self.player_id)
+        for card_id in card_ids:
+            card = next(c for c in player.hand if c.id == card_id)
+            game.run_player_action(pa.PlayMinion(
+                game, card, len(player.play) if loc is None else loc, None, self.player_id))
+        return game
+
+    def _board(self, game):
+        return [c.id for c in game.get_player(self.player_id).play]
+
+    def testTransposition(self):
+        game_a = self._play_minions(clone_game(self.game), ['11', '6'])
+        game_b = self._play_minions(clone_game(self.game), ['6', '11'], loc=0)
+
+        # Minions are played in different orders into the same board, the hashes are same.
+        self.assertEqual(self._board(game_a), self._board(game_b))
+        self.assertEqual(game_a.zobrist_hash(), game_b.zobrist_hash())
+        self.assertNotEqual(game_a.zobrist_hash(), self.game.zobrist_hash())
+
+        # Boards are in different orders, the hashes are different.
+        game_c = self._play_minions(clone_game(self.game), ['6', '11'])
+        self.assertNotEqual(self._board(game_a), self._board(game_c))
+        self.assertNotEqual(state_hash(game_a), state_hash(game_c))
+        self.assertNotEqual(game_a.zobrist_hash(), game_c.zobrist_hash())
+
+        game_d = self._play_minions(clone_game(self.game), ['11', '11'])
+        self.assertNotEqual(game_a.zobrist_hash(), game_d.zobrist_hash())
+
+    def testSwapMinions(self):
+        game = self._play_minions(clone_game(self.game), ['11', '6'])
+        before, observer_before = game.zobrist_hash(), observer_hash(game, 1 - self.player_id)
+
+        # Swapped minions have different hashes, so MCTS does not merge their nodes.
+        play = game.get_player(self.player_id).play
+        play[0], play[1] = play[1], play[0]
+        game.zobrist.check()
+        self.assertNotEqual(game.zobrist_hash(), before)
+        self.assertNotEqual(observer_hash(game, 1 - self.player_id), observer_before)
+
+        play[0], play[1] = play[1], play[0]
+        self.assertEqual(game.zobrist_hash(), before)
+
+    def testDebugGame(self):
+        # Hashes are checked after each player action.
+        game = self.game
+        while game.running and game.n_turns < 30:
+            game.run_player_action(BaseAgent(game, game.current_player).get_player_action())
+            self.assertEqual(game.zobrist_hash(), game.zobrist.full_hash())
+
+        # Hashes are kept after pickling.
+        clone = pickle.loads(pickle.dumps(game))
+        self.assertEqual(clone.zobrist_hash(), game.zobrist_hash())
+        clone.zobrist.check()
+
+    def testEnchantments(self):
+        game = self.game
+        minion = self._play_minions(game, ['11']).get_player(self.player_id).play[0]
+        enchantment_class = all_enchantments()['1000000']
+
+        hashes = [game.zobrist_hash()]
+        enchantments = []
+        for _ in range(2):
+            enchantments.append(enchantment_class(game, minion))
+            game.zobrist.check()
+            hashes.append(game.zobrist_hash())
+        # Same enchantments do not cancel each other.
+        self.assertEqual(len(set(hashes)), 3)
+
+        minion.remove_enchantment(enchantments.pop())
+        game.zobrist.check()
+
+    def testObserverHash(self):
+        game = clone_game(self.game)
+        opponent = game.get_player(1 - self.player_id)
+        before = observer_hash(game, self.player_id)
+
+        # Swap hidden cards of the opponent (like the determinisation of MCTS).
+        opponent.hand[0], opponent.deck[0] = opponent.deck[0], opponent.hand[0]
+        opponent.hand[0].zone, opponent.deck[0].zone = Zone.Hand, Zone.Deck
+        game.zobrist.check()
+        self.assertNotEqual(game.zobrist_hash(), self.game.zobrist_hash())
+        self.assertEqual(observer_hash(game, self.player_id), before)
+        self.assertNotEqual(observer_hash(game, 1 - self.player_id), observer_hash(self.game, 1 - self.player_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,374 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Load test of LAN servers: many simulated clients on the same machine.
+
+Two kinds of servers can be tested:
+    1. 'lockstep': ``local_server.LocalServerV2`` (one server for each match). Clients are
+        ``local_client.AgentClientV2`` played by rule-based agents (see ``ai.rule_based``).
+    2. 'room': ``room_server.RoomServer`` (one server with many rooms). Clients only keep mirrors of the game,
+        they end their turns until the given turn.
+
+All clients run in one ``ClientLoop`` (one thread), all matches run concurrently. Clients concede at the given
+turn. Servers run in a child process, so their CPU time and memory are measured separately (memory is not
+measured on Windows). If the server address is given, the 'room' clients connect to it instead.
+
+Reports:
+    connect_time:           Time of connecting all clients.
+    setup_*:                Time from connecting to the protocol negotiation done, of each client (in ms).
+    latency_*:              Time from sending an action to receiving its broadcast, of each action (in ms).
+    messages_per_second:    Messages received by all clients per second.
+    server_cpu_*:           CPU time of the server (including workers), and its percent of the wall time.
+    server_max_rss:         Peak RSS of the server process plus the peak RSS of workers (in MB).
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.game.default_data import PracticeDecks
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game.player_action import Concede
+from MyHearthStone.game.state_sync import MirrorGame
+from MyHearthStone.network.client_io import ClientLoop
+from MyHearthStone.network.local_client import AgentClientV2
+from MyHearthStone.network.local_server import create_server
+from MyHearthStone.network.protocol import SupportedVersions, create_protocol
+from MyHearthStone.network.room_server import RoomServer
+from MyHearthStone.utils.game import Klass
+
+__author__ = 'fyabc'
+
+
+ExampleDecks = [
+    Deck(klass=Klass.Str2Idx[klass], card_id_list=["6", "11", "10000", "30007"] * 4)
+    for klass in ('Mage', 'Hunter')
+]
+
+# Decks of agents, with playable cards.
+AgentDecks = [PracticeDecks['Normal'][Klass.Str2Idx[klass]] for klass in ('Mage', 'Hunter')]
+
+
+class LoadStats:
+    def __init__(self, n_clients):
+        self.n_clients = n_clients
+        self.n_closed = 0
+        self.n_messages = 0
+        self.n_actions = 0
+        self.results = []
+        self.setup_times = []
+        self.latencies = []
+
+
+# Server process.
+
+def _usage():
+    """Get (CPU time, peak RSS in MB) of this process and its terminated children."""
+    if resource is None:
+        t = os.times()
+        return t.user + t.system + t.children_user + t.children_system, None
+    self_usage, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = self_usage.ru_utime + self_usage.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss is in KB on Linux, in bytes on macOS.
+    unit = 1 << 20 if sys.platform == 'darwin' else 1 << 10
+    return cpu, (self_usage.ru_maxrss + children.ru_maxrss) / unit
+
+
+def _start_room_server(n_workers):
+    """Start a room server in a background thread, return (server, event loop, thread)."""
+    server = RoomServer(('127.0.0.1', 0), n_workers)
+    aio_loop = asyncio.new_event_loop()
+    aio_loop.run_until_complete(server.start())
+    thread = threading.Thread(target=aio_loop.run_forever, name='RoomServerLoop', daemon=True)
+    thread.start()
+    return server, aio_loop, thread
+
+
+def _stop_room_server(server, aio_loop, thread):
+    async def _shutdown():
+        server.close()
+        # Handlers exit when their connections are closed, cancel the rest.
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=1)
+            for task in pending:
+                task.cancel()
+
+    asyncio.run_coroutine_threadsafe(_shutdown(), aio_loop).result(timeout=10)
+    aio_loop.call_soon_threadsafe(aio_loop.stop)
+    thread.join(timeout=10)
+    aio_loop.close()
+
+
+def _serve(kind, n_servers, n_workers, pipe):
+    """Entry of the server process. Send addresses of servers, wait for the stop request, then send the usage."""
+    if kind == 'lockstep':
+        servers = [create_server(2, ('127.0.0.1', 0), capacity=2) for _ in range(n_servers)]
+        for server in servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        addresses = [server.server_address[:2] for server in servers]
+    else:
+        room_server = _start_room_server(n_workers)
+        addresses = [room_server[0]._server.sockets[0].getsockname()[:2]]
+
+    start_cpu, _ = _usage()
+    start = time.perf_counter()
+    pipe.send(addresses)
+    pipe.recv()
+    wall_time = time.perf_counter() - start
+
+    if kind == 'lockstep':
+        # Shutdown waits for the poll interval of the server, so shutdown them in parallel.
+        threads = [threading.Thread(target=server.shutdown) for server in servers]
+        for thread in threads:
+            thread.start()
+        for thread, server in zip(threads, servers):
+            thread.join()
+            server.server_close()
+    else:
+        _stop_room_server(*room_server)
+
+    # Usage of workers is available after they are joined.
+    cpu, max_rss = _usage()
+    pipe.send({'cpu': cpu - start_cpu, 'wall_time': wall_time, 'max_rss': max_rss})
+
+
+class ServerProcess:
+    """Run servers in a child process."""
+
+    def __init__(self, kind, n_servers=1, n_workers=None):
+        self.pipe, child_pipe = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(kind, n_servers, n_workers, child_pipe), name='LoadTestServer')
+        self.process.start()
+        self.addresses = [tuple(address) for address in self.pipe.recv()]
+
+    def stop(self):
+        """Stop the servers, return the usage."""
+        self.pipe.send('stop')
+        usage = self.pipe.recv()
+        self.process.join(timeout=10)
+        return usage
+
+
+# Clients.
+
+class LoadClient:
+    """A simulated client of the room server."""
+
+    def __init__(self, loop, address, nickname, deck_code, n_turns, stats):
+        self.loop = loop
+        self.n_turns = n_turns
+        self.stats = stats
+        self.player_id = None
+        self.mirror = MirrorGame()
+        self.result = None
+
+        # Act at most once for each mirror version.
+        self._acted_version = None
+        self._sent_time = None
+
+        self._start_time = time.perf_counter()
+        self.conn = loop.connect(address, self._on_message, self._on_close)
+        self.conn.send('user_data', nickname=nickname, deck_code=deck_code, protocols=list(SupportedVersions))
+
+    def _on_message(self, conn, msg):
+        self.stats.n_messages += 1
+        msg_type = msg['type']
+        if msg_type == 'protocol':
+            self.stats.setup_times.append(time.perf_counter() - self._start_time)
+            conn.protocol = create_protocol(msg['version'])
+            conn.send('match')
+        elif msg_type == 'match':
+            self.player_id = msg['player_id']
+        elif msg_type == 'game_status':
+            self.mirror.apply_batch(msg['snapshot'])
+            self._act()
+        elif msg_type == 'game_delta':
+            self._on_broadcast()
+            self.mirror.apply_batches(msg['batches'])
+            self._act()
+        elif msg_type == 'game_end':
+            self._on_broadcast()
+            self.result = msg['result']
+            self.stats.results.append(self.result)
+            conn.close()
+
+    def _on_broadcast(self):
+        if self._sent_time is not None:
+            self.stats.latencies.append(time.perf_counter() - self._sent_time)
+            self._sent_time = None
+
+    def _act(self):
+        mirror = self.mirror
+        if mirror.current_player != self.player_id or self._acted_version == mirror.version:
+            return
+        self._acted_version = mirror.version
+        self.stats.n_actions += 1
+        self._sent_time = time.perf_counter()
+        self.conn.send('player_action', action='Concede' if mirror.n_turns >= self.n_turns else 'TurnEnd')
+
+    def _on_close(self, _conn):
+        self.stats.n_closed += 1
+        if self.stats.n_closed == self.stats.n_clients:
+            self.loop.stop()
+
+
+class LoadAgentClient(AgentClientV2):
+    """A simulated client of the lockstep server, played by a rule-based agent."""
+
+    def __init__(self, user, server_address, **kwargs):
+        self.n_turns = kwargs.pop('n_turns')
+        self.stats = kwargs.pop('stats')
+        self.result = None
+        self._start_time = time.perf_counter()
+        self._sent_times = []
+        super().__init__(user, server_address, **kwargs)
+
+    def _on_message(self, conn, d):
+        self.stats.n_messages += 1
+        super()._on_message(conn, d)
+
+    def on_connected(self):
+        self.stats.setup_times.append(time.perf_counter() - self._start_time)
+        super().on_connected()
+
+    def send_action(self, player_action):
+        self.stats.n_actions += 1
+        self._sent_times.append(time.perf_counter())
+        super().send_action(player_action)
+
+    def _apply(self, msg):
+        if msg['player_id'] == self.player_id and self._sent_times:
+            self.stats.latencies.append(time.perf_counter() - self._sent_times.pop(0))
+        super()._apply(msg)
+
+    def choose_action(self):
+        if self.game.n_turns >= self.n_turns:
+            return Concede(self.game, self.player_id)
+        return super().choose_action()
+
+    def on_game_end(self):
+        self.result = self.game.game_result
+        self.stats.results.append(self.result)
+
+    def _on_close(self, conn):
+        super()._on_close(conn)
+        self.stats.n_closed += 1
+        if self.stats.n_closed == self.stats.n_clients:
+            self.loop.stop()
+
+
+def _percentiles(prefix, values, qs=(50, 90, 99)):
+    """Get nearest-rank percentiles and the max of the values (in ms)."""
+    values = sorted(values)
+    result = {}
+    for q in qs:
+        result['{}_p{}'.format(prefix, q)] = values[max(0, -(-len(values) * q // 100) - 1)] * 1000 if values else None
+    result['{}_max'.format(prefix)] = values[-1] * 1000 if values else None
+    return result
+
+
+def run_load_test(n_clients=200, n_turns=4, address=None, n_workers=None, timeout=60, server='room',
+                  agent='BaseAgent'):
+    """Run the load test.
+
+    :param n_clients: Number of clients, each two clients play a match.
+    :param n_turns: Clients concede at this turn.
+    :param address: Address of the room server, default to start one.
+    :param n_workers: Number of room server workers.
+    :param timeout: Stop the test if no messages in this time (in seconds).
+    :param server: Kind of the server, 'lockstep' or 'room'.
+    :param agent: Agent name of lockstep clients.
+    :return: Dict of statistics.
+    """
+    if server not in ('lockstep', 'room'):
+        raise ValueError('Unknown server kind {!r}'.format(server))
+    if address is None:
+        server_process = ServerProcess(server, (n_clients + 1) // 2 if server == 'lockstep' else 1, n_workers)
+        addresses = server_process.addresses
+    elif server == 'room':
+        server_process, addresses = None, [address]
+    else:
+        raise ValueError('Lockstep load test must start its own servers')
+
+    loop = ClientLoop()
+    stats = LoadStats(n_clients)
+    usage = None
+    try:
+        start = time.perf_counter()
+        if server == 'lockstep':
+            clients = [
+                LoadAgentClient(
+                    'load{}'.format(i), addresses[i // 2], loop=loop, agent=agent,
+                    deck_code=AgentDecks[i % 2].to_code(), n_turns=n_turns, stats=stats)
+                for i in range(n_clients)
+            ]
+            for client in clients:
+                client.start()
+        else:
+            clients = [
+                LoadClient(loop, addresses[0], 'load{}'.format(i), ExampleDecks[i % 2].to_code(), n_turns, stats)
+                for i in range(n_clients)
+            ]
+        connect_time = time.perf_counter() - start
+        loop.run(timeout=timeout)
+        total_time = time.perf_counter() - start
+    finally:
+        loop.close()
+        if server_process is not None:
+            usage = server_process.stop()
+
+    result = {
+        'clients': n_clients,
+        'finished': sum(client.result is not None for client in clients),
+        'connect_time': connect_time,
+        'total_time': total_time,
+        'messages': stats.n_messages,
+        'actions': stats.n_actions,
+        'messages_per_second': stats.n_messages / total_time,
+    }
+    result.update(_percentiles('setup', stats.setup_times))
+    result.update(_percentiles('latency', stats.latencies))
+    if usage is not None:
+        result['server_cpu_time'] = usage['cpu']
+        result['server_cpu_percent'] = 100 * usage['cpu'] / usage['wall_time']
+        result['server_max_rss'] = usage['max_rss']
+    return result
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Load test of LAN servers.')
+    parser.add_argument('-n', '--clients', type=int, default=200, help='Number of clients, default is %(default)r')
+    parser.add_argument('-t', '--turns', type=int, default=10, help='Turns of each game, default is %(default)r')
+    parser.add_argument('-s', '--server', default='lockstep', choices=['lockstep', 'room'],
+                        help='Kind of the server, default is %(default)r')
+    parser.add_argument('--agent', default='BaseAgent', help='Agent of lockstep clients, default is %(default)r')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of room server workers')
+    parser.add_argument('-a', '--address', default=None, help='Room server address (host:port), default to start one')
+    parser.add_argument('--timeout', type=float, default=60, help='Idle timeout in seconds, default is %(default)r')
+    args = parser.parse_args(args)
+
+    address = None
+    if args.address is not None:
+        host, port = args.address.rsplit(':', 1)
+        address = (host, int(port))
+
+    result = run_load_test(args.clients, args.turns, address, args.workers, args.timeout, args.server, args.agent)
+    for key, value in result.items():
+        print('{:24}{}'.format(key, round(value, 3) if isinstance(value, float) else value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = 'fyabc'
@@ -0,0 +1,77 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.network.async_server import AsyncLanServer
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.state_sync import MirrorGame
+from MyHearthStone.utils.game import Zone
+
+from .test_room_server import ExampleDecks, _join, _send, _recv_until
+
+__author__ = 'fyabc'
+
+
+class TestAsyncServer(unittest.TestCase):
+    def testPlayMinion(self):
+        async def _main():
+            server = AsyncLanServer(('127.0.0.1', 0))
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                clients = [await _join(port, 'user{}'.format(i), ExampleDecks[i], match=False) for i in range(2)]
+                mirrors = []
+                for reader, _, protocol in clients:
+                    mirrors.append(MirrorGame())
+                    mirrors[-1].apply_batch((await _recv_until(reader, protocol, 'game_status'))['snapshot'])
+                seats = {user.player_id: int(user.nickname[-1]) for user in server.users}
+
+                async def _run(player_id, msg):
+                    _send(clients[seats[player_id]][1], clients[seats[player_id]][2], 'player_action', **msg)
+                    for mirror, (reader, _, protocol) in zip(mirrors, clients):
+                        mirror.apply_batches((await _recv_until(reader, protocol, 'game_delta'))['batches'])
+
+                # [NOTE]: The game is only read between actions, when the engine thread is idle.
+                game = server.game
+                while True:
+                    player_id = game.current_player
+                    actions = [a for a in game.get_legal_actions() if isinstance(a, pa.PlayMinion)]
+                    if actions:
+                        break
+                    await _run(player_id, {'action': 'TurnEnd'})
+                action = actions[0]
+                msg = action.to_dict()
+                await _run(player_id, msg)
+                minion_in_play = action.minion in game.get_zone(Zone.Play, player_id)
+                mirror_play = mirrors[seats[player_id]].get_zone(Zone.Play, player_id)
+
+                # The same action is not legal any more, and players cannot act in the turn of the opponent.
+                reader, writer, protocol = clients[seats[player_id]]
+                _send(writer, protocol, 'player_action', **msg)
+                illegal = await _recv_until(reader, protocol, 'error')
+                reader, writer, protocol = clients[seats[1 - player_id]]
+                _send(writer, protocol, 'player_action', action='TurnEnd')
+                not_in_turn = await _recv_until(reader, protocol, 'error')
+
+                _send(writer, protocol, 'player_action', action='Concede')
+                end = await _recv_until(reader, protocol, 'game_end')
+                return action, minion_in_play, mirror_play, illegal, not_in_turn, end
+            finally:
+                server.close()
+
+        action, minion_in_play, mirror_play, illegal, not_in_turn, end = asyncio.run(_main())
+        self.assertTrue(minion_in_play)
+        self.assertIn(action.minion.eid, mirror_play)
+        self.assertIn('Illegal player action', illegal['text'])
+        self.assertEqual(not_in_turn['text'], 'Not your turn!')
+        self.assertEqual(end['type'], 'game_end')
+
+
+if __name__ == '__main__':
+    unittest.main()
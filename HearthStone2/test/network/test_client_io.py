@@ -0,0 +1,116 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import socket
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from MyHearthStone.network.client_io import RecvBuffer, ClientLoop
+from MyHearthStone.network.protocol import JsonLineProtocol, FramedProtocol
+
+from load_test import run_load_test
+
+__author__ = 'fyabc'
+
+
+class _ChunkSocket:
+    """A fake socket that returns the data in chunks of the given size."""
+
+    def __init__(self, data, chunk_size):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def recv_into(self, view):
+        n = min(len(view), self.chunk_size, len(self.data))
+        view[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def _receive_all(sock, buffer, protocols):
+    """Receive all messages, switch from the first protocol to the second after the 'protocol' message."""
+    protocol, messages = protocols[0], []
+    while buffer.recv_from(sock):
+        while True:
+            msgs = buffer.extract(protocol)
+            if msgs is None:
+                break
+            for msg in msgs:
+                messages.append(msg)
+                if msg['type'] == 'protocol':
+                    protocol = protocols[1]
+    return messages
+
+
+class TestClientIO(unittest.TestCase):
+    def setUp(self):
+        self.messages = [('text', {'text': 'message {}'.format(i) * (i % 7)}) for i in range(50)]
+        self.messages.append(('game_delta', {'batches': [[1, [[5, i, 0, 3, {'health': i}, []] for i in range(200)]]]}))
+
+    def testFramedChunks(self):
+        protocol = FramedProtocol(compress_threshold=256)
+        data = b''.join(protocol.pack([protocol.encode_message(t, obj)]) for t, obj in self.messages)
+        for chunk_size in (1, 7, 100, 4096):
+            # Small buffers must grow for the large message.
+            buffer = RecvBuffer(size=64)
+            received = _receive_all(_ChunkSocket(data, chunk_size), buffer, [protocol])
+            self.assertEqual([msg['type'] for msg in received], [t for t, _ in self.messages])
+            self.assertEqual(received[-1]['batches'], self.messages[-1][1]['batches'])
+            self.assertEqual(len(buffer), 0)
+
+    def testSwitchProtocol(self):
+        v1, v2 = JsonLineProtocol(), FramedProtocol()
+        data = v1.pack([v1.encode_message('text', {'text': 'hello'}), v1.encode_message('protocol', {'version': 2})])
+        data += v2.pack([v2.encode_message(t, obj) for t, obj in self.messages])
+        received = _receive_all(_ChunkSocket(data, 1 << 20), RecvBuffer(), [v1, v2])
+        self.assertEqual([msg['type'] for msg in received], ['text', 'protocol'] + [t for t, _ in self.messages])
+
+    def testLoopWakeup(self):
+        loop = ClientLoop()
+        a, b = socket.socketpair()
+        lines = []
+        try:
+            loop.add_line_input(lines.append, a.makefile('r'))
+            b.sendall(b'hello\nworld\n')
+            b.close()
+            loop.call_soon_threadsafe(lambda: None)
+            loop.run(timeout=1)
+        finally:
+            loop.close()
+            a.close()
+        self.assertEqual(lines, ['hello', 'world', None])
+
+    def testLineInput(self):
+        loop = ClientLoop()
+        r, w = os.pipe()
+        lines = []
+        try:
+            with open(r, 'r', encoding='utf-8') as file:
+                loop.add_line_input(lines.append, file)
+
+                # Pasted lines arrive in one read, all complete lines are delivered, the partial line waits.
+                os.write(w, 'hello\r\n\u4f60\u597d\n\nwor'.encode('utf-8'))
+                loop.run(timeout=0.1)
+                self.assertEqual(lines, ['hello', '\u4f60\u597d', ''])
+                os.write(w, b'ld\nlast')
+                os.close(w)
+                w = None
+                loop.run(timeout=1)
+        finally:
+            if w is not None:
+                os.close(w)
+            loop.close()
+        self.assertEqual(lines, ['hello', '\u4f60\u597d', '', 'world', 'last', None])
+
+    def testLoad(self):
+        result = run_load_test(n_clients=200, n_turns=2, n_workers=1, timeout=60)
+        self.assertEqual(result['finished'], 200)
+        self.assertGreater(result['actions'], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.network.async_server import AsyncConnection
+from MyHearthStone.network.fanout import StateStream
+from MyHearthStone.network.protocol import FramedProtocol
+from MyHearthStone.network.room import Room
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game.state_sync import MirrorGame
+from MyHearthStone.utils.constants import C
+from MyHearthStone.utils.game import Klass
+
+__author__ = 'fyabc'
+
+
+ExampleDecks = [
+    Deck(klass=Klass.Str2Idx[klass], card_id_list=["6", "11", "10000", "30007"] * 4)
+    for klass in ('Mage', 'Hunter')
+]
+
+
+class _FakeWriter:
+    """A stream writer that records written data, ``drain`` waits until it is released."""
+
+    def __init__(self, released=True):
+        self.data = bytearray()
+        self.n_writes = 0
+        self.released = asyncio.Event()
+        if released:
+            self.released.set()
+
+    def get_extra_info(self, name):
+        return '<fake>'
+
+    def write(self, data):
+        self.data += data
+        self.n_writes += 1
+
+    async def drain(self):
+        await self.released.wait()
+
+    def close(self):
+        pass
+
+
+def _connection(writer):
+    conn = AsyncConnection(None, None, writer)
+    conn.protocol = FramedProtocol()
+    conn.start()
+    return conn
+
+
+def _received(writer):
+    return FramedProtocol().feed(writer.data)
+
+
+def _mirror(messages):
+    mirror = MirrorGame()
+    for msg in messages:
+        if msg['type'] == 'game_status':
+            mirror.apply_batch(msg['snapshot'])
+        elif msg['type'] == 'game_delta':
+            mirror.apply_batches(msg['batches'])
+    return mirror
+
+
+def _room_outputs(n_turns):
+    """Outputs of the watchers view of a room, during the given number of turns."""
+    room = Room(0)
+    outputs = room.start([deck.to_code() for deck in ExampleDecks])
+    for _ in range(n_turns):
+        outputs.extend(room.run_player_action(room.game.current_player, {'action': 'TurnEnd'}))
+    return [(msg_type, obj) for target, msg_type, obj in outputs if target == Room.Watchers]
+
+
+class TestFanout(unittest.TestCase):
+    def testMirrorSnapshot(self):
+        mirror = _mirror([{'type': t, **obj} for t, obj in _room_outputs(6)])
+        copied = MirrorGame()
+        copied.apply_batch(mirror.snapshot())
+        self.assertEqual(copied.snapshot(), mirror.snapshot())
+        self.assertEqual(copied.version, mirror.version)
+
+    def testSerializeOnce(self):
+        async def _main():
+            stream = StateStream(Room.Watchers)
+            writers = [_FakeWriter() for _ in range(4)]
+            conns = [_connection(w) for w in writers]
+            for conn in conns:
+                stream.add(conn)
+            for msg_type, obj in _room_outputs(2):
+                stream.publish(msg_type, obj)
+            # All receivers share the same chunks.
+            chunks = [list(conn._queue._queue) for conn in conns]
+            for c in chunks[1:]:
+                self.assertEqual(len(c), len(chunks[0]))
+                self.assertTrue(all(a is b for a, b in zip(c, chunks[0])))
+            for conn in conns:
+                conn.close()
+            await asyncio.sleep(0.01)
+            return stream, writers
+
+        stream, writers = asyncio.run(_main())
+        for writer in writers:
+            self.assertEqual(_mirror(_received(writer)).snapshot(), stream.mirror.snapshot())
+
+    def testCoalesceSlowReceiver(self):
+        outputs = _room_outputs(2 * C.LAN.CoalesceQueueSize)
+
+        async def _main():
+            stream = StateStream(Room.Watchers)
+            fast, slow = _FakeWriter(), _FakeWriter(released=False)
+            fast_conn, slow_conn = _connection(fast), _connection(slow)
+            stream.add(fast_conn)
+            stream.add(slow_conn)
+            for msg_type, obj in outputs:
+                stream.publish(msg_type, obj)
+                await asyncio.sleep(0)
+            self.assertTrue(slow_conn.lagging)
+            self.assertFalse(slow_conn.closed)
+            self.assertFalse(fast_conn.lagging)
+
+            # The slow receiver catches up with a snapshot.
+            slow.released.set()
+            await asyncio.sleep(0.01)
+            self.assertFalse(slow_conn.lagging)
+            fast_conn.close()
+            slow_conn.close()
+            await asyncio.sleep(0.01)
+            return stream, fast, slow
+
+        stream, fast, slow = asyncio.run(_main())
+        fast_messages, slow_messages = _received(fast), _received(slow)
+        self.assertEqual(len(fast_messages), len(outputs))
+        self.assertLess(len(slow_messages), len(outputs))
+        self.assertEqual(slow_messages[-1]['type'], 'game_status')
+        for messages in (fast_messages, slow_messages):
+            self.assertEqual(_mirror(messages).snapshot(), stream.mirror.snapshot())
+
+    def testMissingBatches(self):
+        scheduled = []
+        stream = StateStream(Room.Watchers, schedule=scheduled.append)
+        outputs = _room_outputs(12)
+        stream.publish(*outputs[0])
+        start_version = stream.mirror.version
+        for msg_type, obj in outputs[1:]:
+            stream.publish(msg_type, obj)
+        latest = stream.mirror.version
+
+        # The checkpoint is scheduled once, not taken in ``publish``.
+        self.assertEqual(scheduled, [stream.take_checkpoint])
+        self.assertEqual(stream.checkpoint[0], start_version)
+        self.assertEqual(stream.missing_batches(latest), [])
+
+        # A mirror of an old version is updated by the missing batches.
+        mirror = _mirror([dict(obj, type=msg_type) for msg_type, obj in outputs[:-1]])
+        batches = stream.missing_batches(mirror.version)
+        self.assertEqual(len(batches), latest - mirror.version)
+        mirror.apply_batches(batches)
+        self.assertEqual(mirror.snapshot(), stream.mirror.snapshot())
+
+        # Too many missing batches, send the snapshot instead.
+        self.assertIsNone(stream.missing_batches(start_version))
+
+        # Mirrors older than the checkpoint get the snapshot.
+        scheduled.pop()()
+        self.assertEqual(stream.checkpoint[0], latest)
+        self.assertEqual(stream.log, [])
+        self.assertIsNone(stream.missing_batches(mirror.version - 1))
+        self.assertEqual(stream.missing_batches(latest), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
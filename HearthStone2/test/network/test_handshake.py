@@ -0,0 +1,83 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.network.client_io import ClientLoop
+from MyHearthStone.network.lan_client import LanClient
+from MyHearthStone.network.lan_server import LanServer, LanHandler
+from MyHearthStone.network.local_client import LocalClientV2
+from MyHearthStone.network.local_server import create_server
+from MyHearthStone.network.protocol import SupportedVersions
+from MyHearthStone.network.utils2 import NetworkUser
+
+from .test_room_server import ExampleDecks
+
+__author__ = 'fyabc'
+
+
+class _LockstepClient(LocalClientV2):
+    # The LAN server keeps sending texts while waiting for the game start, stop at the welcome text.
+    def on_message(self, msg_type, d):
+        if d.get('text', '').startswith('Hello'):
+            self.loop.stop()
+        return super().on_message(msg_type, d)
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address
+
+
+class TestHandshake(unittest.TestCase):
+    """All servers and clients use the same handshake (see ``protocol``), clients can connect to servers of
+    the other family."""
+
+    def testLanClientToLockstepServer(self):
+        server = create_server(2, ('127.0.0.1', 0), capacity=4)
+        address = _serve(server)
+        loop = ClientLoop()
+        try:
+            client = LanClient(NetworkUser(address, 'lan', ExampleDecks[0].to_code()), loop=loop, read_input=False)
+            client.start()
+            loop.run(timeout=1)
+            self.assertEqual(client.protocol.version, max(SupportedVersions))
+            self.assertIn('lan', server.users)
+            self.assertEqual(server.users['lan'].protocol.version, max(SupportedVersions))
+            self.assertEqual(server.users['lan'].deck_code, ExampleDecks[0].to_code())
+            client.close()
+        finally:
+            loop.close()
+            server.shutdown()
+            server.server_close()
+
+    def testLockstepClientToLanServer(self):
+        server = LanServer(('127.0.0.1', 0), LanHandler)
+        # Handlers of the LAN server never return before the game start, do not wait for them on close.
+        server.daemon_threads = True
+        address = _serve(server)
+        loop = ClientLoop()
+        try:
+            client = _LockstepClient('lockstep', address, loop=loop, deck_code=ExampleDecks[1].to_code())
+            client.start()
+            loop.run(timeout=5)
+            self.assertTrue(client.connected)
+            self.assertEqual(client.protocol.version, max(SupportedVersions))
+            users = list(server.users)
+            self.assertEqual([user.nickname for user in users], ['lockstep'])
+            self.assertEqual(users[0].protocol.version, max(SupportedVersions))
+            self.assertEqual(users[0].deck_code, ExampleDecks[1].to_code())
+            client.close()
+        finally:
+            loop.close()
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from MyHearthStone.network.local_server import create_server
+from MyHearthStone.network.local_client import LocalClientV2
+from MyHearthStone.network.utils import MsgTypes
+from MyHearthStone.ai.rule_based.basic import BaseAgent
+from MyHearthStone.game.core import Game
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.state_sync import state_hash
+from MyHearthStone.utils.game import Klass, Zone
+
+from load_test import AgentDecks, run_load_test
+
+__author__ = 'fyabc'
+
+
+ExampleDecks = [
+    Deck(klass=Klass.Str2Idx[klass], card_id_list=["6", "11", "10000", "30007"] * 4)
+    for klass in ('Mage', 'Hunter')
+]
+
+
+def _seeded_game(seed):
+    game = Game()
+    game.start_game(ExampleDecks, mode='standard', seed=seed)
+    game.run_player_action(pa.ReplaceStartCard(game, 0, [0]))
+    game.run_player_action(pa.ReplaceStartCard(game, 1, []))
+    return game
+
+
+class _TestClient(LocalClientV2):
+    """End turns until the given turn, then the player 1 concedes."""
+
+    ConcedeTurn = 6
+
+    def on_update(self, player_action):
+        game = self.game
+        if game.current_player != self.player_id or isinstance(player_action, pa.ReplaceStartCard) and \
+                game.state != game.GameState.Main:
+            return
+        if self.player_id == 1 and game.n_turns >= self.ConcedeTurn:
+            self.send_action(pa.Concede(game, self.player_id))
+        else:
+            self.send_action(pa.TurnEnd(game, self.player_id))
+
+
+class _CheatClient(_TestClient):
+    """Send illegal and malformed actions in the first turn of the player, then play as ``_TestClient``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cheated = False
+
+    def on_update(self, player_action):
+        game = self.game
+        if self.cheated or game.state != game.GameState.Main or game.current_player != self.player_id:
+            return super().on_update(player_action)
+        self.cheated = True
+        player_id = self.player_id
+        hand = game.get_zone(Zone.Hand, player_id)
+        enemy_hand = game.get_zone(Zone.Hand, 1 - player_id)
+        enemy_hero = game.get_hero(1 - player_id)
+        expensive = next(card for card in hand if card.cost > game.get_player(player_id).displayed_mana())
+        for action in [
+            # Cards of the opponent, cards without enough mana, and actions in the wrong state.
+            pa.PlayMinion(game, enemy_hand[0], 0, None, player_id).to_dict(),
+            dict(pa.PlayMinion(game, expensive, 0, enemy_hero, player_id).to_dict(), action='PlaySpell'),
+            dict(pa.PlayMinion(game, expensive, 0, None, player_id).to_dict()),
+            pa.ReplaceStartCard(game, player_id, [0]).to_dict(),
+            # Malformed payloads.
+            {'action': 'PlayMinion'},
+            {'action': 'PlayMinion', 'minion': [1], 'loc': 0},
+            {'action': ['TurnEnd']},
+            {'action': 'PlaySpell', 'spell': hand[0].eid, 'po_data': 3},
+            'TurnEnd',
+            None,
+        ]:
+            self.send(MsgTypes.PlayerAction, action=action)
+        super().on_update(player_action)
+
+
+class TestLockstep(unittest.TestCase):
+    def testSeed(self):
+        game1, game2 = _seeded_game(42), _seeded_game(42)
+        for _ in range(4):
+            self.assertEqual(state_hash(game1), state_hash(game2))
+            game1.run_player_action(pa.TurnEnd(game1))
+            game2.run_player_action(pa.TurnEnd(game2))
+        self.assertEqual(state_hash(game1), state_hash(game2))
+        self.assertNotEqual(state_hash(game1), state_hash(_seeded_game(43)))
+
+    def testSerializeAction(self):
+        game = _seeded_game(42)
+        player_id = game.current_player
+        minion = game.get_zone(Zone.Hand, player_id)[0]
+        actions = [
+            pa.TurnEnd(game, player_id),
+            pa.Concede(game, player_id),
+            pa.ReplaceStartCard(game, player_id, [1, 2]),
+            pa.PlayMinion(game, minion, 0, game.get_hero(1 - player_id), player_id),
+            pa.ToAttack(game, game.get_hero(player_id), game.get_hero(1 - player_id)),
+            pa.UseHeroPower(game, None, player_id),
+        ]
+        for action in actions:
+            d = action.to_dict()
+            restored = pa.PlayerAction.from_dict(game, d)
+            self.assertIs(type(restored), type(action))
+            self.assertEqual(restored.to_dict(), d)
+        restored = pa.PlayerAction.from_dict(game, actions[3].to_dict())
+        self.assertIs(restored.minion, minion)
+
+    def testLockstepGame(self):
+        server = create_server(2, ('127.0.0.1', 0), capacity=4)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address = server.server_address
+        try:
+            clients = [
+                _TestClient('player0', address, deck_code=ExampleDecks[0].to_code()),
+                _TestClient('player1', address, deck_code=ExampleDecks[1].to_code()),
+                _TestClient('watcher', address),
+            ]
+            threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=20)
+                self.assertFalse(t.is_alive())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(sorted(c.player_id for c in clients[:2]), [0, 1])
+        self.assertIsNone(clients[2].player_id)
+        hashes = set()
+        for client in clients:
+            self.assertFalse(client.desync)
+            self.assertFalse(client.game.running)
+            self.assertEqual(client.game.game_result, Game.ResultWin0)
+            hashes.add(state_hash(client.game))
+        self.assertEqual(len(hashes), 1)
+        self.assertGreater(len(server.actions), _TestClient.ConcedeTurn)
+
+    def testIllegalActions(self):
+        """Illegal and malformed actions are dropped by all clients."""
+        server = create_server(2, ('127.0.0.1', 0), capacity=4)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address = server.server_address
+        try:
+            clients = [
+                _CheatClient('player0', address, deck_code=ExampleDecks[0].to_code()),
+                _CheatClient('player1', address, deck_code=ExampleDecks[1].to_code()),
+                _TestClient('watcher', address),
+            ]
+            threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=20)
+                self.assertFalse(t.is_alive())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertTrue(all(client.cheated for client in clients[:2]))
+        hashes = set()
+        for client in clients:
+            game = client.game
+            self.assertFalse(client.desync)
+            self.assertEqual(game.game_result, Game.ResultWin0)
+            for player_id in 0, 1:
+                self.assertEqual(game.get_zone(Zone.Play, player_id), [])
+                self.assertEqual(game.get_hero(player_id).health, 30)
+            hashes.add(state_hash(game))
+        self.assertEqual(len(hashes), 1)
+
+    def testAgentGames(self):
+        """Agents must not change the game when choosing actions, and games of the same seed must be same."""
+        for seed in range(5):
+            games = [Game(), Game()]
+            for game in games:
+                game.start_game(AgentDecks, mode='standard', seed=seed)
+                for player_id in range(2):
+                    game.run_player_action(pa.ReplaceStartCard(game, player_id, []))
+            for _ in range(60):
+                if not games[0].running or games[0].n_turns >= 12:
+                    break
+                # Only the first game is queried by the agent.
+                d = BaseAgent(games[0], games[0].current_player).get_player_action().to_dict()
+                for game in games:
+                    game.run_player_action(pa.PlayerAction.from_dict(game, d))
+                self.assertEqual(state_hash(games[0]), state_hash(games[1]), 'Seed {}, action {}'.format(seed, d))
+
+    def testAgentLoad(self):
+        result = run_load_test(n_clients=20, n_turns=6, server='lockstep', timeout=30)
+        self.assertEqual(result['finished'], 20)
+        self.assertIsNotNone(result['latency_p99'])
+
+
+if __name__ == '__main__':
+    unittest.main()
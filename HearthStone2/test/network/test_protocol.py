@@ -0,0 +1,91 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import io
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.network import protocol as proto
+
+__author__ = 'fyabc'
+
+
+Messages = [
+    ('text', {'text': 'Hello'}),
+    ('game_delta', {'batches': [[3, [[1, 4, 0, 1], [5, 12, 0, 3, {'damage': 2}, []]]]]}),
+    ('custom_type', {'value': [None, True, 1.5]}),
+    ('game_status', {'snapshot': [0, [[0]] + [[4, i, 0, 1, '6', {}, []] for i in range(300)]]}),
+]
+
+
+class TestProtocol(unittest.TestCase):
+    def _roundTrip(self, sender, receiver):
+        f = io.BytesIO()
+        msg_type, obj = Messages[0]
+        sender.send(f, msg_type, **obj)
+        sender.send_batch(f, Messages[1:])
+        f.seek(0)
+        result = []
+        while True:
+            msg = receiver.recv(f)
+            if msg is None:
+                break
+            result.append(msg)
+        self.assertEqual(len(result), len(Messages))
+        for msg, (msg_type, obj) in zip(result, Messages):
+            self.assertEqual(msg.pop('type'), msg_type)
+            self.assertEqual(msg, obj)
+        return f.getvalue()
+
+    def testJsonLine(self):
+        self._roundTrip(proto.JsonLineProtocol(), proto.JsonLineProtocol())
+
+    def testFramed(self):
+        data = self._roundTrip(proto.FramedProtocol(compress_threshold=1 << 30), proto.FramedProtocol())
+        json_data = self._roundTrip(proto.JsonLineProtocol(), proto.JsonLineProtocol())
+        self.assertLess(len(data), len(json_data))
+
+    def testCompress(self):
+        plain = self._roundTrip(proto.FramedProtocol(compress_threshold=1 << 30), proto.FramedProtocol())
+        compressed = self._roundTrip(proto.FramedProtocol(compress_threshold=1024), proto.FramedProtocol())
+        self.assertLess(len(compressed), len(plain))
+
+    def testFeed(self):
+        for protocol_type in (proto.JsonLineProtocol, proto.FramedProtocol):
+            sender = protocol_type()
+            data = b''.join(sender.pack([sender.encode_message(t, obj)]) for t, obj in Messages)
+            receiver = protocol_type()
+            result = []
+            for i in range(0, len(data), 7):
+                result.extend(receiver.feed(data[i:i + 7]))
+            self.assertListEqual([msg['type'] for msg in result], [t for t, _ in Messages])
+            self.assertEqual(result[-1]['snapshot'], Messages[-1][1]['snapshot'])
+
+    def testMalformed(self):
+        receiver = proto.FramedProtocol(max_frame_size=100)
+        with self.assertRaises(proto.ProtocolError):
+            receiver.feed(b'\x00\x00\x10\x00\x00')
+        with self.assertRaises(proto.ProtocolError):
+            proto.FramedProtocol().feed(b'\x00\x00\x00\x02\x00\x00\xc1')
+        with self.assertRaises(proto.ProtocolError):
+            proto.JsonLineProtocol().recv(io.BytesIO(b'{bad json\n'))
+
+        # Invalid UTF-8 strings in a frame.
+        sender = proto.FramedProtocol()
+        frame = sender.pack([sender.encode_message('text', {'text': 'ab'})])
+        with self.assertRaises(proto.ProtocolError):
+            proto.FramedProtocol().feed(frame.replace(b'ab', b'\xff\xfe'))
+
+    def testNegotiate(self):
+        self.assertEqual(proto.negotiate(None), 1)
+        self.assertEqual(proto.negotiate([1]), 1)
+        self.assertEqual(proto.negotiate([3, 2, 1]), 2)
+        with self.assertRaises(proto.ProtocolError):
+            proto.negotiate([3])
+
+
+if __name__ == '__main__':
+    unittest.main()
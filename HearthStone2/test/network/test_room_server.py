@@ -0,0 +1,227 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.network.room_server import RoomServer
+from MyHearthStone.network.protocol import JsonLineProtocol, SupportedVersions, create_protocol
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game.state_sync import MirrorGame
+from MyHearthStone.utils.game import Klass
+
+__author__ = 'fyabc'
+
+
+ExampleDecks = [
+    Deck(klass=Klass.Str2Idx[klass], card_id_list=["6", "11", "10000", "30007"] * 4)
+    for klass in ('Mage', 'Hunter')
+]
+
+
+async def _client(port, name, deck, concede=False):
+    """Join the lobby, match a game, concede it (or wait for the opponent), return the received message types."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    protocol = JsonLineProtocol()
+    writer.write(protocol.pack([protocol.encode_message('user_data', {
+        'nickname': name, 'deck_code': deck.to_code(), 'protocols': list(SupportedVersions)})]))
+
+    types, room, mirror = [], None, MirrorGame()
+    while True:
+        msg = await asyncio.wait_for(protocol.recv_async(reader), 20)
+        types.append(msg['type'])
+        if msg['type'] == 'protocol':
+            protocol = create_protocol(msg['version'])
+            writer.write(protocol.pack([protocol.encode_message('match', {})]))
+        elif msg['type'] == 'match':
+            room = msg['room']
+        elif msg['type'] == 'game_status':
+            mirror.apply_batch(msg['snapshot'])
+            if concede:
+                writer.write(protocol.pack([protocol.encode_message('player_action', {'action': 'Concede'})]))
+        elif msg['type'] == 'game_delta':
+            mirror.apply_batches(msg['batches'])
+        elif msg['type'] == 'game_end':
+            break
+    writer.close()
+    return types, room, mirror
+
+
+async def _join(port, name, deck, match=True, **kwargs):
+    """Join the lobby and enter the matchmaking queue, return (reader, writer, protocol)."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    protocol = JsonLineProtocol()
+    writer.write(protocol.pack([protocol.encode_message('user_data', dict(
+        nickname=name, deck_code=deck.to_code(), protocols=list(SupportedVersions), **kwargs))]))
+    msg = await asyncio.wait_for(protocol.recv_async(reader), 20)
+    protocol = create_protocol(msg['version'])
+    if match:
+        writer.write(protocol.pack([protocol.encode_message('match', {})]))
+    return reader, writer, protocol
+
+
+def _send(writer, protocol, msg_type, **kwargs):
+    writer.write(protocol.pack([protocol.encode_message(msg_type, kwargs)]))
+
+
+async def _recv_until(reader, protocol, msg_type):
+    """Receive messages until the message of the type, return it."""
+    while True:
+        msg = await asyncio.wait_for(protocol.recv_async(reader), 20)
+        if msg is None or msg['type'] == msg_type:
+            return msg
+
+
+class TestRoomServer(unittest.TestCase):
+    def testManyRooms(self):
+        async def _main():
+            server = RoomServer(('127.0.0.1', 0), n_workers=2)
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                clients = []
+                for i in range(4):
+                    clients.append(_client(port, 'user{}'.format(i), ExampleDecks[i % 2], concede=i % 2 == 0))
+                    # Make the matchmaking order deterministic.
+                    await asyncio.sleep(0.05)
+                results = await asyncio.gather(*clients)
+                self.assertEqual(server.rooms, {})
+                return results
+            finally:
+                server.close()
+
+        results = asyncio.run(_main())
+        rooms = {}
+        for types, room, mirror in results:
+            self.assertEqual(types[:2], ['protocol', 'text'])
+            self.assertIn('game_status', types)
+            self.assertEqual(types[-1], 'game_end')
+            self.assertGreater(mirror.version, 0)
+            rooms[room['id']] = room
+        self.assertEqual(len(rooms), 2)
+        # Rooms are sharded into different workers.
+        self.assertEqual({room['worker'] for room in rooms.values()}, {0, 1})
+
+    def testTurnTimeout(self):
+        async def _main():
+            server = RoomServer(('127.0.0.1', 0), n_workers=1, turn_timeout=0.1, max_timeouts=2)
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                # Nobody acts, turns end by timeouts until the first player concedes.
+                clients = [await _join(port, 'user{}'.format(i), ExampleDecks[i]) for i in range(2)]
+                return await asyncio.gather(*(_recv_until(r, p, 'game_end') for r, _, p in clients))
+            finally:
+                server.close()
+
+        for msg in asyncio.run(_main()):
+            self.assertEqual(msg['type'], 'game_end')
+
+    def testReconnect(self):
+        async def _main():
+            server = RoomServer(('127.0.0.1', 0), n_workers=1, turn_timeout=0, reconnect_grace=10)
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                clients = [await _join(port, 'user{}'.format(i), ExampleDecks[i]) for i in range(2)]
+                matches, mirrors = [], []
+                for reader, _, protocol in clients:
+                    matches.append(await _recv_until(reader, protocol, 'match'))
+                    mirrors.append(MirrorGame())
+                    mirrors[-1].apply_batch((await _recv_until(reader, protocol, 'game_status'))['snapshot'])
+
+                # The player not in turn disconnects, then the opponent ends its turn.
+                i = next(i for i in range(2) if matches[i]['player_id'] != mirrors[i].current_player)
+                clients[i][1].close()
+                while 'user{}'.format(i) not in server.disconnected:
+                    await asyncio.sleep(0.01)
+                reader, writer, protocol = clients[1 - i]
+                _send(writer, protocol, 'player_action', action='TurnEnd')
+                await _recv_until(reader, protocol, 'game_delta')
+
+                # Users with the nickname but without the reconnect token cannot take the seat.
+                rejected = []
+                for kwargs in ({}, {'reconnect_token': 'wrong'}, {'reconnect_token': None}):
+                    reader, writer, protocol = await _join(
+                        port, 'user{}'.format(i), ExampleDecks[i], match=False, **kwargs)
+                    rejected.append(await _recv_until(reader, protocol, 'error'))
+                    writer.close()
+                self.assertIn('user{}'.format(i), server.disconnected)
+
+                # Reconnect and take the seat back, get missing batches after the version of the mirror.
+                reader, writer, protocol = await _join(
+                    port, 'user{}'.format(i), ExampleDecks[i], match=False, state_version=mirrors[i].version,
+                    reconnect_token=matches[i]['reconnect_token'])
+                rematch = await _recv_until(reader, protocol, 'match')
+                delta = await asyncio.wait_for(protocol.recv_async(reader), 20)
+                mirrors[i].apply_batches(delta['batches'])
+                self.assertEqual(server.disconnected, {})
+                stream = server.rooms[rematch['room']['id']].streams[rematch['player_id']]
+                self.assertEqual(mirrors[i].snapshot(), stream.mirror.snapshot())
+
+                _send(writer, protocol, 'player_action', action='Concede')
+                end = await _recv_until(reader, protocol, 'game_end')
+                return matches[i], rematch, delta, end, rejected
+            finally:
+                server.close()
+
+        match, rematch, delta, end, rejected = asyncio.run(_main())
+        for msg in rejected:
+            self.assertTrue(msg['text'].startswith('Invalid reconnect token'))
+        self.assertNotEqual(rematch['reconnect_token'], match['reconnect_token'])
+        self.assertTrue(rematch['reconnect'])
+        self.assertEqual(rematch['player_id'], match['player_id'])
+        self.assertEqual(rematch['room']['id'], match['room']['id'])
+        self.assertEqual(delta['type'], 'game_delta')
+        self.assertEqual(end['type'], 'game_end')
+
+    def testReconnectInvalidVersion(self):
+        async def _main():
+            server = RoomServer(('127.0.0.1', 0), n_workers=1, turn_timeout=0, reconnect_grace=10)
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                clients = [await _join(port, 'user{}'.format(i), ExampleDecks[i]) for i in range(2)]
+                match = await _recv_until(clients[0][0], clients[0][2], 'match')
+                await _recv_until(clients[0][0], clients[0][2], 'game_status')
+                writer = clients[0][1]
+
+                # Invalid versions (not integers) get the latest snapshot.
+                replies = []
+                for version in ('0', [0], None, True, 1.5):
+                    writer.close()
+                    while 'user0' not in server.disconnected:
+                        await asyncio.sleep(0.01)
+                    reader, writer, protocol = await _join(
+                        port, 'user0', ExampleDecks[0], match=False, state_version=version,
+                        reconnect_token=match['reconnect_token'])
+                    match = await _recv_until(reader, protocol, 'match')
+                    replies.append(await asyncio.wait_for(protocol.recv_async(reader), 20))
+                return replies
+            finally:
+                server.close()
+
+        for msg in asyncio.run(_main()):
+            self.assertEqual(msg['type'], 'game_status')
+
+    def testIdleTimeout(self):
+        async def _main():
+            server = RoomServer(('127.0.0.1', 0), n_workers=1, idle_timeout=0.1)
+            await server.start()
+            port = server._server.sockets[0].getsockname()[1]
+            try:
+                # The connection sends nothing, it is closed by the server.
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                return await asyncio.wait_for(reader.read(), 20)
+            finally:
+                server.close()
+
+        self.assertIn(b'Idle timeout', asyncio.run(_main()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.network.timer import TimerService, LoopTimerService
+from MyHearthStone.network.room import Room
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.utils.game import Klass
+
+__author__ = 'fyabc'
+
+
+ExampleDecks = [
+    Deck(klass=Klass.Str2Idx[klass], card_id_list=["6", "11", "10000", "30007"] * 4)
+    for klass in ('Mage', 'Hunter')
+]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimer(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.timers = TimerService(clock=self.clock)
+        self.fired = []
+
+    def testOrder(self):
+        timers = self.timers
+        for name, delay in [('c', 3), ('a', 1), ('b', 2), ('b2', 2)]:
+            timers.call_later(delay, self.fired.append, name)
+        self.assertEqual(timers.timeout(), 1)
+        self.assertEqual(timers.run_expired(), 0)
+        self.clock.now = 2
+        self.assertEqual(timers.run_expired(), 3)
+        # Timers of equal deadlines run in order of scheduling.
+        self.assertEqual(self.fired, ['a', 'b', 'b2'])
+        self.clock.now = 10
+        timers.run_expired()
+        self.assertEqual(self.fired, ['a', 'b', 'b2', 'c'])
+        self.assertEqual(len(timers), 0)
+        self.assertIsNone(timers.timeout())
+
+    def testKeyAndCancel(self):
+        timers = self.timers
+        timer = timers.call_later(1, self.fired.append, 'x')
+        timers.call_later(1, self.fired.append, 'old', key='k')
+        timers.call_later(2, self.fired.append, 'new', key='k')
+        self.assertEqual(len(timers), 2)
+        self.assertTrue(timers.cancel(timer))
+        self.assertFalse(timers.cancel(timer))
+        self.clock.now = 5
+        timers.run_expired()
+        self.assertEqual(self.fired, ['new'])
+        self.assertIsNone(timers.get('k'))
+        self.assertFalse(timers.cancel('k'))
+
+    def testCallbacks(self):
+        timers = self.timers
+
+        def _reschedule(n):
+            self.fired.append(n)
+            if n < 3:
+                timers.call_later(0, _reschedule, n + 1)
+
+        def _fail():
+            raise ValueError('failed')
+
+        timers.call_later(1, _fail)
+        timers.call_later(1, _reschedule, 0)
+        self.clock.now = 1
+        # Expired timers scheduled by callbacks run in the same call, errors do not stop other timers.
+        self.assertEqual(timers.run_expired(), 5)
+        self.assertEqual(self.fired, [0, 1, 2, 3])
+
+    def testManyTimers(self):
+        timers = self.timers
+        n = 20000
+        for i in range(n):
+            timers.call_later(10 + i % 100, self.fired.append, i, key=i)
+        # Reschedule each timer many times (e.g. timers reset by messages), the heap does not grow much.
+        for step in range(5):
+            for i in range(n):
+                timers.call_later(20 + step, self.fired.append, i, key=i)
+        self.assertEqual(len(timers), n)
+        self.assertLess(len(timers._heap), 2 * n + 1)
+        self.clock.now = 100
+        self.assertEqual(timers.run_expired(), n)
+        self.assertEqual(sorted(self.fired), list(range(n)))
+
+    def testLoopTimers(self):
+        async def _main():
+            timers = LoopTimerService(asyncio.get_running_loop())
+            timers.call_later(0.05, self.fired.append, 'b')
+            timers.call_later(0.1, self.fired.append, 'c', key='c')
+            timers.call_later(0.01, self.fired.append, 'a')
+            timers.call_later(0.02, self.fired.append, 'x', key='x')
+            timers.cancel('x')
+            await asyncio.sleep(0.2)
+            timers.close()
+
+        asyncio.run(_main())
+        self.assertEqual(self.fired, ['a', 'b', 'c'])
+
+    def testRoomTurnTimeout(self):
+        room = Room(0, max_timeouts=2)
+        room.start([deck.to_code() for deck in ExampleDecks])
+        turn = room.turn
+        first = room.game.current_player
+
+        outputs = room.turn_timeout(turn)
+        self.assertEqual(room.turn, turn + 1)
+        self.assertIn('game_delta', [msg_type for _, msg_type, _ in outputs])
+        # Deadlines of ended turns are ignored.
+        self.assertEqual(room.turn_timeout(turn), [])
+
+        # The player acts, so its timeouts are reset.
+        room.run_player_action(1 - first, {'action': 'TurnEnd'})
+        room.run_player_action(first, {'action': 'TurnEnd'})
+        self.assertEqual(room.timeouts[first], 0)
+        room.run_player_action(1 - first, {'action': 'TurnEnd'})
+        room.turn_timeout(room.turn)
+        self.assertEqual(room.timeouts[first], 1)
+        self.assertTrue(room.running)
+        room.run_player_action(1 - first, {'action': 'TurnEnd'})
+
+        # The second timeout of the first player in a row, concede the game.
+        outputs = room.turn_timeout(room.turn)
+        self.assertFalse(room.running)
+        self.assertIn((None, 'game_end', {'result': room.game.game_result}), outputs)
+
+
+if __name__ == '__main__':
+    unittest.main()
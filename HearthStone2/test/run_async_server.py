@@ -0,0 +1,22 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from MyHearthStone.network.async_server import start_async_server
+from MyHearthStone.utils.message import setup_logging
+
+__author__ = 'fyabc'
+
+
+def main():
+    setup_logging(file=None, scr_log=True)
+
+    start_async_server(('localhost', 20000))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,8 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from MyHearthStone.network.local_client import create_client, start_client
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.utils.game import Klass
 from MyHearthStone.utils.message import setup_logging
 
 __author__ = 'fyabc'
@@ -19,7 +21,8 @@ def main():
     client = create_client(
         version=2,
         address=('localhost', 20000),
-        user='user{}'.format(random.randint(1, 10))
+        user='user{}'.format(random.randint(1, 10)),
+        deck_code=Deck(klass=Klass.Str2Idx['Mage'], card_id_list=["6", "11", "10000", "30007"] * 4).to_code(),
     )
     start_client(client)
 
@@ -0,0 +1,148 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Record replays of agent games, or verify replays against the current engine (see ``game.replay``).
+
+Examples::
+
+    python run_replays.py record replays/ -n 1000 -w 8
+    python run_replays.py verify replays/ -w 8
+"""
+
+import argparse
+import glob
+import logging
+import multiprocessing
+import random
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.ai.standard import get_agent_by_name
+from MyHearthStone.game import player_action as pa
+from MyHearthStone.game.core import Game
+from MyHearthStone.game.default_data import PracticeDecks
+from MyHearthStone.game.replay import Replay, ReplayError, ReplayRecorder
+from MyHearthStone.utils.game import DefaultClassHeroMap
+from MyHearthStone.utils.message import setup_logging
+from MyHearthStone.utils.package_io import all_heroes, reload_packages
+
+__author__ = 'fyabc'
+
+
+def _init_worker():
+    setup_logging(file=None, scr_log=True, scr_level=logging.ERROR)
+    reload_packages()
+
+
+def _record(args):
+    """Play an agent game and save the replay.
+
+    :return: (filename, error message or None)
+    """
+    filename, agents, seed, checkpoint_interval = args
+    rng = random.Random(seed)
+    heroes = all_heroes()
+    classes = sorted(k for k in PracticeDecks['Normal'] if DefaultClassHeroMap.get(k) in heroes)
+    decks = [PracticeDecks['Normal'][rng.choice(classes)] for _ in range(2)]
+
+    game = Game()
+    game.start_game(decks, seed=seed)
+    recorder = ReplayRecorder(game, decks, checkpoint_interval=checkpoint_interval)
+    players = [get_agent_by_name(name)(game, player_id) for player_id, name in enumerate(agents)]
+    try:
+        for player in players:
+            game.run_player_action(pa.ReplaceStartCard(game, player.player_id, player.get_replace_card()))
+        while game.running:
+            game.run_player_action(players[game.current_player].get_player_action())
+    except Exception as e:
+        return filename, repr(e)
+    recorder.save(filename)
+    return filename, None
+
+
+def _verify(filename):
+    """Verify a replay.
+
+    :return: (filename, error message or None, number of actions)
+    """
+    try:
+        replay = Replay.load(filename)
+        replay.verify()
+    except ReplayError as e:
+        return filename, str(e), 0
+    except Exception as e:
+        return filename, 'Engine error: {!r}'.format(e), 0
+    return filename, None, len(replay)
+
+
+def _run_pool(fn, tasks, n_workers):
+    if n_workers <= 0:
+        n_workers = os.cpu_count() or 1
+    with multiprocessing.get_context().Pool(n_workers, initializer=_init_worker) as pool:
+        return list(pool.imap_unordered(fn, tasks, chunksize=max(1, len(tasks) // (n_workers * 8))))
+
+
+def record(args):
+    os.makedirs(args.directory, exist_ok=True)
+    tasks = [(os.path.join(args.directory, 'replay-{}.hsr'.format(i)), args.agents, args.seed * 1000003 + i,
+              args.checkpoint_interval) for i in range(args.games)]
+    start_time = time.perf_counter()
+    results = _run_pool(_record, tasks, args.workers)
+    failed = [(filename, message) for filename, message in results if message is not None]
+    for filename, message in failed:
+        print('Skip {}: {}'.format(filename, message))
+    print('Recorded {} replays ({} games failed) in {:.1f}s'.format(
+        len(results) - len(failed), len(failed), time.perf_counter() - start_time))
+    return 0
+
+
+def verify(args):
+    filenames = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(glob.glob(os.path.join(path, '**', '*.hsr'), recursive=True)))
+        else:
+            filenames.append(path)
+    start_time = time.perf_counter()
+    results = _run_pool(_verify, filenames, args.workers)
+    failed = sorted((filename, message) for filename, message, _ in results if message is not None)
+    for filename, message in failed:
+        print('FAILED {}: {}'.format(filename, message))
+    print('Verified {} replays ({} actions), {} failed in {:.1f}s'.format(
+        len(results), sum(n for _, _, n in results), len(failed), time.perf_counter() - start_time))
+    return 1 if failed else 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Record or verify replays.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_record = subparsers.add_parser('record', help='Record replays of agent games')
+    parser_record.add_argument('directory', help='The output directory')
+    parser_record.add_argument('-n', '--games', type=int, default=100, help='Number of games, default is %(default)r')
+    parser_record.add_argument('-a', '--agents', nargs=2, default=['BaseAgent', 'BaseAgent'],
+                               metavar=('AGENT0', 'AGENT1'), help='Names of agents, default is %(default)r')
+    parser_record.add_argument('-c', '--checkpoint-interval', type=int, default=None,
+                               help='Interval (in turns) of checkpoints, default is C.Game.ReplayCheckpointInterval')
+    parser_record.add_argument('--seed', type=int, default=0, help='Random seed, default is %(default)r')
+    parser_record.set_defaults(fn=record)
+
+    parser_verify = subparsers.add_parser('verify', help='Verify replays against the current engine')
+    parser_verify.add_argument('paths', nargs='+', help='Replay files or directories (searched recursively)')
+    parser_verify.set_defaults(fn=verify)
+
+    for sub_parser in (parser_record, parser_verify):
+        sub_parser.add_argument('-w', '--workers', type=int, default=0,
+                                help='Number of worker processes, 0 means the number of CPUs, default is %(default)r')
+    args = parser.parse_args(args)
+
+    setup_logging(file=None, scr_log=True, scr_level=logging.ERROR)
+    return args.fn(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Generate a self-play dataset (see ``ai.selfplay``)."""
+
+import argparse
+import logging
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.ai.selfplay import run_selfplay
+from MyHearthStone.utils.message import setup_logging
+
+__author__ = 'fyabc'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Generate a self-play dataset.')
+    parser.add_argument('directory', help='The output directory')
+    parser.add_argument('-n', '--games', type=int, default=100, help='Number of games, default is %(default)r')
+    parser.add_argument('-a', '--agents', nargs=2, default=None, metavar=('AGENT0', 'AGENT1'),
+                        help='Names of agents, default is C.AI.SelfPlay.Agents')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of worker processes, 0 means the number of CPUs, default is C.AI.SelfPlay.Workers')
+    parser.add_argument('-s', '--shard-size', type=int, default=None,
+                        help='Number of positions of each shard, default is C.AI.SelfPlay.ShardSize')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed, default is %(default)r')
+    args = parser.parse_args(args)
+
+    setup_logging(file=None, scr_log=True, scr_level=logging.WARNING)
+
+    kwargs = {'seed': args.seed}
+    if args.agents is not None:
+        kwargs['agents'] = args.agents
+    if args.workers is not None:
+        kwargs['n_workers'] = args.workers
+    if args.shard_size is not None:
+        kwargs['shard_size'] = args.shard_size
+    statistics = run_selfplay(args.directory, args.games, **kwargs)['statistics']
+    print('{games} games ({failed_games} failed), {positions} positions in {time:.1f}s, '
+          '{positions_per_hour:.0f} positions per hour with {workers} workers'.format(**statistics))
+
+
+if __name__ == '__main__':
+    main()
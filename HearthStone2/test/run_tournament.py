@@ -0,0 +1,69 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Run a deck tournament (see ``ai.tournament``)."""
+
+import argparse
+import logging
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.ai.tournament import Entrant, practice_entrants, run_tournament
+from MyHearthStone.utils.message import setup_logging
+from MyHearthStone.utils.package_io import reload_packages
+
+__author__ = 'fyabc'
+
+
+def _load_entrants(filename):
+    """Load entrants from a file, each line is ``<name> <agent> <deck code>``, lines start with '#' are ignored."""
+    entrants = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, agent, deck_code = line.split(maxsplit=2)
+            entrants.append(Entrant(name, deck_code, agent))
+    return entrants
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run a deck tournament.')
+    parser.add_argument('-d', '--decks', default=None,
+                        help='File of entrants (lines of "<name> <agent> <deck code>"), default is practice decks')
+    parser.add_argument('-a', '--agents', nargs='+', default=['BaseAgent'],
+                        help='Agents of practice decks, default is %(default)r')
+    parser.add_argument('-m', '--mode', choices=['round_robin', 'swiss'], default='round_robin',
+                        help='Tournament mode, default is %(default)r')
+    parser.add_argument('-r', '--rounds', type=int, default=None, help='Number of rounds of the swiss tournament')
+    parser.add_argument('-s', '--seeds', type=int, default=None,
+                        help='Number of seeds of each pairing in each seat, default is C.AI.Tournament.Seeds')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of worker processes, 0 means the number of CPUs, default is C.AI.Tournament.Workers')
+    parser.add_argument('-c', '--cache', default=None, help='The SQLite file of cached results')
+    parser.add_argument('--no-cache', action='store_true', default=False, help='Do not cache results')
+    args = parser.parse_args(args)
+
+    setup_logging(file=None, scr_log=True, scr_level=logging.WARNING)
+    reload_packages()
+
+    entrants = practice_entrants(args.agents) if args.decks is None else _load_entrants(args.decks)
+    kwargs = {}
+    if args.seeds is not None:
+        kwargs['seeds'] = args.seeds
+    if args.workers is not None:
+        kwargs['n_workers'] = args.workers
+    if args.no_cache:
+        kwargs['cache'] = None
+    elif args.cache is not None:
+        kwargs['cache'] = args.cache
+    result = run_tournament(entrants, mode=args.mode, n_rounds=args.rounds, **kwargs)
+    print(result.format())
+    print('{played} games played, {cached} cached, {failed} failed in {time:.1f}s'.format(**result.statistics))
+
+
+if __name__ == '__main__':
+    main()
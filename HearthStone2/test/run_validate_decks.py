@@ -0,0 +1,80 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Validate and normalise deck codes of files (see ``game.deck_validation``).
+
+Examples::
+
+    python run_validate_decks.py ladder.txt -o valid.txt -r errors.jsonl
+    cat decks.txt | python run_validate_decks.py - -m standard > valid.txt
+"""
+
+import argparse
+import json
+import logging
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.game.deck_validation import DeckValidator
+from MyHearthStone.utils.message import setup_logging
+from MyHearthStone.utils.package_io import reload_packages
+
+__author__ = 'fyabc'
+
+
+def _open(filename, mode):
+    if filename == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    return open(filename, mode, encoding='utf-8')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Validate and normalise deck codes (one code per line).')
+    parser.add_argument('input', help='The input file, "-" means stdin')
+    parser.add_argument('-o', '--output', default='-', help='File of normalised codes of valid decks, default is stdout')
+    parser.add_argument('-r', '--report', default=None,
+                        help='File of the error report (JSON lines of {"line", "errors"}), default is not written')
+    parser.add_argument('-m', '--mode', choices=Deck.AllModes, default=None,
+                        help='The expected deck mode, default is any mode')
+    parser.add_argument('-b', '--batch-size', type=int, default=4096, help='Lines of each batch, default is %(default)r')
+    args = parser.parse_args(args)
+
+    setup_logging(file=None, scr_log=True, scr_level=logging.ERROR)
+    reload_packages()
+    validator = DeckValidator(mode=args.mode)
+
+    n_valid, n_invalid = 0, 0
+    error_counts = {}
+    start_time = time.perf_counter()
+    f_in, f_out = _open(args.input, 'r'), _open(args.output, 'w')
+    f_report = None if args.report is None else _open(args.report, 'w')
+    try:
+        for batch in validator.validate_lines(f_in, batch_size=args.batch_size):
+            f_out.writelines(report.code + '\n' for report in batch if report.code is not None)
+            for report in batch:
+                if not report.errors:
+                    n_valid += 1
+                    continue
+                n_invalid += 1
+                for kind, _ in report.errors:
+                    error_counts[kind] = error_counts.get(kind, 0) + 1
+                if f_report is not None:
+                    f_report.write(json.dumps({'line': report.line, 'errors': report.errors}) + '\n')
+    finally:
+        for f in (f_in, f_out, f_report):
+            if f is not None and f not in (sys.stdin, sys.stdout):
+                f.close()
+
+    print('{} valid, {} invalid decks in {:.1f}s'.format(n_valid, n_invalid, time.perf_counter() - start_time),
+          file=sys.stderr)
+    for kind, count in sorted(error_counts.items(), key=lambda e: -e[1]):
+        print('    {}: {}'.format(kind, count), file=sys.stderr)
+    return 1 if n_invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
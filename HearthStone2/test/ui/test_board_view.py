@@ -0,0 +1,159 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+import os
+from importlib.util import spec_from_file_location, module_from_spec
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from MyHearthStone.game import player_action as pa
+
+from game.utils import example_game
+
+__author__ = 'fyabc'
+
+
+def _load_board_view():
+    # [NOTE]: The package ``MyHearthStone.ui`` imports Cocos, but this module does not depend on it.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                        'MyHearthStone', 'ui', 'ui_cocos', 'board_view.py')
+    spec = spec_from_file_location('_board_view', path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+bv = _load_board_view()
+
+
+def _run_until(game, action_type):
+    """End turns until an action of the type is legal, return the action."""
+    while True:
+        actions = [a for a in game.get_legal_actions() if isinstance(a, action_type)]
+        if actions:
+            return actions[0]
+        game.run_player_action(pa.TurnEnd(game, game.current_player))
+
+
+class _Layer:
+    """Render snapshots like ``GameBoardLayer``: create missing sprites, and record updated keys."""
+
+    def __init__(self, game):
+        self.game = game
+        self.view_model = bv.BoardViewModel()
+        self.sprites = {}
+
+    def refresh(self):
+        snapshot = self.view_model.snapshot(self.game.players)
+        updated = set()
+        for key in snapshot.views:
+            sprite = self.sprites.setdefault(key, object())
+            if snapshot.changed(key, sprite):
+                updated.add(key)
+        for key in [key for key in self.sprites if key not in snapshot.views]:
+            del self.sprites[key]
+        labels = [i for i in range(2) if snapshot.label_changed(i)]
+        diff = snapshot.diff()
+        self.view_model.commit(snapshot)
+        return snapshot, updated, labels, diff
+
+
+class TestBoardView(unittest.TestCase):
+    def setUp(self):
+        self.game = example_game()
+        self.layer = _Layer(self.game)
+
+    def tearDown(self):
+        if self.game.running:
+            self.game.end_game()
+
+    def testCreate(self):
+        snapshot, updated, labels, (created, removed, moved, changed) = self.layer.refresh()
+        self.assertEqual(updated, set(snapshot.views))
+        self.assertEqual(set(created), set(snapshot.views))
+        self.assertEqual((removed, moved, changed), ([], [], []))
+        self.assertEqual(labels, [0, 1])
+        for player in self.game.players:
+            self.assertIn((bv.Hero, player.hero), snapshot.views)
+            for card in player.hand:
+                self.assertIn((bv.Hand, card), snapshot.views)
+
+        # Nothing changed.
+        _, updated, labels, diff = self.layer.refresh()
+        self.assertEqual(updated, set())
+        self.assertEqual(labels, [])
+        self.assertEqual(diff, ([], [], [], []))
+
+    def testMoveAndRemove(self):
+        game = self.game
+        action = _run_until(game, pa.PlayMinion)
+        player_id, minion = action.player_id, action.minion
+        self.layer.refresh()
+        hand = list(game.players[player_id].hand)
+        game.run_player_action(action)
+
+        _, updated, labels, (created, removed, moved, changed) = self.layer.refresh()
+        self.assertEqual(created, [(bv.Play, minion)])
+        self.assertEqual(removed, [(bv.Hand, minion)])
+        # Cards after the minion moved, all other hand cards moved since the size of the hand changed.
+        self.assertEqual(set(moved), {(bv.Hand, card) for card in hand if card is not minion})
+        self.assertIn(player_id, labels)
+        self.assertIn((bv.Play, minion), updated)
+        self.assertNotIn((bv.Hand, minion), updated)
+        self.assertTrue(set(moved) <= updated)
+        self.assertNotIn((bv.Hero, game.players[player_id].hero), updated)
+
+    def testUpdate(self):
+        game = self.game
+        action = _run_until(game, pa.UseHeroPower)
+        player = game.players[action.player_id]
+        self.layer.refresh()
+        game.run_player_action(action)
+
+        _, updated, _, (created, removed, moved, changed) = self.layer.refresh()
+        self.assertEqual((created, removed, moved), ([], [], []))
+        self.assertIn((bv.HeroPower, player.hero_power), changed)
+        self.assertEqual(updated, set(changed))
+
+    def testRecreatedSprite(self):
+        snapshot, _, _, _ = self.layer.refresh()
+        key = (bv.Hero, self.game.players[0].hero)
+        old_sprite = self.layer.sprites[key]
+        self.layer.sprites[key] = object()
+
+        # The view is the same, but the sprite is new (e.g. created by an animation).
+        snapshot, updated, _, diff = self.layer.refresh()
+        self.assertEqual(updated, {key})
+        self.assertEqual(diff, ([], [], [], []))
+        self.assertIsNot(snapshot.sprites[key], old_sprite)
+
+        # After reset, all sprites are updated.
+        self.layer.view_model.reset()
+        snapshot, updated, _, _ = self.layer.refresh()
+        self.assertEqual(updated, set(snapshot.views))
+
+    def testStatus(self):
+        view_model = self.layer.view_model
+        snapshot, _, _, _ = self.layer.refresh()
+        hero_key, hand_key = (bv.Hero, self.game.players[0].hero), next(k for k in snapshot.views if k[0] == bv.Hand)
+        hero, card = self.layer.sprites[hero_key], self.layer.sprites[hand_key]
+
+        self.assertTrue(view_model.status_changed(hero, 'active'))
+        self.assertFalse(view_model.status_changed(hero, 'active'))
+        self.assertTrue(view_model.status_changed(hero, None))
+        self.assertFalse(view_model.status_changed(hero, None))
+        self.assertTrue(view_model.status_changed(card, 'playable'))
+
+        # Statuses of sprites not rendered any more are forgotten.
+        del self.layer.sprites[hand_key]
+        self.layer.refresh()
+        self.assertIn(hero, view_model.statuses)
+        self.assertNotIn(card, view_model.statuses)
+        self.assertTrue(view_model.status_changed(card, 'playable'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.utils import codec
+
+__author__ = 'fyabc'
+
+
+class TestCodec(unittest.TestCase):
+    def _assertRoundTrip(self, obj, expected=None):
+        self.assertEqual(codec.loads(codec.dumps(obj)), obj if expected is None else expected)
+
+    def testScalars(self):
+        for v in [None, True, False, 0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 64 - 1,
+                  -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31 - 1, -2 ** 63, 0.5, -1.25e100]:
+            self._assertRoundTrip(v)
+        self.assertIs(codec.loads(codec.dumps(True)), True)
+
+    def testStrings(self):
+        for n in [0, 1, 31, 32, 255, 256, 65535, 65536]:
+            self._assertRoundTrip('a' * n)
+            self._assertRoundTrip(b'b' * n)
+        self._assertRoundTrip('火球术')
+
+    def testContainers(self):
+        self._assertRoundTrip([1, [2, [3, {}]], {'a': None, 1: 'int key'}])
+        self._assertRoundTrip(list(range(20)))
+        self._assertRoundTrip({str(i): i for i in range(20)})
+        self._assertRoundTrip((1, (2, 3)), [1, [2, 3]])
+
+    def testSmallSize(self):
+        self.assertEqual(len(codec.dumps([1, 2, 3])), 4)
+        self.assertEqual(len(codec.dumps({'zone': 3})), 7)
+
+    def testErrors(self):
+        with self.assertRaises(codec.CodecError):
+            codec.dumps(object())
+        with self.assertRaises(codec.CodecError):
+            codec.dumps(2 ** 64)
+        data = codec.dumps([1, 2, 'abc'])
+        with self.assertRaises(codec.CodecError):
+            codec.loads(data[:-2])
+        with self.assertRaises(codec.CodecError):
+            codec.loads(data + b'\x00')
+        with self.assertRaises(codec.CodecError):
+            codec.loads(b'\xc1')
+
+        # Invalid UTF-8 strings, unhashable keys and truncated strings.
+        data = bytearray(codec.dumps('ab'))
+        data[1], data[2] = 0xff, 0xfe
+        with self.assertRaises(codec.CodecError):
+            codec.loads(bytes(data))
+        with self.assertRaises(codec.CodecError):
+            codec.loads(b'\x81\x90\x00')
+        with self.assertRaises(codec.CodecError):
+            codec.load_from(codec.dumps([1, 'abc'])[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
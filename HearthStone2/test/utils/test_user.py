@@ -1,4 +1,109 @@
 #! /usr/bin/python
 # -*- coding: utf-8 -*-
 
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from MyHearthStone.game.deck import Deck
+from MyHearthStone.utils.user import AppUser
+from MyHearthStone.utils.user_store import UserStore, migrate_json_users
+
 __author__ = 'fyabc'
+
+ExampleDeckCode = Deck(klass=0, card_id_list=['6', '6', '11'], name='Test').to_code()
+
+
+class TestUserStore(unittest.TestCase):
+    def setUp(self):
+        self.store = UserStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def testCreateAndLoad(self):
+        store = self.store
+        self.assertIsNone(AppUser.get_user_list(store))
+
+        user = AppUser.load_or_create('alice', store=store)
+        user.cards['30'] = 2
+        user.packs['basic'] = 3
+        user.dusts = 100
+        user.decks.append(ExampleDeckCode)
+        user.dump()
+        bob = AppUser.load_or_create('bob', store=store)
+        bob.dump()
+
+        self.assertEqual(AppUser.get_user_list(store), [[1, 'bob'], [0, 'alice']])
+        self.assertEqual(store.find_uuid(user.uuid), 0)
+        loaded = AppUser.load_or_create('alice', store=store)
+        self.assertEqual(loaded.to_dict(), user.to_dict())
+        self.assertEqual(AppUser.load_or_create(None, store=store).user_id, 1)
+
+    def testIncrementalUpdates(self):
+        store = self.store
+        user = AppUser.load_or_create('alice', store=store)
+        user.cards.update({'1': 1, '2': 2})
+        user.decks.extend([ExampleDeckCode, ExampleDeckCode])
+        user.dump()
+
+        user = AppUser.load_or_create(0, store=store)
+        del user.cards['1']
+        user.cards['3'] = 1
+        user.dusts = 40
+        del user.decks[0]
+        user.dump()
+
+        data = store.load(0)
+        self.assertEqual(data['cards'], {'2': 2, '3': 1})
+        self.assertEqual(data['dusts'], 40)
+        self.assertEqual(len(data['decks']), 1)
+
+        store.save(0, cards={'2': 0}, packs={'classic': 1})
+        data = store.load(0)
+        self.assertEqual(data['cards'], {'3': 1})
+        self.assertEqual(data['packs'], {'classic': 1})
+
+    def testSameName(self):
+        store = self.store
+        store.insert_user({'user_id': 0, 'nickname': 'alice'})
+        store.insert_user({'user_id': 5, 'nickname': 'alice'})
+        self.assertEqual(store.find('alice'), [0, 5])
+        with self.assertRaises(ValueError):
+            AppUser.load_or_create('alice', store=store)
+        self.assertEqual(AppUser.load_or_create('bob', store=store).user_id, 6)
+
+
+class TestMigrateJsonUsers(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testMigrate(self):
+        user_list_filename = os.path.join(self.path, 'users.json')
+        with open(user_list_filename, 'w') as f:
+            json.dump([[1, 'bob'], [0, 'alice']], f)
+        alice = AppUser(user_id=0, nickname='alice', cards={'30': 2}, dusts=50, decks=[ExampleDeckCode])
+        with open(os.path.join(self.path, '0.json'), 'w') as f:
+            json.dump(alice.to_dict(), f)
+
+        store = UserStore(os.path.join(self.path, 'users.sqlite'))
+        try:
+            self.assertEqual(migrate_json_users(store, user_list_filename, self.path), 2)
+            self.assertEqual(migrate_json_users(store, user_list_filename, self.path), 0)
+            self.assertEqual(store.user_list(), [[1, 'bob'], [0, 'alice']])
+            self.assertEqual(store.load(0), json.loads(json.dumps(alice.to_dict())))
+            self.assertEqual(store.load(1)['nickname'], 'bob')
+        finally:
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()